@@ -0,0 +1,196 @@
+import asyncio
+import time
+from HttpSession import BoundSession
+from ResponseDecoder import ResponseDecoder
+
+try:
+    import aiohttp
+except ImportError:
+    # aiohttp is needed for async clients only, sync clients work without it
+    aiohttp = None
+
+
+class AsyncResponse:
+    """
+    Fully read response of aiohttp request. It has the same fields as requests.Response, which are used by
+    get_response_content methods of clients, so the same result contract is kept for async clients
+    """
+    def __init__(self, status_code: int, content: bytes, headers=None):
+        self.status_code = status_code
+        self.content = content
+        self.headers = headers or {}
+
+    def json(self):
+        return ResponseDecoder.get_default_loads()(self.content)
+
+
+class AsyncHttpSession:
+    """
+    Pooled keep-alive aiohttp session, can be shared between AsyncVkClient, AsyncYaUploader and AsyncImageSaver
+    """
+    def __init__(self, limit=100, limit_per_host=10, timeout=(3.05, 30)):
+        """
+        :param limit: total max connections
+        :param limit_per_host: max connections per host
+        :param timeout: default (connect, read) timeout in seconds or total timeout for every request
+        """
+        if aiohttp is None:
+            raise ImportError(f'{type(self).__name__} requires aiohttp package')
+        self.__limit = limit
+        self.__limit_per_host = limit_per_host
+        self.__timeout = timeout
+        # aiohttp session should be created inside running event loop, so it is created on first request
+        self.__session = None
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        await self.close()
+
+    @staticmethod
+    def make_timeout(timeout):
+        if type(timeout) is tuple:
+            return aiohttp.ClientTimeout(sock_connect=timeout[0], sock_read=timeout[1])
+        return aiohttp.ClientTimeout(total=timeout)
+
+    @staticmethod
+    def prepare_params(params: dict):
+        """
+        aiohttp accepts only strings and numbers as query values, so values are converted the same way
+        as requests does it, and None values are dropped
+        """
+        if not params:
+            return None
+        return {key: str(value) for key, value in params.items() if value is not None}
+
+    def __get_session(self):
+        if self.__session is None or self.__session.closed:
+            connector = aiohttp.TCPConnector(limit=self.__limit, limit_per_host=self.__limit_per_host)
+            self.__session = aiohttp.ClientSession(connector=connector, timeout=self.make_timeout(self.__timeout))
+        return self.__session
+
+    async def request(self, method: str, url: str, params: dict = None, timeout=None, **kwargs):
+        if timeout is not None:
+            kwargs['timeout'] = self.make_timeout(timeout)
+        async with self.__get_session().request(method, url, params=self.prepare_params(params),
+                                                **kwargs) as response:
+            content = await response.read()
+            return AsyncResponse(response.status, content, response.headers)
+
+    def bind(self, base_url='', params: dict = None, headers: dict = None, timeout=None, limiter=None, retry=None,
+             metrics=None, service=''):
+        """
+        Returns lightweight view of this session with base URL, params and headers attached once
+        :param base_url: prefix for relative paths
+        :param params: query params sent with every request (e.g. access token and API version)
+        :param headers: headers sent with every request (e.g. authorization)
+        :param timeout: overrides session timeout for this view
+        :param limiter: RateLimiter, which is acquired before every request of this view without blocking event loop
+        :param retry: RetryPolicy, which retries throttled requests (HTTP 429, 503) and connection errors
+        :param metrics: Metrics registry, which records count, latency and size of every request
+        :param service: service label of recorded requests, e.g. 'vk'
+        :return: AsyncBoundSession instance sharing this session connection pool
+        """
+        return AsyncBoundSession(self, base_url=base_url, params=params, headers=headers, timeout=timeout,
+                                 limiter=limiter, retry=retry, metrics=metrics, service=service)
+
+    async def close(self):
+        if self.__session is not None:
+            await self.__session.close()
+
+
+class AsyncBoundSession:
+    """
+    View of AsyncHttpSession with base URL, params and headers of one API client attached,
+    the same as BoundSession of HttpSession
+    """
+    def __init__(self, http: AsyncHttpSession, base_url='', params: dict = None, headers: dict = None,
+                 timeout=None, limiter=None, retry=None, metrics=None, service=''):
+        self.__http = http
+        self.__base_url = base_url
+        self.__params = dict(params or {})
+        self.__headers = dict(headers or {})
+        self.__timeout = timeout
+        self.__limiter = limiter
+        self.__retry = retry
+        self.__metrics = metrics
+        self.__service = service
+
+    def get_http_session(self):
+        return self.__http
+
+    def get_base_url(self):
+        return self.__base_url
+
+    def get_limiter(self):
+        return self.__limiter
+
+    def get_retry_policy(self):
+        return self.__retry
+
+    def get_metrics(self):
+        return self.__metrics
+
+    @staticmethod
+    def get_connection_errors():
+        """
+        :return: aiohttp errors of requests which were not answered, they are retried by RetryPolicy
+        """
+        return aiohttp.ClientConnectionError, asyncio.TimeoutError
+
+    async def __send(self, method: str, url: str, endpoint: str, **kwargs):
+        if self.__limiter is not None:
+            await self.__limiter.acquire_async()
+        if self.__metrics is None:
+            return await self.__http.request(method, url, **kwargs)
+        started = time.perf_counter()
+        try:
+            response = await self.__http.request(method, url, **kwargs)
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            self.__metrics.record_request(self.__service, endpoint, type(e).__name__, time.perf_counter() - started)
+            raise
+        data = kwargs.get('data')
+        bytes_out = len(data) if isinstance(data, (bytes, str)) else kwargs['headers'].get('Content-Length')
+        self.__metrics.record_request(self.__service, endpoint, response.status_code, time.perf_counter() - started,
+                                      int(bytes_out or 0), len(response.content))
+        return response
+
+    def __get_retry_after(self, response: AsyncResponse):
+        return self.__retry.get_response_retry_after(response)
+
+    async def request(self, method: str, url: str, params: dict = None, headers: dict = None, **kwargs):
+        """
+        Sends request through shared connection pool, see BoundSession.request
+        :return: AsyncResponse object
+        """
+        endpoint = BoundSession.get_endpoint(url) if self.__metrics is not None else ''
+        if not url.startswith(('http://', 'https://')):
+            url = self.__base_url + url
+        if params:
+            params = {**self.__params, **params}
+        else:
+            params = self.__params
+        if headers:
+            headers = {**self.__headers, **headers}
+        else:
+            headers = self.__headers
+        kwargs.setdefault('timeout', self.__timeout)
+        # streamed bodies (files, iterators) can't be sent twice, so such requests are not retried
+        if self.__retry is None or not isinstance(kwargs.get('data'), (type(None), bytes, str, dict)):
+            return await self.__send(method, url, endpoint, params=params, headers=headers, **kwargs)
+        return await self.__retry.run_async(
+            lambda: self.__send(method, url, endpoint, params=params, headers=headers, **kwargs),
+            self.__get_retry_after, self.__limiter, self.get_connection_errors())
+
+    async def get(self, url: str, **kwargs):
+        return await self.request('GET', url, **kwargs)
+
+    async def put(self, url: str, **kwargs):
+        return await self.request('PUT', url, **kwargs)
+
+    async def post(self, url: str, **kwargs):
+        return await self.request('POST', url, **kwargs)
+
+    async def delete(self, url: str, **kwargs):
+        return await self.request('DELETE', url, **kwargs)
@@ -0,0 +1,279 @@
+import asyncio
+import json
+from ImageSaver import ImageSaver
+from PhotoBatch import PhotoBatch
+from SizeSelector import SizeSelector
+from NameAllocator import NameAllocator
+from SyncManifest import SyncManifest
+from UploadOptions import UploadOptions
+from AsyncVkClient import AsyncVkClient
+from AsyncYaUploader import AsyncYaUploader
+from AsyncHttpSession import AsyncHttpSession
+from Logger import Logger
+from Metrics import Metrics
+from RateLimiter import RateLimiter
+
+
+class AsyncImageSaver:
+    """
+    Asyncio counterpart of ImageSaver with the same methods and the same result contract.
+    Saver can't make requests in constructor, so use "await AsyncImageSaver.create(...)" or call "await init()"
+    """
+    # files are uploaded concurrently if options are not passed
+    DEFAULT_CONCURRENCY = 10
+
+    def __init__(self, token_vk: str, token_ya: str, uid_vk, debug_mode=False, session: AsyncHttpSession = None,
+                 size_policy='max', vk_api_url: str = None, ya_api_url: str = None, vk_rate: float = None,
+                 ya_rate: float = None, metrics: Metrics = None):
+        """
+        :param vk_rate: VK requests per second, limiter is shared with other clients of the token, see ImageSaver
+        :param ya_rate: Yandex disk requests per second
+        :param metrics: Metrics registry of both clients, shared one is used by default
+        """
+        self.__debug_mode = debug_mode
+        self.__logger = Logger(type(self).__name__, debug_mode)
+        # size policy is the same as in ImageSaver, e.g. 'max' or 'width:1280'
+        self.__size_selector = size_policy if isinstance(size_policy, SizeSelector) \
+            else SizeSelector.from_string(size_policy)
+        self.__session = session if session is not None else AsyncHttpSession()
+        self.__metrics = metrics if metrics is not None else Metrics.get_default()
+        # if rate is not set, clients use their default rates, the same as in ImageSaver
+        vk_limiter = RateLimiter.for_token('vk', token_vk, vk_rate) if vk_rate else None
+        ya_limiter = RateLimiter.for_token('ya', token_ya, ya_rate) if ya_rate else None
+        self.__client = AsyncVkClient(token_vk, uid_vk, debug_mode=debug_mode, session=self.__session,
+                                      api_base_url=vk_api_url, rate_limiter=vk_limiter, metrics=self.__metrics)
+        self.__uploader = AsyncYaUploader(token_ya, debug_mode=debug_mode, session=self.__session,
+                                          api_base_url=ya_api_url, rate_limiter=ya_limiter, metrics=self.__metrics)
+        self.__initialized = False
+        self.__status = f'{type(self).__name__} not initialised.'
+
+    @classmethod
+    async def create(cls, token_vk: str, token_ya: str, uid_vk, debug_mode=False,
+                     session: AsyncHttpSession = None, size_policy='max', vk_api_url: str = None,
+                     ya_api_url: str = None, vk_rate: float = None, ya_rate: float = None, metrics: Metrics = None):
+        saver = cls(token_vk, token_ya, uid_vk, debug_mode, session, size_policy, vk_api_url, ya_api_url, vk_rate,
+                    ya_rate, metrics)
+        await saver.init()
+        return saver
+
+    async def init(self):
+        """
+        Initializes VK client and Yandex uploader concurrently
+        :return: True if both initialized
+        """
+        self.log(f'\nCreating {type(self).__name__}...', True)
+        await asyncio.gather(self.__client.init(), self.__uploader.init())
+        if self.__client.is_initialized() and self.__uploader.is_initialized():
+            self.__status = f'{type(self).__name__} initialised.'
+            self.__initialized = True
+        else:
+            self.__status = f'{type(self).__name__} init failed.'
+            self.__initialized = False
+        self.log(self.__status, True)
+        return self.__initialized
+
+    @staticmethod
+    def get_auth_link(app_id: str, scope='status'):
+        return AsyncVkClient.get_auth_link(app_id=app_id, scope=scope)
+
+    def is_initialized(self):
+        return self.__initialized
+
+    def is_client_initialized(self):
+        return self.__client.is_initialized()
+
+    def is_uploader_initialized(self):
+        return self.__uploader.is_initialized()
+
+    def get_session(self):
+        return self.__session
+
+    def get_metrics(self):
+        return self.__metrics
+
+    def log(self, message, is_debug_msg=False, sep=' '):
+        self.__logger.log(message, is_debug_msg, sep)
+
+    async def get_images_links(self, vk_id=None, album_id='profile', max_qty=10):
+        """
+        Loads VK photos page by page and chooses the biggest size of every photo, see ImageSaver.get_images_links
+        """
+        if not self.__initialized:
+            self.log('Error: not initialized.', True)
+            return PhotoBatch()
+        links = PhotoBatch()
+        namer = NameAllocator()
+        offset = 0
+        # adapting count to minimize request's quantity (max returned items count per request is 1000)
+        count = max_qty if max_qty <= 1000 else 1000
+        self.log(f'\nRequesting max {count} {album_id} images links from VK {album_id}...', True)
+        while True:
+            user_photos = await self.__client.get_user_photos(user_id=vk_id, album_id=album_id, count=count,
+                                                              offset=offset, fields=ImageSaver.PHOTO_FIELDS)
+            if not user_photos['success']:
+                self.__logger.debug('Loading image links failed: %s', user_photos['message'])
+                break
+            items_count = len(user_photos['object']['items'])
+            self.__logger.debug('Loaded %d images links from VK', items_count)
+            # if we reached the end
+            if items_count == 0:
+                break
+            # raw items are not kept, only chosen sizes of photos are stored
+            links.extend(ImageSaver.get_links_from_items(user_photos['object']['items'][:max_qty - len(links)],
+                                                         selector=self.__size_selector, namer=namer))
+            # if returned less items than requested, suppose that we reached the end
+            # or if next iteration will return more items than we requested
+            if items_count < count or count + offset >= max_qty:
+                break
+            offset += count
+        self.log(f'Loading images links finished', True)
+        return links
+
+    async def create_folder(self, folder_name: str):
+        if not self.__initialized:
+            self.log('Error: not initialized', True)
+            return {'object': None, 'success': False, 'message': 'Error: not initialized'}
+        result = await self.__uploader.create_folder(folder_name)
+        if result['success']:
+            self.log(f'\nFolder created: {result["object"]["href"]}', True)
+        else:
+            self.log(f'\nError creating folder. {result["message"]}', True)
+        return result
+
+    async def __upload_file(self, folder: str, file, semaphore: asyncio.Semaphore, stop: asyncio.Event,
+                            fail_fast=True):
+        async with semaphore:
+            # with fail fast policy files which are not started yet are skipped after first failure
+            if stop.is_set():
+                return None
+            response = await self.__uploader.upload_remote_file(folder + '/' + str(file[0]) + file[1], file[2])
+            if fail_fast and not response['success']:
+                stop.set()
+            return response
+
+    @staticmethod
+    def __skip_repeated(files):
+        """
+        :return: files without photos met before in the same list (by owner ID and photo ID)
+        """
+        seen = set()
+        unique = []
+        for file in files:
+            key = SyncManifest.get_key(file)
+            if key is not None:
+                if key[:2] in seen:
+                    continue
+                seen.add(key[:2])
+            unique.append(file)
+        return unique
+
+    async def upload_remote_files(self, folder: str, files: list, log_file_path: str = None,
+                                  options: UploadOptions = None):
+        """
+        Uploads files by their URLs to Yandex disk folder concurrently, see ImageSaver.upload_remote_files
+        :param folder: target folder on disk
+        :param files: PhotoBatch or list of [filename, extension, url, size type] as returned by get_images_links
+        :param log_file_path: local path of log file, by default images_log.json
+        :param options: see UploadOptions, by default DEFAULT_CONCURRENCY files are uploaded at once.
+                        confirm and manifest are not supported, dedup skips photos repeated in files only,
+                        log is always saved as JSON array at the end, so buffer_size, log_sync_every and
+                        export_json are not used
+        :return: {'object': {'uploaded': 'count of accepted files', 'failed': 'list of failed files with messages'},
+                 'success': 'True if all files accepted',
+                 'message': 'contains error string if any or empty string'}
+        """
+        if options is None:
+            options = UploadOptions(concurrency=self.DEFAULT_CONCURRENCY)
+        if options.get_confirm() or options.get_manifest() is not None:
+            raise ValueError(f'{type(self).__name__} supports neither confirm nor manifest: {options!r}')
+        result = {'object': None, 'success': False, 'message': ''}
+        if not self.__initialized:
+            self.log('Error: not initialized', True)
+            result['message'] = 'Not initialized'
+            return result
+        self.log(f'\nStart to upload remote files to folder {folder}...', True)
+        if not log_file_path:
+            log_file_path = 'images_log.json'
+        if options.get_dedup():
+            files = self.__skip_repeated(files)
+        semaphore = asyncio.Semaphore(options.get_concurrency())
+        stop = asyncio.Event()
+        responses = await asyncio.gather(*[self.__upload_file(folder, file, semaphore, stop, options.get_fail_fast())
+                                           for file in files])
+        log = []
+        failed = []
+        # gather keeps order of files, so log is always the same for the same files list
+        for count, (file, response) in enumerate(zip(files, responses), 1):
+            if response is None:
+                continue
+            if response['success']:
+                self.__logger.debug('Uploading file #%d accepted: %s', count, response['object']['href'])
+                log.append({'filename': f'{file[0]}{file[1]}', 'size': f'{file[3]}'})
+            else:
+                self.__logger.debug('Uploading file failed: %s (%s)', file[2], response['message'])
+                failed.append({'url': file[2], 'filename': f'{file[0]}{file[1]}', 'message': response['message']})
+        with open(log_file_path, 'w+') as log_file:
+            json.dump(log, log_file)
+        self.log(f'\nLog file saved to {log_file_path}', True)
+        result['object'] = {'uploaded': len(log), 'failed': failed}
+        if failed:
+            result['message'] = f'Uploading file failed: {failed[0]["url"]} ({failed[0]["message"]})'
+            if len(failed) > 1:
+                result['message'] += f' and {len(failed) - 1} more'
+        else:
+            result['success'] = True
+        self.log(f'Uploading log file to disk with overwrite...', True)
+        response = await self.__uploader.upload_local_file(file_path=log_file_path, folder=(folder + '/'))
+        if response['success']:
+            self.log(f'Log file uploaded to disk', True)
+        else:
+            self.log(f'Uploading log file error. {response["message"]}', True)
+        return result
+
+    async def list_disk(self):
+        if not self.__initialized:
+            self.log('\nError: not initialized.', True)
+            return {'object': None, 'success': False, 'message': 'Error: not initialized'}
+        self.log('\nPrinting files list on Yandex disk...', True)
+        result = (await self.__uploader.list_files(50))['object']
+        self.log(result, True, sep='\n')
+        return result
+
+    async def get_user_vk_status(self, user_id=None):
+        if not self.__initialized:
+            self.log('\nError: not initialized.', True)
+            return ''
+        result = await self.__client.get_user_status(user_id)
+        if result['success']:
+            self.log(f'\nVK user status: {result["object"]}', True)
+            return result["object"]
+        else:
+            self.log(f'\nVK user status: {result["message"]}', True)
+            return ''
+
+    async def delete_file(self, file_path: str):
+        if not self.__initialized:
+            self.log('\nError: not initialized.', True)
+            return {'object': None, 'success': False, 'message': 'Error: not initialized'}
+        self.log('\nTry to delete file or folder: ' + file_path, True)
+        result = await self.__uploader.delete_file(file_path)
+        if result['success']:
+            self.log(f'File/Folder deleted: {file_path}', True)
+        else:
+            self.log(f'File/Folder delete error: {result["message"]}', True)
+        return result
+
+    async def get_file_info(self, file_path: str):
+        if not self.__initialized:
+            self.log('\nError: not initialized', True)
+            return {'object': None, 'success': False, 'message': 'Error: not initialized'}
+        self.log(f'\nChecking if file/folder "{file_path}" is exist...', True)
+        result = await self.__uploader.get_file_info(file_path)
+        if result['success']:
+            self.log(f'File/Folder present: {file_path}', True)
+        else:
+            self.log(f'File/Folder not found: {result["message"]}', True)
+        return result
+
+    async def close(self):
+        await self.__session.close()
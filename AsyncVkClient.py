@@ -0,0 +1,278 @@
+from VkClient import VkClient
+from SocialGraph import SocialGraph
+from AsyncHttpSession import AsyncHttpSession
+from Logger import Logger
+from Metrics import Metrics
+from RateLimiter import RateLimiter
+from ResponseDecoder import ResponseDecoder
+from RetryPolicy import CircuitOpenError, RetryPolicy
+
+
+class AsyncVkClient:
+    """
+    Asyncio counterpart of VkClient with the same methods and the same result contract.
+    Client can't make requests in constructor, so use "await AsyncVkClient.create(...)" or call "await init()"
+    """
+    __API_BASE_URL = 'https://api.vk.com/method/'
+    __DECODER = ResponseDecoder(error_getter=lambda content: VkClient.get_api_error(content))
+    # decodes responses without error check, so error code can be checked before retry
+    __RAW_DECODER = ResponseDecoder()
+
+    def __init__(self, token: str, user_id=None, version: str = '5.124', debug_mode=False,
+                 session: AsyncHttpSession = None, user: dict = None, api_base_url: str = None,
+                 rate_limiter: RateLimiter = None, retry_policy: RetryPolicy = None, metrics: Metrics = None):
+        """
+        :param user: known user info from users.get with domain field, then client is initialized without init()
+        :param api_base_url: API URL, e.g. of local mock server, VK API by default
+        :param rate_limiter: requests budget, by default the same one as of VkClient with the same token
+        :param retry_policy: retries of throttled requests and connection errors, see VkClient
+        :param metrics: Metrics registry, shared one is used by default
+        """
+        self.__debug_mode = debug_mode
+        self.__logger = Logger(type(self).__name__, debug_mode)
+        self.__vksite = 'https://vk.com/'
+        self.__token = token
+        self.__version = version
+        self.__headers = {'User-Agent': 'Netology'}
+        self.__params = {'access_token': self.__token, 'v': self.__version}
+        self.__http = session if session is not None else AsyncHttpSession()
+        self.__api_base_url = api_base_url or self.__API_BASE_URL
+        # limiter, retries and metrics are the same as in VkClient, waiting doesn't block event loop
+        if rate_limiter is None:
+            rate_limiter = RateLimiter.for_token('vk', token, VkClient.DEFAULT_RATE)
+        self.__rate_limiter = rate_limiter
+        self.__metrics = metrics if metrics is not None else Metrics.get_default()
+        self.__retry_policy = retry_policy if retry_policy is not None \
+            else RetryPolicy.for_vk(self.__api_base_url, token, metrics=self.__metrics)
+        # requests are retried by __call only, as VK throttling errors come with HTTP 200
+        self.__session = self.__http.bind(self.__api_base_url, params=self.__params, headers=self.__headers,
+                                          limiter=rate_limiter, metrics=self.__metrics, service='vk')
+        self.__requested_user_id = user_id
+        self.__initialized = False
+        self.__user_id = None
+        self.__first_name = None
+        self.__last_name = None
+        self.__domain = None
+        self.__status = f'{type(self).__name__} not initialised'
+        if user is not None:
+            self.__set_user({'object': [user], 'success': True, 'message': ''})
+
+    @classmethod
+    async def create(cls, token: str, user_id=None, version: str = '5.124', debug_mode=False,
+                     session: AsyncHttpSession = None, api_base_url: str = None, rate_limiter: RateLimiter = None,
+                     retry_policy: RetryPolicy = None, metrics: Metrics = None):
+        client = cls(token, user_id, version, debug_mode, session, api_base_url=api_base_url,
+                     rate_limiter=rate_limiter, retry_policy=retry_policy, metrics=metrics)
+        await client.init()
+        return client
+
+    async def init(self):
+        """
+        Checks token and loads user info, the same way as VkClient constructor does
+        :return: True if client initialized
+        """
+        # below line needed for get_users only
+        self.__initialized = True
+        self.__set_user(await self.get_users(user_ids=self.__requested_user_id))
+        return self.__initialized
+
+    def __set_user(self, user: dict):
+        is_deactivated = False
+        if user['success']:
+            is_deactivated = user['object'][0].get('deactivated', False)
+        if user['success'] and not is_deactivated:
+            self.__initialized = True
+            self.__user_id = str(user['object'][0]['id'])
+            self.__first_name = user['object'][0]['first_name']
+            self.__last_name = user['object'][0]['last_name']
+            self.__domain = user['object'][0]['domain']
+            self.__status = f'{type(self).__name__} initialised with user: ' \
+                            f'{self.__first_name} {self.__last_name} (#{self.__user_id})'
+        else:
+            self.__initialized = False
+            if is_deactivated:
+                user['message'] = 'User ' + str(is_deactivated)
+            # error message will be in status
+            self.__status = f'{type(self).__name__} init failed: ' + user['message']
+        self.log(self.__status, True)
+
+    def log(self, message, is_debug_msg=False, sep=' '):
+        self.__logger.log(message, is_debug_msg, sep)
+
+    def is_initialized(self):
+        return self.__initialized
+
+    def get_id(self):
+        return self.__user_id
+
+    def get_fname(self):
+        return self.__first_name
+
+    def get_lname(self):
+        return self.__last_name
+
+    def get_domain(self):
+        return self.__domain
+
+    def get_status(self):
+        return self.__status
+
+    def get_session(self):
+        return self.__http
+
+    def get_rate_limiter(self):
+        return self.__rate_limiter
+
+    def get_retry_policy(self):
+        return self.__retry_policy
+
+    def get_metrics(self):
+        return self.__metrics
+
+    def __str__(self):
+        if not self.__user_id:
+            return self.__status
+        return self.__vksite + self.__domain
+
+    async def __and__(self, other):
+        # coroutine is returned, so usage is "await (client1 & client2)"
+        # the same checks, response parsing and chunks as in VkClient, see SocialGraph
+        pair = SocialGraph.get_pair(self, other)
+        if pair is None:
+            return False
+        if pair[0] == pair[1]:
+            # mutual friends are defined for two different users only
+            return []
+        mutual = await self.get_mutual_friends(friends_ids=[pair[1]], user_id=pair[0])
+        if not mutual['success']:
+            return False
+        friends_ids = list(SocialGraph.parse_mutual(mutual['object']).get(pair[1], ()))
+        self.__logger.debug('Let\'s get %d mutual friends...', len(friends_ids))
+        # profiles are loaded in bulk, so new clients make no requests
+        result = []
+        # requests are spaced by rate limiter
+        for chunk in SocialGraph.iter_chunks(friends_ids, VkClient.USERS_LIMIT):
+            users = await self.get_users(user_ids=chunk)
+            if not users['success']:
+                return False
+            result.extend(self.make_client(user) for user in users['object'])
+        return result
+
+    def make_client(self, user: dict):
+        """
+        :param user: user info from users.get with domain field
+        :return: initialized AsyncVkClient of user with the same token and session, see VkClient.make_client
+        """
+        return AsyncVkClient(self.__token, user['id'], self.__version, self.__debug_mode, self.__http, user=user,
+                             api_base_url=self.__api_base_url, rate_limiter=self.__rate_limiter,
+                             retry_policy=self.__retry_policy, metrics=self.__metrics)
+
+    @staticmethod
+    def get_auth_link(app_id: str, scope='status'):
+        return VkClient.get_auth_link(app_id=app_id, scope=scope)
+
+    @staticmethod
+    def prepare_params(params):
+        return VkClient.prepare_params(params)
+
+    @staticmethod
+    def get_response_content(response, path='response', sep=','):
+        return VkClient.get_response_content(response, path=path, sep=sep)
+
+    def __get_retry_after(self, sent: tuple):
+        # HTTP 429 and 503 can have Retry-After header
+        retry_after, result = sent
+        if retry_after is not None:
+            return retry_after
+        if result['success'] and self.__retry_policy.is_retryable_error(VkClient.get_api_error_code(result['object'])):
+            # VK gives no hint how long to wait, so backoff delay is used
+            return 0.0
+        return None
+
+    async def __call(self, method: str, path='response', items_prefix='', fields=None, **kwargs):
+        """
+        Sends GET request to API method, retries it and decodes the last response, see VkClient.__call
+        :return: the same as get_response_content
+        """
+        async def send():
+            response = await self.__session.get(method, **kwargs)
+            retry_after = self.__retry_policy.get_response_retry_after(response)
+            return retry_after, self.__RAW_DECODER.decode(response, '', items_prefix=items_prefix, fields=fields)
+        try:
+            result = (await self.__retry_policy.run_async(send, self.__get_retry_after, self.__rate_limiter,
+                                                          self.__session.get_connection_errors()))[1]
+        except (*self.__session.get_connection_errors(), CircuitOpenError) as e:
+            # connection errors after the last attempt and open circuit are reported as any other failure
+            self.__logger.debug('Request %s failed: %s', method, e)
+            return {'object': None, 'success': False, 'message': f'Request failed: {type(e).__name__}: {e}'}
+        if not result['success']:
+            return result
+        code = VkClient.get_api_error_code(result['object'])
+        if code is not None:
+            self.__metrics.inc('api_errors_total', service='vk', method=method, code=code)
+        return self.__DECODER.finish(result['object'], path)
+
+    async def get_user_photos(self,
+                              user_id: str = None, album_id='profile', photo_sizes=True, count=50, offset=0,
+                              extended=True, fields: list = None):
+        """
+        Receive all photos links in JSON format, see VkClient.get_user_photos
+        """
+        if not self.__initialized:
+            self.log('Error: not initialized.', True)
+            return {'object': None, 'success': False, 'message': f'Error: {type(self).__name__} not initialized'}
+        params = {'photo_sizes': photo_sizes, 'count': count, 'offset': offset, 'extended': extended}
+        if not user_id:
+            user_id = self.__user_id
+        params.update({'user_id': self.prepare_params(user_id)})
+        if album_id:
+            params.update({'album_id': self.prepare_params(album_id)})
+        return await self.__call('photos.get', 'response', items_prefix='response.items.item', fields=fields,
+                                 params=params)
+
+    async def get_user_status(self, user_id: str = None):
+        """
+        This method gets user status, see VkClient.get_user_status
+        """
+        if not self.__initialized:
+            self.log('Error: not initialized.', True)
+            return {'object': None, 'success': False, 'message': f'Error: {type(self).__name__} not initialized'}
+        if not user_id:
+            user_id = self.__user_id
+        params = {}
+        if user_id:
+            params = {'user_id': self.prepare_params(user_id)}
+        return await self.__call('status.get', 'response,text', params=params)
+
+    async def get_users(self, fields: [str] = None, user_ids: [str] = None):
+        """
+        This method receive users info by their ID's, see VkClient.get_users
+        """
+        if fields is None:
+            fields = ['domain']
+        if not self.__initialized:
+            self.log('Error: not initialized.', True)
+            return {'object': None, 'success': False, 'message': f'Error: {type(self).__name__} not initialized'}
+        params = {}
+        if fields:
+            params.update({'fields': self.prepare_params(fields)})
+        if user_ids:
+            params.update({'user_ids': self.prepare_params(user_ids)})
+        return await self.__call('users.get', params=params)
+
+    async def get_mutual_friends(self, friends_ids=None, user_id=None):
+        """
+        This method returns target users and their common friends with specified user,
+        see VkClient.get_mutual_friends
+        """
+        if not self.__initialized:
+            self.log('Error: not initialized.', True)
+            return {'object': None, 'success': False, 'message': f'Error: {type(self).__name__} not initialized'}
+        if not user_id:
+            user_id = self.__user_id
+        params = {}
+        if friends_ids:
+            params.update({'target_uids': self.prepare_params(friends_ids)})
+        if user_id:
+            params.update({'source_uid': user_id})
+        return await self.__call('friends.getMutual', params=params)
@@ -0,0 +1,253 @@
+import asyncio
+import time
+from YaUploader import YaUploader
+from Metrics import Metrics
+from OperationTracker import OperationTracker
+from RateLimiter import RateLimiter
+from RetryPolicy import RetryPolicy
+from UploadStream import UploadStream
+from AsyncHttpSession import AsyncHttpSession
+from Logger import Logger
+
+
+class AsyncYaUploader:
+    """
+    Asyncio counterpart of YaUploader with the same methods and the same result contract.
+    Uploader can't make requests in constructor, so use "await AsyncYaUploader.create(...)" or call "await init()"
+    """
+    def __init__(self, token: str, debug_mode=False, session: AsyncHttpSession = None, api_base_url: str = None,
+                 rate_limiter: RateLimiter = None, retry_policy: RetryPolicy = None, metrics: Metrics = None):
+        """
+        :param api_base_url: API URL, e.g. of local mock server, Yandex disk API by default
+        :param rate_limiter: requests budget, by default the same one as of YaUploader with the same token
+        :param retry_policy: retries of throttled requests and connection errors, see YaUploader
+        :param metrics: Metrics registry, shared one is used by default
+        """
+        self.__debug_mode = debug_mode
+        self.__logger = Logger(type(self).__name__, debug_mode)
+        self.__token = token
+        self.__api_base_url = api_base_url or 'https://cloud-api.yandex.net:443'
+        self.__headers = {'User-Agent': 'Netology', 'Authorization': 'OAuth ' + self.__token}
+        self.__delay = 0.3
+        self.__http = session if session is not None else AsyncHttpSession()
+        # limiter, retries and metrics are the same as in YaUploader, waiting doesn't block event loop
+        if rate_limiter is None:
+            rate_limiter = RateLimiter.for_token('ya', token, YaUploader.DEFAULT_RATE)
+        self.__rate_limiter = rate_limiter
+        self.__metrics = metrics if metrics is not None else Metrics.get_default()
+        self.__retry_policy = retry_policy if retry_policy is not None \
+            else RetryPolicy.for_yandex(self.__api_base_url, token, metrics=self.__metrics)
+        self.__session = self.__http.bind(self.__api_base_url, headers=self.__headers, limiter=rate_limiter,
+                                          retry=self.__retry_policy, metrics=self.__metrics, service='ya')
+        self.__initialized = False
+        self.__display_name = None
+        self.__status = f'{type(self).__name__} not initialised'
+
+    @classmethod
+    async def create(cls, token: str, debug_mode=False, session: AsyncHttpSession = None, api_base_url: str = None,
+                     rate_limiter: RateLimiter = None, retry_policy: RetryPolicy = None, metrics: Metrics = None):
+        uploader = cls(token, debug_mode, session, api_base_url, rate_limiter, retry_policy, metrics)
+        await uploader.init()
+        return uploader
+
+    async def init(self):
+        """
+        Checks token and loads disk owner name, the same way as YaUploader constructor does
+        :return: True if uploader initialized
+        """
+        # below line needed for get_disk_info only
+        self.__initialized = True
+        info = await self.get_disk_info()
+        if info['success']:
+            self.__display_name = info['object']['user']['display_name']
+            self.__status = f'{type(self).__name__} initialised with user: {self.__display_name}'
+        else:
+            self.__initialized = False
+            self.__status = f'{type(self).__name__} init failed: ' + info['message']
+        self.log(self.__status, True)
+        return self.__initialized
+
+    def log(self, message, is_debug_msg=False, sep=' '):
+        self.__logger.log(message, is_debug_msg, sep)
+
+    def is_initialized(self):
+        return self.__initialized
+
+    def get_status(self):
+        return self.__status
+
+    def get_session(self):
+        return self.__http
+
+    def get_rate_limiter(self):
+        return self.__rate_limiter
+
+    def get_retry_policy(self):
+        return self.__retry_policy
+
+    def get_metrics(self):
+        return self.__metrics
+
+    @staticmethod
+    def convert_bytes(size, precision=2):
+        return YaUploader.convert_bytes(size, precision)
+
+    @staticmethod
+    def get_response_content(response, path='', sep=','):
+        return YaUploader.get_response_content(response, path=path, sep=sep)
+
+    async def get_disk_info(self):
+        """
+        Service method is suitable for quick check Yandex token, see YaUploader.get_disk_info
+        """
+        if not self.__initialized:
+            self.log('Error: not initialized', True)
+            return {'object': None, 'success': False, 'message': f'Error: {type(self).__name__} not initialized'}
+        response = await self.__session.get('/v1/disk')
+        return self.get_response_content(response)
+
+    async def create_folder(self, folder_name: str):
+        """
+        Creates folder at Yandex Disk with specified name, see YaUploader.create_folder
+        """
+        if not self.__initialized:
+            self.log('Error: not initialized', True)
+            return {'object': None, 'success': False, 'message': f'Error: {type(self).__name__} not initialized'}
+        if not folder_name:
+            folder_name = '/'
+        params = {'path': folder_name}
+        response = await self.__session.put('/v1/disk/resources', params=params)
+        return self.get_response_content(response)
+
+    async def upload_local_file(self, file_path: str, folder: str = '', disk_name: str = None,
+                                chunk_size=UploadStream.CHUNK_SIZE, progress=None):
+        """
+        This method uploads local file to Yandex disk as raw body chunk by chunk, see YaUploader.upload_local_file.
+        File is opened and read in executor, so event loop is not blocked by disk reads
+        """
+        if not self.__initialized:
+            self.log('Error: not initialized', True)
+            return {'object': None, 'success': False, 'message': f'Error: {type(self).__name__} not initialized'}
+        if not file_path:
+            self.log('Error: file name is empty', True)
+            return {'object': None, 'success': False, 'message': f'File name is empty'}
+        stream = await asyncio.get_running_loop().run_in_executor(None, UploadStream.from_file, file_path,
+                                                                  chunk_size, progress)
+        try:
+            # first we have to get upload link
+            params = {'path': folder + (disk_name or file_path), 'overwrite': True}
+            response = await self.__session.get('/v1/disk/resources/upload', params=params)
+            upload_link = self.get_response_content(response)
+            if not upload_link['success']:
+                return upload_link
+            # size is known, so body is sent with Content-Length instead of chunked encoding, as in YaUploader
+            response = await self.__session.put(upload_link['object']['href'], data=stream,
+                                                headers={'Content-Length': str(stream.get_size())})
+        finally:
+            stream.close()
+        result = self.get_response_content(response)
+        if result['success']:
+            result['object'] = stream.get_stats()
+        return result
+
+    async def list_files(self, limit=20):
+        """
+        This method show files list at Yandex disk, see YaUploader.list_files
+        """
+        if not self.__initialized:
+            self.log('Error: not initialized', True)
+            return {'object': None, 'success': False, 'message': f'Error: {type(self).__name__} not initialized'}
+        result = {'object': [], 'success': False, 'message': ''}
+        offset = 0
+        while True:
+            self.__logger.debug('requesting %d files with offset %d...', limit, offset)
+            params = {'limit': limit, 'fields': 'path, size', 'offset': offset}
+            response = self.get_response_content(await self.__session.get('/v1/disk/resources/files', params=params))
+            if not response['success']:
+                # in case of partial loading 'success' will be True, but message will contain an error
+                result['message'] = response['message']
+                break
+            items = response['object']['items']
+            if len(items) < 1:
+                result['success'] = response['success']
+                break
+            result['object'] += [f'{x["path"][5:]} ({self.convert_bytes(int(x["size"]))})'
+                                 for x in items]
+            # if returned less files than we requested, means that no more files left
+            if len(items) < limit:
+                break
+            offset += limit
+        return result
+
+    async def upload_remote_file(self, file_path: str, url: str):
+        """
+        Uploads files to Yandex disk using url link, see YaUploader.upload_remote_file
+        """
+        if not self.__initialized:
+            self.log('Error: not initialized', True)
+            return {'object': None, 'success': False, 'message': f'Error: {type(self).__name__} not initialized'}
+        if not url:
+            self.log('Error: url is empty', True)
+            return {'object': None, 'success': False, 'message': f'URL is empty'}
+        params = {'path': file_path, 'url': url}
+        response = await self.__session.post('/v1/disk/resources/upload', params=params)
+        return self.get_response_content(response)
+
+    async def delete_file(self, file_path: str):
+        """
+        Delete file from Yandex Disk, see YaUploader.delete_file
+        """
+        if not self.__initialized:
+            self.log('Error: not initialized', True)
+            return {'object': None, 'success': False, 'message': f'Error: {type(self).__name__} not initialized'}
+        if not file_path:
+            self.log('Error: file/folder name is empty.', True)
+            return {'object': None, 'success': False, 'message': f'File/folder name is empty'}
+        params = {'path': file_path, 'permanently': True, 'force_async': False}
+        response = self.get_response_content(await self.__session.delete('/v1/disk/resources', params=params))
+        # if delete operation scheduled (code 202), otherwise will be 204
+        if response['success'] and response['object']:
+            await self.get_operation_status(response['object']['href'])
+        return response
+
+    async def get_file_info(self, file_path: str):
+        """
+        Get file info on Yandex disk, see YaUploader.get_file_info
+        """
+        if not self.__initialized:
+            self.log('Error: not initialized', True)
+            return {'object': None, 'success': False, 'message': f'Error: {type(self).__name__} not initialized'}
+        if not file_path:
+            file_path = '/'
+        params = {'path': file_path}
+        response = await self.__session.get('/v1/disk/resources', params=params)
+        return self.get_response_content(response)
+
+    async def get_operation_status(self, url: str, timeout=30):
+        """
+        Waiting operation for checking async actions (copy, move, delete) on disk without blocking event loop.
+        Operation is checked with the same exponential backoff and jitter as in YaUploader.get_operation_status
+        :param url: async operation URL
+        :param timeout: max waiting time in seconds
+        """
+        if not self.__initialized:
+            self.log('Error: not initialized', True)
+            return {'object': None, 'success': False, 'message': f'Error: {type(self).__name__} not initialized'}
+        if not url:
+            self.log('Error: URL is empty.', True)
+            return {'object': None, 'success': False, 'message': f'URL is empty'}
+        started = time.monotonic()
+        attempt = 0
+        while True:
+            timer = OperationTracker.get_backoff_delay(attempt, self.__delay)
+            if time.monotonic() - started + timer > timeout:
+                return {'object': None, 'success': False, 'message': 'Timeout reached'}
+            await asyncio.sleep(timer)
+            self.__logger.debug('Checking %s', url)
+            response = self.get_response_content(await self.__session.get(url))
+            if response['success'] and response['object']['status'] == 'success':
+                return {'object': None, 'success': True, 'message': ''}
+            elif response['success'] and response['object']['status'] == 'failed':
+                return {'object': None, 'success': False, 'message': 'Operation was not successful'}
+            attempt += 1
+            self.__logger.debug('Check failed. Next attempt #%d', attempt + 1)
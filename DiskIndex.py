@@ -0,0 +1,223 @@
+import sqlite3
+import threading
+import time
+from Logger import Logger
+
+
+class DiskIndex:
+    """
+    Persistent local index of Yandex disk files (path, size, md5, sha256, modified). Existence and collision checks
+    are served from SQLite instead of one API request per path. Index is refreshed incrementally from
+    the last uploaded files feed, full refresh walks whole files list with big pages
+    """
+    def __init__(self, uploader, db_path='disk_index.db', page_size=1000, debug_mode=False):
+        """
+        :param uploader: YaUploader instance, used for refresh
+        :param db_path: path of SQLite database file, ':memory:' can be used for one-time runs
+        :param page_size: files count per API request during refresh
+        """
+        self.__uploader = uploader
+        self.__db_path = db_path
+        self.__page_size = page_size
+        self.__debug_mode = debug_mode
+        self.__logger = Logger(type(self).__name__, debug_mode)
+        self.__lock = threading.Lock()
+        self.__connection = sqlite3.connect(db_path, check_same_thread=False)
+        self.__connection.execute('PRAGMA journal_mode=WAL')
+        self.__connection.execute('PRAGMA synchronous=NORMAL')
+        self.__connection.execute('CREATE TABLE IF NOT EXISTS resources ('
+                                  'path TEXT PRIMARY KEY, folder TEXT NOT NULL, name TEXT NOT NULL, size INTEGER, '
+                                  'md5 TEXT, sha256 TEXT, modified TEXT, indexed REAL NOT NULL)')
+        self.__connection.execute('CREATE INDEX IF NOT EXISTS resources_folder ON resources (folder)')
+        self.__connection.execute('CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)')
+        self.__connection.commit()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def log(self, message, is_debug_msg=False, sep=' '):
+        self.__logger.log(message, is_debug_msg, sep)
+
+    @staticmethod
+    def normalize_path(path: str):
+        """
+        Makes one form of disk path: "disk:/Test/1.jpg", "/Test/1.jpg" and "Test/1.jpg" become "Test/1.jpg"
+        """
+        if path.startswith('disk:'):
+            path = path[5:]
+        return path.strip('/')
+
+    @staticmethod
+    def __to_row(item: dict):
+        path = DiskIndex.normalize_path(item['path'])
+        folder, _, name = path.rpartition('/')
+        return (path, folder, name, item.get('size'), item.get('md5'), item.get('sha256'), item.get('modified'),
+                time.time())
+
+    @staticmethod
+    def __to_dict(row):
+        return {'path': row[0], 'folder': row[1], 'name': row[2], 'size': row[3], 'md5': row[4], 'sha256': row[5],
+                'modified': row[6]}
+
+    def __get_meta(self, key: str):
+        row = self.__connection.execute('SELECT value FROM meta WHERE key=?', (key,)).fetchone()
+        return row[0] if row else None
+
+    def __set_meta(self, key: str, value):
+        self.__connection.execute('INSERT OR REPLACE INTO meta VALUES (?, ?)', (key, str(value)))
+
+    def add(self, items: list):
+        """
+        Adds or updates files in index, e.g. right after they were uploaded
+        :param items: list of file dicts with "path" and optional "size", "md5", "sha256", "modified"
+        """
+        with self.__lock:
+            self.__connection.executemany('INSERT OR REPLACE INTO resources VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                                          [self.__to_row(item) for item in items])
+            modified = max([item['modified'] for item in items if item.get('modified')], default=None)
+            if modified and modified > (self.__get_meta('last_modified') or ''):
+                self.__set_meta('last_modified', modified)
+            self.__connection.commit()
+
+    def remove(self, path: str):
+        """
+        Removes file or folder with all its files from index
+        :param path: disk path
+        """
+        path = self.normalize_path(path)
+        with self.__lock:
+            self.__connection.execute('DELETE FROM resources WHERE path=? OR path LIKE ? ESCAPE \'\\\'',
+                                      (path, self.__escape_like(path) + '/%'))
+            self.__connection.commit()
+
+    @staticmethod
+    def __escape_like(value: str):
+        return value.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+    def refresh(self, full=False):
+        """
+        Refreshes index from disk. Incremental refresh reads last uploaded files until already indexed ones,
+        full refresh rereads whole files list and drops files which were deleted on disk
+        :param full: if True or if index was never refreshed, full refresh is made
+        :return: {'object': 'count of added or updated files', 'success': 'True if refresh finished',
+                 'message': 'contains error string if any or empty string'}
+        """
+        with self.__lock:
+            last_modified = self.__get_meta('last_modified')
+            is_empty = self.__get_meta('full_refresh') is None
+        if full or is_empty:
+            return self.__refresh_full()
+        self.log(f'Refreshing disk index with files modified after {last_modified}...', True)
+        response = self.__uploader.get_last_uploaded(self.__page_size)
+        if not response['success']:
+            return {'object': 0, 'success': False, 'message': response['message']}
+        items = [item for item in response['object'] if (item.get('modified') or '') > (last_modified or '')]
+        if items:
+            self.add(items)
+        # if every file in feed is new, feed may be too short to cover all changes, so full refresh is needed
+        if len(items) == len(response['object']) == self.__page_size:
+            return self.__refresh_full()
+        return {'object': len(items), 'success': True, 'message': ''}
+
+    def __refresh_full(self):
+        self.log('Full refresh of disk index...', True)
+        started = time.time()
+        offset = 0
+        count = 0
+        while True:
+            response = self.__uploader.get_files_page(self.__page_size, offset)
+            if not response['success']:
+                return {'object': count, 'success': False, 'message': response['message']}
+            items = response['object']
+            if items:
+                self.add(items)
+            count += len(items)
+            # if returned less files than we requested, means that no more files left
+            if len(items) < self.__page_size:
+                break
+            offset += self.__page_size
+        with self.__lock:
+            # files which were not seen during refresh are deleted from disk
+            self.__connection.execute('DELETE FROM resources WHERE indexed < ?', (started,))
+            self.__set_meta('full_refresh', started)
+            self.__connection.commit()
+        self.log(f'Disk index contains {count} files', True)
+        return {'object': count, 'success': True, 'message': ''}
+
+    def get(self, path: str):
+        """
+        :param path: disk path of file
+        :return: file dict or None if file is not in index
+        """
+        with self.__lock:
+            row = self.__connection.execute('SELECT * FROM resources WHERE path=?',
+                                            (self.normalize_path(path),)).fetchone()
+        return self.__to_dict(row) if row else None
+
+    def exists(self, path: str):
+        """
+        :param path: disk path of file or folder (folder is found if it contains at least one file)
+        :return: True if file or not empty folder is in index
+        """
+        path = self.normalize_path(path)
+        with self.__lock:
+            row = self.__connection.execute('SELECT 1 FROM resources WHERE path=? OR folder=? OR folder LIKE ? '
+                                            'ESCAPE \'\\\' LIMIT 1',
+                                            (path, path, self.__escape_like(path) + '/%')).fetchone()
+        return row is not None
+
+    def list_folder(self, folder: str, recursive=False):
+        """
+        :param folder: disk path of folder
+        :param recursive: if True, files of subfolders are returned too
+        :return: list of file dicts sorted by path
+        """
+        folder = self.normalize_path(folder)
+        with self.__lock:
+            if recursive and not folder:
+                rows = self.__connection.execute('SELECT * FROM resources ORDER BY path').fetchall()
+            elif recursive:
+                rows = self.__connection.execute('SELECT * FROM resources WHERE folder=? OR folder LIKE ? '
+                                                 'ESCAPE \'\\\' ORDER BY path',
+                                                 (folder, self.__escape_like(folder) + '/%')).fetchall()
+            else:
+                rows = self.__connection.execute('SELECT * FROM resources WHERE folder=? ORDER BY path',
+                                                 (folder,)).fetchall()
+        return [self.__to_dict(row) for row in rows]
+
+    def get_names(self, folder: str):
+        """
+        :param folder: disk path of folder
+        :return: set of file names in folder, suitable for collision checks
+        """
+        with self.__lock:
+            rows = self.__connection.execute('SELECT name FROM resources WHERE folder=?',
+                                             (self.normalize_path(folder),)).fetchall()
+        return {row[0] for row in rows}
+
+    def find_by_hash(self, md5: str = None, sha256: str = None):
+        """
+        :return: list of file dicts with the same content hash
+        """
+        with self.__lock:
+            if sha256:
+                rows = self.__connection.execute('SELECT * FROM resources WHERE sha256=?', (sha256,)).fetchall()
+            else:
+                rows = self.__connection.execute('SELECT * FROM resources WHERE md5=?', (md5,)).fetchall()
+        return [self.__to_dict(row) for row in rows]
+
+    def get_stats(self):
+        """
+        :return: dict with files count, total size and time of the last full refresh
+        """
+        with self.__lock:
+            count, size = self.__connection.execute('SELECT COUNT(*), SUM(size) FROM resources').fetchone()
+            full_refresh = self.__get_meta('full_refresh')
+        return {'files': count, 'size': size or 0, 'full_refresh': float(full_refresh) if full_refresh else None}
+
+    def close(self):
+        with self.__lock:
+            self.__connection.close()
@@ -0,0 +1,186 @@
+import re
+import time
+from urllib.parse import urlparse
+import requests
+from requests.adapters import HTTPAdapter
+
+
+class HttpSession:
+    """
+    Pooled keep-alive HTTP session. One instance can be shared between VkClient, YaUploader and ImageSaver,
+    so the whole process reuses warm TCP/TLS connections instead of a new handshake on every request
+    """
+    def __init__(self, pool_connections=10, pool_maxsize=10, max_retries=0, timeout=(3.05, 30), pool_block=False,
+                 host_limits: dict = None):
+        """
+        :param pool_connections: number of per-host connection pools to keep
+        :param pool_maxsize: max kept-alive connections per host
+        :param max_retries: low-level connection retries (DNS, refused connection), not HTTP errors
+        :param timeout: default (connect, read) timeout in seconds for every request
+        :param pool_block: if True, wait for a free connection instead of opening an extra one over pool_maxsize
+        :param host_limits: per-host pool sizes, e.g. {'https://api.vk.com': 3}, overrides pool_maxsize for host
+        """
+        self.__timeout = timeout
+        self.__pool_connections = pool_connections
+        self.__pool_block = pool_block
+        self.__max_retries = max_retries
+        self.__session = requests.Session()
+        self.__session.mount('https://', self.__make_adapter(pool_maxsize))
+        self.__session.mount('http://', self.__make_adapter(pool_maxsize))
+        for prefix, maxsize in (host_limits or {}).items():
+            self.set_host_limit(prefix, maxsize)
+
+    def __make_adapter(self, pool_maxsize):
+        return HTTPAdapter(pool_connections=self.__pool_connections, pool_maxsize=pool_maxsize,
+                           max_retries=self.__max_retries, pool_block=self.__pool_block)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def set_host_limit(self, prefix: str, pool_maxsize: int):
+        """
+        Limits kept-alive connections for all URLs started with prefix
+        :param prefix: URL prefix, e.g. 'https://cloud-api.yandex.net'
+        :param pool_maxsize: max connections to this host
+        """
+        self.__session.mount(prefix, self.__make_adapter(pool_maxsize))
+
+    def get_timeout(self):
+        return self.__timeout
+
+    def request(self, method: str, url: str, timeout=None, **kwargs):
+        if timeout is None:
+            timeout = self.__timeout
+        return self.__session.request(method, url, timeout=timeout, **kwargs)
+
+    def bind(self, base_url='', params: dict = None, headers: dict = None, timeout=None, limiter=None, retry=None,
+             metrics=None, service=''):
+        """
+        Returns lightweight view of this session with base URL, params and headers attached once
+        :param base_url: prefix for relative paths
+        :param params: query params sent with every request (e.g. access token and API version)
+        :param headers: headers sent with every request (e.g. authorization)
+        :param timeout: overrides session timeout for this view
+        :param limiter: RateLimiter, which is acquired before every request of this view
+        :param retry: RetryPolicy, which retries throttled requests (HTTP 429, 503) and connection errors
+        :param metrics: Metrics registry, which records count, latency and size of every request
+        :param service: service label of recorded requests, e.g. 'vk'
+        :return: BoundSession instance sharing this session connection pool
+        """
+        return BoundSession(self, base_url=base_url, params=params, headers=headers, timeout=timeout, limiter=limiter,
+                            retry=retry, metrics=metrics, service=service)
+
+    def close(self):
+        self.__session.close()
+
+
+class BoundSession:
+    """
+    View of HttpSession with base URL, params and headers of one API client attached
+    """
+    # path segments with IDs (at least 3 digits), e.g. operation IDs, are replaced in endpoint labels
+    __ID_SEGMENT = re.compile(r'/(?=[^/]*\d[^/]*\d[^/]*\d)[^/]+')
+
+    def __init__(self, http: HttpSession, base_url='', params: dict = None, headers: dict = None, timeout=None,
+                 limiter=None, retry=None, metrics=None, service=''):
+        self.__http = http
+        self.__base_url = base_url
+        self.__params = dict(params or {})
+        self.__headers = dict(headers or {})
+        self.__timeout = timeout
+        self.__limiter = limiter
+        self.__retry = retry
+        self.__metrics = metrics
+        self.__service = service
+
+    def get_http_session(self):
+        return self.__http
+
+    def get_base_url(self):
+        return self.__base_url
+
+    def get_limiter(self):
+        return self.__limiter
+
+    def get_retry_policy(self):
+        return self.__retry
+
+    def get_metrics(self):
+        return self.__metrics
+
+    @staticmethod
+    def get_endpoint(url: str):
+        """
+        :param url: absolute URL or path relative to base URL
+        :return: label of API method, e.g. 'photos.get' or '/v1/disk/operations/{id}'
+        """
+        if url.startswith(('http://', 'https://')):
+            url = urlparse(url).path
+        return BoundSession.__ID_SEGMENT.sub('/{id}', url)
+
+    def __send(self, method: str, url: str, endpoint: str, **kwargs):
+        if self.__limiter is not None:
+            self.__limiter.acquire()
+        if self.__metrics is None:
+            return self.__http.request(method, url, **kwargs)
+        started = time.perf_counter()
+        try:
+            response = self.__http.request(method, url, **kwargs)
+        except requests.exceptions.RequestException as e:
+            self.__metrics.record_request(self.__service, endpoint, type(e).__name__, time.perf_counter() - started)
+            raise
+        bytes_in = response.headers.get('Content-Length')
+        if bytes_in is None and not kwargs.get('stream'):
+            bytes_in = len(response.content)
+        self.__metrics.record_request(self.__service, endpoint, response.status_code, time.perf_counter() - started,
+                                      int(response.request.headers.get('Content-Length') or 0), int(bytes_in or 0))
+        return response
+
+    def __get_retry_after(self, response):
+        retry_after = self.__retry.get_response_retry_after(response)
+        if retry_after is not None:
+            # connection of throttled response is released before waiting
+            response.close()
+        return retry_after
+
+    def request(self, method: str, url: str, params: dict = None, headers: dict = None, **kwargs):
+        """
+        Sends request through shared connection pool
+        :param method: HTTP method
+        :param url: absolute URL or path relative to base URL
+        :param params: request params, merged over base params
+        :param headers: request headers, merged over base headers
+        :return: requests.Response object
+        """
+        endpoint = self.get_endpoint(url) if self.__metrics is not None else ''
+        if not url.startswith(('http://', 'https://')):
+            url = self.__base_url + url
+        if params:
+            params = {**self.__params, **params}
+        else:
+            params = self.__params
+        if headers:
+            headers = {**self.__headers, **headers}
+        else:
+            headers = self.__headers
+        kwargs.setdefault('timeout', self.__timeout)
+        # streamed bodies (files, iterators) can't be sent twice, so such requests are not retried
+        if self.__retry is None or not isinstance(kwargs.get('data'), (type(None), bytes, str, dict)):
+            return self.__send(method, url, endpoint, params=params, headers=headers, **kwargs)
+        return self.__retry.run(lambda: self.__send(method, url, endpoint, params=params, headers=headers, **kwargs),
+                                self.__get_retry_after, self.__limiter)
+
+    def get(self, url: str, **kwargs):
+        return self.request('GET', url, **kwargs)
+
+    def put(self, url: str, **kwargs):
+        return self.request('PUT', url, **kwargs)
+
+    def post(self, url: str, **kwargs):
+        return self.request('POST', url, **kwargs)
+
+    def delete(self, url: str, **kwargs):
+        return self.request('DELETE', url, **kwargs)
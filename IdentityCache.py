@@ -0,0 +1,113 @@
+import hashlib
+import threading
+import time
+
+
+class IdentityCache:
+    """
+    Thread-safe cache of successful token checks (VK users.get and Yandex disk info) with TTL, so clients
+    created again with the same token, e.g. by many jobs of JobRunner, don't repeat the check.
+    Concurrent checks of one key are made once: other callers wait for result of the first one.
+    Failed checks are not cached, as they can be temporary. Tokens are not kept in keys
+    """
+    __shared = None
+    __shared_lock = threading.Lock()
+
+    def __init__(self, ttl=600.0):
+        """
+        :param ttl: seconds while cached identity is valid, 0 means no caching
+        """
+        self.__ttl = ttl
+        self.__lock = threading.Lock()
+        # key -> (expiry time, identity)
+        self.__items = {}
+        # key -> Event of running check
+        self.__loading = {}
+        self.__hits = 0
+        self.__misses = 0
+
+    @classmethod
+    def get_shared(cls):
+        """
+        :return: cache shared by all clients which got no own cache
+        """
+        with cls.__shared_lock:
+            if cls.__shared is None:
+                cls.__shared = cls()
+            return cls.__shared
+
+    @staticmethod
+    def make_key(service: str, token: str, user_id=None):
+        """
+        :param service: API name, e.g. 'vk' or 'ya'
+        :param token: API token, only its hash is used
+        :param user_id: checked user ID, None means token owner
+        """
+        return f'{service}:{hashlib.sha256(token.encode()).hexdigest()[:16]}:{user_id or ""}'
+
+    def get_ttl(self):
+        return self.__ttl
+
+    def get_stats(self):
+        with self.__lock:
+            return {'items': len(self.__items), 'hits': self.__hits, 'misses': self.__misses}
+
+    def get(self, key: str):
+        """
+        :return: cached identity or None if it is absent or expired
+        """
+        with self.__lock:
+            item = self.__items.get(key)
+            if item is None:
+                return None
+            if item[0] <= time.monotonic():
+                del self.__items[key]
+                return None
+            return item[1]
+
+    def put(self, key: str, identity):
+        if self.__ttl <= 0:
+            return
+        with self.__lock:
+            self.__items[key] = (time.monotonic() + self.__ttl, identity)
+
+    def invalidate(self, key: str = None):
+        """
+        :param key: key to remove, None means all keys
+        """
+        with self.__lock:
+            if key is None:
+                self.__items.clear()
+            else:
+                self.__items.pop(key, None)
+
+    def load(self, key: str, loader):
+        """
+        Returns cached identity or checks token
+        :param key: see make_key
+        :param loader: callable without params which checks token and returns result dict
+                       {'object', 'success', 'message'}, only successful results are cached
+        :return: result dict of loader or cached result
+        """
+        while True:
+            with self.__lock:
+                item = self.__items.get(key)
+                if item is not None and item[0] > time.monotonic():
+                    self.__hits += 1
+                    return item[1]
+                event = self.__loading.get(key)
+                if event is None:
+                    event = self.__loading[key] = threading.Event()
+                    self.__misses += 1
+                    break
+            # the same check is running in other thread, its result is used if it succeeds
+            event.wait()
+        try:
+            result = loader()
+            if result['success']:
+                self.put(key, result)
+            return result
+        finally:
+            with self.__lock:
+                del self.__loading[key]
+            event.set()
@@ -1,32 +1,118 @@
+import itertools
+import queue
+import re
+import sys
+import threading
 import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
 import pathlib as pl
 from VkClient import VkClient
 from YaUploader import YaUploader
-import json
+from HttpSession import HttpSession
+from Logger import Logger
+from Metrics import Metrics
+from OperationTracker import OperationTracker
+from SyncManifest import SyncManifest
+from UploadOptions import UploadOptions
+from UploadLog import UploadLog
+from DiskIndex import DiskIndex
+from PhotoBatch import PhotoBatch
+from SizeSelector import SizeSelector
+from NameAllocator import NameAllocator
+from RateLimiter import RateLimiter
+from ResponseCache import ResponseCache
 
 
 class ImageSaver:
-    def __init__(self, token_vk: str, token_ya: str, uid_vk, debug_mode=False):
+    __DEFAULT_SELECTOR = SizeSelector()
+    # only these fields of VK photos are decoded, other ones (e.g. text, tags, reposts) are skipped
+    PHOTO_FIELDS = ['id', 'owner_id', 'date', 'likes', 'sizes']
+    # remote: Yandex fetches every URL itself, stream: photos are piped from VK to upload links by this process
+    TRANSFER_MODES = ('remote', 'stream')
+    # system albums returned by photos.getAlbums, photos.get accepts their names instead of IDs
+    SYSTEM_ALBUMS = {-6: 'profile', -7: 'wall', -15: 'saved'}
+    # album_id of jobs which back up all albums of account, see upload_account
+    ALL_ALBUMS = 'all'
+
+    def __init__(self, token_vk: str, token_ya: str, uid_vk, debug_mode=False, session: HttpSession = None,
+                 disk_index_path: str = None, stream_decode=False, size_policy='max', name_template='likes',
+                 vk_rate: float = None, ya_rate: float = None, vk_api_url: str = None, ya_api_url: str = None,
+                 metrics: Metrics = None, lazy=False, response_cache: ResponseCache = None, transfer_mode='remote',
+                 verify_checksums=False):
+        """
+        :param lazy: if True, tokens are checked on first use instead of constructor, see validate
+        :param response_cache: persistent cache of VK read responses, None means no caching
+        :param transfer_mode: how photos get to disk, see TRANSFER_MODES and set_transfer_mode
+        :param verify_checksums: if True, MD5 of every streamed photo is compared with MD5 reported by disk
+        """
         self.__debug_mode = debug_mode
+        self.__logger = Logger(type(self).__name__, debug_mode)
+        # clients and stages of this saver are measured in one registry, see Metrics
+        self.__metrics = metrics if metrics is not None else Metrics.get_default()
+        # see NameAllocator.TEMPLATES, e.g. 'likes' or 'likes_date'
+        self.__name_template = name_template
+        self.__size_selector = None
+        self.set_size_policy(size_policy)
+        self.__transfer_mode = None
+        self.set_transfer_mode(transfer_mode)
+        self.__verify_checksums = verify_checksums
+        # if True, VK pages are decoded while downloading: less memory for big albums, but more CPU time
+        self.__stream_decode = stream_decode
         self.log('\nCreating ImageSaver...', True)
-        self.__client = VkClient(token_vk, uid_vk, debug_mode=debug_mode)
-        self.__uploader = YaUploader(token_ya, debug_mode=debug_mode)
-        self.__types = {'s': 1, 'm': 2, 'x': 3, 'o': 4, 'p': 5, 'q': 6, 'r': 7, 'y': 8, 'z': 9, 'w': 10}
-        self.__delay = 0.3
-        if self.__client.is_initialized() and self.__uploader.is_initialized():
-            self.__status = f'{type(self).__name__} initialised.'
-            self.__initialized = True
-        else:
-            self.__status = f'{type(self).__name__} init failed.'
-            self.__initialized = False
-        self.log(self.__status, True)
+        # both clients share one connection pool, which can be shared with other ImageSaver instances as well
+        self.__session = session if session is not None else HttpSession()
+        # requests per second of every token, limiters are shared with other savers using the same tokens,
+        # if rate is not set, clients use their default rates
+        vk_limiter = RateLimiter.for_token('vk', token_vk, vk_rate) if vk_rate else None
+        ya_limiter = RateLimiter.for_token('ya', token_ya, ya_rate) if ya_rate else None
+        # API URLs are changed only for local mock servers, see benchmarks/end_to_end.py
+        # tokens are checked by validate, so both checks run at the same time
+        self.__client = VkClient(token_vk, uid_vk, debug_mode=debug_mode, session=self.__session,
+                                 rate_limiter=vk_limiter, api_base_url=vk_api_url, metrics=self.__metrics, lazy=True,
+                                 response_cache=response_cache)
+        self.__uploader = YaUploader(token_ya, debug_mode=debug_mode, session=self.__session, rate_limiter=ya_limiter,
+                                     api_base_url=ya_api_url, metrics=self.__metrics, lazy=True)
+        # local index of disk files answers existence checks without API requests
+        self.__disk_index = DiskIndex(self.__uploader, disk_index_path, debug_mode=debug_mode) \
+            if disk_index_path else None
+        self.__validate_lock = threading.Lock()
+        self.__validated = False
+        self.__initialized = False
+        self.__status = f'{type(self).__name__} is not validated yet'
+        if not lazy:
+            self.validate()
+
+    def validate(self):
+        """
+        Checks VK and Yandex tokens concurrently, only once per saver. Checks are cached in IdentityCache,
+        so savers created again with the same tokens make no requests. Lazy saver calls it on first use
+        :return: True if both clients are initialized
+        """
+        if self.__validated:
+            return self.__initialized
+        with self.__validate_lock:
+            if not self.__validated:
+                with ThreadPoolExecutor(max_workers=1) as executor:
+                    # Yandex token is checked in other thread while VK token is checked in this one
+                    uploader_initialized = executor.submit(self.__uploader.validate)
+                    client_initialized = self.__client.validate()
+                    self.__initialized = client_initialized and uploader_initialized.result()
+                if self.__initialized:
+                    self.__status = f'{type(self).__name__} initialised.'
+                else:
+                    self.__status = f'{type(self).__name__} init failed.'
+                self.__validated = True
+                self.log(self.__status, True)
+        return self.__initialized
 
     @staticmethod
     def get_auth_link(app_id: str, scope='status'):
         return VkClient.get_auth_link(app_id=app_id, scope=scope)
 
     def is_initialized(self):
-        return self.__initialized
+        return self.validate()
 
     def is_client_initialized(self):
         return self.__client.is_initialized()
@@ -34,84 +120,444 @@ class ImageSaver:
     def is_uploader_initialized(self):
         return self.__uploader.is_initialized()
 
+    def get_session(self):
+        return self.__session
+
+    def get_disk_index(self):
+        return self.__disk_index
+
+    def get_metrics(self):
+        return self.__metrics
+
+    def get_size_selector(self):
+        return self.__size_selector
+
+    def set_size_policy(self, size_policy):
+        """
+        Sets which size of photos is uploaded
+        :param size_policy: SizeSelector or its short form, e.g. 'max', 'max_pixels:1310720', 'type:x', 'width:1280'
+        """
+        if not isinstance(size_policy, SizeSelector):
+            size_policy = SizeSelector.from_string(size_policy)
+        self.__size_selector = size_policy
+
+    def get_transfer_mode(self):
+        return self.__transfer_mode
+
+    def set_transfer_mode(self, transfer_mode: str):
+        """
+        Sets how photos are uploaded: 'remote' asks Yandex to fetch VK URLs (upload is confirmed by operation check),
+        'stream' downloads photos from VK and sends chunks to upload links as they arrive, so throughput is limited
+        by concurrency of upload_remote_files only, photos are never kept in memory or on disk, and their MD5 is known
+        """
+        if transfer_mode not in self.TRANSFER_MODES:
+            raise ValueError(f'Unknown transfer mode: {transfer_mode}, '
+                             f'expected one of {", ".join(self.TRANSFER_MODES)}')
+        self.__transfer_mode = transfer_mode
+
     def log(self, message, is_debug_msg=False, sep=' '):
-        if self.__debug_mode or (not self.__debug_mode and not is_debug_msg):
-            if type(message) in [list, dict, tuple, set]:
-                print(*message, sep=sep)
-            else:
-                print(message, sep=sep)
-
-    def get_images_links(self, vk_id=None, album_id='profile', max_qty=10):
-        result = []
-        if not self.__initialized:
+        self.__logger.log(message, is_debug_msg, sep)
+
+    def get_images_links(self, vk_id=None, album_id='profile', max_qty=10, pages_per_request=25, folder: str = None):
+        """
+        Loads VK photos links and chooses the biggest size of every photo, see iter_images_pages
+        :return: PhotoBatch, which can be used as list of [filename, extension, url, size type, owner ID, photo ID]
+        """
+        links = PhotoBatch()
+        if not self.is_initialized():
             self.log('Error: not initialized.', True)
-            return result
-        images = []
-        offset = 0
+            return links
+        for page in self.iter_images_pages(vk_id, album_id, max_qty, pages_per_request, folder):
+            links.extend(page)
+        return links
+
+    def iter_images_links(self, vk_id=None, album_id='profile', max_qty=10, pages_per_request=25, folder: str = None):
+        """
+        The same as iter_images_pages, but yields link list for every photo
+        """
+        for page in self.iter_images_pages(vk_id, album_id, max_qty, pages_per_request, folder):
+            yield from page
+
+    def iter_images_pages(self, vk_id=None, album_id='profile', max_qty=10, pages_per_request=25, folder: str = None):
+        """
+        Loads VK photos links and yields them page by page. First page is loaded with photos.get,
+        it contains total photos count, so all remaining pages are requested with execute method,
+        up to 25 pages per one HTTP request. Only one execute response is kept in memory at a time
+        :param vk_id: ID of VK user, if None - user of VK client will be taken
+        :param album_id: one of album type: wall, profile, saved
+        :param max_qty: max photos count
+        :param pages_per_request: photos.get pages in one execute request, VK allows max 25
+        :param folder: target folder on disk, if set, names of files in it are not given to photos
+        :return: yields PhotoBatch for every page
+        """
+        if not self.is_initialized():
+            self.log('Error: not initialized.', True)
+            return
+        namer = NameAllocator(self.__name_template)
+        if folder is not None:
+            namer.seed(self.get_folder_names(folder))
         # adapting count to minimize request's quantity (max returned items count per request is 1000)
         count = max_qty if max_qty <= 1000 else 1000
         self.log(f'\nRequesting max {count} {album_id} images links from VK {album_id}...', True)
-        while True:
-            user_photos = self.__client.get_user_photos(user_id=vk_id, album_id=album_id, count=count, offset=offset)
+        with self.__metrics.timer('stage_duration_seconds', stage='harvest_links'):
+            user_photos = self.__client.get_user_photos(user_id=vk_id, album_id=album_id, count=count,
+                                                        fields=self.PHOTO_FIELDS, stream=self.__stream_decode)
+        if not user_photos['success']:
+            self.__logger.debug('Loading image links failed: %s', user_photos['message'])
+            return
+        items = user_photos['object']['items']
+        self.__logger.debug('Loaded %d images links from VK', len(items))
+        # if returned less items than requested, suppose that we reached the end
+        total = min(user_photos['object'].get('count', 0), max_qty) if len(items) == count else 0
+        # let's cut images to match exact max_count items
+        yield self.__select_sizes(items[:max_qty], namer)
+        left = max_qty - len(items)
+        calls = [self.__client.make_user_photos_call(user_id=vk_id, album_id=album_id, count=count, offset=offset)
+                 for offset in range(count, total, count)]
+        pages = self.__client.iter_execute(calls, pages_per_request, self.PHOTO_FIELDS, self.__stream_decode)
+        started = time.perf_counter()
+        for user_photos in pages:
+            # time of waiting for the next page, without time spent by consumer of pages
+            self.__metrics.observe('stage_duration_seconds', time.perf_counter() - started, stage='harvest_links')
             if not user_photos['success']:
-                self.log(f'Loading image links failed: {user_photos["message"]}', True)
+                self.__logger.debug('Loading image links failed: %s', user_photos['message'])
                 break
-            items_count = len(user_photos['object']['items'])
-            self.log(f'Loaded {items_count} images links from VK', True)
+            items = user_photos['object']['items']
+            self.__logger.debug('Loaded %d images links from VK', len(items))
             # if we reached the end
-            if items_count == 0:
+            if len(items) == 0:
                 break
-            images += user_photos['object']['items']
-            # if returned less items than requested, suppose that we reached the end
-            # or if next iteration will return more items than we requested
-            if items_count < count or count + offset >= max_qty:
+            yield self.__select_sizes(items[:left], namer)
+            left -= len(items)
+            if left <= 0:
                 break
-            offset += count
-            # prevent ban from service
-            time.sleep(self.__delay)
+            started = time.perf_counter()
         self.log(f'Loading images links finished', True)
-        likes_set = set()
-        # let's cut images to match exact max_count items
-        for item in images[:max_qty]:
-            # let's detect images with the maximum resolution, based on dimensions or on type if dimensions is absent
-            img_url = ''
-            img_url_fallback = ''
-            # this needed as fallback if all resolutions will be zero
-            max_type = -1
-            size_type_letter = ''
-            # even if we will be unable to detect max resolution link, we will always take the first one
-            max_res = -1
-            for size in item['sizes']:
-                res = size['height'] * size['width']
-                if max_res < res:
-                    max_res = res
-                    img_url = size['url']
-                # fallback only
-                size_type = self.__types.get(size['type'], 0)
-                if max_type < size_type:
-                    max_type = size_type
-                    size_type_letter = size['type']
-                    # below line needed to prevent additional loop through sizes list in case of fallback
-                    img_url_fallback = size['url']
-            # fallback if unable to detect resolutions
-            # for images older than 2012 year https://vk.com/dev/objects/photo_sizes
-            if max_res == 0:
-                img_url = img_url_fallback
-            # save likes, img url, file extension and size type in sublist
-            likes_count = str(item['likes']['count'])
-            # let's check if same filename already added and rename it
-            if likes_count in likes_set:
-                i = 1
-                postfix = '_'
-                while f'{likes_count}{postfix}{i}' in likes_set:
-                    i += 1
-                likes_count += f'{postfix}{i}'
-            likes_set.add(likes_count)
-            result.append([likes_count, pl.Path(img_url).suffix, img_url, size_type_letter])
+
+    def stream_images_links(self, vk_id=None, album_id='profile', max_qty=10, pages_per_request=25,
+                            buffer_size=1000, folder: str = None):
+        """
+        Loads VK photos links in background thread and yields them as soon as each page arrives, so uploading
+        can start while next pages are still loading. Bounded buffer stops loading until consumer catches up
+        :param buffer_size: max links waiting in buffer, other params are the same as in iter_images_links
+        :return: yields link list [filename, extension, url, size type, owner ID, photo ID] for every photo
+        """
+        return self.__stream(lambda: self.iter_images_links(vk_id, album_id, max_qty, pages_per_request, folder),
+                             buffer_size)
+
+    def __stream(self, make_items, buffer_size: int):
+        """
+        Reads iterable made by make_items in background thread and yields its items through bounded buffer
+        """
+        buffer = queue.Queue(maxsize=max(buffer_size, 1))
+        stop = threading.Event()
+        finished = object()
+        errors = []
+
+        def put(item):
+            # consumer can stop reading at any moment, so we don't block forever on full buffer
+            while not stop.is_set():
+                try:
+                    buffer.put(item, timeout=0.1)
+                    return True
+                except queue.Full:
+                    continue
+            return False
+
+        def produce():
+            try:
+                for link in make_items():
+                    if not put(link):
+                        return
+            except Exception as e:
+                errors.append(e)
+            put(finished)
+
+        producer = threading.Thread(target=produce, name=f'{type(self).__name__}-links', daemon=True)
+        producer.start()
+        try:
+            while True:
+                link = buffer.get()
+                if link is finished:
+                    break
+                yield link
+            if errors:
+                raise errors[0]
+        finally:
+            stop.set()
+            producer.join()
+
+    def upload_album(self, folder: str, vk_id=None, album_id='profile', max_qty=10, log_file_path: str = None,
+                     options: UploadOptions = None):
+        """
+        Streams VK album to Yandex disk folder: uploads start as soon as first page of links is loaded
+        and memory usage depends on page and buffer size (see UploadOptions), not on album size.
+        Params are the same as in stream_images_links and upload_remote_files
+        :return: the same as upload_remote_files
+        """
+        options = options if options is not None else UploadOptions()
+        links = self.stream_images_links(vk_id, album_id, max_qty, buffer_size=options.get_buffer_size(),
+                                         folder=folder)
+        try:
+            return self.upload_remote_files(folder, links, log_file_path, options)
+        finally:
+            links.close()
+
+    @staticmethod
+    def get_album_name(album: dict, used: set = None):
+        """
+        :param album: VK album object with id and title
+        :param used: already given names, name is made unique by album ID and added to it
+        :return: name of subfolder on disk, system albums are named wall, profile and saved
+        """
+        album_id = album['id']
+        name = ImageSaver.SYSTEM_ALBUMS.get(album_id)
+        if name is None:
+            # characters which are not allowed in disk paths are replaced
+            name = re.sub(r'[\\/:*?"<>|\s]+', ' ', str(album.get('title') or '')).strip(' .') or f'album_{album_id}'
+        if used is not None:
+            if name.lower() in used:
+                name = f'{name}_{album_id}'
+            used.add(name.lower())
+        return name
+
+    def get_albums(self, vk_id=None):
+        """
+        Loads all albums of VK user, including system ones (see SYSTEM_ALBUMS)
+        :param vk_id: ID of VK user, if None - user of VK client will be taken
+        :return: list of dicts {'album_id': 'ID or system album name for photos.get', 'title': 'album title',
+                                'size': 'photos count', 'name': 'unique subfolder name'},
+                 empty if albums can't be loaded
+        """
+        if not self.is_initialized():
+            self.log('Error: not initialized.', True)
+            return []
+        response = self.__client.get_albums(user_id=vk_id)
+        if not response['success']:
+            self.__logger.debug('Loading albums failed: %s', response['message'])
+            return []
+        albums = []
+        used = set()
+        for album in response['object'].get('items') or []:
+            # other system albums (e.g. photos with user) can't be loaded by owner
+            if album['id'] < 0 and album['id'] not in self.SYSTEM_ALBUMS:
+                continue
+            albums.append({'album_id': self.SYSTEM_ALBUMS.get(album['id'], album['id']),
+                           'title': album.get('title', ''), 'size': album.get('size', 0),
+                           'name': self.get_album_name(album, used)})
+        self.__logger.debug('Loaded %d albums from VK', len(albums))
+        return albums
+
+    def __execute_chunks(self, calls: list, pages_per_request: int, concurrency: int):
+        """
+        Sends execute requests of calls concurrently and yields results of calls in order of calls list.
+        All requests go through rate limiter of VK client, so concurrency doesn't exceed requests budget
+        """
+        chunks = [calls[start:start + pages_per_request] for start in range(0, len(calls), pages_per_request)]
+        if concurrency <= 1 or len(chunks) <= 1:
+            yield from self.__client.iter_execute(calls, pages_per_request, self.PHOTO_FIELDS, self.__stream_decode)
+            return
+
+        def execute(chunk: list):
+            return list(self.__client.iter_execute(chunk, pages_per_request, self.PHOTO_FIELDS,
+                                                   self.__stream_decode))
+
+        # bounded window keeps only few responses in memory, as in __iter_uploads
+        window = concurrency * 2
+        pending = deque()
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            try:
+                for chunk in chunks:
+                    pending.append(executor.submit(execute, chunk))
+                    if len(pending) >= window:
+                        yield from pending.popleft().result()
+                while pending:
+                    yield from pending.popleft().result()
+            finally:
+                # consumer stopped reading, so requests not started yet are dropped
+                for future in pending:
+                    future.cancel()
+
+    def iter_account_pages(self, vk_id=None, max_qty: int = None, albums: list = None, concurrency=4,
+                           pages_per_request=25, folder: str = None):
+        """
+        Loads links of photos of all albums of VK user and yields them as one stream ordered by album and page.
+        First pages of all albums are loaded by execute requests (25 albums per request), their counts give
+        offsets of all remaining pages, which are packed into execute requests regardless of album borders
+        and loaded concurrently within requests budget of VK token
+        :param vk_id: ID of VK user, if None - user of VK client will be taken
+        :param max_qty: max photos count of every album, None means all photos
+        :param albums: albums as returned by get_albums, by default all albums are loaded
+        :param concurrency: execute requests in flight
+        :param pages_per_request: photos.get pages in one execute request, VK allows max 25
+        :param folder: root folder on disk, if set, names of files in album subfolders are not given to photos
+        :return: yields tuples of album subfolder name and PhotoBatch of one page
+        """
+        if not self.is_initialized():
+            self.log('Error: not initialized.', True)
+            return
+        if albums is None:
+            albums = self.get_albums(vk_id)
+        # empty albums are not requested at all
+        albums = [album for album in albums if album.get('size', 1)]
+        if max_qty is None:
+            # real sizes are taken from the first pages
+            max_qty = sys.maxsize
+        count = max_qty if max_qty <= 1000 else 1000
+        pages_per_request = max(1, min(pages_per_request, 25))
+        self.log(f'\nRequesting images links of {len(albums)} albums from VK...', True)
+        calls = [self.__client.make_user_photos_call(user_id=vk_id, album_id=album['album_id'], count=count)
+                 for album in albums]
+        with self.__metrics.timer('stage_duration_seconds', stage='harvest_links'):
+            first_pages = list(self.__execute_chunks(calls, pages_per_request, concurrency))
+        # offsets of remaining pages of every album are known now, so they are planned at once
+        calls = []
+        plans = []
+        for album, first_page in zip(albums, first_pages):
+            pages = 0
+            if first_page['success'] and len(first_page['object']['items']) == count:
+                total = min(first_page['object'].get('count', 0), max_qty)
+                for offset in range(count, total, count):
+                    calls.append(self.__client.make_user_photos_call(user_id=vk_id, album_id=album['album_id'],
+                                                                     count=count, offset=offset))
+                    pages += 1
+            plans.append(pages)
+        self.__logger.debug('Planned %d pages of %d albums', len(calls), len(albums))
+        results = self.__execute_chunks(calls, pages_per_request, concurrency)
+        try:
+            for album, first_page, pages in zip(albums, first_pages, plans):
+                name = album['name']
+                if not first_page['success']:
+                    self.__logger.debug('Loading album %s failed: %s', name, first_page['message'])
+                    continue
+                namer = NameAllocator(self.__name_template)
+                if folder is not None:
+                    namer.seed(self.get_folder_names(f'{folder}/{name}'))
+                items = first_page['object']['items']
+                self.__logger.debug('Loaded %d images links of album %s', len(items), name)
+                yield name, self.__select_sizes(items[:max_qty], namer)
+                left = max_qty - len(items)
+                started = time.perf_counter()
+                # results of all planned pages are read, so the next album starts with its own pages
+                for _ in range(pages):
+                    user_photos = next(results)
+                    self.__metrics.observe('stage_duration_seconds', time.perf_counter() - started,
+                                           stage='harvest_links')
+                    if left <= 0:
+                        continue
+                    if not user_photos['success']:
+                        self.__logger.debug('Loading album %s failed: %s', name, user_photos['message'])
+                        left = 0
+                        continue
+                    items = user_photos['object']['items']
+                    if len(items) == 0:
+                        left = 0
+                        continue
+                    yield name, self.__select_sizes(items[:left], namer)
+                    left -= len(items)
+                    started = time.perf_counter()
+        finally:
+            results.close()
+        self.log(f'Loading images links of account finished', True)
+
+    def iter_account_links(self, vk_id=None, max_qty: int = None, albums: list = None, concurrency=4,
+                           pages_per_request=25, folder: str = None):
+        """
+        The same as iter_account_pages, but yields tuple of album subfolder name and link list for every photo
+        """
+        for name, page in self.iter_account_pages(vk_id, max_qty, albums, concurrency, pages_per_request, folder):
+            for link in page:
+                yield name, link
+
+    def upload_account(self, folder: str, vk_id=None, max_qty: int = None, log_file_path: str = None,
+                       options: UploadOptions = None, albums: list = None, fetch_concurrency=4):
+        """
+        Backs up all albums of VK user to subfolders of disk folder, one subfolder per album.
+        Links are loaded in background (see iter_account_pages) while photos of previous albums are uploading
+        :param folder: root folder on disk, it and album subfolders are created if they don't exist
+        :param log_file_path: local path of classic JSON log, every album gets own log with album name suffix
+        :param options: options of uploads of every album, see UploadOptions
+        :param fetch_concurrency: execute requests in flight while loading links
+        :return: the same as upload_remote_files, object contains totals and 'albums' dict of results by album name
+        """
+        result = {'object': None, 'success': False, 'message': ''}
+        if not self.is_initialized():
+            self.log('Error: not initialized', True)
+            result['message'] = 'Not initialized'
+            return result
+        options = options if options is not None else UploadOptions()
+        log_path = pl.Path(log_file_path or 'images_log.json')
+        totals = {'uploaded': 0, 'skipped': 0, 'linked': 0, 'duplicates': 0, 'failed': [], 'albums': {}}
+        messages = []
+        links = self.__stream(lambda: self.iter_account_links(vk_id, max_qty, albums, fetch_concurrency,
+                                                              folder=folder), options.get_buffer_size())
+        try:
+            for name, album_links in itertools.groupby(links, key=lambda x: x[0]):
+                subfolder = f'{folder}/{name}'
+                created = self.__uploader.create_folder(subfolder)
+                # folder can exist after previous runs
+                if not created['success'] and created['message'].find('409') < 0:
+                    self.__logger.debug('Creating folder %s failed: %s', subfolder, created['message'])
+                log_name = re.sub(r'[^\w.-]+', '_', name)
+                album_log_path = log_path.with_name(f'{log_path.stem}_{log_name}{log_path.suffix}')
+                response = self.upload_remote_files(subfolder, (link for _, link in album_links), str(album_log_path),
+                                                    options)
+                totals['albums'][name] = response['object']
+                if response['object'] is not None:
+                    for key in ('uploaded', 'skipped', 'linked', 'duplicates'):
+                        totals[key] += response['object'][key]
+                    totals['failed'].extend(response['object']['failed'])
+                if not response['success']:
+                    messages.append(f'{name}: {response["message"]}')
+                    if options.get_fail_fast():
+                        break
+        finally:
+            links.close()
+        result['object'] = totals
+        result['message'] = '; '.join(messages)
+        result['success'] = not messages
+        return result
+
+    @staticmethod
+    def get_url_suffix(url: str):
+        """
+        :return: file extension from URL path, e.g. '.jpg' for 'https://sun9-1.userapi.com/c/abc.jpg?size=1280x960'
+        """
+        # URL can contain query string, so extension is taken from path only
+        path = url.partition('?')[0].partition('#')[0]
+        dot = path.rfind('.')
+        return path[dot:] if dot > path.rfind('/') + 1 else ''
+
+    @staticmethod
+    def get_links_from_items(items: list, likes_set: set = None, selector: SizeSelector = None,
+                             namer: NameAllocator = None):
+        """
+        Chooses one size of every VK photo (the biggest by default) and names files by likes count
+        :param items: list of VK photo objects requested with photo_sizes and extended params
+        :param likes_set: already used filenames, it is updated, so it can be passed again with next page of items
+        :param selector: SizeSelector with size policy, by default the biggest size is taken
+        :param namer: NameAllocator with name template, it should be passed again with next page of items,
+                      if set, likes_set is ignored
+        :return: PhotoBatch, which can be used as list of [filename, extension, url, size type, owner ID, photo ID]
+        """
+        result = PhotoBatch()
+        if namer is None:
+            namer = NameAllocator(used=likes_set)
+        if selector is None:
+            selector = ImageSaver.__DEFAULT_SELECTOR
+        for item, size in zip(items, selector.select_page(items)):
+            # photo without sizes can't be downloaded
+            if size is None:
+                continue
+            img_url = size['url']
+            width, height = size.get('width') or 0, size.get('height') or 0
+            result.add(namer.allocate_for(item), ImageSaver.get_url_suffix(img_url), img_url, size['type'],
+                       item.get('owner_id'), item.get('id'), width, height, item['likes']['count'],
+                       item.get('date', 0))
         return result
 
     def create_folder(self, folder_name: str):
-        if not self.__initialized:
+        if not self.is_initialized():
             self.log('Error: not initialized', True)
             return {'object': None, 'success': False, 'message': 'Error: not initialized'}
         result = self.__uploader.create_folder(folder_name)
@@ -121,50 +567,270 @@ class ImageSaver:
             self.log(f'\nError creating folder. {result["message"]}', True)
         return result
 
-    def upload_remote_files(self, folder: str, files: list, log_file_path: str = None):
+    def __select_sizes(self, items: list, namer: NameAllocator):
+        with self.__metrics.timer('stage_duration_seconds', stage='select_sizes'):
+            return self.get_links_from_items(items, selector=self.__size_selector, namer=namer)
+
+    def __upload_file(self, folder: str, file):
+        path = folder + '/' + str(file[0]) + file[1]
+        if self.__transfer_mode == 'stream':
+            with self.__metrics.timer('stage_duration_seconds', stage='stream_transfer'):
+                response = self.__uploader.upload_from_url(path, file[2], verify=self.__verify_checksums)
+            if response['success']:
+                self.__metrics.inc('transfer_bytes_total', response['object']['bytes'], mode='stream')
+            return response
+        with self.__metrics.timer('stage_duration_seconds', stage='submit_upload'):
+            return self.__uploader.upload_remote_file(path, file[2])
+
+    def __iter_uploads(self, folder: str, files: list, concurrency=1, fail_fast=True):
+        """
+        Uploads files and yields pairs of file and upload response strictly in order of files list
+        :param folder: target folder on disk
+        :param files: list of files as returned by get_images_links
+        :param concurrency: max uploads in flight, if 1 files are uploaded one by one
+        :param fail_fast: if True, no new uploads are started after first failed one
+        """
+        if concurrency <= 1:
+            for file in files:
+                response = self.__upload_file(folder, file)
+                yield file, response
+                if fail_fast and not response['success']:
+                    return
+            return
+        # bounded window of submitted uploads keeps workers busy, but doesn't queue whole album at once
+        window = concurrency * 2
+        pending = deque()
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            for file in files:
+                pending.append((file, executor.submit(self.__upload_file, folder, file)))
+                if len(pending) < window:
+                    continue
+                file, future = pending.popleft()
+                response = future.result()
+                yield file, response
+                if fail_fast and not response['success']:
+                    break
+            # already started uploads are finished anyway, so let's report them too
+            while pending:
+                file, future = pending.popleft()
+                yield file, future.result()
+
+    def __skip_known(self, folder: str, files, manifest: SyncManifest, dedup: bool, upload_log: UploadLog,
+                     skipped: list, linked: list, duplicates: list):
+        """
+        Drops files already uploaded to folder and, if dedup is True, repeated photos (by owner ID and photo ID).
+        Photos found in manifest in other folders are linked to their disk path instead of uploading
+        """
+        seen = set()
+        for file in files:
+            key = SyncManifest.get_key(file) if dedup else None
+            if key is not None:
+                if key[:2] in seen:
+                    duplicates.append(file)
+                    continue
+                seen.add(key[:2])
+            if manifest is not None and manifest.is_uploaded(folder, file):
+                skipped.append(file)
+                continue
+            if key is not None:
+                stored = manifest.find_photo(*key[:2]) if manifest is not None else None
+                if stored is not None:
+                    manifest.mark_uploaded(folder, file, stored['disk_path'], stored['md5'])
+                    upload_log.append({'filename': f'{file[0]}{file[1]}', 'size': f'{file[3]}',
+                                       'disk_path': stored['disk_path']})
+                    linked.append(file)
+                    continue
+            yield file
+        if skipped:
+            self.log(f'Skipped {len(skipped)} files which are already uploaded', True)
+        if linked or duplicates:
+            self.log(f'Linked {len(linked)} photos uploaded to other folders, dropped {len(duplicates)} duplicates',
+                     True)
+
+    def upload_remote_files(self, folder: str, files, log_file_path: str = None, options: UploadOptions = None):
+        """
+        Uploads files by their URLs to Yandex disk folder. Every accepted file is appended to JSON Lines log
+        right away, and new log entries are synced to disk folder as separate segment files
+        :param folder: target folder on disk
+        :param files: PhotoBatch, list or iterable of [filename, extension, url, size type, owner ID, photo ID]
+                      as returned by get_images_links
+        :param log_file_path: local path of classic JSON log, by default images_log.json,
+                              JSON Lines log is saved next to it with .jsonl extension
+        :param options: concurrency, error policy, manifest and log options, see UploadOptions,
+                        by default files are uploaded one by one and upload stops on first failed file
+        :return: {'object': {'uploaded': 'count of accepted (or confirmed) files',
+                             'skipped': 'count of files found in manifest',
+                             'linked': 'count of photos found in other folders',
+                             'duplicates': 'count of repeated photos',
+                             'failed': 'list of failed files with messages',
+                             'operations': 'stats of upload operations if confirm is True'},
+                 'success': 'True if all files accepted (and confirmed)',
+                 'message': 'contains error string if any or empty string'}
+        """
         result = {'object': None, 'success': False, 'message': ''}
-        if not self.__initialized:
+        if not self.is_initialized():
             self.log('Error: not initialized', True)
             result['message'] = 'Not initialized'
             return result
         self.log(f'\nStart to upload remote files to folder {folder}...', True)
         if not log_file_path:
             log_file_path = 'images_log.json'
-        with open(log_file_path, 'w+') as log_file:
-            log = []
-            for count, file in enumerate(files, 1):
-                response = self.__uploader.upload_remote_file(folder + '/' + str(file[0]) + file[1], file[2])
-                if response['success']:
-                    self.log(f'Uploading file #{count} accepted: {response["object"]["href"]}', True)
-                    log.append({'filename': f'{file[0]}{file[1]}', 'size': f'{file[3]}'})
+        options = options if options is not None else UploadOptions()
+        manifest = options.get_manifest()
+        log_sync_every = options.get_log_sync_every()
+        failed = []
+        skipped = []
+        linked = []
+        duplicates = []
+        # one tracker polls all accepted uploads in background while next files are uploading
+        tracker = OperationTracker(self.__uploader, debug_mode=self.__debug_mode, metrics=self.__metrics) \
+            if options.get_confirm() else None
+        operations = []
+        uploaded = 0
+        # log is continued, so entries which crashed run couldn't sync are not lost,
+        # tracker thread is stopped even if uploading is interrupted, e.g. by error in files generator
+        with UploadLog(str(pl.Path(log_file_path).with_suffix('.jsonl')), append=True) as upload_log, \
+                tracker if tracker is not None else nullcontext():
+            self.__sync_left_log(folder, upload_log)
+            if manifest is not None or options.get_dedup():
+                files = self.__skip_known(folder, files, manifest, options.get_dedup(), upload_log, skipped, linked,
+                                          duplicates)
+            uploads = self.__iter_uploads(folder, files, options.get_concurrency(), options.get_fail_fast())
+            for count, (file, response) in enumerate(uploads, 1):
+                if not response['success']:
+                    self.__logger.debug('Uploading file failed: %s (%s)', file[2], response['message'])
+                    failed.append({'url': file[2], 'filename': f'{file[0]}{file[1]}', 'message': response['message']})
+                    continue
+                # streamed files are stored already, remote uploads are finished by disk later
+                if 'md5' in response['object']:
+                    self.__logger.debug('Uploading file #%d finished: %s (md5 %s)', count, file[2],
+                                        response['object']['md5'])
                 else:
-                    self.log(f'Uploading file failed: {file[2]} ({response["object"]})', True)
-                    result['success'] = False
-                    result['message'] = f'Uploading file failed: {file[2]} ({response["object"]})'
-                    break
-                # prevent ban
-                time.sleep(self.__delay)
-            json.dump(log, log_file)
-            self.log(f'\nLog file saved to {log_file_path}', True)
-        self.log(f'Uploading log file to disk with overwrite...', True)
-        response = self.__uploader.upload_local_file(file_path=log_file_path, folder=(folder + '/'))
+                    self.__logger.debug('Uploading file #%d accepted: %s', count, response['object']['href'])
+                if tracker and 'href' in response['object']:
+                    operations.append((file, tracker.track(response['object']['href'], f'{file[0]}{file[1]}')))
+                    continue
+                uploaded += 1
+                self.__log_upload(folder, file, upload_log, manifest, response['object'].get('md5'))
+                if log_sync_every and upload_log.get_unsynced_count() >= log_sync_every:
+                    self.__sync_log(folder, upload_log)
+            if tracker:
+                self.log(f'\nWaiting {len(operations)} upload operations...', True)
+                result['object'] = {'operations': tracker.wait()['object']}
+                for file, future in operations:
+                    operation = future.result()
+                    if operation['success']:
+                        uploaded += 1
+                        self.__log_upload(folder, file, upload_log, manifest)
+                    else:
+                        failed.append({'url': file[2], 'filename': f'{file[0]}{file[1]}',
+                                       'message': operation['message']})
+                self.log(f'Confirmed {uploaded} of {len(operations)} uploads', True)
+            self.log(f'\nLog file saved to {upload_log.get_path()}', True)
+            self.__sync_log(folder, upload_log)
+            if options.get_export_json():
+                # manifest knows all files in folder, including ones uploaded by previous runs
+                upload_log.export_json(log_file_path, manifest.get_uploaded(folder) if manifest is not None else None)
+                self.log(f'Log file exported to {log_file_path}', True)
+        result['object'] = {**(result['object'] or {}), 'uploaded': uploaded, 'skipped': len(skipped),
+                            'linked': len(linked), 'duplicates': len(duplicates), 'failed': failed}
+        self.__metrics.inc('photos_total', uploaded, status='uploaded')
+        self.__metrics.inc('photos_total', len(skipped), status='skipped')
+        self.__metrics.inc('photos_total', len(linked), status='linked')
+        self.__metrics.inc('photos_total', len(duplicates), status='duplicate')
+        self.__metrics.inc('photos_total', len(failed), status='failed')
+        if failed:
+            result['message'] = f'Uploading file failed: {failed[0]["url"]} ({failed[0]["message"]})'
+            if len(failed) > 1:
+                result['message'] += f' and {len(failed) - 1} more'
+        else:
+            result['success'] = True
+        return result
+
+    def __log_upload(self, folder: str, file, upload_log: UploadLog, manifest: SyncManifest = None, md5: str = None):
+        upload_log.append({'filename': f'{file[0]}{file[1]}', 'size': f'{file[3]}'})
+        disk_path = f'{folder}/{file[0]}{file[1]}'
+        if manifest is not None:
+            manifest.mark_uploaded(folder, file, disk_path, md5)
+        # accepted file takes its name at once, without waiting for the next refresh of index
+        if self.__disk_index is not None:
+            self.__disk_index.add([{'path': disk_path, 'md5': md5}])
+
+    def __sync_left_log(self, folder: str, upload_log: UploadLog):
+        """
+        Syncs log entries left by previous run to their folder, then binds log to folder of this run.
+        If syncing fails, left entries are synced with entries of this run
+        """
+        left_folder = upload_log.get_folder()
+        if upload_log.get_unsynced_count() and left_folder is not None:
+            self.log(f'Found {upload_log.get_unsynced_count()} log entries of previous run', True)
+            self.__sync_log(left_folder.rstrip('/'), upload_log)
+        upload_log.set_folder(folder + '/')
+
+    def __sync_log(self, folder: str, upload_log: UploadLog):
+        count = upload_log.get_unsynced_count()
+        if not count:
+            return
+        self.log(f'Uploading {count} new log entries to disk...', True)
+        response = upload_log.sync(self.__uploader, folder + '/')
         if response['success']:
-            self.log(f'Log file uploaded to disk', True)
+            self.log(f'Log entries uploaded to disk', True)
         else:
             self.log(f'Uploading log file error. {response["message"]}', True)
+
+    def get_folder_names(self, folder: str):
+        """
+        :param folder: folder path on disk
+        :return: set of names of files and folders in folder, empty if folder doesn't exist
+        """
+        if not self.is_initialized():
+            self.log('\nError: not initialized.', True)
+            return set()
+        # index is refreshed from last uploaded files first, so files uploaded by others since then are known too,
+        # if refresh fails, names are listed by API
+        if self.__disk_index is not None and self.refresh_disk_index()['success']:
+            return self.__disk_index.get_names(folder)
+        names = set()
+        page_size = 1000
+        while True:
+            response = self.__uploader.get_folder_items(folder, page_size, len(names))
+            if not response['success']:
+                # folder doesn't exist yet
+                break
+            names.update(item['name'] for item in response['object'])
+            if len(response['object']) < page_size:
+                break
+        self.log(f'Found {len(names)} files in folder {folder}', True)
+        return names
+
+    def refresh_disk_index(self, full=False):
+        if not self.is_initialized():
+            self.log('\nError: not initialized.', True)
+            return {'object': None, 'success': False, 'message': 'Error: not initialized'}
+        if self.__disk_index is None:
+            return {'object': None, 'success': False, 'message': 'Disk index is not enabled'}
+        result = self.__disk_index.refresh(full)
+        if result['success']:
+            self.log(f'Disk index refreshed, {result["object"]} files updated', True)
+        else:
+            self.log(f'Disk index refresh error: {result["message"]}', True)
         return result
 
     def list_disk(self):
-        if not self.__initialized:
+        if not self.is_initialized():
             self.log('\nError: not initialized.', True)
             return {'object': None, 'success': False, 'message': 'Error: not initialized'}
         self.log('\nPrinting files list on Yandex disk...', True)
-        result = self.__uploader.list_files(50)['object']
+        if self.__disk_index is not None and self.refresh_disk_index()['success']:
+            result = [f'/{x["path"]} ({YaUploader.convert_bytes(int(x["size"] or 0))})'
+                      for x in self.__disk_index.list_folder('', recursive=True)]
+        else:
+            result = self.__uploader.list_files(50)['object']
         self.log(result, True, sep='\n')
         return result
 
     def get_user_vk_status(self, user_id=None):
-        if not self.__initialized:
+        if not self.is_initialized():
             self.log('\nError: not initialized.', True)
             return ''
         result = self.__client.get_user_status(user_id)
@@ -176,22 +842,29 @@ class ImageSaver:
             return ''
 
     def delete_file(self, file_path: str):
-        if not self.__initialized:
+        if not self.is_initialized():
             self.log('\nError: not initialized.', True)
             return {'object': None, 'success': False, 'message': 'Error: not initialized'}
         self.log('\nTry to delete file or folder: ' + file_path, True)
         result = self.__uploader.delete_file(file_path)
         if result['success']:
+            if self.__disk_index is not None:
+                self.__disk_index.remove(file_path)
             self.log(f'File/Folder deleted: {file_path}', True)
         else:
             self.log(f'File/Folder delete error: {result["message"]}', True)
         return result
 
     def get_file_info(self, file_path: str):
-        if not self.__initialized:
+        if not self.is_initialized():
             self.log('\nError: not initialized', True)
             return {'object': None, 'success': False, 'message': 'Error: not initialized'}
         self.log(f'\nChecking if file/folder "{file_path}" is exist...', True)
+        # index knows files and not empty folders, anything else is checked on disk
+        if self.__disk_index is not None and self.__disk_index.exists(file_path):
+            info = self.__disk_index.get(file_path) or {'path': DiskIndex.normalize_path(file_path), 'type': 'dir'}
+            self.log(f'File/Folder present in disk index: {file_path}', True)
+            return {'object': {**info, 'path': 'disk:/' + info['path']}, 'success': True, 'message': ''}
         result = self.__uploader.get_file_info(file_path)
         if result['success']:
             self.log(f'File/Folder present: {file_path}', True)
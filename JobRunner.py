@@ -0,0 +1,261 @@
+import argparse
+import json
+import pathlib as pl
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from HttpSession import HttpSession
+from Logger import Logger
+from ImageSaver import ImageSaver
+from ResponseCache import ResponseCache
+from SyncManifest import SyncManifest
+from UploadOptions import UploadOptions
+from YaUploader import YaUploader
+
+
+class JobRunner:
+    """
+    Backs up many accounts. Every job is VK token, VK user and album, Yandex token and target folder.
+    Album "all" backs up every album of account to own subfolder, see ImageSaver.upload_account.
+    Jobs run in thread pool and share one connection pool, every token has own requests budget (RateLimiter),
+    so total throughput grows with tokens count. With processes > 1 jobs are split between processes, so that
+    all jobs of every VK token and every Yandex token run in one process and budgets of tokens are still enforced
+    """
+    JOB_DEFAULTS = {'vk_id': None, 'album_id': 'profile', 'max_qty': 10, 'concurrency': 1, 'size_policy': 'max',
+                    'name_template': 'likes', 'log_file_path': None}
+    JOB_REQUIRED = ('token_vk', 'token_ya', 'folder')
+
+    def __init__(self, workers=4, processes=1, vk_rate=3.0, ya_rate: float = None, manifest_path: str = None,
+                 log_dir='logs', debug_mode=False, log_path: str = None, log_json=False, run_id: str = None,
+                 vk_cache_path: str = None, vk_api_url: str = None, ya_api_url: str = None):
+        """
+        :param workers: jobs running at the same time in every process
+        :param processes: processes count, 1 means all jobs run in threads of current process
+        :param vk_rate: max VK requests per second of every VK token
+        :param ya_rate: max Yandex requests per second of every Yandex token, None means YaUploader.DEFAULT_RATE
+        :param manifest_path: path of SyncManifest database shared by all jobs, None means no resume
+        :param log_dir: folder of job logs, which are named by job number and target folder
+        :param log_path: JSON Lines file of log records of all jobs, None means console only
+        :param log_json: if True, console log records are JSON lines too
+        :param run_id: ID of log records, child processes get ID of parent run
+        :param vk_cache_path: path of ResponseCache database shared by all jobs, None means no caching
+        :param vk_api_url: VK API URL, e.g. of local mock server, see ImageSaver
+        :param ya_api_url: Yandex disk API URL, e.g. of local mock server
+        """
+        self.__workers = max(workers, 1)
+        self.__processes = max(processes, 1)
+        self.__vk_rate = vk_rate
+        self.__ya_rate = ya_rate
+        self.__manifest_path = manifest_path
+        self.__log_dir = log_dir
+        self.__debug_mode = debug_mode
+        self.__log_path = log_path
+        self.__vk_cache_path = vk_cache_path
+        self.__vk_api_url = vk_api_url
+        self.__ya_api_url = ya_api_url
+        self.__log_json = log_json
+        if log_path or log_json:
+            Logger.configure(path=log_path, json_format=log_json)
+        if run_id:
+            Logger.set_run_id(run_id)
+        self.__logger = Logger(type(self).__name__, debug_mode)
+
+    def log(self, message, is_debug_msg=False, sep=' '):
+        self.__logger.log(message, is_debug_msg, sep)
+
+    def get_options(self):
+        return {'workers': self.__workers, 'vk_rate': self.__vk_rate, 'ya_rate': self.__ya_rate,
+                'manifest_path': self.__manifest_path, 'log_dir': self.__log_dir, 'debug_mode': self.__debug_mode,
+                'log_path': self.__log_path, 'log_json': self.__log_json, 'run_id': Logger.get_run_id(),
+                'vk_cache_path': self.__vk_cache_path, 'vk_api_url': self.__vk_api_url,
+                'ya_api_url': self.__ya_api_url}
+
+    @staticmethod
+    def load_jobs(path: str):
+        """
+        Loads jobs from JSON array or JSON Lines file, e.g.
+        {"token_vk": "...", "token_ya": "...", "vk_id": "1", "album_id": "wall", "max_qty": 100, "folder": "Backup/1"}
+        :param path: path of jobs file
+        :return: list of job dicts with default values of missing optional fields
+        """
+        with open(path, encoding='utf-8') as file:
+            if pl.Path(path).suffix == '.jsonl':
+                jobs = [json.loads(line) for line in file if line.strip()]
+            else:
+                jobs = json.load(file)
+        return [JobRunner.make_job(job) for job in jobs]
+
+    @staticmethod
+    def make_job(job: dict):
+        """
+        :param job: job dict, see load_jobs
+        :return: job dict with default values of missing optional fields
+        """
+        missing = [key for key in JobRunner.JOB_REQUIRED if not job.get(key)]
+        if missing:
+            raise ValueError(f'Job for folder {job.get("folder")} has no {", ".join(missing)}')
+        return {**JobRunner.JOB_DEFAULTS, **job}
+
+    def run(self, jobs: list):
+        """
+        Runs all jobs
+        :param jobs: list of job dicts, see load_jobs
+        :return: {'object': {'jobs': 'list of job results in jobs order', 'succeeded': 'count', 'failed': 'count',
+                             'seconds': 'total time'},
+                 'success': 'True if all jobs succeeded',
+                 'message': 'contains error string if any or empty string'}
+        """
+        started = time.monotonic()
+        jobs = [(index, self.make_job(job)) for index, job in enumerate(jobs)]
+        if self.__processes > 1 and len(jobs) > 1:
+            results = self.__run_processes(jobs)
+        else:
+            results = self.run_jobs(jobs)
+        results.sort(key=lambda x: x['job'])
+        failed = [result for result in results if not result['success']]
+        result = {'object': {'jobs': results, 'succeeded': len(results) - len(failed), 'failed': len(failed),
+                             'seconds': time.monotonic() - started},
+                  'success': not failed, 'message': ''}
+        if failed:
+            result['message'] = f'{len(failed)} of {len(results)} jobs failed'
+        self.log(f'Finished {len(results)} jobs in {result["object"]["seconds"]:.1f} sec, {len(failed)} failed', True)
+        return result
+
+    @staticmethod
+    def get_shards(jobs: list, processes: int):
+        """
+        Splits jobs between processes: jobs which share VK or Yandex token (directly or through other jobs)
+        are one group, and every group goes to one process, so budget of every token is shared by its jobs.
+        Groups are given to the least loaded process, starting from the biggest group
+        :param jobs: list of (job number, job dict)
+        :param processes: max processes count
+        :return: list of not empty shards, every shard is list of (job number, job dict) in jobs order
+        """
+        parents = {}
+
+        def find(token):
+            parents.setdefault(token, token)
+            while parents[token] != token:
+                parents[token] = parents[parents[token]]
+                token = parents[token]
+            return token
+
+        for _, job in jobs:
+            parents[find(('vk', job['token_vk']))] = find(('ya', job['token_ya']))
+        groups = {}
+        for item in jobs:
+            groups.setdefault(find(('vk', item[1]['token_vk'])), []).append(item)
+        shards = [[] for _ in range(max(processes, 1))]
+        for group in sorted(groups.values(), key=len, reverse=True):
+            min(shards, key=len).extend(group)
+        return [sorted(shard, key=lambda x: x[0]) for shard in shards if shard]
+
+    def __run_processes(self, jobs: list):
+        shards = self.get_shards(jobs, self.__processes)
+        self.log(f'Running {len(jobs)} jobs in {len(shards)} processes...', True)
+        with ProcessPoolExecutor(max_workers=len(shards)) as executor:
+            futures = [executor.submit(JobRunner.run_shard, self.get_options(), shard) for shard in shards]
+            return [result for future in futures for result in future.result()]
+
+    @staticmethod
+    def run_shard(options: dict, jobs: list):
+        """
+        Runs part of jobs in child process
+        :param options: constructor params of JobRunner, see get_options
+        :param jobs: list of (job number, job dict)
+        :return: list of job results
+        """
+        return JobRunner(**options).run_jobs(jobs)
+
+    def run_jobs(self, jobs: list):
+        """
+        Runs jobs in thread pool of current process
+        :param jobs: list of (job number, job dict)
+        :return: list of job results in completion order
+        """
+        manifest = SyncManifest(self.__manifest_path) if self.__manifest_path else None
+        # reruns read VK photos lists and users from cache instead of VK
+        cache = ResponseCache(self.__vk_cache_path) if self.__vk_cache_path else None
+        # one connection pool for all jobs, it keeps connections to VK and Yandex for every worker
+        session = HttpSession(pool_maxsize=max(10, self.__workers * 2))
+        try:
+            with ThreadPoolExecutor(max_workers=self.__workers) as executor:
+                futures = [executor.submit(self.__run_job, index, job, session, manifest, cache)
+                           for index, job in jobs]
+                return [future.result() for future in futures]
+        finally:
+            session.close()
+            if manifest is not None:
+                manifest.close()
+            if cache is not None:
+                cache.close()
+
+    def __get_log_path(self, index: int, job: dict):
+        if job['log_file_path']:
+            return job['log_file_path']
+        pl.Path(self.__log_dir).mkdir(parents=True, exist_ok=True)
+        name = re.sub(r'[^\w.-]+', '_', job['folder']).strip('_')
+        return str(pl.Path(self.__log_dir) / f'{index:04d}_{name}.json')
+
+    def __run_job(self, index: int, job: dict, session: HttpSession, manifest: SyncManifest = None,
+                  cache: ResponseCache = None):
+        # tokens are never put into results and logs
+        result = {'job': index, 'folder': job['folder'], 'vk_id': job['vk_id'], 'album_id': job['album_id'],
+                  'object': None, 'success': False, 'message': '', 'seconds': 0.0}
+        started = time.monotonic()
+        with Logger.job(index):
+            self.__do_job(index, job, session, manifest, cache, result)
+            result['seconds'] = time.monotonic() - started
+            self.__logger.debug('Job #%d (%s) finished in %.1f sec: %s', index, job['folder'], result['seconds'],
+                                'success' if result['success'] else result['message'], folder=job['folder'],
+                                seconds=result['seconds'], success=result['success'])
+        return result
+
+    def __do_job(self, index: int, job: dict, session: HttpSession, manifest: SyncManifest, cache: ResponseCache,
+                 result: dict):
+        try:
+            saver = ImageSaver(job['token_vk'], job['token_ya'], job['vk_id'], debug_mode=self.__debug_mode,
+                               session=session, size_policy=job['size_policy'], name_template=job['name_template'],
+                               vk_rate=self.__vk_rate, ya_rate=self.__ya_rate, response_cache=cache,
+                               vk_api_url=self.__vk_api_url, ya_api_url=self.__ya_api_url)
+            if not saver.is_initialized():
+                result['message'] = 'Init failed, check tokens and VK user ID'
+                return
+            folder = saver.create_folder(job['folder'])
+            # folder can exist after previous runs
+            if not folder['success'] and folder['message'].find('409') < 0:
+                result['message'] = folder['message']
+                return
+            options = UploadOptions(job['concurrency'], fail_fast=False, manifest=manifest)
+            if job['album_id'] == ImageSaver.ALL_ALBUMS:
+                response = saver.upload_account(job['folder'], job['vk_id'], job['max_qty'],
+                                                self.__get_log_path(index, job), options)
+            else:
+                response = saver.upload_album(job['folder'], job['vk_id'], job['album_id'], job['max_qty'],
+                                              self.__get_log_path(index, job), options)
+            result.update({'object': response['object'], 'success': response['success'],
+                           'message': response['message']})
+        except Exception as e:
+            result['message'] = f'Job failed: {type(e).__name__}: {e}'
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Backs up VK photos of many accounts to Yandex disk')
+    parser.add_argument('jobs', help='JSON or JSON Lines file with jobs, see JobRunner.load_jobs')
+    parser.add_argument('--workers', type=int, default=4, help='jobs running at the same time in every process')
+    parser.add_argument('--processes', type=int, default=1, help='processes count')
+    parser.add_argument('--vk-rate', type=float, default=3.0, help='max VK requests per second of every token')
+    parser.add_argument('--ya-rate', type=float, default=None,
+                        help=f'max Yandex requests per second of every token, {YaUploader.DEFAULT_RATE:g} by default')
+    parser.add_argument('--manifest', default=None, help='SyncManifest database path, enables resume')
+    parser.add_argument('--log-dir', default='logs', help='folder of job logs')
+    parser.add_argument('--vk-cache', default=None, help='ResponseCache database path, caches VK read requests')
+    parser.add_argument('--debug', action='store_true', help='print debug messages')
+    parser.add_argument('--log-file', default=None, help='JSON Lines file of log records')
+    parser.add_argument('--log-json', action='store_true', help='print log records as JSON lines')
+    args = parser.parse_args()
+    runner = JobRunner(args.workers, args.processes, args.vk_rate, args.ya_rate, args.manifest, args.log_dir,
+                       args.debug, args.log_file, args.log_json, vk_cache_path=args.vk_cache)
+    summary = runner.run(JobRunner.load_jobs(args.jobs))
+    Logger.flush()
+    print(json.dumps(summary, ensure_ascii=False, indent=2))
@@ -0,0 +1,187 @@
+import atexit
+import contextvars
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+import threading
+import uuid
+from contextlib import contextmanager
+
+
+class JsonFormatter(logging.Formatter):
+    """
+    Formats record as one JSON line with time, level, component, run and job IDs, message and extra fields
+    """
+    def format(self, record: logging.LogRecord):
+        data = {'time': record.created, 'level': record.levelname.lower(),
+                'component': getattr(record, 'component', record.name), 'run_id': getattr(record, 'run_id', None),
+                'job_id': getattr(record, 'job_id', None), 'message': record.getMessage()}
+        data.update(getattr(record, 'fields', None) or {})
+        return json.dumps(data, ensure_ascii=False, default=str)
+
+
+class DeferredQueueHandler(logging.handlers.QueueHandler):
+    """
+    Puts record into queue as is, so message is formatted by listener thread instead of logging thread.
+    Args of records must not be changed after logging, that is true for numbers and strings used by Logger
+    """
+    def prepare(self, record: logging.LogRecord):
+        return record
+
+
+class Logger:
+    """
+    Structured logger shared by all classes instead of print based log() methods. Records are put into queue
+    and written by one background thread (QueueListener), so logging never blocks requests. Messages are
+    formatted lazily with %-style args, so debug messages cost nothing when debug mode is off.
+    Every record has run ID (one per process run) and job ID (see job), so logs of many jobs can be split
+    """
+    NAME = 'photo_backup'
+    __run_id = uuid.uuid4().hex[:12]
+    __job_id = contextvars.ContextVar('job_id', default=None)
+    __lock = threading.Lock()
+    __queue = None
+    __listener = None
+    __pid = None
+    __exit_registered = False
+
+    def __init__(self, component: str, debug_mode=False):
+        """
+        :param component: name of logging class, e.g. 'ImageSaver'
+        :param debug_mode: if False, debug messages are dropped before formatting
+        """
+        self.__component = component
+        self.__debug_mode = debug_mode
+        self.__logger = logging.getLogger(f'{self.NAME}.{component}')
+
+    @classmethod
+    def configure(cls, stream=sys.stdout, path: str = None, json_format=False, level=logging.DEBUG):
+        """
+        Sets outputs of all loggers, can be called again to change them
+        :param stream: console stream, None means no console output
+        :param path: path of JSON Lines file, None means no file
+        :param json_format: if True, console records are JSON lines too, otherwise only messages are printed
+        :param level: min level of written records
+        """
+        with cls.__lock:
+            cls.__stop()
+            handlers = []
+            if stream is not None:
+                console = logging.StreamHandler(stream)
+                console.setFormatter(JsonFormatter() if json_format else logging.Formatter('%(message)s'))
+                handlers.append(console)
+            if path is not None:
+                file = logging.FileHandler(path, encoding='utf-8')
+                file.setFormatter(JsonFormatter())
+                handlers.append(file)
+            # queue is not limited, so put never waits
+            cls.__queue = queue.Queue()
+            cls.__listener = logging.handlers.QueueListener(cls.__queue, *handlers, respect_handler_level=True)
+            cls.__listener.start()
+            cls.__pid = os.getpid()
+            root = logging.getLogger(cls.NAME)
+            for handler in list(root.handlers):
+                root.removeHandler(handler)
+            root.addHandler(DeferredQueueHandler(cls.__queue))
+            root.setLevel(level)
+            root.propagate = False
+            if not cls.__exit_registered:
+                atexit.register(cls.shutdown)
+                cls.__exit_registered = True
+
+    @classmethod
+    def __stop(cls):
+        if cls.__listener is not None and cls.__pid == os.getpid():
+            cls.__listener.stop()
+        cls.__listener = None
+
+    @classmethod
+    def __ensure_configured(cls):
+        # listener thread is not copied to child process, so child gets own one
+        if cls.__pid != os.getpid():
+            cls.configure()
+
+    @classmethod
+    def flush(cls):
+        """
+        Waits until all queued records are written, e.g. before printing to the same console
+        """
+        if cls.__queue is not None and cls.__pid == os.getpid():
+            cls.__queue.join()
+
+    @classmethod
+    def shutdown(cls):
+        with cls.__lock:
+            cls.__stop()
+
+    @classmethod
+    def get_run_id(cls):
+        return cls.__run_id
+
+    @classmethod
+    def set_run_id(cls, run_id: str):
+        """
+        :param run_id: ID of current run, e.g. the same ID in all processes of one JobRunner run
+        """
+        cls.__run_id = run_id
+
+    @classmethod
+    def get_job_id(cls):
+        return cls.__job_id.get()
+
+    @classmethod
+    @contextmanager
+    def job(cls, job_id):
+        """
+        All records made inside with block in current thread or task get this job ID
+        """
+        token = cls.__job_id.set(job_id)
+        try:
+            yield
+        finally:
+            cls.__job_id.reset(token)
+
+    def is_debug_mode(self):
+        return self.__debug_mode
+
+    def __emit(self, level: int, message: str, args: tuple, fields: dict):
+        self.__ensure_configured()
+        if not self.__logger.isEnabledFor(level):
+            return
+        # record is made directly to skip search of caller frame, component is known anyway
+        self.__logger.handle(self.__logger.makeRecord(
+            self.__logger.name, level, self.__component, 0, message, args, None,
+            extra={'component': self.__component, 'run_id': self.__run_id, 'job_id': self.__job_id.get(),
+                   'fields': fields}))
+
+    def debug(self, message: str, *args, **fields):
+        """
+        :param message: message with %-style placeholders, it is formatted only if record is written
+        :param args: values of placeholders
+        :param fields: extra fields of JSON record, e.g. url='...'
+        """
+        if self.__debug_mode:
+            self.__emit(logging.DEBUG, message, args, fields)
+
+    def info(self, message: str, *args, **fields):
+        self.__emit(logging.INFO, message, args, fields)
+
+    def warning(self, message: str, *args, **fields):
+        self.__emit(logging.WARNING, message, args, fields)
+
+    def error(self, message: str, *args, **fields):
+        self.__emit(logging.ERROR, message, args, fields)
+
+    def log(self, message, is_debug_msg=False, sep=' '):
+        """
+        The same as old log() methods: debug messages are written in debug mode only, others are always written
+        :param message: string or list, tuple, set or dict, which items are joined with sep
+        """
+        if is_debug_msg and not self.__debug_mode:
+            return
+        if type(message) in [list, dict, tuple, set]:
+            message = sep.join(str(x) for x in message)
+        self.__emit(logging.DEBUG if is_debug_msg else logging.INFO, '%s', (message,), {})
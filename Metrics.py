@@ -0,0 +1,219 @@
+import bisect
+import json
+import threading
+import time
+from contextlib import contextmanager
+
+
+class Histogram:
+    """
+    Histogram with fixed buckets, the same as Prometheus histogram: observation costs one binary search
+    and memory doesn't grow with observations count
+    """
+    __slots__ = ('bounds', 'counts', 'count', 'sum')
+
+    def __init__(self, bounds: tuple):
+        """
+        :param bounds: sorted upper bounds of buckets, the last +Inf bucket is added automatically
+        """
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def get_cumulative(self):
+        """
+        :return: list of (upper bound, observations count not more than bound), the last bound is inf
+        """
+        result = []
+        total = 0
+        for bound, count in zip(self.bounds + (float('inf'),), self.counts):
+            total += count
+            result.append((bound, total))
+        return result
+
+    def quantile(self, part: float):
+        """
+        Estimates quantile by linear interpolation inside bucket, e.g. part=0.99 for p99
+        :return: estimated value, the last finite bound if quantile falls into +Inf bucket
+        """
+        if not self.count:
+            return 0.0
+        rank = part * self.count
+        lower = 0.0
+        total = 0
+        for bound, count in zip(self.bounds, self.counts):
+            if count and total + count >= rank:
+                return lower + (bound - lower) * (rank - total) / count
+            total += count
+            lower = bound
+        return self.bounds[-1] if self.bounds else 0.0
+
+
+class Metrics:
+    """
+    Thread-safe registry of counters and histograms with labels: requests, latency, bytes, retries and
+    API errors of every endpoint, and duration of ImageSaver stages. Every update is a dict lookup under
+    one lock, so metrics can stay on in production, and disabled registry doesn't do anything at all.
+    Snapshot can be exported as Prometheus text format or JSON
+    """
+    # seconds, from fast local calls to slow uploads
+    DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+    __default = None
+    __default_lock = threading.Lock()
+
+    def __init__(self, buckets: tuple = DEFAULT_BUCKETS, enabled=True):
+        """
+        :param buckets: upper bounds of histogram buckets in seconds
+        :param enabled: if False, all updates are ignored
+        """
+        self.__buckets = tuple(sorted(buckets))
+        self.__enabled = enabled
+        self.__lock = threading.Lock()
+        # (name, sorted tuple of label pairs) -> value
+        self.__counters = {}
+        self.__histograms = {}
+        self.__started = time.time()
+
+    @classmethod
+    def get_default(cls):
+        """
+        :return: registry shared by all clients which got no own registry
+        """
+        with cls.__default_lock:
+            if cls.__default is None:
+                cls.__default = cls()
+            return cls.__default
+
+    def is_enabled(self):
+        return self.__enabled
+
+    def set_enabled(self, enabled: bool):
+        self.__enabled = enabled
+
+    def inc(self, name: str, value=1, **labels):
+        """
+        Increases counter
+        :param name: counter name, e.g. 'http_requests_total'
+        :param value: increment
+        :param labels: label values, e.g. service='vk', endpoint='photos.get'
+        """
+        if not self.__enabled:
+            return
+        key = (name, tuple(sorted(labels.items())))
+        with self.__lock:
+            self.__counters[key] = self.__counters.get(key, 0) + value
+
+    def observe(self, name: str, value: float, **labels):
+        """
+        Adds observation to histogram
+        :param name: histogram name, e.g. 'http_request_duration_seconds'
+        :param value: observed value, usually seconds
+        :param labels: label values
+        """
+        if not self.__enabled:
+            return
+        key = (name, tuple(sorted(labels.items())))
+        with self.__lock:
+            histogram = self.__histograms.get(key)
+            if histogram is None:
+                histogram = self.__histograms[key] = Histogram(self.__buckets)
+            histogram.observe(value)
+
+    @contextmanager
+    def timer(self, name: str, **labels):
+        """
+        Measures duration of with block into histogram, e.g. with metrics.timer('stage_duration_seconds', stage='x')
+        """
+        if not self.__enabled:
+            yield
+            return
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - started, **labels)
+
+    def record_request(self, service: str, endpoint: str, status, seconds: float, bytes_out=0, bytes_in=0):
+        """
+        Records one HTTP request
+        :param service: API name, e.g. 'vk' or 'ya'
+        :param endpoint: API method or path without IDs
+        :param status: HTTP status code or error name if response was not received
+        :param seconds: time until response headers were received
+        :param bytes_out: request body size
+        :param bytes_in: response body size if known
+        """
+        if not self.__enabled:
+            return
+        labels = (('endpoint', endpoint), ('service', service))
+        with self.__lock:
+            for name, value in ((('http_requests_total', labels + (('status', str(status)),)), 1),
+                                (('http_request_bytes_total', labels), bytes_out),
+                                (('http_response_bytes_total', labels), bytes_in)):
+                self.__counters[name] = self.__counters.get(name, 0) + value
+            key = ('http_request_duration_seconds', labels)
+            histogram = self.__histograms.get(key)
+            if histogram is None:
+                histogram = self.__histograms[key] = Histogram(self.__buckets)
+            histogram.observe(seconds)
+
+    def reset(self):
+        with self.__lock:
+            self.__counters.clear()
+            self.__histograms.clear()
+            self.__started = time.time()
+
+    def snapshot(self):
+        """
+        :return: {'started': 'unix time of registry start or reset', 'counters': {name: [{'labels', 'value'}]},
+                  'histograms': {name: [{'labels', 'count', 'sum', 'p50', 'p99', 'buckets': [[bound, count]]}]}}
+        """
+        with self.__lock:
+            counters = list(self.__counters.items())
+            histograms = [(key, histogram.get_cumulative(), histogram.count, histogram.sum,
+                           histogram.quantile(0.5), histogram.quantile(0.99))
+                          for key, histogram in self.__histograms.items()]
+        result = {'started': self.__started, 'counters': {}, 'histograms': {}}
+        for (name, labels), value in sorted(counters):
+            result['counters'].setdefault(name, []).append({'labels': dict(labels), 'value': value})
+        for (name, labels), buckets, count, total, p50, p99 in sorted(histograms, key=lambda x: x[0]):
+            result['histograms'].setdefault(name, []).append(
+                {'labels': dict(labels), 'count': count, 'sum': total, 'p50': p50, 'p99': p99,
+                 'buckets': [[bound if bound != float('inf') else '+Inf', value] for bound, value in buckets]})
+        return result
+
+    def to_json(self, indent=None):
+        return json.dumps(self.snapshot(), indent=indent)
+
+    @staticmethod
+    def __format_labels(labels: dict, extra: dict = None):
+        labels = {**labels, **(extra or {})}
+        if not labels:
+            return ''
+        values = ','.join('{}="{}"'.format(key, str(value).replace('\\', '\\\\').replace('"', '\\"'))
+                          for key, value in labels.items())
+        return '{' + values + '}'
+
+    def to_prometheus(self):
+        """
+        :return: snapshot in Prometheus text exposition format
+        """
+        snapshot = self.snapshot()
+        lines = []
+        for name, series in snapshot['counters'].items():
+            lines.append(f'# TYPE {name} counter')
+            lines += [f'{name}{self.__format_labels(item["labels"])} {item["value"]}' for item in series]
+        for name, series in snapshot['histograms'].items():
+            lines.append(f'# TYPE {name} histogram')
+            for item in series:
+                for bound, count in item['buckets']:
+                    lines.append(f'{name}_bucket{self.__format_labels(item["labels"], {"le": bound})} {count}')
+                lines.append(f'{name}_sum{self.__format_labels(item["labels"])} {item["sum"]}')
+                lines.append(f'{name}_count{self.__format_labels(item["labels"])} {item["count"]}')
+        return '\n'.join(lines) + '\n'
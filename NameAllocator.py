@@ -0,0 +1,82 @@
+from datetime import datetime, timezone as dt_timezone, tzinfo
+
+
+class NameAllocator:
+    """
+    Gives every photo unique file name made by template. Taken names are kept in set and every base name has
+    own counter of suffixes, so duplicates get "_1", "_2"... without scanning taken names from the beginning.
+    Allocator can be seeded with names which already exist in target folder, so reruns never overwrite files
+    """
+    TEMPLATES = {'likes': '{likes}', 'likes_date': '{likes}_{date}', 'date': '{date}', 'id': '{owner_id}_{id}'}
+
+    def __init__(self, template='likes', used: set = None, date_format='%Y-%m-%d', separator='_',
+                 timezone: tzinfo = dt_timezone.utc):
+        """
+        :param template: one of TEMPLATES names or format string with {likes}, {date}, {id} and {owner_id} fields
+        :param used: already taken names without extensions, this set is updated by allocator
+        :param date_format: strftime format of {date} field
+        :param separator: separator between base name and number of duplicate
+        :param timezone: timezone of {date} field, UTC by default, so names don't depend on host settings
+        """
+        self.__template = self.TEMPLATES.get(template, template)
+        self.__used = used if used is not None else set()
+        self.__date_format = date_format
+        self.__separator = separator
+        self.__timezone = timezone
+        # next number to try for every base name which was already taken
+        self.__counters = {}
+        self.__with_date = '{date' in self.__template
+
+    def get_template(self):
+        return self.__template
+
+    def get_used(self):
+        return self.__used
+
+    def is_used(self, name: str):
+        return name in self.__used
+
+    def seed(self, names, strip_suffix=True):
+        """
+        Marks names as taken, e.g. names of files in target folder
+        :param names: iterable of file names
+        :param strip_suffix: if True, extension is removed, so '5.jpg' takes name '5'
+        """
+        for name in names:
+            if strip_suffix and '.' in name[1:]:
+                name = name[:name.rindex('.')]
+            self.__used.add(name)
+
+    def make_base(self, item: dict):
+        """
+        :param item: VK photo object
+        :return: name by template before duplicates are resolved
+        """
+        values = {'likes': item.get('likes', {}).get('count', 0), 'id': item.get('id'),
+                  'owner_id': item.get('owner_id')}
+        if self.__with_date:
+            values['date'] = datetime.fromtimestamp(item.get('date', 0), self.__timezone).strftime(self.__date_format)
+        return self.__template.format(**values)
+
+    def allocate(self, base: str):
+        """
+        :param base: wanted name
+        :return: base if it is free, otherwise base with the first free number, returned name becomes taken
+        """
+        if base not in self.__used:
+            self.__used.add(base)
+            return base
+        number = self.__counters.get(base, 1)
+        while f'{base}{self.__separator}{number}' in self.__used:
+            number += 1
+        self.__counters[base] = number + 1
+        name = f'{base}{self.__separator}{number}'
+        self.__used.add(name)
+        return name
+
+    def allocate_for(self, item: dict):
+        """
+        :param item: VK photo object
+        :return: unique name of photo
+        """
+        return self.allocate(self.make_base(item))
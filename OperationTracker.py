@@ -0,0 +1,198 @@
+import heapq
+import itertools
+import random
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+from Logger import Logger
+from Metrics import Metrics
+
+
+class OperationTracker:
+    """
+    Tracks many Yandex disk async operations (remote uploads, deletes, copies) in one background thread.
+    Every operation is polled with exponential backoff and jitter, so thousands of pending operations don't need
+    a blocking poll loop each. Completion is exposed through futures and callbacks
+    """
+    def __init__(self, uploader, base_delay=0.3, max_delay=10.0, jitter=0.5, timeout=300.0, concurrency=4,
+                 debug_mode=False, metrics: Metrics = None):
+        """
+        :param uploader: YaUploader instance, its check_operation method is used for polling
+        :param base_delay: delay before the first check in seconds, then it is doubled after every check
+        :param max_delay: max delay between checks of one operation
+        :param jitter: random part of delay, 0.5 means delay can be changed by +-50%
+        :param timeout: operation is considered failed if it is not finished after timeout seconds
+        :param concurrency: max status requests in flight
+        :param metrics: Metrics registry, which records duration of finished operations
+        """
+        self.__uploader = uploader
+        self.__base_delay = base_delay
+        self.__max_delay = max_delay
+        self.__jitter = jitter
+        self.__timeout = timeout
+        self.__concurrency = max(concurrency, 1)
+        self.__debug_mode = debug_mode
+        self.__logger = Logger(type(self).__name__, debug_mode)
+        self.__metrics = metrics
+        # heap of (next check time, sequence number, operation), sequence number keeps heap order stable
+        self.__queue = []
+        self.__sequence = itertools.count()
+        self.__condition = threading.Condition()
+        self.__thread = None
+        self.__closed = False
+        self.__futures = []
+        self.__latencies = []
+        self.__counters = {'success': 0, 'failed': 0, 'timeout': 0}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def log(self, message, is_debug_msg=False, sep=' '):
+        self.__logger.log(message, is_debug_msg, sep)
+
+    @staticmethod
+    def get_backoff_delay(attempt: int, base_delay=0.3, max_delay=10.0, jitter=0.5):
+        """
+        Exponential backoff with jitter, so many operations started at once are not checked at the same moments
+        :param attempt: number of already made attempts
+        :param base_delay: delay before first attempt
+        :param max_delay: max delay without jitter
+        :param jitter: random part of delay, 0.5 means delay can be changed by +-50%
+        :return: delay in seconds
+        """
+        delay = min(max_delay, base_delay * 2 ** attempt)
+        return delay * (1 + random.uniform(-jitter, jitter))
+
+    def __next_delay(self, attempt):
+        return self.get_backoff_delay(attempt, self.__base_delay, self.__max_delay, self.__jitter)
+
+    def track(self, url: str, name: str = None, callback=None):
+        """
+        Registers operation for polling
+        :param url: async operation URL, returned in "href" by Yandex API
+        :param name: operation name for logs and results, e.g. uploaded file name
+        :param callback: function which receives future when operation is finished
+        :return: future with {'object': {'url', 'name', 'status', 'latency', 'attempts'}, 'success', 'message'}
+        """
+        future = Future()
+        if callback is not None:
+            future.add_done_callback(callback)
+        started = time.monotonic()
+        operation = {'url': url, 'name': name or url, 'future': future, 'started': started, 'attempts': 0}
+        with self.__condition:
+            if self.__closed:
+                raise RuntimeError(f'{type(self).__name__} is closed')
+            self.__futures.append(future)
+            heapq.heappush(self.__queue, (started + self.__next_delay(0), next(self.__sequence), operation))
+            if self.__thread is None:
+                self.__thread = threading.Thread(target=self.__run, name=type(self).__name__, daemon=True)
+                self.__thread.start()
+            self.__condition.notify()
+        return future
+
+    def __run(self):
+        with ThreadPoolExecutor(max_workers=self.__concurrency) as executor:
+            while True:
+                with self.__condition:
+                    while not self.__closed and (not self.__queue or self.__queue[0][0] > time.monotonic()):
+                        self.__condition.wait(self.__queue[0][0] - time.monotonic() if self.__queue else None)
+                    if self.__closed:
+                        return
+                    due = []
+                    now = time.monotonic()
+                    while self.__queue and self.__queue[0][0] <= now:
+                        due.append(heapq.heappop(self.__queue)[2])
+                # all operations due at the same time are checked together
+                for operation, response in zip(due, executor.map(self.__check, due)):
+                    self.__handle(operation, response)
+
+    def __check(self, operation):
+        operation['attempts'] += 1
+        try:
+            return self.__uploader.check_operation(operation['url'])
+        except Exception as e:
+            # network errors are not final, operation will be checked again
+            return {'object': None, 'success': False, 'message': str(e)}
+
+    def __handle(self, operation, response):
+        if response['success'] and response['object'] == 'success':
+            self.__finish(operation, 'success', True, '')
+        elif response['success'] and response['object'] == 'failed':
+            self.__finish(operation, 'failed', False, 'Operation was not successful')
+        elif time.monotonic() - operation['started'] > self.__timeout:
+            self.__finish(operation, 'timeout', False, 'Timeout reached')
+        else:
+            delay = self.__next_delay(operation['attempts'])
+            self.__logger.debug('Operation %s is not finished, next check after %.2f sec', operation['name'], delay)
+            with self.__condition:
+                if not self.__closed:
+                    heapq.heappush(self.__queue, (time.monotonic() + delay, next(self.__sequence), operation))
+                    return
+            self.__finish(operation, 'timeout', False, 'Tracker closed')
+
+    def __finish(self, operation, status: str, success: bool, message: str):
+        latency = time.monotonic() - operation['started']
+        with self.__condition:
+            self.__counters[status] += 1
+            self.__latencies.append(latency)
+        if self.__metrics is not None:
+            self.__metrics.observe('operation_duration_seconds', latency, status=status)
+        self.__logger.debug('Operation %s finished with status %s in %.2f sec', operation['name'], status, latency)
+        operation['future'].set_result({'object': {'url': operation['url'], 'name': operation['name'],
+                                                   'status': status, 'latency': latency,
+                                                   'attempts': operation['attempts']},
+                                        'success': success, 'message': message})
+
+    def get_stats(self):
+        """
+        :return: dict with counters of finished operations and their latency in seconds
+        """
+        with self.__condition:
+            latencies = sorted(self.__latencies)
+            stats = {'tracked': len(self.__futures), 'pending': len(self.__futures) - len(latencies),
+                     **self.__counters}
+        if latencies:
+            stats.update({'latency_avg': sum(latencies) / len(latencies),
+                          'latency_p50': latencies[int(0.5 * (len(latencies) - 1))],
+                          'latency_p99': latencies[int(0.99 * (len(latencies) - 1))],
+                          'latency_max': latencies[-1]})
+        return stats
+
+    def wait(self, timeout=None):
+        """
+        Waits all tracked operations
+        :param timeout: max waiting time in seconds, None means waiting until every operation is finished
+        :return: {'object': 'stats of operations as in get_stats with list of failed operations',
+                 'success': 'True if all operations finished successfully',
+                 'message': 'contains error string if any or empty string'}
+        """
+        with self.__condition:
+            futures = list(self.__futures)
+        done, not_done = wait(futures, timeout=timeout)
+        failed = [future.result()['object'] for future in done if not future.result()['success']]
+        result = {'object': {**self.get_stats(), 'failed_operations': failed}, 'success': False, 'message': ''}
+        if not_done:
+            result['message'] = f'{len(not_done)} operations are still in progress'
+        elif failed:
+            result['message'] = f'{len(failed)} operations failed'
+        else:
+            result['success'] = True
+        return result
+
+    def close(self):
+        """
+        Stops polling, operations which are still pending are finished with "Tracker closed" message
+        """
+        with self.__condition:
+            self.__closed = True
+            pending = [item[2] for item in self.__queue]
+            self.__queue.clear()
+            self.__condition.notify()
+        if self.__thread is not None:
+            self.__thread.join()
+        for operation in pending:
+            if not operation['future'].done():
+                self.__finish(operation, 'timeout', False, 'Tracker closed')
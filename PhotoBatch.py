@@ -0,0 +1,142 @@
+import sys
+from array import array
+
+
+class PhotoBatch:
+    """
+    Columnar storage of VK photos chosen for upload: numbers are kept in typed arrays, extensions and size types
+    are stored once and referenced by small codes, so only file names and URLs remain Python strings.
+    Items are built on access as link lists [filename, extension, url, size type, owner ID, photo ID],
+    so batch can be used everywhere list of links is accepted
+    """
+    def __init__(self, links=None):
+        """
+        :param links: iterable of link lists to add
+        """
+        self.__names = []
+        self.__urls = []
+        self.__suffix_codes = array('H')
+        self.__size_codes = array('H')
+        self.__owner_ids = array('q')
+        self.__photo_ids = array('q')
+        self.__widths = array('I')
+        self.__heights = array('I')
+        self.__likes = array('I')
+        self.__dates = array('q')
+        # value tables of interned strings, code is index in table
+        self.__suffixes = []
+        self.__size_types = []
+        self.__suffix_index = {}
+        self.__size_index = {}
+        if links is not None:
+            self.extend(links)
+
+    @staticmethod
+    def __encode(table: list, index: dict, value: str):
+        code = index.get(value)
+        if code is None:
+            code = len(table)
+            table.append(sys.intern(value))
+            index[value] = code
+        return code
+
+    def add(self, name: str, suffix: str, url: str, size_type: str, owner_id: int = None, photo_id: int = None,
+            width=0, height=0, likes=0, date=0):
+        """
+        Adds photo without creating link list
+        :param name: file name without extension, e.g. likes count
+        :param suffix: file extension with dot, e.g. '.jpg'
+        :param url: URL of chosen photo size
+        :param size_type: VK size type letter of chosen size
+        :param owner_id: VK owner ID of photo
+        :param photo_id: VK photo ID
+        :param width: width of chosen size in pixels, 0 if unknown
+        :param height: height of chosen size in pixels, 0 if unknown
+        :param likes: likes count
+        :param date: photo date as unix time
+        """
+        self.__names.append(name)
+        self.__urls.append(url)
+        self.__suffix_codes.append(self.__encode(self.__suffixes, self.__suffix_index, suffix))
+        self.__size_codes.append(self.__encode(self.__size_types, self.__size_index, size_type))
+        # 0 is not valid VK ID, so it means absent ID
+        self.__owner_ids.append(owner_id or 0)
+        self.__photo_ids.append(photo_id or 0)
+        self.__widths.append(width or 0)
+        self.__heights.append(height or 0)
+        self.__likes.append(likes or 0)
+        self.__dates.append(date or 0)
+
+    def append(self, link):
+        """
+        :param link: link list [filename, extension, url, size type, owner ID, photo ID]
+        """
+        self.add(str(link[0]), link[1], link[2], str(link[3]), *link[4:6])
+
+    def extend(self, links):
+        if not isinstance(links, PhotoBatch):
+            for link in links:
+                self.append(link)
+            return
+        suffix_codes = [self.__encode(self.__suffixes, self.__suffix_index, value) for value in links.__suffixes]
+        size_codes = [self.__encode(self.__size_types, self.__size_index, value) for value in links.__size_types]
+        self.__names += links.__names
+        self.__urls += links.__urls
+        self.__suffix_codes.extend(suffix_codes[code] for code in links.__suffix_codes)
+        self.__size_codes.extend(size_codes[code] for code in links.__size_codes)
+        self.__owner_ids += links.__owner_ids
+        self.__photo_ids += links.__photo_ids
+        self.__widths += links.__widths
+        self.__heights += links.__heights
+        self.__likes += links.__likes
+        self.__dates += links.__dates
+
+    def __len__(self):
+        return len(self.__names)
+
+    def __getitem__(self, index):
+        if type(index) is slice:
+            # columns are copied as they are, so details of photos are kept
+            batch = PhotoBatch()
+            for i in range(*index.indices(len(self))):
+                batch.add(*self.get_details(i).values())
+            return batch
+        if index < 0:
+            index += len(self)
+        return [self.__names[index], self.__suffixes[self.__suffix_codes[index]], self.__urls[index],
+                self.__size_types[self.__size_codes[index]], self.__owner_ids[index] or None,
+                self.__photo_ids[index] or None]
+
+    def __iter__(self):
+        return (self[i] for i in range(len(self)))
+
+    def __eq__(self, other):
+        if isinstance(other, (PhotoBatch, list, tuple)):
+            return len(self) == len(other) and all(a == list(b) for a, b in zip(self, other))
+        return NotImplemented
+
+    def __repr__(self):
+        return f'{type(self).__name__}({len(self)} photos)'
+
+    def get_details(self, index: int):
+        """
+        :return: dict with all stored fields of photo, the same as params of add
+        """
+        if index < 0:
+            index += len(self)
+        name, suffix, url, size_type, owner_id, photo_id = self[index]
+        return {'name': name, 'suffix': suffix, 'url': url, 'size_type': size_type, 'owner_id': owner_id,
+                'photo_id': photo_id, 'width': self.__widths[index], 'height': self.__heights[index],
+                'likes': self.__likes[index], 'date': self.__dates[index]}
+
+    def get_names(self):
+        return self.__names
+
+    def get_urls(self):
+        return self.__urls
+
+    def to_lists(self):
+        """
+        :return: list of link lists [filename, extension, url, size type, owner ID, photo ID]
+        """
+        return list(self)
@@ -0,0 +1,174 @@
+import asyncio
+import hashlib
+import threading
+import time
+from Logger import Logger
+
+
+class RateLimiter:
+    """
+    Thread-safe token bucket: requests are sent at the allowed rate with short bursts, instead of sleeping
+    fixed delay after every request. Limiters can be shared by key, e.g. all clients with the same VK token
+    use one budget of 3 requests per second, while clients with different tokens don't wait for each other.
+    Limiter is adaptive: throttled responses halve the rate and can pause all callers (see throttle),
+    and successful requests restore it step by step (see recover)
+    """
+    # part of max rate restored after every successful request
+    RECOVERY_STEP = 0.05
+    __shared = {}
+    __shared_lock = threading.Lock()
+
+    def __init__(self, rate=3.0, burst: int = None, min_rate: float = None):
+        """
+        :param rate: tokens (requests) per second, it is also max rate of adaptive limiter
+        :param burst: max tokens saved while limiter is idle, by default 1, so requests are evenly spaced
+                      (VK counts requests in every second, so burst of saved tokens can exceed the limit)
+        :param min_rate: rate is never lowered below it by throttling, by default 1/10 of rate
+        """
+        self.__rate = float(rate)
+        self.__max_rate = self.__rate
+        self.__min_rate = float(min_rate) if min_rate is not None else self.__rate / 10
+        self.__burst = float(burst if burst is not None else 1)
+        self.__tokens = self.__burst
+        self.__updated = time.monotonic()
+        self.__lock = threading.Lock()
+        self.__acquired = 0
+        self.__waited = 0.0
+        self.__throttled = 0
+
+    @classmethod
+    def get_shared(cls, key: str, rate=3.0, burst: int = None):
+        """
+        :param key: budget name, e.g. 'vk:<token hash>'
+        :param rate: rate of new limiter, existing limiter keeps its rate and a warning is logged if it differs
+        :param burst: burst of new limiter
+        :return: limiter shared by all callers with the same key in this process
+        """
+        with cls.__shared_lock:
+            limiter = cls.__shared.get(key)
+            if limiter is None:
+                limiter = cls.__shared[key] = cls(rate, burst)
+            elif limiter.__max_rate != float(rate) or limiter.__burst != float(burst if burst is not None else 1):
+                Logger(cls.__name__).warning('Limiter %s is shared with rate %g and burst %g, requested rate %g and '
+                                             'burst %s are ignored', key, limiter.__max_rate, limiter.__burst,
+                                             rate, burst, key=key)
+            return limiter
+
+    @classmethod
+    def for_token(cls, service: str, token: str, rate=3.0, burst: int = None):
+        """
+        Shared limiter of one API token, token itself is not kept in limiter keys
+        :param service: API name, e.g. 'vk' or 'ya'
+        :param token: API token
+        """
+        return cls.get_shared(f'{service}:{hashlib.sha256(token.encode()).hexdigest()[:16]}', rate, burst)
+
+    def get_rate(self):
+        return self.__rate
+
+    def get_max_rate(self):
+        return self.__max_rate
+
+    def set_rate(self, rate: float):
+        """
+        Sets both current and max rate
+        """
+        with self.__lock:
+            self.__refill()
+            self.__rate = self.__max_rate = float(rate)
+            self.__min_rate = min(self.__min_rate, self.__rate)
+
+    def __refill(self):
+        now = time.monotonic()
+        # time of last update is in future while limiter is paused, tokens are not added until then
+        if now > self.__updated:
+            self.__tokens = min(self.__burst, self.__tokens + (now - self.__updated) * self.__rate)
+            self.__updated = now
+
+    def try_acquire(self, tokens=1):
+        """
+        :return: True if tokens were taken without waiting
+        """
+        with self.__lock:
+            self.__refill()
+            if self.__tokens < tokens:
+                return False
+            self.__tokens -= tokens
+            self.__acquired += tokens
+            return True
+
+    def reserve(self, tokens=1, timeout: float = None):
+        """
+        Takes tokens in advance: bucket can go below zero, so every caller gets own time slot
+        and waiting callers are served in order of their calls
+        :param tokens: tokens count, usually one per request
+        :param timeout: max waiting time in seconds, None means waiting as long as needed
+        :return: seconds to wait before sending request, or None if it is longer than timeout (nothing is taken)
+        """
+        with self.__lock:
+            self.__refill()
+            delay = max(0.0, self.__updated - time.monotonic()) + max(0.0, tokens - self.__tokens) / self.__rate
+            if timeout is not None and delay > timeout:
+                return None
+            self.__tokens -= tokens
+            self.__acquired += tokens
+            self.__waited += delay
+            return delay
+
+    def acquire(self, tokens=1, timeout: float = None):
+        """
+        Waits until tokens are available and takes them
+        :param tokens: tokens count, usually one per request
+        :param timeout: max waiting time in seconds, None means waiting as long as needed
+        :return: True if tokens were taken, False if timeout reached
+        """
+        delay = self.reserve(tokens, timeout)
+        if delay is None:
+            return False
+        if delay > 0:
+            time.sleep(delay)
+        return True
+
+    async def acquire_async(self, tokens=1, timeout: float = None):
+        """
+        The same as acquire, but waits without blocking event loop, so async and sync clients can share limiter
+        """
+        delay = self.reserve(tokens, timeout)
+        if delay is None:
+            return False
+        if delay > 0:
+            await asyncio.sleep(delay)
+        return True
+
+    def throttle(self, retry_after: float = 0.0):
+        """
+        Slows limiter down after throttled response: rate is halved (but not below min rate),
+        saved tokens are dropped and, if server asked to wait, nobody gets tokens until then
+        :param retry_after: seconds to wait from Retry-After header or similar hint, 0 if there is no hint
+        """
+        with self.__lock:
+            self.__refill()
+            self.__rate = max(self.__min_rate, self.__rate / 2)
+            self.__tokens = min(self.__tokens, 0.0)
+            self.__updated = max(self.__updated, time.monotonic() + (retry_after or 0.0))
+            self.__throttled += 1
+
+    def recover(self):
+        """
+        Speeds limiter up after successful request, so rate returns to max rate when throttling is over
+        """
+        if self.__rate >= self.__max_rate:
+            return
+        with self.__lock:
+            # time passed before the change is credited at the old rate
+            self.__refill()
+            self.__rate = min(self.__max_rate, self.__rate + self.__max_rate * self.RECOVERY_STEP)
+
+    def get_stats(self):
+        """
+        :return: dict with current and max rate, taken tokens count, total waiting time in seconds
+                 and count of throttled responses
+        """
+        with self.__lock:
+            return {'rate': self.__rate, 'max_rate': self.__max_rate, 'acquired': self.__acquired,
+                    'waited': self.__waited, 'throttled': self.__throttled}
@@ -0,0 +1,211 @@
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from Metrics import Metrics
+
+
+class ResponseCache:
+    """
+    Persistent cache of VK read responses (users.get, photos.get, photos.getAlbums and others) in SQLite,
+    so reruns and dry runs against the same accounts don't repeat requests and don't spend rate limits.
+    Responses are keyed by method and normalized params within scope of one token (only its hash is kept),
+    every method has its own TTL, and the least recently used responses are evicted over size bounds.
+    Totals of responses are kept in database by triggers, so several processes (e.g. of JobRunner) can share one file,
+    hits and misses are counted by this instance only
+    """
+    # seconds, methods without TTL are never cached
+    DEFAULT_TTLS = {'users.get': 86400.0, 'status.get': 600.0, 'friends.getMutual': 3600.0, 'photos.get': 3600.0,
+                    'photos.getAlbums': 3600.0}
+
+    def __init__(self, db_path='vk_cache.db', ttls: dict = None, max_entries=10000, max_bytes=64 * 2 ** 20,
+                 metrics: Metrics = None):
+        """
+        :param db_path: path of SQLite database file, ':memory:' can be used for one-time runs
+        :param ttls: TTL in seconds by method name, they replace DEFAULT_TTLS, 0 disables caching of method
+        :param max_entries: max cached responses
+        :param max_bytes: max total size of cached responses
+        :param metrics: Metrics registry, which counts hits and misses, shared one is used by default
+        """
+        self.__db_path = db_path
+        self.__ttls = {**self.DEFAULT_TTLS, **(ttls or {})}
+        self.__max_entries = max_entries
+        self.__max_bytes = max_bytes
+        self.__metrics = metrics if metrics is not None else Metrics.get_default()
+        self.__hits = 0
+        self.__misses = 0
+        self.__lock = threading.Lock()
+        self.__connection = sqlite3.connect(db_path, check_same_thread=False)
+        self.__connection.execute('PRAGMA journal_mode=WAL')
+        self.__connection.execute('PRAGMA synchronous=NORMAL')
+        # methods are names of all calls in response separated by commas, e.g. ',photos.get,users.get,' for execute
+        self.__connection.execute('CREATE TABLE IF NOT EXISTS responses ('
+                                  'key TEXT PRIMARY KEY, scope TEXT NOT NULL, method TEXT NOT NULL, '
+                                  'content TEXT NOT NULL, size INTEGER NOT NULL, expires REAL NOT NULL, '
+                                  'accessed REAL NOT NULL, methods TEXT NOT NULL DEFAULT \'\')')
+        columns = [row[1] for row in self.__connection.execute('PRAGMA table_info(responses)')]
+        if 'methods' not in columns:
+            self.__connection.execute("ALTER TABLE responses ADD COLUMN methods TEXT NOT NULL DEFAULT ''")
+            self.__connection.execute("UPDATE responses SET methods=',' || method || ','")
+            # calls of cached execute requests are unknown, so they couldn't be invalidated by method
+            self.__connection.execute("DELETE FROM responses WHERE method='execute'")
+        self.__connection.execute('CREATE INDEX IF NOT EXISTS responses_accessed ON responses (accessed)')
+        # totals are updated by triggers, so bounds are checked without table scan
+        self.__connection.execute('CREATE TABLE IF NOT EXISTS totals (id INTEGER PRIMARY KEY CHECK (id=0), '
+                                  'entries INTEGER NOT NULL, bytes INTEGER NOT NULL)')
+        self.__connection.execute('CREATE TRIGGER IF NOT EXISTS responses_insert AFTER INSERT ON responses BEGIN '
+                                  'UPDATE totals SET entries=entries+1, bytes=bytes+NEW.size; END')
+        self.__connection.execute('CREATE TRIGGER IF NOT EXISTS responses_delete AFTER DELETE ON responses BEGIN '
+                                  'UPDATE totals SET entries=entries-1, bytes=bytes-OLD.size; END')
+        self.__connection.execute('INSERT OR IGNORE INTO totals SELECT 0, COUNT(*), COALESCE(SUM(size), 0) '
+                                  'FROM responses')
+        self.__connection.commit()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def get_path(self):
+        return self.__db_path
+
+    def get_ttl(self, method: str):
+        """
+        :return: TTL of method in seconds, 0 if method is not cached
+        """
+        return self.__ttls.get(method, 0.0)
+
+    def get_batch_ttl(self, methods: list):
+        """
+        :param methods: method names of calls in one execute request
+        :return: the shortest TTL of methods, 0 if any of them is not cached
+        """
+        return min((self.get_ttl(method) for method in methods), default=0.0)
+
+    def get_stats(self):
+        """
+        :return: dict with entries and bytes of all cached responses and hits and misses of this instance
+        """
+        with self.__lock:
+            entries, size = self.__get_totals()
+            return {'entries': entries, 'bytes': size, 'hits': self.__hits, 'misses': self.__misses}
+
+    def __get_totals(self):
+        return self.__connection.execute('SELECT entries, bytes FROM totals').fetchone()
+
+    @staticmethod
+    def make_scope(token: str, version: str = ''):
+        """
+        :return: scope of responses of one token and API version, token itself is not kept
+        """
+        return f'{hashlib.sha256(token.encode()).hexdigest()[:16]}:{version}'
+
+    @staticmethod
+    def make_key(scope: str, method: str, params: dict = None):
+        """
+        :param params: request params, their order and value types (1 or '1') don't matter
+        """
+        params = {str(key): str(value) for key, value in (params or {}).items()
+                  if value is not None and key != 'access_token'}
+        data = json.dumps([scope, method, sorted(params.items())], ensure_ascii=False)
+        return hashlib.sha256(data.encode()).hexdigest()
+
+    def get(self, scope: str, method: str, params: dict = None):
+        """
+        :return: cached decoded response or None if it is absent or expired
+        """
+        key = self.make_key(scope, method, params)
+        now = time.time()
+        with self.__lock:
+            row = self.__connection.execute('SELECT content, expires FROM responses WHERE key=?', (key,)).fetchone()
+            if row is not None and row[1] > now:
+                self.__connection.execute('UPDATE responses SET accessed=? WHERE key=?', (now, key))
+                self.__connection.commit()
+                self.__hits += 1
+            else:
+                if row is not None:
+                    self.__connection.execute('DELETE FROM responses WHERE key=?', (key,))
+                    self.__connection.commit()
+                self.__misses += 1
+                row = None
+        self.__metrics.inc('cache_requests_total', service='vk', method=method,
+                           result='miss' if row is None else 'hit')
+        return None if row is None else json.loads(row[0])
+
+    def put(self, scope: str, method: str, params: dict, content, ttl: float = None, methods: list = None):
+        """
+        :param content: decoded response
+        :param ttl: TTL in seconds, TTL of method by default
+        :param methods: names of calls in response, e.g. of execute request, then response is invalidated with
+                        any of them. Only method itself by default
+        """
+        ttl = self.get_ttl(method) if ttl is None else ttl
+        if ttl <= 0:
+            return
+        key = self.make_key(scope, method, params)
+        data = json.dumps(content, ensure_ascii=False, separators=(',', ':'))
+        size = len(data.encode())
+        if size > self.__max_bytes:
+            return
+        now = time.time()
+        with self.__lock:
+            self.__connection.execute('DELETE FROM responses WHERE key=?', (key,))
+            self.__connection.execute('INSERT INTO responses VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                                      (key, scope, method, data, size, now + ttl, now,
+                                       ',' + ','.join(methods or [method]) + ','))
+            self.__evict()
+            self.__connection.commit()
+
+    def __evict(self):
+        entries, size = self.__get_totals()
+        # expired responses go first, then the least recently used ones
+        if entries > self.__max_entries or size > self.__max_bytes:
+            self.__connection.execute('DELETE FROM responses WHERE expires<=?', (time.time(),))
+            entries, size = self.__get_totals()
+        while entries > self.__max_entries or size > self.__max_bytes:
+            rows = self.__connection.execute('SELECT key, size FROM responses ORDER BY accessed LIMIT ?',
+                                             (max(entries - self.__max_entries, 16),)).fetchall()
+            if not rows:
+                break
+            for key, row_size in rows:
+                self.__connection.execute('DELETE FROM responses WHERE key=?', (key,))
+                entries -= 1
+                size -= row_size
+                if entries <= self.__max_entries and size <= self.__max_bytes:
+                    break
+
+    def invalidate(self, scope: str = None, method: str = None, params: dict = None):
+        """
+        Removes cached responses, e.g. after user changed status
+        :param scope: scope of token, None means all tokens
+        :param method: method name, None means all methods. Responses containing its calls (see put) are removed too
+        :param params: params of one request, used with scope and method only
+        """
+        with self.__lock:
+            if scope is not None and method is not None and params is not None:
+                self.__connection.execute('DELETE FROM responses WHERE key=?', (self.make_key(scope, method, params),))
+            else:
+                conditions = []
+                if scope is not None:
+                    conditions.append(('scope=?', (scope,)))
+                if method is not None:
+                    conditions.append(('(method=? OR instr(methods, ?) > 0)', (method, f',{method},')))
+                where = ' AND '.join(x[0] for x in conditions) or '1=1'
+                self.__connection.execute(f'DELETE FROM responses WHERE {where}',
+                                          tuple(value for x in conditions for value in x[1]))
+            self.__connection.commit()
+
+    def purge_expired(self):
+        """
+        :return: count of removed expired responses
+        """
+        with self.__lock:
+            count = self.__connection.execute('DELETE FROM responses WHERE expires<=?', (time.time(),)).rowcount
+            self.__connection.commit()
+            return count
+
+    def close(self):
+        with self.__lock:
+            self.__connection.close()
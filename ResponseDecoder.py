@@ -0,0 +1,238 @@
+import io
+import itertools
+import json
+import sys
+from functools import lru_cache
+from http.client import responses
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+try:
+    import ujson
+except ImportError:
+    ujson = None
+try:
+    import ijson
+except ImportError:
+    # without ijson streamed responses are decoded as a whole and then cut to requested fields
+    ijson = None
+
+
+class ResponseDecoder:
+    """
+    Shared decoder of JSON API responses into {'object', 'success', 'message'} result dicts. Lookup paths are
+    parsed once and cached, JSON decoder is pluggable (orjson or ujson is used if installed), and big responses
+    can be decoded incrementally with ijson, so only requested fields of list items are built
+    """
+    __default_loads = orjson.loads if orjson is not None else ujson.loads if ujson is not None else json.loads
+    __STREAM_CHUNK_SIZE = 64 * 1024
+
+    def __init__(self, error_getter=None, loads=None):
+        """
+        :param error_getter: function which receives decoded JSON and returns API error message or None
+        :param loads: JSON decoder function, which accepts bytes, by default the fastest installed one is used
+        """
+        self.__error_getter = error_getter
+        self.__loads = loads
+
+    @staticmethod
+    def get_default_loads():
+        return ResponseDecoder.__default_loads
+
+    @staticmethod
+    def set_default_loads(loads):
+        """
+        Replaces JSON decoder of all decoders created without own one
+        :param loads: function which accepts bytes and returns decoded object, e.g. json.loads
+        """
+        ResponseDecoder.__default_loads = loads
+
+    def loads(self, content: bytes):
+        return (self.__loads or ResponseDecoder.__default_loads)(content)
+
+    @staticmethod
+    @lru_cache(maxsize=256)
+    def compile_path(path: str, sep=','):
+        """
+        Splits lookup path once, e.g. 'response, items' becomes ('response', 'items'), result is cached
+        :param path: path to JSON object, separated by sep
+        :param sep: delimiter sign in path string
+        :return: tuple of keys
+        """
+        # correcting some small mistypes in path (spaces, multiple delimiters)
+        return tuple(key.strip() for key in (path or '').split(sep) if key.strip())
+
+    @staticmethod
+    def extract_path(result: dict, path='', sep=','):
+        """
+        This method replaces object in result dict with nested object found by path
+        :param result: result dict with decoded JSON in 'object'
+        :param path: path to JSON object, separated by sep
+        :param sep: delimiter sign in path string
+        :return: the same result dict with found object, success flag and message
+        """
+        for key in ResponseDecoder.compile_path(path, sep):
+            # If we found list in JSON we can no longer go forward, so we stop and return what we have
+            if type(result['object']) is list:
+                break
+            found = result['object'].get(key) if type(result['object']) is dict else None
+            # if any part of path doesn't found, we return null object
+            if found is None:
+                result['object'] = None
+                result['message'] = 'Object not found'
+                return result
+            result['object'] = found
+        result['success'] = True
+        return result
+
+    @staticmethod
+    def check_status(response):
+        """
+        :return: failed result dict if response has not successful status code, otherwise None
+        """
+        if 200 <= response.status_code < 300:
+            return None
+        return {'object': None, 'success': False,
+                'message': f'Request error: {response.status_code} ({responses.get(response.status_code, "")})'}
+
+    def finish(self, content, path='', sep=','):
+        """
+        Applies error getter and lookup path to already decoded JSON
+        :param content: decoded JSON
+        :param path: path to JSON object, separated by sep
+        :param sep: delimiter sign in path string
+        :return: the same as decode
+        """
+        result = {'object': content, 'success': False, 'message': ''}
+        if self.__error_getter is not None:
+            error = self.__error_getter(content)
+            if error:
+                result['object'] = None
+                result['message'] = error
+                return result
+        return self.extract_path(result, path, sep)
+
+    def decode(self, response, path='', sep=',', items_prefix='', fields=None):
+        """
+        This method returns object from JSON response using specified path OR returns errors
+        :param response: requests.Response or any object with status_code and content
+        :param path: path to JSON object, separated by sep
+        :param sep: delimiter sign in path string
+        :param items_prefix: dotted path of list items in ijson notation, e.g. 'response.items.item'
+        :param fields: names of item fields to keep, other fields are dropped right after decoding
+        :return: {'object': 'contains found JSON object or None if response body empty',
+                 'success': 'True if requested path found (if specified) and no error codes',
+                 'message': 'contains error string if any or empty string'}
+        """
+        result = self.check_status(response)
+        if result is not None:
+            return result
+        # to prevent json parsing error if body is empty, but only when lookup path doesn't specified
+        if not path and len(response.content) == 0:
+            return {'object': None, 'success': True, 'message': 'Response body is empty'}
+        try:
+            content = self.loads(response.content)
+        except ValueError:
+            return {'object': None, 'success': False, 'message': 'JSON decode error'}
+        if fields is not None:
+            self.__cut_fields(content, self.compile_path(items_prefix, '.'), set(fields))
+        return self.finish(content, path, sep)
+
+    def decode_stream(self, response, path='', sep=',', items_prefix='', fields=None):
+        """
+        Decodes response body incrementally while it is downloaded (request should be sent with stream=True),
+        so whole body is never kept in memory and fields which are not requested are never built.
+        It takes more CPU time than decode, so it is worth for big responses only. Without ijson it is
+        the same as decode
+        :param response: requests.Response or any object with status_code and content
+        :param path: path to JSON object, separated by sep
+        :param sep: delimiter sign in path string
+        :param items_prefix: dotted path of list items in ijson notation, e.g. 'response.items.item'
+        :param fields: names of item fields to keep, if None items are kept as is
+        :return: the same as decode
+        """
+        try:
+            if ijson is None:
+                return self.decode(response, path, sep, items_prefix, fields)
+            result = self.check_status(response)
+            if result is not None:
+                return result
+            try:
+                content = self.__build(self.__open(response), items_prefix, fields)
+            except ijson.JSONError:
+                return {'object': None, 'success': False, 'message': 'JSON decode error'}
+            if content is None and not path:
+                return {'object': None, 'success': True, 'message': 'Response body is empty'}
+            return self.finish(content, path, sep)
+        finally:
+            if hasattr(response, 'close'):
+                response.close()
+
+    @staticmethod
+    def __open(response):
+        if not hasattr(response, 'iter_content'):
+            return io.BytesIO(response.content)
+        return ChunksReader(response.iter_content(ResponseDecoder.__STREAM_CHUNK_SIZE))
+
+    @staticmethod
+    def __build(file, items_prefix: str, fields):
+        builder = ijson.ObjectBuilder()
+        fields = None if fields is None else set(fields)
+        skipped = None
+        events = ijson.parse(file, use_float=True)
+        try:
+            prefix, event, value = next(events)
+        except ijson.IncompleteJSONError:
+            # body is empty
+            return None
+        events = itertools.chain([(prefix, event, value)], events)
+        for prefix, event, value in events:
+            if skipped is not None:
+                # value of skipped field ends with scalar or closing event with the same prefix
+                if prefix == skipped and event not in ('start_map', 'start_array', 'map_key'):
+                    skipped = None
+                continue
+            if fields is not None and event == 'map_key' and prefix == items_prefix and value not in fields:
+                skipped = f'{prefix}.{value}'
+                continue
+            if event == 'map_key' or (event == 'string' and len(value) <= 2):
+                # the same keys and short values (e.g. size types) are repeated in every item, so they are shared
+                value = sys.intern(value)
+            builder.event(event, value)
+        return getattr(builder, 'value', None)
+
+    @staticmethod
+    def __cut_fields(content, keys: tuple, fields: set):
+        if not keys:
+            if type(content) is dict:
+                for key in [key for key in content if key not in fields]:
+                    del content[key]
+            return
+        if keys[0] == 'item' and type(content) is list:
+            for item in content:
+                ResponseDecoder.__cut_fields(item, keys[1:], fields)
+        elif type(content) is dict and keys[0] in content:
+            ResponseDecoder.__cut_fields(content[keys[0]], keys[1:], fields)
+
+
+class ChunksReader:
+    """
+    Minimal file-like wrapper over iterator of bytes chunks, so downloaded chunks can be parsed by ijson
+    """
+    def __init__(self, chunks):
+        self.__chunks = iter(chunks)
+        self.__buffer = b''
+
+    def read(self, size=-1):
+        if size is None or size < 0:
+            data, self.__buffer = self.__buffer + b''.join(self.__chunks), b''
+            return data
+        while not self.__buffer:
+            chunk = next(self.__chunks, None)
+            if chunk is None:
+                return b''
+            self.__buffer = chunk
+        data, self.__buffer = self.__buffer[:size], self.__buffer[size:]
+        return data
@@ -0,0 +1,282 @@
+import asyncio
+import email.utils
+import hashlib
+import threading
+import time
+import requests
+from Metrics import Metrics
+from OperationTracker import OperationTracker
+from RateLimiter import RateLimiter
+
+
+class CircuitOpenError(requests.exceptions.ConnectionError):
+    """
+    Raised instead of sending request while circuit breaker is open
+    """
+
+
+class CircuitBreaker:
+    """
+    Stops requests to service which fails again and again: after failure_threshold failed requests in a row
+    circuit is open and requests fail at once without network calls. After reset_timeout one trial request
+    is allowed (half-open state), its success closes circuit and its failure opens it again
+    """
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+    __shared = {}
+    __shared_lock = threading.Lock()
+
+    def __init__(self, failure_threshold=5, reset_timeout=30.0):
+        """
+        :param failure_threshold: failed requests in a row which open circuit
+        :param reset_timeout: seconds after which trial request is allowed
+        """
+        self.__failure_threshold = max(failure_threshold, 1)
+        self.__reset_timeout = reset_timeout
+        self.__failures = 0
+        self.__state = self.CLOSED
+        self.__opened = 0.0
+        self.__lock = threading.Lock()
+
+    @classmethod
+    def get_shared(cls, key: str, failure_threshold=5, reset_timeout=30.0):
+        """
+        :param key: breaker name, e.g. 'vk:<API URL>:<token hash>', see for_client
+        :return: breaker shared by all clients with the same key in this process
+        """
+        with cls.__shared_lock:
+            breaker = cls.__shared.get(key)
+            if breaker is None:
+                breaker = cls.__shared[key] = cls(failure_threshold, reset_timeout)
+            return breaker
+
+    @classmethod
+    def for_client(cls, service: str, api_base_url: str, token: str = None, failure_threshold=5, reset_timeout=30.0):
+        """
+        Shared breaker of one API URL and token: clients with a dead URL, bad token or exhausted rate budget
+        don't open circuit of other clients, token itself is not kept in breaker keys
+        :param service: API name, e.g. 'vk' or 'ya'
+        :param api_base_url: API URL of client
+        :param token: API token, None means breaker is shared by all tokens of the URL
+        """
+        token_hash = hashlib.sha256(token.encode()).hexdigest()[:16] if token else ''
+        return cls.get_shared(f'{service}:{api_base_url}:{token_hash}', failure_threshold, reset_timeout)
+
+    def get_state(self):
+        with self.__lock:
+            return self.__state
+
+    def allow(self):
+        """
+        :return: True if request can be sent
+        """
+        with self.__lock:
+            if self.__state == self.OPEN and time.monotonic() - self.__opened >= self.__reset_timeout:
+                # only the first caller after timeout gets trial request
+                self.__state = self.HALF_OPEN
+                return True
+            return self.__state == self.CLOSED
+
+    def record_success(self):
+        with self.__lock:
+            self.__failures = 0
+            self.__state = self.CLOSED
+
+    def record_failure(self):
+        with self.__lock:
+            self.__failures += 1
+            if self.__state == self.HALF_OPEN or self.__failures >= self.__failure_threshold:
+                self.__state = self.OPEN
+                self.__opened = time.monotonic()
+
+
+class RetryPolicy:
+    """
+    Retries throttled and temporarily failed requests with exponential backoff and jitter.
+    Server hint (Retry-After header) is honoured, rate limiter of requests is slowed down on every throttled
+    response and restored on success, and circuit breaker stops requests to service which is down
+    """
+    # VK API errors: too many requests per second, flood control, internal server error
+    VK_ERROR_CODES = (6, 9, 10)
+    HTTP_STATUSES = (429, 503)
+
+    def __init__(self, max_attempts=5, base_delay=0.5, max_delay=30.0, jitter=0.5, statuses=HTTP_STATUSES,
+                 error_codes=(), breaker: CircuitBreaker = None, metrics: Metrics = None, service=''):
+        """
+        :param max_attempts: max requests count including the first one
+        :param base_delay: delay before the first retry in seconds, then it is doubled after every retry
+        :param max_delay: max delay between retries without jitter
+        :param jitter: random part of delay, 0.5 means delay can be changed by +-50%
+        :param statuses: HTTP status codes which are retried
+        :param error_codes: API error codes which are retried, see get_retry_after of clients
+        :param breaker: CircuitBreaker of the service, None means no breaker
+        :param metrics: Metrics registry, which counts retries
+        :param service: service label of counted retries, e.g. 'vk'
+        """
+        self.__max_attempts = max(max_attempts, 1)
+        self.__base_delay = base_delay
+        self.__max_delay = max_delay
+        self.__jitter = jitter
+        self.__statuses = frozenset(statuses)
+        self.__error_codes = frozenset(error_codes)
+        self.__breaker = breaker
+        self.__retries = 0
+        self.__metrics = metrics
+        self.__service = service
+
+    @classmethod
+    def for_vk(cls, api_base_url='https://api.vk.com/method/', token: str = None, **kwargs):
+        """
+        Policy for VK API: HTTP 429/503 and API errors 6, 9, 10 are retried, breaker is shared by VK clients
+        with the same API URL and token, see CircuitBreaker.for_client
+        """
+        kwargs.setdefault('error_codes', cls.VK_ERROR_CODES)
+        if 'breaker' not in kwargs:
+            kwargs['breaker'] = CircuitBreaker.for_client('vk', api_base_url, token)
+        kwargs.setdefault('service', 'vk')
+        return cls(**kwargs)
+
+    @classmethod
+    def for_yandex(cls, api_base_url='https://cloud-api.yandex.net:443', token: str = None, **kwargs):
+        """
+        Policy for Yandex disk API: HTTP 429/503 are retried, breaker is shared by Yandex clients
+        with the same API URL and token, see CircuitBreaker.for_client
+        """
+        if 'breaker' not in kwargs:
+            kwargs['breaker'] = CircuitBreaker.for_client('ya', api_base_url, token)
+        kwargs.setdefault('service', 'ya')
+        return cls(**kwargs)
+
+    def get_breaker(self):
+        return self.__breaker
+
+    def get_retries(self):
+        return self.__retries
+
+    def set_metrics(self, metrics: Metrics):
+        self.__metrics = metrics
+
+    def is_retryable_error(self, code):
+        return code in self.__error_codes
+
+    @staticmethod
+    def parse_retry_after(value):
+        """
+        :param value: Retry-After header value, seconds or HTTP date
+        :return: seconds to wait or None if value is absent or invalid
+        """
+        if not value:
+            return None
+        try:
+            return max(0.0, float(value))
+        except ValueError:
+            pass
+        try:
+            date = email.utils.parsedate_to_datetime(value)
+        except (TypeError, ValueError):
+            return None
+        return max(0.0, date.timestamp() - time.time())
+
+    def get_response_retry_after(self, response):
+        """
+        :param response: requests.Response or any object with status_code and headers
+        :return: None if response is final, otherwise seconds to wait from Retry-After header, 0 if it is absent
+        """
+        if response.status_code not in self.__statuses:
+            return None
+        return self.parse_retry_after(response.headers.get('Retry-After')) or 0.0
+
+    def get_delay(self, attempt: int, retry_after=0.0):
+        """
+        :param attempt: number of already made attempts minus one
+        :param retry_after: seconds to wait suggested by server
+        :return: delay before the next attempt, not shorter than server asked
+        """
+        return max(retry_after or 0.0,
+                   OperationTracker.get_backoff_delay(attempt, self.__base_delay, self.__max_delay, self.__jitter))
+
+    def __check_breaker(self):
+        if self.__breaker is not None and not self.__breaker.allow():
+            raise CircuitOpenError('Circuit is open after repeated failures, request is not sent')
+
+    def __get_next_delay(self, attempt: int, result, error: Exception, get_retry_after, limiter: RateLimiter):
+        """
+        Handles result or connection error of attempt
+        :return: None if result is final, otherwise delay before the next attempt,
+                 error is raised if attempts are over
+        """
+        if error is not None:
+            if self.__breaker is not None:
+                self.__breaker.record_failure()
+            if attempt + 1 >= self.__max_attempts:
+                raise error
+            retry_after = 0.0
+            reason = 'connection'
+        else:
+            retry_after = get_retry_after(result)
+            if retry_after is None:
+                if self.__breaker is not None:
+                    self.__breaker.record_success()
+                if limiter is not None:
+                    limiter.recover()
+                return None
+            if limiter is not None:
+                limiter.throttle(retry_after)
+            reason = 'throttled'
+            if attempt + 1 >= self.__max_attempts:
+                # throttling is not outage, so only exhausted attempts are counted by breaker
+                if self.__breaker is not None:
+                    self.__breaker.record_failure()
+                return None
+        if self.__metrics is not None:
+            self.__metrics.inc('retries_total', service=self.__service, reason=reason)
+        self.__retries += 1
+        return self.get_delay(attempt, retry_after)
+
+    def run(self, send, get_retry_after, limiter: RateLimiter = None):
+        """
+        Sends request until it is not throttled or attempts are over
+        :param send: callable without params which sends request and returns its result
+        :param get_retry_after: callable which gets result and returns None if result is final, otherwise
+                                seconds to wait suggested by server, 0 if server gave no hint
+        :param limiter: RateLimiter of the requests, it is slowed down on throttling and restored on success
+        :return: result of the last attempt, connection errors of the last attempt are raised
+        """
+        attempt = 0
+        while True:
+            self.__check_breaker()
+            result, error = None, None
+            try:
+                result = send()
+            except CircuitOpenError:
+                raise
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+                error = e
+            delay = self.__get_next_delay(attempt, result, error, get_retry_after, limiter)
+            if delay is None:
+                return result
+            time.sleep(delay)
+            attempt += 1
+
+    async def run_async(self, send, get_retry_after, limiter: RateLimiter = None, errors=(asyncio.TimeoutError,)):
+        """
+        The same as run for coroutines, delays don't block event loop
+        :param send: callable without params which returns coroutine sending request
+        :param errors: connection errors of the async HTTP library, which are retried
+        """
+        attempt = 0
+        while True:
+            self.__check_breaker()
+            result, error = None, None
+            try:
+                result = await send()
+            except CircuitOpenError:
+                raise
+            except errors as e:
+                error = e
+            delay = self.__get_next_delay(attempt, result, error, get_retry_after, limiter)
+            if delay is None:
+                return result
+            await asyncio.sleep(delay)
+            attempt += 1
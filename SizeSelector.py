@@ -0,0 +1,104 @@
+class SizeSelector:
+    """
+    Chooses one size of every VK photo by policy:
+    'max' - the biggest size, 'max_pixels' - the biggest size with width * height not more than pixels,
+    'type' - size with exact type letter (or the closest one by rank), 'width' - size with the closest width.
+    Rank and nominal dimensions of size types are precomputed once, sizes without dimensions (photos older
+    than 2012 year) are compared by nominal dimensions of their type https://vk.com/dev/objects/photo_sizes
+    """
+    POLICIES = ('max', 'max_pixels', 'type', 'width')
+    # rank of size types, the same as was used for fallback in ImageSaver
+    RANKS = {'s': 1, 'm': 2, 'x': 3, 'o': 4, 'p': 5, 'q': 6, 'r': 7, 'y': 8, 'z': 9, 'w': 10}
+    # max dimensions of size types
+    TYPE_DIMENSIONS = {'s': (75, 75), 'm': (130, 130), 'x': (604, 604), 'o': (130, 130), 'p': (200, 200),
+                       'q': (320, 320), 'r': (510, 510), 'y': (807, 807), 'z': (1080, 1024), 'w': (2560, 2048)}
+
+    def __init__(self, policy='max', pixels: int = None, size_type: str = None, width: int = None):
+        """
+        :param policy: one of POLICIES
+        :param pixels: max width * height for 'max_pixels' policy, e.g. 1280 * 1024
+        :param size_type: type letter for 'type' policy, e.g. 'x'
+        :param width: target width in pixels for 'width' policy
+        """
+        if policy not in self.POLICIES:
+            raise ValueError(f'Unknown size policy: {policy}, expected one of {", ".join(self.POLICIES)}')
+        if policy == 'max_pixels' and not pixels:
+            raise ValueError('pixels should be set for max_pixels policy')
+        if policy == 'type' and size_type not in self.RANKS:
+            raise ValueError(f'Unknown size type: {size_type}')
+        if policy == 'width' and not width:
+            raise ValueError('width should be set for width policy')
+        self.__policy = policy
+        self.__pixels = pixels
+        self.__size_type = size_type
+        self.__width = width
+        self.__key = {'max': self.__max_key, 'max_pixels': self.__max_pixels_key, 'type': self.__type_key,
+                      'width': self.__width_key}[policy]
+
+    def __str__(self):
+        value = {'max_pixels': self.__pixels, 'type': self.__size_type, 'width': self.__width}.get(self.__policy)
+        return self.__policy if value is None else f'{self.__policy}:{value}'
+
+    @classmethod
+    def from_string(cls, policy: str):
+        """
+        Makes selector from short form, e.g. 'max', 'max_pixels:1310720', 'type:x' or 'width:1280'
+        """
+        name, _, value = policy.partition(':')
+        if name == 'max_pixels':
+            return cls(name, pixels=int(value))
+        if name == 'type':
+            return cls(name, size_type=value)
+        if name == 'width':
+            return cls(name, width=int(value))
+        return cls(name)
+
+    def get_policy(self):
+        return self.__policy
+
+    @staticmethod
+    def get_dimensions(size: dict):
+        """
+        :param size: VK photo size object
+        :return: tuple of width and height, nominal dimensions of size type are used if real ones are absent
+        """
+        width, height = size.get('width') or 0, size.get('height') or 0
+        if width and height:
+            return width, height
+        return SizeSelector.TYPE_DIMENSIONS.get(size.get('type'), (0, 0))
+
+    def __max_key(self, size: dict):
+        width, height = self.get_dimensions(size)
+        return width * height, self.RANKS.get(size.get('type'), 0)
+
+    def __max_pixels_key(self, size: dict):
+        width, height = self.get_dimensions(size)
+        area = width * height
+        # sizes which fit go first and the biggest of them wins, otherwise the smallest size is taken
+        fits = area <= self.__pixels
+        return fits, area if fits else -area
+
+    def __type_key(self, size: dict):
+        rank = self.RANKS.get(size.get('type'), 0)
+        # exact type wins, otherwise the closest rank, bigger one if there are two
+        return -abs(rank - self.RANKS[self.__size_type]), rank
+
+    def __width_key(self, size: dict):
+        width = self.get_dimensions(size)[0]
+        return -abs(width - self.__width), width
+
+    def select(self, sizes: list):
+        """
+        :param sizes: list of VK photo size objects
+        :return: chosen size object or None if list is empty
+        """
+        return max(sizes, key=self.__key) if sizes else None
+
+    def select_page(self, items: list):
+        """
+        Chooses sizes for whole page of photos in one pass
+        :param items: list of VK photo objects requested with photo_sizes param
+        :return: list of chosen size objects in the same order, None for photos without sizes
+        """
+        key = self.__key
+        return [max(item['sizes'], key=key) if item.get('sizes') else None for item in items]
@@ -0,0 +1,226 @@
+import threading
+from Logger import Logger
+
+
+class SocialGraph:
+    """
+    In-memory graph of mutual friends of VK users, loaded in bulk through one VkClient.
+    friends.getMutual calls get up to 100 target users each and are sent in execute requests (up to 25 calls
+    per request), profiles of friends are loaded by users.get with up to 1000 IDs per request.
+    Loaded mutual friends and profiles are kept, so repeated and overlapping queries make no requests
+    """
+    # max target_uids of one friends.getMutual call
+    MUTUAL_TARGETS_LIMIT = 100
+
+    def __init__(self, client, debug_mode=False, calls_per_request=25):
+        """
+        :param client: VkClient, which token is used for all requests
+        :param calls_per_request: API calls in one execute request, VK allows max 25
+        """
+        self.__client = client
+        self.__calls_per_request = calls_per_request
+        self.__logger = Logger(type(self).__name__, debug_mode)
+        self.__lock = threading.Lock()
+        # adjacency of loaded pairs: user ID -> {other user ID -> tuple of their mutual friends IDs}
+        self.__mutual = {}
+        # user ID -> profile from users.get
+        self.__profiles = {}
+
+    def log(self, message, is_debug_msg=False, sep=' '):
+        self.__logger.log(message, is_debug_msg, sep)
+
+    def get_client(self):
+        return self.__client
+
+    def get_stats(self):
+        with self.__lock:
+            return {'users': len(self.__mutual), 'pairs': sum(len(x) for x in self.__mutual.values()) // 2,
+                    'profiles': len(self.__profiles)}
+
+    @staticmethod
+    def get_pair(client, other):
+        """
+        Checks operands of "client & other" of VkClient and AsyncVkClient
+        :return: tuple of user IDs of both clients, or None if other is not a client of the same type
+                 or any of clients is not initialized
+        """
+        if type(other).__name__ != type(client).__name__ or not client.is_initialized() or not other.is_initialized():
+            return None
+        return int(client.get_id()), int(other.get_id())
+
+    @staticmethod
+    def iter_chunks(ids: list, size: int):
+        """
+        :return: generator of lists of up to size IDs, e.g. of one users.get request
+        """
+        for start in range(0, len(ids), size):
+            yield ids[start:start + size]
+
+    @staticmethod
+    def parse_mutual(items):
+        """
+        :param items: response of friends.getMutual with target_uids, list of target IDs and their common_friends
+        :return: dict of tuples of mutual friends IDs by target user ID
+        """
+        return {int(item['id']): tuple(item.get('common_friends') or ()) for item in items or []}
+
+    def invalidate(self, user_id=None):
+        """
+        Forgets loaded mutual friends and profiles
+        :param user_id: user whose pairs and profile are removed, None means all users
+        """
+        with self.__lock:
+            if user_id is None:
+                self.__mutual.clear()
+                self.__profiles.clear()
+                return
+            user_id = int(user_id)
+            self.__profiles.pop(user_id, None)
+            for other in self.__mutual.pop(user_id, {}):
+                self.__mutual.get(other, {}).pop(user_id, None)
+
+    def __get_cached(self, source: int, target: int):
+        return self.__mutual.get(source, {}).get(target)
+
+    def __put(self, source: int, target: int, friends: tuple):
+        # mutual friends are symmetric, so pair is known from both sides
+        self.__mutual.setdefault(source, {})[target] = friends
+        self.__mutual.setdefault(target, {})[source] = friends
+
+    def load_mutual(self, pairs):
+        """
+        Loads mutual friends of pairs which are not loaded yet. Targets of one source are requested together
+        :param pairs: iterable of (source user ID, target user ID)
+        :return: {'object': 'count of loaded pairs',
+                 'success': 'True if all requests succeeded',
+                 'message': 'contains error string if any or empty string'}
+        """
+        targets = {}
+        with self.__lock:
+            for source, target in pairs:
+                source, target = int(source), int(target)
+                if source != target and self.__get_cached(source, target) is None:
+                    targets.setdefault(source, set()).add(target)
+        calls = [self.__client.make_mutual_friends_call(chunk, source) for source, source_targets in targets.items()
+                 for chunk in self.iter_chunks(sorted(source_targets), self.MUTUAL_TARGETS_LIMIT)]
+        result = {'object': 0, 'success': True, 'message': ''}
+        if not calls:
+            return result
+        self.__logger.debug('Loading mutual friends of %d pairs by %d calls...',
+                            sum(len(x) for x in targets.values()), len(calls))
+        for call, response in zip(calls, self.__client.execute_batch(calls, self.__calls_per_request)):
+            if not response['success']:
+                # e.g. private profile, other calls are still useful
+                result.update({'success': False, 'message': response['message']})
+                continue
+            source = int(call[1]['source_uid'])
+            with self.__lock:
+                for target, friends in self.parse_mutual(response['object']).items():
+                    self.__put(source, target, friends)
+                    result['object'] += 1
+        return result
+
+    def get_mutual_friends(self, source_id, target_ids: list):
+        """
+        :param source_id: user ID, whose friends are compared
+        :param target_ids: IDs of other users
+        :return: {'object': 'dict of mutual friends IDs lists by target ID, failed targets are absent',
+                 'success': 'True if mutual friends of all targets are known',
+                 'message': 'contains error string if any or empty string'}
+        """
+        source_id = int(source_id)
+        loaded = self.load_mutual((source_id, target) for target in target_ids)
+        result = {'object': {}, 'success': True, 'message': loaded['message']}
+        with self.__lock:
+            for target in target_ids:
+                friends = self.__get_cached(source_id, int(target))
+                if friends is None:
+                    result['success'] = False
+                    continue
+                result['object'][int(target)] = list(friends)
+        if not result['success'] and not result['message']:
+            result['message'] = 'Mutual friends are not returned for some users'
+        return result
+
+    def get_common_friends(self, user_ids: list):
+        """
+        N-way intersection: friends who are friends of all users at once
+        :param user_ids: two or more user IDs
+        :return: {'object': 'list of friends IDs in order of friends of the first user',
+                 'success': 'True if mutual friends of all users are known',
+                 'message': 'contains error string if any or empty string'}
+        """
+        user_ids = list(dict.fromkeys(int(x) for x in user_ids))
+        if len(user_ids) < 2:
+            return {'object': None, 'success': False, 'message': 'At least two users are needed'}
+        # friends of all users are the intersection of mutual friends of the first user with every other user
+        mutual = self.get_mutual_friends(user_ids[0], user_ids[1:])
+        if not mutual['success']:
+            return {'object': None, 'success': False, 'message': mutual['message']}
+        lists = sorted(mutual['object'].values(), key=len)
+        common = set(lists[0])
+        for friends in lists[1:]:
+            if not common:
+                break
+            common.intersection_update(friends)
+        order = mutual['object'][user_ids[1]]
+        return {'object': [x for x in order if x in common], 'success': True, 'message': ''}
+
+    def get_mutual_matrix(self, user_ids: list):
+        """
+        Loads mutual friends of every pair of users, e.g. to find the most connected users of a group
+        :param user_ids: user IDs
+        :return: {'object': 'dict of mutual friends IDs lists by pairs (user ID, other user ID), where
+                             user goes before other one in user_ids',
+                 'success': 'True if mutual friends of all pairs are known',
+                 'message': 'contains error string if any or empty string'}
+        """
+        user_ids = list(dict.fromkeys(int(x) for x in user_ids))
+        pairs = [(user_ids[i], other) for i in range(len(user_ids)) for other in user_ids[i + 1:]]
+        loaded = self.load_mutual(pairs)
+        result = {'object': {}, 'success': True, 'message': loaded['message']}
+        with self.__lock:
+            for pair in pairs:
+                friends = self.__get_cached(*pair)
+                if friends is None:
+                    result['success'] = False
+                    continue
+                result['object'][pair] = list(friends)
+        if not result['success'] and not result['message']:
+            result['message'] = 'Mutual friends are not returned for some pairs'
+        return result
+
+    def get_profiles(self, user_ids: list):
+        """
+        Loads profiles of users which are not loaded yet by users.get, up to VkClient.USERS_LIMIT IDs per request
+        :param user_ids: user IDs
+        :return: {'object': 'dict of profiles by user ID, deleted or failed users are absent',
+                 'success': 'True if all requests succeeded',
+                 'message': 'contains error string if any or empty string'}
+        """
+        user_ids = list(dict.fromkeys(int(x) for x in user_ids))
+        with self.__lock:
+            missing = [x for x in user_ids if x not in self.__profiles]
+        result = {'object': {}, 'success': True, 'message': ''}
+        for chunk in self.iter_chunks(missing, self.__client.USERS_LIMIT):
+            users = self.__client.get_users(user_ids=chunk)
+            if not users['success']:
+                result.update({'success': False, 'message': users['message']})
+                continue
+            with self.__lock:
+                for user in users['object']:
+                    self.__profiles[int(user['id'])] = user
+        with self.__lock:
+            result['object'] = {x: self.__profiles[x] for x in user_ids if x in self.__profiles}
+        return result
+
+    def get_clients(self, user_ids: list):
+        """
+        :param user_ids: user IDs
+        :return: {'object': 'list of VkClient of users with the same token, they make no requests to check users',
+                 'success': 'True if profiles of all users are loaded',
+                 'message': 'contains error string if any or empty string'}
+        """
+        profiles = self.get_profiles(user_ids)
+        clients = [self.__client.make_client(profile) for profile in profiles['object'].values()]
+        return {'object': clients, 'success': profiles['success'], 'message': profiles['message']}
@@ -0,0 +1,126 @@
+import sqlite3
+import threading
+import time
+
+
+class SyncManifest:
+    """
+    Persistent local manifest of uploaded photos, keyed by target folder, VK owner ID, photo ID and chosen size.
+    After crash or interrupted upload, rerun uploads only photos which are missing in manifest.
+    Manifest is also dedup index of photos: find_photo looks photo up by owner ID and photo ID in all folders,
+    so photo found in several albums is uploaded once and other folders only link to its disk path
+    """
+    def __init__(self, db_path='sync_manifest.db'):
+        """
+        :param db_path: path of SQLite database file, ':memory:' can be used for one-time runs
+        """
+        self.__db_path = db_path
+        self.__lock = threading.Lock()
+        self.__connection = sqlite3.connect(db_path, check_same_thread=False)
+        # WAL journal makes every commit cheap, so each upload is saved immediately
+        self.__connection.execute('PRAGMA journal_mode=WAL')
+        self.__connection.execute('PRAGMA synchronous=NORMAL')
+        self.__connection.execute('CREATE TABLE IF NOT EXISTS uploads ('
+                                  'folder TEXT NOT NULL, owner_id INTEGER NOT NULL, photo_id INTEGER NOT NULL, '
+                                  'size_type TEXT NOT NULL, filename TEXT NOT NULL, disk_path TEXT NOT NULL, '
+                                  'url TEXT, uploaded REAL NOT NULL, '
+                                  'PRIMARY KEY (folder, owner_id, photo_id, size_type))')
+        # MD5 of content is known for streamed uploads only, column is added to manifests of older versions
+        columns = [row[1] for row in self.__connection.execute('PRAGMA table_info(uploads)')]
+        if 'md5' not in columns:
+            self.__connection.execute('ALTER TABLE uploads ADD COLUMN md5 TEXT')
+        self.__connection.execute('CREATE INDEX IF NOT EXISTS uploads_photo ON uploads (owner_id, photo_id)')
+        self.__connection.commit()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def get_path(self):
+        return self.__db_path
+
+    @staticmethod
+    def get_key(file):
+        """
+        :param file: link record [filename, extension, url, size type, owner ID, photo ID]
+        :return: tuple of owner ID, photo ID and size type or None if record has no photo identity
+        """
+        if len(file) < 6 or file[4] is None or file[5] is None:
+            return None
+        return int(file[4]), int(file[5]), str(file[3])
+
+    def get_disk_path(self, folder: str, file):
+        """
+        :param folder: target folder on disk
+        :param file: link record as returned by get_images_links
+        :return: disk path where photo was uploaded or None if it wasn't uploaded yet
+        """
+        key = self.get_key(file)
+        if key is None:
+            return None
+        with self.__lock:
+            row = self.__connection.execute('SELECT disk_path FROM uploads WHERE folder=? AND owner_id=? AND '
+                                            'photo_id=? AND size_type=?', (folder, *key)).fetchone()
+        return row[0] if row else None
+
+    def is_uploaded(self, folder: str, file):
+        return self.get_disk_path(folder, file) is not None
+
+    def mark_uploaded(self, folder: str, file, disk_path: str, md5: str = None):
+        """
+        Saves uploaded photo to manifest and commits immediately, so it survives crash
+        :param folder: target folder on disk
+        :param file: link record as returned by get_images_links
+        :param disk_path: path of uploaded file on disk, or path of the same photo in other folder if it was linked
+        :param md5: MD5 of file content if known
+        """
+        key = self.get_key(file)
+        if key is None:
+            return
+        with self.__lock:
+            self.__connection.execute('INSERT OR REPLACE INTO uploads (folder, owner_id, photo_id, size_type, '
+                                      'filename, disk_path, url, uploaded, md5) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                                      (folder, *key, f'{file[0]}{file[1]}', disk_path, file[2], time.time(), md5))
+            self.__connection.commit()
+
+    def find_photo(self, owner_id: int, photo_id: int):
+        """
+        Looks photo up in all folders
+        :return: {'folder', 'disk_path', 'size_type', 'md5'} of the first uploaded copy or None if photo is unknown
+        """
+        with self.__lock:
+            row = self.__connection.execute('SELECT folder, disk_path, size_type, md5 FROM uploads '
+                                            'WHERE owner_id=? AND photo_id=? ORDER BY uploaded LIMIT 1',
+                                            (int(owner_id), int(photo_id))).fetchone()
+        return {'folder': row[0], 'disk_path': row[1], 'size_type': row[2], 'md5': row[3]} if row else None
+
+    def forget(self, folder: str):
+        """
+        Removes all records of folder, e.g. after folder was deleted on disk
+        :param folder: target folder on disk
+        """
+        with self.__lock:
+            self.__connection.execute('DELETE FROM uploads WHERE folder=?', (folder,))
+            self.__connection.commit()
+
+    def count(self, folder: str):
+        with self.__lock:
+            return self.__connection.execute('SELECT COUNT(*) FROM uploads WHERE folder=?', (folder,)).fetchone()[0]
+
+    def get_uploaded(self, folder: str):
+        """
+        :param folder: target folder on disk
+        :return: list of {'filename', 'size'} entries of all photos uploaded to folder, in upload order,
+                 photos linked to other folders have 'disk_path' of their copy
+        """
+        with self.__lock:
+            rows = self.__connection.execute('SELECT filename, size_type, disk_path FROM uploads WHERE folder=? '
+                                             'ORDER BY uploaded', (folder,)).fetchall()
+        return [{'filename': row[0], 'size': row[1]} if row[2] == f'{folder}/{row[0]}'
+                else {'filename': row[0], 'size': row[1], 'disk_path': row[2]} for row in rows]
+
+    def close(self):
+        with self.__lock:
+            self.__connection.close()
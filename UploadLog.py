@@ -0,0 +1,210 @@
+import json
+import os
+import pathlib as pl
+import threading
+import time
+
+
+class UploadLog:
+    """
+    Append-only JSON Lines log of uploaded files. Every entry is written as soon as file is accepted and flushed
+    to disk in batches, so crash loses at most one batch. New entries can be synced to Yandex disk as separate
+    segment files, so the log on disk is never rewritten as a whole.
+    Synced position and disk folder of the log are kept in state file next to it (e.g. images_log.jsonl.state),
+    so continued log knows entries which previous run couldn't sync before crash
+    """
+    def __init__(self, path='images_log.jsonl', flush_every=50, fsync=True, append=False):
+        """
+        :param path: local path of JSON Lines file
+        :param flush_every: entries count after which file is flushed (and synced with fsync)
+        :param fsync: if True, flushed data is also forced to physical disk
+        :param append: if True, existing log is continued and its entries which are not synced yet (see state file)
+                       are synced with new ones, otherwise log is truncated
+        """
+        self.__path = path
+        self.__state_path = path + '.state'
+        self.__flush_every = max(flush_every, 1)
+        self.__fsync = fsync
+        self.__lock = threading.Lock()
+        state = {}
+        if append:
+            self.__drop_torn_line(path)
+            state = self.__read_state()
+        elif os.path.exists(self.__state_path):
+            os.remove(self.__state_path)
+        self.__file = open(path, 'a' if append else 'w', encoding='utf-8')
+        self.__unflushed = 0
+        # entries of this run start here, the log before it belongs to previous runs
+        self.__run_offset = self.__file.tell()
+        # log without state was written by older version, which synced it at the end of every run
+        self.__synced_offset = min(state.get('offset', self.__run_offset), self.__run_offset)
+        self.__folder = state.get('folder')
+        # entries left unsynced by previous run are synced with entries of this run
+        self.__count = self.__count_lines(self.__synced_offset) if self.__synced_offset < self.__run_offset else 0
+        self.__synced_count = 0
+        self.__segment = 0
+        self.__run_id = time.strftime('%Y%m%d%H%M%S')
+
+    def __read_state(self):
+        try:
+            with open(self.__state_path, encoding='utf-8') as file:
+                return json.load(file)
+        except (OSError, ValueError):
+            return {}
+
+    def __write_state(self):
+        # state is replaced at once, so crash leaves either old or new state
+        temp_path = self.__state_path + '.tmp'
+        with open(temp_path, 'w', encoding='utf-8') as file:
+            json.dump({'offset': self.__synced_offset, 'folder': self.__folder}, file)
+        os.replace(temp_path, self.__state_path)
+
+    def __count_lines(self, offset: int):
+        with open(self.__path, 'rb') as file:
+            file.seek(offset)
+            return sum(chunk.count(b'\n') for chunk in iter(lambda: file.read(1 << 16), b''))
+
+    @staticmethod
+    def __drop_torn_line(path: str):
+        # crash while writing can leave incomplete last line, it is cut, so new entries start on their own line
+        if not os.path.exists(path):
+            return
+        with open(path, 'rb+') as file:
+            size = file.seek(0, os.SEEK_END)
+            if size == 0:
+                return
+            file.seek(size - 1)
+            if file.read(1) == b'\n':
+                return
+            position = size
+            while position > 0:
+                start = max(0, position - 4096)
+                file.seek(start)
+                newline = file.read(position - start).rfind(b'\n')
+                if newline >= 0:
+                    file.truncate(start + newline + 1)
+                    return
+                position = start
+            file.truncate(0)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def get_path(self):
+        return self.__path
+
+    def get_count(self):
+        """
+        :return: count of entries which are synced or are to be synced by this log object
+        """
+        return self.__count
+
+    def get_folder(self):
+        """
+        :return: disk folder of the log entries with "/" at the end, which is saved in state file,
+                 or None if it is not set yet
+        """
+        return self.__folder
+
+    def set_folder(self, folder: str):
+        """
+        Saves disk folder of new entries in state file, entries left by previous run should be synced before
+        :param folder: target folder on disk, with "/" at the end
+        """
+        with self.__lock:
+            self.__folder = folder
+            self.__write_state()
+
+    def get_unsynced_count(self):
+        return self.__count - self.__synced_count
+
+    def append(self, entry: dict):
+        """
+        Writes one entry, file is flushed after every flush_every entries
+        :param entry: JSON serializable dict, e.g. {'filename': '34.jpg', 'size': 'z'}
+        """
+        with self.__lock:
+            self.__file.write(json.dumps(entry, ensure_ascii=False) + '\n')
+            self.__count += 1
+            self.__unflushed += 1
+            if self.__unflushed >= self.__flush_every:
+                self.__flush()
+
+    def __flush(self):
+        self.__file.flush()
+        if self.__fsync:
+            os.fsync(self.__file.fileno())
+        self.__unflushed = 0
+
+    def flush(self):
+        with self.__lock:
+            self.__flush()
+
+    def read(self, current_run=False):
+        """
+        :param current_run: if True, only entries appended by this log object are returned
+        :return: list of all entries in log file, incomplete last line left by crash is skipped
+        """
+        self.flush()
+        entries = []
+        with open(self.__path, encoding='utf-8') as file:
+            if current_run:
+                file.seek(self.__run_offset)
+            for line in file:
+                if not line.strip():
+                    continue
+                try:
+                    entries.append(json.loads(line))
+                except ValueError:
+                    # only the last line can be incomplete after crash
+                    if line.endswith('\n'):
+                        raise
+        return entries
+
+    def export_json(self, json_path: str, entries: list = None):
+        """
+        Exports log as classic JSON array
+        :param json_path: path of JSON file
+        :param entries: entries to export instead of entries of this run, e.g. all files of folder from manifest
+        """
+        if entries is None:
+            entries = self.read(current_run=True)
+        with open(json_path, 'w') as json_file:
+            json.dump(entries, json_file)
+
+    def sync(self, uploader, folder: str):
+        """
+        Uploads entries appended since previous sync as a new segment file, e.g. images_log.20201020123000.0001.jsonl
+        :param uploader: YaUploader instance
+        :param folder: target folder on disk, with "/" at the end
+        :return: upload result dict of YaUploader or success result if nothing to sync
+        """
+        with self.__lock:
+            self.__flush()
+            if self.__count == self.__synced_count:
+                return {'object': None, 'success': True, 'message': 'Nothing to sync'}
+            with open(self.__path, 'rb') as file:
+                file.seek(self.__synced_offset)
+                data = file.read()
+            offset, count = self.__synced_offset + len(data), self.__count
+            self.__segment += 1
+            path = pl.Path(self.__path)
+            disk_name = f'{path.stem}.{self.__run_id}.{self.__segment:04d}{path.suffix}'
+        response = uploader.upload_stream(folder + disk_name, data)
+        with self.__lock:
+            if response['success']:
+                self.__synced_offset, self.__synced_count = offset, count
+                self.__folder = folder
+                self.__write_state()
+            else:
+                self.__segment -= 1
+        return response
+
+    def close(self):
+        with self.__lock:
+            if not self.__file.closed:
+                self.__flush()
+                self.__file.close()
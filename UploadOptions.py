@@ -0,0 +1,78 @@
+from SyncManifest import SyncManifest
+
+
+class UploadOptions:
+    """
+    How ImageSaver uploads files to disk: concurrency, error policy, confirmation, manifest and log options.
+    One object is passed to upload_remote_files, upload_album and upload_account, so options are set once
+    and every album of account is uploaded the same way
+    """
+    def __init__(self, concurrency=1, fail_fast=True, confirm=False, manifest: SyncManifest = None, dedup=False,
+                 buffer_size=1000, log_sync_every=100, export_json=True):
+        """
+        :param concurrency: max uploads in flight, by default files are uploaded one by one
+        :param fail_fast: if True, stop on first failed file, otherwise continue and collect failures
+        :param confirm: if True, waits until Yandex actually fetches accepted files, only confirmed files are logged,
+                        streamed files (see ImageSaver.set_transfer_mode) are stored before they are accepted
+        :param manifest: if set, files already uploaded to folder are skipped and new ones are saved to manifest,
+                         so interrupted upload can be resumed, JSON log will contain all files uploaded to folder
+        :param dedup: if True, photo met several times (e.g. in wall and profile albums) is uploaded once, and photo
+                      uploaded to other folder before (see manifest) is linked to its disk path instead of upload.
+                      Off by default, so every file passed is uploaded as before
+        :param buffer_size: max links loaded ahead of uploads by upload_album and upload_account
+        :param log_sync_every: new log entries count after which they are synced to disk, 0 means sync at the end only
+        :param export_json: if True, log is also exported locally as classic JSON array
+        """
+        if concurrency < 1:
+            raise ValueError(f'concurrency should be positive: {concurrency}')
+        if buffer_size < 1:
+            raise ValueError(f'buffer_size should be positive: {buffer_size}')
+        if log_sync_every < 0:
+            raise ValueError(f'log_sync_every should not be negative: {log_sync_every}')
+        self.__concurrency = concurrency
+        self.__fail_fast = fail_fast
+        self.__confirm = confirm
+        self.__manifest = manifest
+        self.__dedup = dedup
+        self.__buffer_size = buffer_size
+        self.__log_sync_every = log_sync_every
+        self.__export_json = export_json
+
+    def __repr__(self):
+        return f'{type(self).__name__}({", ".join(f"{k}={v!r}" for k, v in self.to_dict().items())})'
+
+    def to_dict(self):
+        return {'concurrency': self.__concurrency, 'fail_fast': self.__fail_fast, 'confirm': self.__confirm,
+                'manifest': self.__manifest, 'dedup': self.__dedup, 'buffer_size': self.__buffer_size,
+                'log_sync_every': self.__log_sync_every, 'export_json': self.__export_json}
+
+    def replace(self, **changes):
+        """
+        :param changes: options to change, the same as constructor params
+        :return: new UploadOptions with other options copied from this one
+        """
+        return type(self)(**{**self.to_dict(), **changes})
+
+    def get_concurrency(self):
+        return self.__concurrency
+
+    def get_fail_fast(self):
+        return self.__fail_fast
+
+    def get_confirm(self):
+        return self.__confirm
+
+    def get_manifest(self):
+        return self.__manifest
+
+    def get_dedup(self):
+        return self.__dedup
+
+    def get_buffer_size(self):
+        return self.__buffer_size
+
+    def get_log_sync_every(self):
+        return self.__log_sync_every
+
+    def get_export_json(self):
+        return self.__export_json
@@ -0,0 +1,141 @@
+import asyncio
+import mmap
+import os
+import time
+
+
+class UploadStream:
+    """
+    Request body which is sent chunk by chunk, so upload of any size takes constant memory.
+    Source can be bytes-like buffer, file-like object, iterator of bytes or local file (memory-mapped).
+    Content-Length is sent when size is known, otherwise body is sent with chunked transfer encoding.
+    Stream is also async iterable for aiohttp, then chunks are read in executor and event loop is not blocked
+    """
+    CHUNK_SIZE = 1024 * 1024
+
+    def __init__(self, data, chunk_size=CHUNK_SIZE, progress=None, size: int = None):
+        """
+        :param data: bytes, bytearray, memoryview, file-like object opened in binary mode or iterator of bytes
+        :param chunk_size: max size of one chunk in bytes
+        :param progress: function which receives sent bytes, total bytes (or None if unknown) and elapsed seconds
+        :param size: body size, if it can't be detected from data
+        """
+        self.__chunk_size = max(chunk_size, 1)
+        self.__progress = progress
+        self.__size = size
+        self.__view = None
+        self.__file = None
+        self.__iterator = None
+        # resources opened by stream itself, they are closed in close()
+        self.__owned = []
+        self.__position = 0
+        self.__sent = 0
+        self.__started = None
+        self.__finished = None
+        if isinstance(data, (bytes, bytearray, memoryview, mmap.mmap)):
+            self.__view = memoryview(data)
+            self.__size = self.__view.nbytes
+        elif hasattr(data, 'read'):
+            self.__file = data
+            if self.__size is None and hasattr(data, 'seekable') and data.seekable():
+                position = data.tell()
+                self.__size = data.seek(0, os.SEEK_END) - position
+                data.seek(position)
+        else:
+            self.__iterator = iter(data)
+
+    @classmethod
+    def from_file(cls, file_path: str, chunk_size=CHUNK_SIZE, progress=None):
+        """
+        Opens local file and maps it to memory, so chunks are read by OS on demand
+        :param file_path: local file path
+        :return: UploadStream instance, which should be closed after upload
+        """
+        file = open(file_path, 'rb')
+        size = os.fstat(file.fileno()).st_size
+        # empty file can't be mapped
+        data = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) if size else b''
+        stream = cls(data, chunk_size, progress)
+        stream.__owned = [data, file] if size else [file]
+        return stream
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    @property
+    def len(self):
+        # requests reads body size from this attribute, if it is None, chunked transfer encoding is used
+        return self.__size
+
+    def get_size(self):
+        return self.__size
+
+    def __read_chunk(self):
+        """
+        :return: next chunk or None at the end of data
+        """
+        if self.__view is not None:
+            if self.__position >= self.__view.nbytes:
+                return None
+            chunk = self.__view[self.__position:self.__position + self.__chunk_size]
+            self.__position += chunk.nbytes
+            return chunk
+        if self.__file is not None:
+            return self.__file.read(self.__chunk_size) or None
+        # iterator can return chunks of any size, they are sent as is
+        return next((chunk for chunk in self.__iterator if chunk), None)
+
+    def __read_bytes(self):
+        # chunk of memory-mapped file is copied here, so its pages are read from disk in executor thread,
+        # and no slice of mapped file is left after the call, so file can be closed at any moment
+        chunk = self.__read_chunk()
+        return bytes(chunk) if chunk is not None else None
+
+    def __count(self, size: int):
+        self.__sent += size
+        if self.__progress is not None:
+            self.__progress(self.__sent, self.__size, time.monotonic() - self.__started)
+
+    def __iter__(self):
+        self.__started = time.monotonic()
+        # buffer is sent from the start every time, e.g. again after redirect
+        self.__position = 0
+        while True:
+            chunk = self.__read_chunk()
+            if chunk is None:
+                break
+            yield chunk
+            self.__count(len(chunk))
+        self.__finished = time.monotonic()
+
+    async def __aiter__(self):
+        loop = asyncio.get_running_loop()
+        self.__started = time.monotonic()
+        self.__position = 0
+        while True:
+            chunk = await loop.run_in_executor(None, self.__read_bytes)
+            if chunk is None:
+                break
+            # aiohttp may not ask for the end of body after the last chunk, so chunk is counted when it is given
+            self.__count(len(chunk))
+            yield chunk
+        self.__finished = time.monotonic()
+
+    def get_stats(self):
+        """
+        :return: dict with sent bytes, elapsed seconds and throughput in bytes per second
+        """
+        if self.__started is None:
+            return {'bytes': 0, 'seconds': 0.0, 'throughput': 0.0}
+        seconds = (self.__finished or time.monotonic()) - self.__started
+        return {'bytes': self.__sent, 'seconds': seconds, 'throughput': self.__sent / seconds if seconds else 0.0}
+
+    def close(self):
+        if self.__view is not None:
+            self.__view.release()
+        for resource in self.__owned:
+            resource.close()
+        self.__owned = []
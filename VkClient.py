@@ -1,24 +1,103 @@
-import time
+import json
+import threading
 from urllib.parse import urlencode
-from http.client import responses
 import requests
+from HttpSession import HttpSession
+from IdentityCache import IdentityCache
+from Logger import Logger
+from Metrics import Metrics
+from RateLimiter import RateLimiter
+from ResponseCache import ResponseCache
+from ResponseDecoder import ResponseDecoder
+from RetryPolicy import RetryPolicy
+from SocialGraph import SocialGraph
 
 
 class VkClient:
     __API_BASE_URL = 'https://api.vk.com/method/'
+    # max API calls in one execute request
+    __EXECUTE_LIMIT = 25
+    __DECODER = ResponseDecoder(error_getter=lambda content: VkClient.get_api_error(content))
+    # decodes responses without error check, so error code can be checked before retry
+    __RAW_DECODER = ResponseDecoder()
+    # VK allows 3 requests per second for user token
+    DEFAULT_RATE = 3.0
+    # max user IDs in one users.get request
+    USERS_LIMIT = 1000
 
-    def __init__(self, token: str, user_id=None, version: str = '5.124', debug_mode=False):
+    def __init__(self, token: str, user_id=None, version: str = '5.124', debug_mode=False,
+                 session: HttpSession = None, rate_limiter: RateLimiter = None, retry_policy: RetryPolicy = None,
+                 api_base_url: str = None, metrics: Metrics = None, lazy=False, user: dict = None,
+                 identity_cache: IdentityCache = None, response_cache: ResponseCache = None):
+        """
+        :param lazy: if True, token is checked on first use instead of constructor, see validate
+        :param user: known user info from users.get with domain field, then client makes no requests to check it
+        :param identity_cache: cache of token checks, shared one is used by default
+        :param response_cache: persistent cache of read methods responses, None means no caching
+        """
         self.__debug_mode = debug_mode
+        self.__logger = Logger(type(self).__name__, debug_mode)
         self.__vksite = 'https://vk.com/'
         self.__token = token
         self.__version = version
         self.__headers = {'User-Agent': 'Netology'}
         self.__params = {'access_token': self.__token, 'v': self.__version}
-        self.__delay = 0.3
-        # below line needed for get_users only
-        self.__initialized = True
-        # try to instantiate
-        user = self.get_users(user_ids=user_id)
+        # API URL can be changed, e.g. to local mock server in benchmarks
+        self.__api_base_url = api_base_url or self.__API_BASE_URL
+        # connection pool can be shared with other clients, otherwise own one is created
+        self.__http = session if session is not None else HttpSession()
+        # requests budget is shared by all clients with the same token, see RateLimiter.for_token
+        if rate_limiter is None:
+            rate_limiter = RateLimiter.for_token('vk', token, self.DEFAULT_RATE)
+        self.__rate_limiter = rate_limiter
+        # requests, retries and API errors are counted in shared registry, unless own one is given
+        self.__metrics = metrics if metrics is not None else Metrics.get_default()
+        # throttled requests (HTTP 429, 503 and API errors 6, 9, 10) are retried with backoff by __call only,
+        # so session of client has no own retries, failures of other URLs and tokens don't open its breaker
+        self.__retry_policy = retry_policy if retry_policy is not None \
+            else RetryPolicy.for_vk(self.__api_base_url, token, metrics=self.__metrics)
+        self.__session = self.__http.bind(self.__api_base_url, params=self.__params, headers=self.__headers,
+                                          limiter=rate_limiter, retry=None, metrics=self.__metrics,
+                                          service='vk')
+        self.__identity_cache = identity_cache if identity_cache is not None else IdentityCache.get_shared()
+        self.__response_cache = response_cache
+        self.__cache_scope = ResponseCache.make_scope(token, version)
+        # created on first use, see get_social_graph
+        self.__social_graph = None
+        self.__requested_user_id = user_id
+        self.__validate_lock = threading.Lock()
+        self.__validated = False
+        self.__initialized = False
+        self.__user_id = None
+        self.__first_name = None
+        self.__last_name = None
+        self.__domain = None
+        self.__status = f'{type(self).__name__} is not validated yet'
+        if user is not None:
+            self.__set_user({'object': [user], 'success': True, 'message': ''})
+        elif not lazy:
+            self.validate()
+
+    def validate(self):
+        """
+        Checks token and loads user info once, the result is cached in IdentityCache for other clients
+        with the same token and user ID. Lazy client calls it on the first request or getter call
+        :return: True if client is initialized
+        """
+        if self.__validated:
+            return self.__initialized
+        with self.__validate_lock:
+            if not self.__validated:
+                key = IdentityCache.make_key('vk', self.__token, self.__requested_user_id)
+                self.__set_user(self.__identity_cache.load(key, self.__load_user))
+        return self.__initialized
+
+    def __load_user(self):
+        method, params, path = self.make_users_call(user_ids=self.__requested_user_id)
+        # token check always goes to VK, it is cached by IdentityCache only
+        return self.__call('GET', method, cache_ttl=0, params=params)
+
+    def __set_user(self, user: dict):
         is_deactivated = False
         if user['success']:
             is_deactivated = user['object'][0].get('deactivated', False)
@@ -36,56 +115,108 @@ class VkClient:
             self.__first_name = None
             self.__last_name = None
             self.__domain = None
-            if is_deactivated:
-                user['message'] = 'User ' + str(is_deactivated)
+            # cached result is shared, so it is not changed
+            message = 'User ' + str(is_deactivated) if is_deactivated else user['message']
             # error message will be in status
-            self.__status = f'{type(self).__name__} init failed: ' + user['message']
+            self.__status = f'{type(self).__name__} init failed: ' + message
+        self.__validated = True
         self.log(self.__status, True)
 
     def log(self, message, is_debug_msg=False, sep=' '):
-        if self.__debug_mode or (not self.__debug_mode and not is_debug_msg):
-            if type(message) in [list, dict, tuple, set]:
-                print(*message, sep=sep)
-            else:
-                print(message, sep=sep)
+        self.__logger.log(message, is_debug_msg, sep)
 
     def is_initialized(self):
-        return self.__initialized
+        return self.validate()
+
+    def is_validated(self):
+        return self.__validated
 
     def get_id(self):
+        self.validate()
         return self.__user_id
 
     def get_fname(self):
+        self.validate()
         return self.__first_name
 
     def get_lname(self):
+        self.validate()
         return self.__last_name
 
     def get_domain(self):
+        self.validate()
         return self.__domain
 
     def get_status(self):
+        self.validate()
         return self.__status
 
+    def get_session(self):
+        return self.__http
+
+    def get_rate_limiter(self):
+        return self.__rate_limiter
+
+    def get_retry_policy(self):
+        return self.__retry_policy
+
+    def get_api_base_url(self):
+        return self.__api_base_url
+
+    def get_metrics(self):
+        return self.__metrics
+
+    def get_response_cache(self):
+        return self.__response_cache
+
+    def invalidate_cache(self, method: str = None):
+        """
+        Removes cached responses of this token
+        :param method: method name, e.g. 'status.get', None means all methods. Pages loaded by iter_execute
+                       are removed with any method of their calls
+        """
+        if self.__response_cache is not None:
+            self.__response_cache.invalidate(self.__cache_scope, method)
+
     def __str__(self):
-        if not self.__user_id:
+        if not self.get_id():
             return self.__status
         return self.__vksite + self.__domain
 
     def __and__(self, other):
-        if type(other).__name__ != type(self).__name__:
+        pair = SocialGraph.get_pair(self, other)
+        if pair is None:
             return False
-        mutual = self.get_mutual_friends(friends_ids=[other.get_id()], user_id=self.get_id())
-        if not mutual['success']:
+        if pair[0] == pair[1]:
+            # mutual friends are defined for two different users only
+            return []
+        graph = self.get_social_graph()
+        common = graph.get_common_friends(list(pair))
+        if not common['success']:
             return False
-        result = []
-        for friend in mutual['object']:
-            self.log(f'Let\'s get {len(friend["common_friends"])} mutual friends...', True)
-            for x in friend['common_friends']:
-                result.append(VkClient(self.__token, x))
-                # to prevent ban from server
-                time.sleep(self.__delay)
-        return result
+        self.__logger.debug('Let\'s get %d mutual friends...', len(common['object']))
+        # profiles are loaded in bulk, so new clients make no requests
+        clients = graph.get_clients(common['object'])
+        return clients['object'] if clients['success'] else False
+
+    def get_social_graph(self):
+        """
+        :return: SocialGraph of this client, it keeps loaded mutual friends and profiles between calls
+        """
+        with self.__validate_lock:
+            if self.__social_graph is None:
+                self.__social_graph = SocialGraph(self, self.__debug_mode)
+            return self.__social_graph
+
+    def make_client(self, user: dict):
+        """
+        :param user: user info from users.get with domain field
+        :return: VkClient of user with the same token, session, limiter and caches, it makes no request to check user
+        """
+        # requests of new clients are paced by the same limiter
+        return VkClient(self.__token, user['id'], self.__version, session=self.__http, rate_limiter=self.__rate_limiter,
+                        retry_policy=self.__retry_policy, api_base_url=self.__api_base_url, metrics=self.__metrics,
+                        user=user, identity_cache=self.__identity_cache, response_cache=self.__response_cache)
 
     @staticmethod
     def get_auth_link(app_id: str, scope='status'):
@@ -124,59 +255,119 @@ class VkClient:
         return result
 
     @staticmethod
-    def get_response_content(response: requests.Response, path='response', sep=','):
+    def get_api_error(content):
+        """
+        :param content: decoded JSON response
+        :return: VK error message if present, otherwise None
+        """
+        error = content.get('error') if type(content) is dict else None
+        if error:
+            return 'API error: ' + str(error.get('error_msg'))
+        return None
+
+    @staticmethod
+    def get_api_error_code(content):
+        """
+        :param content: decoded JSON response
+        :return: VK error code if present, otherwise None
+        """
+        error = content.get('error') if type(content) is dict else None
+        return error.get('error_code') if type(error) is dict else None
+
+    def __get_retry_after(self, sent: tuple):
+        # HTTP 429 and 503 can have Retry-After header
+        retry_after, result = sent
+        if retry_after is not None:
+            return retry_after
+        if result['success'] and self.__retry_policy.is_retryable_error(self.get_api_error_code(result['object'])):
+            # VK gives no hint how long to wait, so backoff delay is used
+            return 0.0
+        return None
+
+    def __call(self, http_method: str, method: str, path='response', items_prefix='', fields=None, stream=False,
+               cache_ttl: float = None, cache_methods: list = None, **kwargs):
+        """
+        Sends API request, retries it on connection errors, HTTP 429 and 503 and VK throttling errors,
+        and decodes the last response. Requests are retried here only, VK session has no own retries
+        :param http_method: HTTP method
+        :param method: VK API method name
+        :param path: path to JSON object, separated by comma
+        :param items_prefix: dotted path of list items, see get_response_content
+        :param fields: if set, items found by items_prefix keep only these fields
+        :param stream: if True, response is decoded while downloading
+        :param cache_ttl: TTL of cached response, TTL of method in ResponseCache by default, 0 means no caching
+        :param cache_methods: names of calls in response, so it is invalidated with any of them, see ResponseCache.put
+        :return: the same as get_response_content
+        """
+        cache_params = None
+        if self.__response_cache is not None and cache_ttl is None:
+            cache_ttl = self.__response_cache.get_ttl(method)
+        if self.__response_cache is not None and cache_ttl > 0:
+            # fields change decoded content, so they are part of the key
+            cache_params = {**(kwargs.get('params') or kwargs.get('data') or {}), '_fields': fields}
+            content = self.__response_cache.get(self.__cache_scope, method, cache_params)
+            if content is not None:
+                return self.__DECODER.finish(content, path)
+
+        def send():
+            response = self.__session.request(http_method, method, stream=stream, **kwargs)
+            retry_after = self.__retry_policy.get_response_retry_after(response)
+            decode = self.__RAW_DECODER.decode_stream if stream else self.__RAW_DECODER.decode
+            return retry_after, decode(response, '', items_prefix=items_prefix, fields=fields)
+        try:
+            result = self.__retry_policy.run(send, self.__get_retry_after, self.__rate_limiter)[1]
+        except requests.exceptions.RequestException as e:
+            # connection errors after the last attempt and open circuit are reported as any other failure
+            self.__logger.debug('Request %s failed: %s', method, e)
+            return {'object': None, 'success': False, 'message': f'Request failed: {type(e).__name__}: {e}'}
+        if not result['success']:
+            return result
+        code = self.get_api_error_code(result['object'])
+        if code is not None:
+            self.__metrics.inc('api_errors_total', service='vk', method=method, code=code)
+        elif cache_params is not None and type(result['object']) is dict and 'execute_errors' not in result['object']:
+            self.__response_cache.put(self.__cache_scope, method, cache_params, result['object'], cache_ttl,
+                                      cache_methods)
+        return self.__DECODER.finish(result['object'], path)
+
+    @staticmethod
+    def get_response_content(response: requests.Response, path='response', sep=',', items_prefix='', fields=None):
         """
         This method returns object from JSON response using specified path OR returns errors
         We can hide errors and make one logic for processing any responses
         :param response: response object
         :param path: path to JSON object, separated by comma
         :param sep: delimiter sign in path string
+        :param items_prefix: dotted path of list items, e.g. 'response.items.item'
+        :param fields: if set, items found by items_prefix keep only these fields
         :return: {'object': 'contains found JSON object or None if response body empty',
                  'success': 'True if requested path found (if specified) and no error codes',
                  'message': 'contains error string if any or empty string'}
         """
-        result = {'object': None, 'success': False, 'message': ''}
-        if not (200 <= response.status_code < 300):
-            result['message'] = f'Request error: {str(response.status_code)} ({responses[response.status_code]})'
-            return result
-        # to prevent json parsing error if body is empty, but only when lookup path doesn't specified
-        if (path == '' or path is None) and len(response.content) == 0:
-            result['success'] = True
-            result['message'] = 'Response body is empty'
-            return result
-        try:
-            result['object'] = response.json()
-        except ValueError:
-            result['object'] = None
-            result['message'] = 'JSON decode error'
-            return result
-        # try to get VK error message if present, otherwise return null API error description
-        if result['object'].get('error'):
-            result['message'] = 'API error: ' + result['object'].get('error', {'error_msg': None})['error_msg']
-            result['object'] = None
-            return result
-        # Let's extract nested object using string path
-        for key in path.split(sep):
-            # correcting some small mistypes in path (spaces, multiple delimiters)
-            if key == '':
-                continue
-            # If we found list in JSON we can no longer go forward, so we stop and return what we have
-            if type(result['object']) is list:
-                result['success'] = True
-                return result
-            else:
-                found = result['object'].get(key.strip())
-            # if any part of path doesn't found, we return null object
-            if found is None:
-                result['object'] = None
-                result['message'] = 'Object not found'
-                return result
-            result['object'] = found
-        result['success'] = True
-        return result
+        return VkClient.__DECODER.decode(response, path, sep, items_prefix, fields)
+
+    @staticmethod
+    def get_stream_content(response: requests.Response, path='response', sep=',', items_prefix='', fields=None):
+        """
+        The same as get_response_content, but response is decoded incrementally while it is downloaded,
+        see ResponseDecoder.decode_stream
+        """
+        return VkClient.__DECODER.decode_stream(response, path, sep, items_prefix, fields)
+
+    @staticmethod
+    def extract_path(result: dict, path='response', sep=','):
+        """
+        This method replaces object in result dict with nested object found by path
+        :param result: result dict with decoded JSON in 'object'
+        :param path: path to JSON object, separated by comma
+        :param sep: delimiter sign in path string
+        :return: the same result dict with found object, success flag and message
+        """
+        return ResponseDecoder.extract_path(result, path, sep)
 
     def get_user_photos(self,
-                        user_id: str = None, album_id='profile', photo_sizes=True, count=50, offset=0, extended=True):
+                        user_id: str = None, album_id='profile', photo_sizes=True, count=50, offset=0, extended=True,
+                        fields: list = None, stream=False):
         """
         Receive all photos links in JSON format.
         Description here: https://vk.com/dev/photos.get
@@ -186,22 +377,57 @@ class VkClient:
         :param count: images per request
         :param offset: offset from which count images
         :param extended: True, if needed likes, comments, tags, reposts
+        :param fields: if set, only these fields of photos are kept, e.g. ['id', 'owner_id', 'likes', 'sizes']
+        :param stream: if True, response is decoded while downloading, so whole response is not kept in memory
         :return: {'object': 'contains JSON object or None if response body empty',
                  'success': 'True if requested path found (if specified) and no error codes',
                  'message': 'contains error string if any or empty string'}
         """
-        if not self.__initialized:
+        if not self.is_initialized():
             self.log('Error: not initialized.', True)
             return {'object': None, 'success': False, 'message': f'Error: {type(self).__name__} not initialized'}
+        method, params, path = self.make_user_photos_call(user_id, album_id, photo_sizes, count, offset, extended)
+        return self.__call('GET', method, 'response', 'response.items.item', fields, stream, params=params)
+
+    def make_user_photos_call(self,
+                              user_id: str = None, album_id='profile', photo_sizes=True, count=50, offset=0,
+                              extended=True):
+        """
+        Prepares photos.get call for execute_batch, parameters are the same as in get_user_photos
+        :return: tuple of method name, params and path to object in method response
+        """
         params = {'photo_sizes': photo_sizes, 'count': count, 'offset': offset, 'extended': extended}
         if not user_id:
             user_id = self.__user_id
         params.update({'user_id': self.prepare_params(user_id)})
         if album_id:
             params.update({'album_id': self.prepare_params(album_id)})
-        response = requests.get(self.__API_BASE_URL + 'photos.get',
-                                params={**self.__params, **params}, headers=self.__headers)
-        return self.get_response_content(response, path='response')
+        return 'photos.get', params, ''
+
+    def get_albums(self, user_id: str = None, need_system=True):
+        """
+        This method receives albums of user with their photos count
+        Description here: https://vk.com/dev/photos.getAlbums
+        :param user_id: ID of user, if None - your token's account ID will be taken
+        :param need_system: if True, system albums (wall, profile, saved) are returned too
+        :return: {'object': 'contains JSON object with "count" and "items" or None if response body empty',
+                 'success': 'True if requested path found (if specified) and no error codes',
+                 'message': 'contains error string if any or empty string'}
+        """
+        if not self.is_initialized():
+            self.log('Error: not initialized.', True)
+            return {'object': None, 'success': False, 'message': f'Error: {type(self).__name__} not initialized'}
+        method, params, path = self.make_albums_call(user_id, need_system)
+        return self.__call('GET', method, params=params)
+
+    def make_albums_call(self, user_id: str = None, need_system=True):
+        """
+        Prepares photos.getAlbums call for execute_batch, parameters are the same as in get_albums
+        :return: tuple of method name, params and path to object in method response
+        """
+        if not user_id:
+            user_id = self.__user_id
+        return 'photos.getAlbums', {'owner_id': self.prepare_params(user_id), 'need_system': int(need_system)}, ''
 
     def get_user_status(self, user_id: str = None):
         """
@@ -211,17 +437,23 @@ class VkClient:
                  'success': 'True if requested path found (if specified) and no error codes',
                  'message': 'contains error string if any or empty string'}
         """
-        if not self.__initialized:
+        if not self.is_initialized():
             self.log('Error: not initialized.', True)
             return {'object': None, 'success': False, 'message': f'Error: {type(self).__name__} not initialized'}
+        method, params, path = self.make_user_status_call(user_id)
+        return self.__call('GET', method, path='response,' + path, params=params)
+
+    def make_user_status_call(self, user_id: str = None):
+        """
+        Prepares status.get call for execute_batch, parameters are the same as in get_user_status
+        :return: tuple of method name, params and path to object in method response
+        """
         if not user_id:
             user_id = self.__user_id
         params = {}
         if user_id:
             params = {'user_id': self.prepare_params(user_id)}
-        response = requests.get(self.__API_BASE_URL + 'status.get',
-                                params={**self.__params, **params}, headers=self.__headers)
-        return self.get_response_content(response, path='response,text')
+        return 'status.get', params, 'text'
 
     def get_users(self, fields: [str] = None, user_ids: [str] = None):
         """
@@ -233,19 +465,25 @@ class VkClient:
                  'success': 'True if requested path found (if specified) and no error codes',
                  'message': 'contains error string if any or empty string'}
         """
-        if fields is None:
-            fields = ['domain']
-        if not self.__initialized:
+        if not self.is_initialized():
             self.log('Error: not initialized.', True)
             return {'object': None, 'success': False, 'message': f'Error: {type(self).__name__} not initialized'}
+        method, params, path = self.make_users_call(fields, user_ids)
+        return self.__call('GET', method, params=params)
+
+    def make_users_call(self, fields: [str] = None, user_ids: [str] = None):
+        """
+        Prepares users.get call for execute_batch, parameters are the same as in get_users
+        :return: tuple of method name, params and path to object in method response
+        """
+        if fields is None:
+            fields = ['domain']
         params = {}
         if fields:
             params.update({'fields': self.prepare_params(fields)})
         if user_ids:
             params.update({'user_ids': self.prepare_params(user_ids)})
-        response = requests.get(self.__API_BASE_URL + 'users.get',
-                                params={**self.__params, **params}, headers=self.__headers)
-        return self.get_response_content(response)
+        return 'users.get', params, ''
 
     def get_mutual_friends(self, friends_ids=None, user_id=None):
         """
@@ -257,9 +495,17 @@ class VkClient:
                  'success': 'True if requested path found (if specified) and no error codes',
                  'message': 'contains error string if any or empty string'}
         """
-        if not self.__initialized:
+        if not self.is_initialized():
             self.log('Error: not initialized.', True)
             return {'object': None, 'success': False, 'message': f'Error: {type(self).__name__} not initialized'}
+        method, params, path = self.make_mutual_friends_call(friends_ids, user_id)
+        return self.__call('GET', method, path='response', params=params)
+
+    def make_mutual_friends_call(self, friends_ids=None, user_id=None):
+        """
+        Prepares friends.getMutual call for execute_batch, parameters are the same as in get_mutual_friends
+        :return: tuple of method name, params and path to object in method response
+        """
         if not user_id:
             user_id = self.__user_id
         params = {}
@@ -267,6 +513,82 @@ class VkClient:
             params.update({'target_uids': self.prepare_params(friends_ids)})
         if user_id:
             params.update({'source_uid': user_id})
-        response = requests.get(self.__API_BASE_URL + 'friends.getMutual',
-                                params={**self.__params, **params}, headers=self.__headers)
-        return self.get_response_content(response, path='response')
+        return 'friends.getMutual', params, ''
+
+    @staticmethod
+    def make_execute_code(calls: list):
+        """
+        This static method makes VKScript code, which runs all calls and returns list of their responses
+        :param calls: list of tuples (method name, params dict, ...)
+        :return: VKScript code string
+        """
+        api_calls = []
+        for call in calls:
+            # VKScript object literal is the same as JSON, but boolean params are expected as 1 or 0
+            params = {key: int(value) if type(value) is bool else value
+                      for key, value in call[1].items() if value is not None}
+            api_calls.append(f'API.{call[0]}({json.dumps(params, ensure_ascii=False)})')
+        return 'return [' + ','.join(api_calls) + '];'
+
+    def execute(self, code: str, fields: list = None, stream=False):
+        """
+        This method runs VKScript code on VK side, up to 25 API calls per one request
+        Description here: https://vk.com/dev/execute
+        :param code: VKScript code
+        :param fields: if set, "items" of every call result keep only these fields, e.g. for photos.get pages
+        :param stream: if True, response is decoded while downloading, so whole response is not kept in memory
+        :return: {'object': 'contains whole JSON object with "response" and "execute_errors" if any',
+                 'success': 'True if no error codes',
+                 'message': 'contains error string if any or empty string'}
+        """
+        return self.__execute(code, fields, stream, 0)
+
+    def __execute(self, code: str, fields: list = None, stream=False, cache_ttl: float = 0, methods: list = None):
+        if not self.is_initialized():
+            self.log('Error: not initialized.', True)
+            return {'object': None, 'success': False, 'message': f'Error: {type(self).__name__} not initialized'}
+        # code can be long, so it is sent in request body
+        return self.__call('POST', 'execute', '', 'response.item.items.item', fields, stream, cache_ttl,
+                           methods, data={'code': code})
+
+    def iter_execute(self, calls: list, calls_per_request=25, fields: list = None, stream=False):
+        """
+        This method coalesces API calls into execute requests and splits results back into per-call results
+        :param calls: list of tuples (method name, params dict, path to object in method response),
+                      such tuples are returned by make_*_call methods
+        :param calls_per_request: API calls in one execute request, VK allows max 25
+        :param fields: if set, "items" of every call result keep only these fields, see execute
+        :param stream: if True, every execute response is decoded while downloading
+        :return: yields {'object', 'success', 'message'} dict for every call in the same order as calls
+        """
+        calls_per_request = max(1, min(calls_per_request, self.__EXECUTE_LIMIT))
+        for start in range(0, len(calls), calls_per_request):
+            chunk = calls[start:start + calls_per_request]
+            self.__logger.debug('Executing %d API calls in one request...', len(chunk))
+            # execute of read calls only is cached as long as its shortest cached call, other code is not cached
+            ttl = self.__response_cache.get_batch_ttl([call[0] for call in chunk]) \
+                if self.__response_cache is not None else 0
+            response = self.__execute(self.make_execute_code(chunk), fields, stream, ttl,
+                                      sorted({call[0] for call in chunk}))
+            if not response['success']:
+                for _ in chunk:
+                    yield {'object': None, 'success': False, 'message': response['message']}
+                continue
+            items = response['object'].get('response') or []
+            # failed calls return false and their errors come in separate list in the same order
+            errors = list(response['object'].get('execute_errors') or [])
+            for i, call in enumerate(chunk):
+                item = items[i] if i < len(items) else False
+                if item is False:
+                    error = errors.pop(0) if errors else {}
+                    self.__metrics.inc('api_errors_total', service='vk', method=call[0], code=error.get('error_code'))
+                    yield {'object': None, 'success': False,
+                           'message': 'API error: ' + str(error.get('error_msg', f'{call[0]} call failed'))}
+                else:
+                    yield self.extract_path({'object': item, 'success': False, 'message': ''}, call[2])
+
+    def execute_batch(self, calls: list, calls_per_request=25, fields: list = None, stream=False):
+        """
+        The same as iter_execute, but returns list of all results
+        """
+        return list(self.iter_execute(calls, calls_per_request, fields, stream))
@@ -1,20 +1,79 @@
+import hashlib
+import threading
 import time
 
 import requests
-from http.client import responses
+from HttpSession import HttpSession
+from IdentityCache import IdentityCache
+from Logger import Logger
+from Metrics import Metrics
+from OperationTracker import OperationTracker
+from RateLimiter import RateLimiter
+from ResponseDecoder import ResponseDecoder
+from RetryPolicy import RetryPolicy
+from UploadStream import UploadStream
 
 
 class YaUploader:
-    def __init__(self, token: str, debug_mode=False):
+    __DECODER = ResponseDecoder()
+    # Yandex doesn't publish its limits, so rate is lowered only when disk answers with HTTP 429
+    DEFAULT_RATE = 10.0
+    __API_BASE_URL = 'https://cloud-api.yandex.net:443'
+
+    def __init__(self, token: str, debug_mode=False, session: HttpSession = None, rate_limiter: RateLimiter = None,
+                 retry_policy: RetryPolicy = None, api_base_url: str = None, metrics: Metrics = None, lazy=False,
+                 identity_cache: IdentityCache = None):
+        """
+        :param lazy: if True, token is checked on first use instead of constructor, see validate
+        :param identity_cache: cache of token checks, shared one is used by default
+        """
         self.__debug_mode = debug_mode
+        self.__logger = Logger(type(self).__name__, debug_mode)
         self.__token = token
-        self.__api_base_url = 'https://cloud-api.yandex.net:443'
+        # API URL can be changed, e.g. to local mock server in benchmarks
+        self.__api_base_url = api_base_url or self.__API_BASE_URL
         self.__headers = {'User-Agent': 'Netology', 'Authorization': 'OAuth ' + self.__token}
         self.__delay = 0.3
-        # below line needed for get_disk_info only
-        self.__initialized = True
-        # try to instantiate
-        info = self.get_disk_info()
+        # connection pool can be shared with other clients, otherwise own one is created
+        self.__http = session if session is not None else HttpSession()
+        # requests budget is shared by all clients with the same token, see RateLimiter.for_token
+        if rate_limiter is None:
+            rate_limiter = RateLimiter.for_token('ya', token, self.DEFAULT_RATE)
+        self.__rate_limiter = rate_limiter
+        # requests and retries are counted in shared registry, unless own one is given
+        self.__metrics = metrics if metrics is not None else Metrics.get_default()
+        # throttled requests (HTTP 429, 503) are retried with backoff, Retry-After header is honoured
+        self.__retry_policy = retry_policy if retry_policy is not None \
+            else RetryPolicy.for_yandex(self.__api_base_url, token, metrics=self.__metrics)
+        self.__session = self.__http.bind(self.__api_base_url, headers=self.__headers, limiter=rate_limiter,
+                                          retry=self.__retry_policy, metrics=self.__metrics, service='ya')
+        self.__identity_cache = identity_cache if identity_cache is not None else IdentityCache.get_shared()
+        self.__validate_lock = threading.Lock()
+        self.__validated = False
+        self.__initialized = False
+        self.__display_name = None
+        self.__status = f'{type(self).__name__} is not validated yet'
+        if not lazy:
+            self.validate()
+
+    def validate(self):
+        """
+        Checks token once, the result is cached in IdentityCache for other uploaders with the same token.
+        Lazy uploader calls it on the first request
+        :return: True if uploader is initialized
+        """
+        if self.__validated:
+            return self.__initialized
+        with self.__validate_lock:
+            if not self.__validated:
+                key = IdentityCache.make_key('ya', self.__token)
+                self.__set_disk_info(self.__identity_cache.load(key, self.__load_disk_info))
+        return self.__initialized
+
+    def __load_disk_info(self):
+        return self.get_response_content(self.__session.get('/v1/disk'))
+
+    def __set_disk_info(self, info: dict):
         if info['success']:
             self.__initialized = True
             self.__display_name = info['object']['user']['display_name']
@@ -23,21 +82,37 @@ class YaUploader:
             self.__initialized = False
             self.__display_name = None
             self.__status = f'{type(self).__name__} init failed: ' + info['message']
+        self.__validated = True
         self.log(self.__status, True)
 
     def log(self, message, is_debug_msg=False, sep=' '):
-        if self.__debug_mode or (not self.__debug_mode and not is_debug_msg):
-            if type(message) in [list, dict, tuple, set]:
-                print(*message, sep=sep)
-            else:
-                print(message, sep=sep)
+        self.__logger.log(message, is_debug_msg, sep)
 
     def is_initialized(self):
-        return self.__initialized
+        return self.validate()
+
+    def is_validated(self):
+        return self.__validated
 
     def get_status(self):
+        self.validate()
         return self.__status
 
+    def get_session(self):
+        return self.__http
+
+    def get_rate_limiter(self):
+        return self.__rate_limiter
+
+    def get_retry_policy(self):
+        return self.__retry_policy
+
+    def get_api_base_url(self):
+        return self.__api_base_url
+
+    def get_metrics(self):
+        return self.__metrics
+
     @staticmethod
     def convert_bytes(size, precision=2):
         suffixes = [' B', ' kB', ' mB', ' gB', ' tB']
@@ -52,6 +127,8 @@ class YaUploader:
         """
         This method returns object from JSON response using specified path OR returns errors
         We can hide errors and make one logic for processing any responses
+        Yandex API error messages comes with error status codes, so it is hard and unnecessary to decode them,
+        as they duplicates HTTP error codes
         :param response: response object
         :param path: path to JSON object, separated by comma
         :param sep: delimiter sign in path string
@@ -59,42 +136,7 @@ class YaUploader:
                  'success': 'True if requested path found (if specified) and no error codes',
                  'message': 'contains error string if any or empty string'}
         """
-        result = {'object': None, 'success': False, 'message': ''}
-        if not (200 <= response.status_code < 300):
-            result['message'] = f'Request error: {str(response.status_code)} ({responses[response.status_code]})'
-            return result
-        # to prevent json parsing error if body is empty, but only when lookup path doesn't specified
-        if not path and len(response.content) == 0:
-            result['success'] = True
-            result['message'] = 'Response body is empty'
-            return result
-        try:
-            result['object'] = response.json()
-        except ValueError:
-            result['object'] = None
-            result['message'] = 'JSON decode error'
-            return result
-        # Yandex API error messages comes with error status codes, so it is hard and unnecessary to decode them,
-        # as they duplicates HTTP error codes
-        # Let's extract nested object using string path
-        for key in path.split(sep):
-            # correcting some small mistypes in path (spaces, multiple delimiters)
-            if key == '':
-                continue
-            # If we found list in JSON we can no longer go forward, so we stop and return what we have
-            if type(result['object']) is list:
-                result['success'] = True
-                return result
-            else:
-                found = result['object'].get(key.strip())
-            # if any part of path doesn't found, we return null object
-            if found is None:
-                result['object'] = None
-                result['message'] = 'Object not found'
-                return result
-            result['object'] = found
-        result['success'] = True
-        return result
+        return YaUploader.__DECODER.decode(response, path, sep)
 
     def get_disk_info(self):
         """
@@ -103,10 +145,10 @@ class YaUploader:
                  'success': 'True if requested path found (if specified) and no error codes',
                  'message': 'contains error string if any or empty string'}
         """
-        if not self.__initialized:
+        if not self.is_initialized():
             self.log('Error: not initialized', True)
             return {'object': None, 'success': False, 'message': f'Error: {type(self).__name__} not initialized'}
-        response = requests.get(self.__api_base_url + '/v1/disk', headers=self.__headers)
+        response = self.__session.get('/v1/disk')
         return self.get_response_content(response)
 
     def create_folder(self, folder_name: str):
@@ -117,45 +159,125 @@ class YaUploader:
                  'success': 'True if requested path found (if specified) and no error codes',
                  'message': 'contains error string if any or empty string'}
         """
-        if not self.__initialized:
+        if not self.is_initialized():
             self.log('Error: not initialized', True)
             return {'object': None, 'success': False, 'message': f'Error: {type(self).__name__} not initialized'}
         if not folder_name:
             folder_name = '/'
         params = {'path': folder_name}
-        response = requests.put(self.__api_base_url + '/v1/disk/resources',
-                                params=params, headers=self.__headers)
+        response = self.__session.put('/v1/disk/resources', params=params)
         return self.get_response_content(response)
 
-    def upload_local_file(self, file_path: str, folder: str = ''):
+    def upload_local_file(self, file_path: str, folder: str = '', disk_name: str = None,
+                          chunk_size=UploadStream.CHUNK_SIZE, progress=None):
         """
-        This method uploads local file to Yandex disk
+        This method uploads local file to Yandex disk. File is memory-mapped and sent as raw body chunk by chunk,
+        so files of any size are uploaded in constant memory
         Description here: https://yandex.ru/dev/disk/api/reference/upload.html
         :param folder: folder names separated by sign "/" and at the end
         :param file_path: local file path
-        :return: {'object': 'contains JSON object or None if response body empty',
-                 'success': 'True if requested path found (if specified) and no error codes',
+        :param disk_name: file name on disk, by default the same as local file path
+        :param chunk_size: size of one sent chunk in bytes
+        :param progress: function which receives sent bytes, total bytes and elapsed seconds after every chunk
+        :return: {'object': 'contains dict with sent bytes, seconds and throughput if upload succeeded',
+                 'success': 'True if file uploaded',
                  'message': 'contains error string if any or empty string'}
         """
-        if not self.__initialized:
+        if not self.is_initialized():
             self.log('Error: not initialized', True)
             return {'object': None, 'success': False, 'message': f'Error: {type(self).__name__} not initialized'}
         if not file_path:
             self.log('Error: file name is empty', True)
             return {'object': None, 'success': False, 'message': f'File name is empty'}
-        # first we have to get upload link
+        with UploadStream.from_file(file_path, chunk_size, progress) as stream:
+            return self.upload_stream(folder + (disk_name or file_path), stream)
 
-        params = {'path': folder + file_path, 'overwrite': True}
-        response = requests.get(self.__api_base_url + '/v1/disk/resources/upload', params=params, headers=self.__headers)
+    def upload_stream(self, disk_path: str, data, overwrite=True, chunk_size=UploadStream.CHUNK_SIZE, progress=None):
+        """
+        This method uploads in-memory buffer, file-like object or iterator of bytes to Yandex disk
+        without building whole request body in memory
+        Description here: https://yandex.ru/dev/disk/api/reference/upload.html
+        :param disk_path: file path on disk
+        :param data: bytes-like object, file-like object opened in binary mode, iterator of bytes or UploadStream
+        :param overwrite: if True, existing file on disk is overwritten
+        :param chunk_size: size of one sent chunk in bytes
+        :param progress: function which receives sent bytes, total bytes (or None) and elapsed seconds
+        :return: {'object': 'contains dict with sent bytes, seconds and throughput if upload succeeded',
+                 'success': 'True if file uploaded',
+                 'message': 'contains error string if any or empty string'}
+        """
+        if not self.is_initialized():
+            self.log('Error: not initialized', True)
+            return {'object': None, 'success': False, 'message': f'Error: {type(self).__name__} not initialized'}
+        # first we have to get upload link
+        params = {'path': disk_path, 'overwrite': overwrite}
+        response = self.__session.get('/v1/disk/resources/upload', params=params)
         upload_link = self.get_response_content(response)
         if not upload_link['success']:
             return upload_link
         # using upload link let's actually start file uploading
-        params = {'path': file_path}
-        files = {'file': open(file_path, 'rb')}
-        response = requests.put(upload_link['object']['href'],
-                                params=params, headers=self.__headers, files=files)
-        return self.get_response_content(response)
+        stream = data if isinstance(data, UploadStream) else UploadStream(data, chunk_size, progress)
+        response = self.get_response_content(self.__session.put(upload_link['object']['href'], data=stream))
+        if response['success']:
+            response['object'] = stream.get_stats()
+            if self.__logger.is_debug_mode():
+                self.__logger.debug('Uploaded %s to %s (%s/s)', self.convert_bytes(response['object']['bytes']),
+                                    disk_path, self.convert_bytes(response['object']['throughput']))
+        return response
+
+    def upload_from_url(self, disk_path: str, url: str, overwrite=False, chunk_size=64 * 1024, verify=False,
+                        progress=None):
+        """
+        This method streams file from URL (e.g. VK CDN) directly to Yandex disk: downloaded chunks are sent
+        to upload link as they arrive, so file is kept neither in memory nor on local disk, and its MD5 is computed
+        on the fly. Unlike upload_remote_file, file is stored when method returns, so no operation check is needed
+        Description here: https://yandex.ru/dev/disk/api/reference/upload.html
+        :param disk_path: file path on disk
+        :param url: URL of file
+        :param overwrite: if True, existing file on disk is overwritten
+        :param chunk_size: size of one downloaded and sent chunk in bytes
+        :param verify: if True, MD5 of uploaded file is requested from disk and compared with computed one
+        :param progress: function which receives sent bytes, total bytes (or None) and elapsed seconds
+        :return: {'object': 'contains dict with sent bytes, seconds, throughput, md5 and verified flag if verify',
+                 'success': 'True if file uploaded (and verified)',
+                 'message': 'contains error string if any or empty string'}
+        """
+        if not self.is_initialized():
+            self.log('Error: not initialized', True)
+            return {'object': None, 'success': False, 'message': f'Error: {type(self).__name__} not initialized'}
+        if not url:
+            self.log('Error: url is empty', True)
+            return {'object': None, 'success': False, 'message': f'URL is empty'}
+        md5 = hashlib.md5()
+        try:
+            # download is started before upload link is requested, so missing files cost no disk requests
+            with self.__http.request('GET', url, stream=True) as download:
+                if download.status_code != 200:
+                    return {'object': None, 'success': False,
+                            'message': f'Download failed: HTTP {download.status_code} {download.reason}'}
+                # compressed body is longer after decoding, so its size is unknown and chunked encoding is used
+                size = int(download.headers['Content-Length']) \
+                    if download.headers.get('Content-Length') and not download.headers.get('Content-Encoding') \
+                    else None
+
+                def chunks():
+                    for chunk in download.iter_content(chunk_size):
+                        md5.update(chunk)
+                        yield chunk
+                response = self.upload_stream(disk_path, UploadStream(chunks(), chunk_size, progress, size),
+                                              overwrite)
+        except requests.exceptions.RequestException as e:
+            return {'object': None, 'success': False, 'message': f'Transfer failed: {type(e).__name__}: {e}'}
+        if not response['success']:
+            return response
+        response['object']['md5'] = md5.hexdigest()
+        if verify:
+            info = self.get_file_info(disk_path)
+            response['object']['verified'] = info['success'] and info['object'].get('md5') == md5.hexdigest()
+            if not response['object']['verified']:
+                response['success'] = False
+                response['message'] = f'Checksum of {disk_path} doesn\'t match: {info["message"] or "MD5 differs"}'
+        return response
 
     def list_files(self, limit=20):
         """
@@ -166,15 +288,15 @@ class YaUploader:
                  'success': 'True if requested path found (if specified) and no error codes',
                  'message': 'contains error string if any or empty string'}
         """
-        if not self.__initialized:
+        if not self.is_initialized():
             self.log('Error: not initialized', True)
             return {'object': None, 'success': False, 'message': f'Error: {type(self).__name__} not initialized'}
         result = {'object': [], 'success': False, 'message': ''}
         offset = 0
         while True:
-            self.log('requesting ' + str(limit) + ' files with offset ' + str(offset) + '...', True)
+            self.__logger.debug('requesting %d files with offset %d...', limit, offset)
             params = {'limit': limit, 'fields': 'path, size', 'offset': offset}
-            response = requests.get(self.__api_base_url + '/v1/disk/resources/files', params=params, headers=self.__headers)
+            response = self.__session.get('/v1/disk/resources/files', params=params)
             response = self.get_response_content(response)
             if not response['success']:
                 # in case of partial loading 'success' will be True, but message will contain an error
@@ -192,6 +314,61 @@ class YaUploader:
             offset += limit
         return result
 
+    def get_files_page(self, limit=1000, offset=0,
+                       fields='items.path,items.size,items.md5,items.sha256,items.modified'):
+        """
+        This method returns one page of flat files list of Yandex disk as structured objects
+        Description here: https://yandex.ru/dev/disk/api/reference/all-files.html
+        :param limit: files count per page
+        :param offset: offset of the page
+        :param fields: requested fields of every file
+        :return: {'object': 'contains list of file objects',
+                 'success': 'True if requested path found (if specified) and no error codes',
+                 'message': 'contains error string if any or empty string'}
+        """
+        if not self.is_initialized():
+            self.log('Error: not initialized', True)
+            return {'object': None, 'success': False, 'message': f'Error: {type(self).__name__} not initialized'}
+        params = {'limit': limit, 'offset': offset, 'fields': fields}
+        return self.get_response_content(self.__session.get('/v1/disk/resources/files', params=params), path='items')
+
+    def get_folder_items(self, folder: str, limit=1000, offset=0, fields='_embedded.items.name,_embedded.items.type'):
+        """
+        This method returns one page of folder contents
+        Description here: https://yandex.ru/dev/disk/api/reference/meta.html
+        :param folder: folder path on disk
+        :param limit: items count per page
+        :param offset: offset of the page
+        :param fields: requested fields of every item
+        :return: {'object': 'contains list of file and folder objects',
+                 'success': 'True if requested path found (if specified) and no error codes',
+                 'message': 'contains error string if any or empty string'}
+        """
+        if not self.is_initialized():
+            self.log('Error: not initialized', True)
+            return {'object': None, 'success': False, 'message': f'Error: {type(self).__name__} not initialized'}
+        params = {'path': folder or '/', 'limit': limit, 'offset': offset, 'fields': fields}
+        response = self.__session.get('/v1/disk/resources', params=params)
+        return self.get_response_content(response, path='_embedded,items')
+
+    def get_last_uploaded(self, limit=1000,
+                          fields='items.path,items.size,items.md5,items.sha256,items.modified'):
+        """
+        This method returns recently uploaded files, sorted by upload date from the newest
+        Description here: https://yandex.ru/dev/disk/api/reference/recent-upload.html
+        :param limit: files count
+        :param fields: requested fields of every file
+        :return: {'object': 'contains list of file objects',
+                 'success': 'True if requested path found (if specified) and no error codes',
+                 'message': 'contains error string if any or empty string'}
+        """
+        if not self.is_initialized():
+            self.log('Error: not initialized', True)
+            return {'object': None, 'success': False, 'message': f'Error: {type(self).__name__} not initialized'}
+        params = {'limit': limit, 'fields': fields}
+        response = self.__session.get('/v1/disk/resources/last-uploaded', params=params)
+        return self.get_response_content(response, path='items')
+
     def upload_remote_file(self, file_path: str, url: str):
         """
         Uploads files to Yandex disk using url link
@@ -202,36 +379,36 @@ class YaUploader:
                  'success': 'True if requested path found (if specified) and no error codes',
                  'message': 'contains error string if any or empty string'}
         """
-        if not self.__initialized:
+        if not self.is_initialized():
             self.log('Error: not initialized', True)
             return {'object': None, 'success': False, 'message': f'Error: {type(self).__name__} not initialized'}
         if not url:
             self.log('Error: url is empty', True)
             return {'object': None, 'success': False, 'message': f'URL is empty'}
         params = {'path': file_path, 'url': url}
-        response = requests.post(self.__api_base_url + '/v1/disk/resources/upload', params=params, headers=self.__headers)
+        response = self.__session.post('/v1/disk/resources/upload', params=params)
         return self.get_response_content(response)
 
-    def delete_file(self, file_path: str):
+    def delete_file(self, file_path: str, wait=True):
         """
         Delete file from Yandex Disk
         Description here: https://yandex.ru/dev/disk/api/reference/delete.html
         :param file_path: File or folder name at Yandex disk
+        :param wait: if True, waits scheduled delete operation, otherwise its href can be passed to OperationTracker
         :return: {'object': 'contains JSON object or None if response body empty',
                  'success': 'True if requested path found (if specified) and no error codes',
                  'message': 'contains error string if any or empty string'}
         """
-        if not self.__initialized:
+        if not self.is_initialized():
             self.log('Error: not initialized', True)
             return {'object': None, 'success': False, 'message': f'Error: {type(self).__name__} not initialized'}
         if not file_path:
             self.log('Error: file/folder name is empty.', True)
             return {'object': None, 'success': False, 'message': f'File/folder name is empty'}
         params = {'path': file_path, 'permanently': True, 'force_async': False}
-        response = self.get_response_content(requests.delete(self.__api_base_url + '/v1/disk/resources',
-                                                             params=params, headers=self.__headers))
+        response = self.get_response_content(self.__session.delete('/v1/disk/resources', params=params))
         # if delete operation scheduled (code 202), otherwise will be 204
-        if response['success'] and response['object']:
+        if wait and response['success'] and response['object']:
             self.get_operation_status(response['object']['href'])
         return response
 
@@ -243,43 +420,60 @@ class YaUploader:
                  'success': 'True if requested path found (if specified) and no error codes',
                  'message': 'contains error string if any or empty string'}
         """
-        if not self.__initialized:
+        if not self.is_initialized():
             self.log('Error: not initialized', True)
             return {'object': None, 'success': False, 'message': f'Error: {type(self).__name__} not initialized'}
         if not file_path:
             file_path = '/'
         params = {'path': file_path}
-        response = requests.get(self.__api_base_url + '/v1/disk/resources', params=params, headers=self.__headers)
+        response = self.__session.get('/v1/disk/resources', params=params)
         return self.get_response_content(response)
 
-    def get_operation_status(self, url: str):
+    def check_operation(self, url: str):
+        """
+        Checks async operation status once
+        Description here: https://yandex.ru/dev/disk/api/reference/operations.html
+        :param url: async operation URL
+        :return: {'object': 'contains status string: success, failed or in-progress',
+                 'success': 'True if status received',
+                 'message': 'contains error string if any or empty string'}
+        """
+        if not self.is_initialized():
+            self.log('Error: not initialized', True)
+            return {'object': None, 'success': False, 'message': f'Error: {type(self).__name__} not initialized'}
+        if not url:
+            self.log('Error: URL is empty.', True)
+            return {'object': None, 'success': False, 'message': f'URL is empty'}
+        self.__logger.debug('Checking %s', url)
+        return self.get_response_content(self.__session.get(url), path='status')
+
+    def get_operation_status(self, url: str, timeout=30):
         """
-        Waiting operation for checking async actions (copy, move, delete) on disk
+        Waiting operation for checking async actions (copy, move, delete) on disk.
+        Operation is checked with exponential backoff and jitter, to wait many operations at once use OperationTracker
         Description here: https://yandex.ru/dev/disk/api/reference/operations.html
         :param url: async operation URL
-        :return: None
+        :param timeout: max waiting time in seconds
+        :return: {'object': None, 'success': 'True if operation finished successfully',
+                 'message': 'contains error string if any or empty string'}
         """
-        if not self.__initialized:
+        if not self.is_initialized():
             self.log('Error: not initialized', True)
             return {'object': None, 'success': False, 'message': f'Error: {type(self).__name__} not initialized'}
         if not url:
             self.log('Error: URL is empty.', True)
             return {'object': None, 'success': False, 'message': f'URL is empty'}
-        timer = self.__delay
+        started = time.monotonic()
+        attempt = 0
         while True:
-            time.sleep(timer)
-            self.log('Checking ' + url, True)
-            response = self.get_response_content(requests.get(url, headers=self.__headers))
-            # gives 10 attempts
-            if (response['success'] and response['object']['status'] == 'in-progress') and timer < 3:
-                # slightly increase wait time
-                timer += self.__delay
-                self.log('Check failed. Next attempt after ' + str(timer) + ' sec', True)
-            elif timer >= 3:
+            timer = OperationTracker.get_backoff_delay(attempt, self.__delay)
+            if time.monotonic() - started + timer > timeout:
                 return {'object': None, 'success': False, 'message': 'Timeout reached'}
-            elif response['success'] and response['object']['status'] == 'success':
+            time.sleep(timer)
+            response = self.check_operation(url)
+            if response['success'] and response['object'] == 'success':
                 return {'object': None, 'success': True, 'message': ''}
-            elif response['success'] and response['object']['status'] == 'failed':
+            elif response['success'] and response['object'] == 'failed':
                 return {'object': None, 'success': False, 'message': 'Operation was not successful'}
-            else:
-                continue
+            attempt += 1
+            self.__logger.debug('Check failed. Next attempt #%d', attempt + 1)
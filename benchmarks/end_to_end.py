@@ -0,0 +1,201 @@
+"""
+Runs the whole ImageSaver flow against local mock VK and Yandex disk servers (see mock_api.py) and reports
+time and throughput of every stage, p50/p99 latency of requests, requests count by endpoint and peak memory.
+Runs offline, so results of two commits can be compared to find regressions.
+Usage: python benchmarks/end_to_end.py --photos 2000 --latency 0.02 --concurrency 8 [--transfer stream] [--json]
+       python benchmarks/end_to_end.py --photos 500 --account --albums 3
+"""
+import argparse
+import json
+import pathlib as pl
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from collections import defaultdict
+from urllib.parse import urlparse
+
+try:
+    import resource
+except ImportError:
+    # not available on Windows, peak RSS is not reported there
+    resource = None
+
+sys.path.insert(0, str(pl.Path(__file__).resolve().parent.parent))
+
+from HttpSession import HttpSession  # noqa: E402
+from ImageSaver import ImageSaver  # noqa: E402
+from Metrics import Metrics  # noqa: E402
+from UploadOptions import UploadOptions  # noqa: E402
+from VkClient import VkClient  # noqa: E402
+from mock_api import MockDisk, MockVk  # noqa: E402
+
+
+class TimedSession(HttpSession):
+    """
+    HttpSession which measures latency of every request, grouped by host
+    """
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.__lock = threading.Lock()
+        self.__latencies = defaultdict(list)
+
+    def request(self, method: str, url: str, timeout=None, **kwargs):
+        started = time.perf_counter()
+        try:
+            return super().request(method, url, timeout=timeout, **kwargs)
+        finally:
+            elapsed = time.perf_counter() - started
+            with self.__lock:
+                self.__latencies[urlparse(url).netloc].append(elapsed)
+
+    def pop_latencies(self):
+        """
+        :return: dict of latencies lists by host, measured since previous call
+        """
+        with self.__lock:
+            latencies, self.__latencies = self.__latencies, defaultdict(list)
+        return latencies
+
+
+def percentile(values: list, part: float):
+    """
+    :return: nearest-rank percentile of values, e.g. part=0.99 for p99
+    """
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, max(0, int(round(part * len(values))) - 1))]
+
+
+def summarize_latencies(latencies: list):
+    return {'requests': len(latencies), 'p50_ms': percentile(latencies, 0.5) * 1000,
+            'p99_ms': percentile(latencies, 0.99) * 1000, 'max_ms': max(latencies, default=0.0) * 1000}
+
+
+def run(args):
+    vk = MockVk(photos=args.photos, friends=args.friends, albums=args.albums, latency=args.latency,
+                error_rate=args.error_rate, rate_limit=args.vk_limit, seed=args.seed).start()
+    disk = MockDisk(latency=args.latency, error_rate=args.error_rate, rate_limit=args.disk_limit,
+                    seed=args.seed + 1).start()
+    session = TimedSession(pool_maxsize=max(10, args.concurrency * 2))
+    hosts = {urlparse(vk.get_url()).netloc: 'vk', urlparse(disk.get_url()).netloc: 'disk'}
+    stages = []
+    report = {'params': vars(args), 'stages': stages}
+    if args.memory:
+        # tracemalloc slows allocations down, so time of such run is not comparable with plain runs
+        tracemalloc.start()
+
+    def stage(name: str, count: int, started: float):
+        seconds = time.perf_counter() - started
+        latencies = session.pop_latencies()
+        stages.append({'stage': name, 'seconds': seconds, 'items': count,
+                       'items_per_sec': count / seconds if seconds else 0.0,
+                       'latency': {hosts.get(host, host): summarize_latencies(values)
+                                   for host, values in latencies.items()}})
+
+    try:
+        with tempfile.TemporaryDirectory() as log_dir:
+            started = time.perf_counter()
+            total_started = started
+            saver = ImageSaver('vk-token', 'ya-token', None, session=session, vk_rate=args.vk_rate,
+                               ya_rate=args.ya_rate, vk_api_url=vk.get_api_url(), ya_api_url=disk.get_api_url(),
+                               stream_decode=args.stream_decode, transfer_mode=args.transfer,
+                               verify_checksums=args.verify)
+            stage('init', 2, started)
+            if not saver.is_initialized():
+                raise RuntimeError('ImageSaver is not initialized, check mock servers')
+            saver.create_folder(args.folder)
+            log_path = str(pl.Path(log_dir) / 'images_log.json')
+            options = UploadOptions(args.concurrency, fail_fast=False)
+            if args.account:
+                started = time.perf_counter()
+                result = saver.upload_account(args.folder, max_qty=args.photos, log_file_path=log_path,
+                                              options=options)
+                stage('upload_account', result['object']['uploaded'], started)
+            elif args.pipeline:
+                started = time.perf_counter()
+                result = saver.upload_album(args.folder, album_id='wall', max_qty=args.photos,
+                                            log_file_path=log_path, options=options)
+                stage('upload_album', result['object']['uploaded'], started)
+            else:
+                started = time.perf_counter()
+                links = saver.get_images_links(album_id='wall', max_qty=args.photos)
+                stage('get_images_links', len(links), started)
+                started = time.perf_counter()
+                result = saver.upload_remote_files(args.folder, links, log_path, options)
+                stage('upload_remote_files', result['object']['uploaded'], started)
+            report['failed'] = len(result['object']['failed'])
+            started = time.perf_counter()
+            files = saver.list_disk()
+            stage('list_files', len(files), started)
+            started = time.perf_counter()
+            client = VkClient('vk-token', 1, session=session, api_base_url=vk.get_api_url())
+            mutual = client & VkClient('vk-token', 2, session=session, api_base_url=vk.get_api_url())
+            stage('mutual_friends', len(mutual or []), started)
+            report['total_seconds'] = time.perf_counter() - total_started
+    finally:
+        if args.memory:
+            report['peak_traced_mb'] = tracemalloc.get_traced_memory()[1] / 2 ** 20
+            tracemalloc.stop()
+        session.close()
+        vk.stop()
+        disk.stop()
+    if resource is not None:
+        # kilobytes on Linux, bytes on macOS
+        scale = 2 ** 20 if sys.platform == 'darwin' else 2 ** 10
+        report['peak_rss_mb'] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / scale
+    report['servers'] = {'vk': vk.get_stats(), 'disk': disk.get_stats()}
+    report['metrics'] = Metrics.get_default().snapshot()
+    return report
+
+
+def print_report(report: dict):
+    print(f'{"stage":<22}{"seconds":>10}{"items":>8}{"items/s":>10}   latency p50 / p99 ms (requests)')
+    for stage in report['stages']:
+        latency = ', '.join(f'{host} {value["p50_ms"]:.1f} / {value["p99_ms"]:.1f} ({value["requests"]})'
+                            for host, value in stage['latency'].items())
+        print(f'{stage["stage"]:<22}{stage["seconds"]:>10.3f}{stage["items"]:>8}{stage["items_per_sec"]:>10.1f}   '
+              f'{latency}')
+    print(f'\nTotal: {report["total_seconds"]:.3f} sec, failed uploads: {report["failed"]}')
+    for name in ('peak_rss_mb', 'peak_traced_mb'):
+        if name in report:
+            print(f'{name}: {report[name]:.1f}')
+    for server, stats in report['servers'].items():
+        print(f'\n{server}: {stats["requests"]} requests, {stats["errors"]} errors, {stats["throttled"]} throttled')
+        for endpoint, count in sorted(stats['endpoints'].items(), key=lambda x: -x[1]):
+            print(f'  {endpoint:<45}{count:>8}')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Offline benchmark of ImageSaver flow with mock VK and Yandex disk')
+    parser.add_argument('--photos', type=int, default=1000, help='album size and photos to upload')
+    parser.add_argument('--friends', type=int, default=5, help='mutual friends count')
+    parser.add_argument('--latency', type=float, default=0.005, help='average server latency in seconds')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='part of requests failed with temporary error')
+    parser.add_argument('--vk-limit', type=float, default=None, help='VK server limit, requests per second')
+    parser.add_argument('--disk-limit', type=float, default=None, help='disk server limit, requests per second')
+    parser.add_argument('--vk-rate', type=float, default=100.0, help='VK client rate, requests per second')
+    parser.add_argument('--ya-rate', type=float, default=1000.0, help='disk client rate, requests per second')
+    parser.add_argument('--concurrency', type=int, default=4, help='uploads in flight')
+    parser.add_argument('--pipeline', action='store_true', help='use upload_album instead of separate stages')
+    parser.add_argument('--account', action='store_true', help='use upload_account to back up all albums')
+    parser.add_argument('--albums', type=int, default=0, help='user albums count besides system ones')
+    parser.add_argument('--stream-decode', action='store_true', help='decode VK responses while downloading')
+    parser.add_argument('--transfer', choices=ImageSaver.TRANSFER_MODES, default='remote',
+                        help='remote: disk fetches photo URLs, stream: photos are piped from VK to disk')
+    parser.add_argument('--verify', action='store_true', help='compare MD5 of streamed photos with disk')
+    parser.add_argument('--memory', action='store_true', help='trace Python allocations, makes run slower')
+    parser.add_argument('--folder', default='Benchmark', help='target folder on mock disk')
+    parser.add_argument('--seed', type=int, default=1, help='seed of random latency and errors')
+    parser.add_argument('--json', action='store_true', help='print report as JSON')
+    parser.add_argument('--prometheus', action='store_true', help='print client metrics in Prometheus format')
+    arguments = parser.parse_args()
+    result = run(arguments)
+    if arguments.json:
+        print(json.dumps(result, indent=2))
+    else:
+        print_report(result)
+    if arguments.prometheus:
+        print('\n' + Metrics.get_default().to_prometheus())
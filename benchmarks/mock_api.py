@@ -0,0 +1,405 @@
+"""
+Local stand-in servers of VK API and Yandex disk API for offline benchmarks.
+Servers answer with the same JSON structures as real services, and can add latency, random errors
+and throttling, so the whole ImageSaver flow can be measured without network and tokens
+"""
+import hashlib
+import json
+import random
+import re
+import threading
+import time
+from collections import Counter, defaultdict, deque
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+
+class MockHandler(BaseHTTPRequestHandler):
+    # keep-alive connections, the same as real services
+    protocol_version = 'HTTP/1.1'
+    # headers and body are sent separately, so without it every response waits for delayed ACK
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        pass
+
+    def read_body(self):
+        if self.headers.get('Transfer-Encoding') == 'chunked':
+            data = bytearray()
+            while True:
+                size = int(self.rfile.readline().strip(), 16)
+                if size == 0:
+                    self.rfile.readline()
+                    return bytes(data)
+                data += self.rfile.read(size)
+                self.rfile.readline()
+        return self.rfile.read(int(self.headers.get('Content-Length') or 0))
+
+    def handle_method(self):
+        url = urlparse(self.path)
+        query = {key: values[0] for key, values in parse_qs(url.query).items()}
+        body = self.read_body()
+        if self.headers.get('Content-Type', '').startswith('application/x-www-form-urlencoded'):
+            query.update({key: values[0] for key, values in parse_qs(body.decode()).items()})
+        status, content, headers = self.server.api.dispatch(self.command, url.path, query, body, self.headers)
+        data = content if type(content) is bytes else (json.dumps(content).encode() if content is not None else b'')
+        self.send_response(status)
+        for key, value in headers.items():
+            self.send_header(key, value)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    do_GET = do_PUT = do_POST = do_DELETE = handle_method
+
+
+class MockServer:
+    """
+    HTTP server running in background thread. Subclasses implement handle, this class adds latency,
+    random errors and per token throttling and counts requests by endpoint
+    """
+    def __init__(self, latency=0.0, jitter=0.5, error_rate=0.0, rate_limit: float = None, seed=1):
+        """
+        :param latency: average response delay in seconds
+        :param jitter: random part of latency, 0.5 means delay can be changed by +-50%
+        :param error_rate: part of requests answered with temporary error, e.g. 0.01
+        :param rate_limit: max requests per second of one token, over limit requests are throttled
+        :param seed: seed of random errors and delays, the same seed gives the same run
+        """
+        self.__latency = latency
+        self.__jitter = jitter
+        self.__error_rate = error_rate
+        self.__rate_limit = rate_limit
+        self.__random = random.Random(seed)
+        self.__lock = threading.Lock()
+        # request times of every token in the last second
+        self.__windows = defaultdict(deque)
+        self.__requests = Counter()
+        self.__errors = 0
+        self.__throttled = 0
+        self.__server = None
+        self.__thread = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.stop()
+
+    def start(self):
+        self.__server = ThreadingHTTPServer(('127.0.0.1', 0), MockHandler)
+        self.__server.daemon_threads = True
+        self.__server.api = self
+        self.__thread = threading.Thread(target=self.__server.serve_forever, daemon=True)
+        self.__thread.start()
+        return self
+
+    def stop(self):
+        if self.__server is not None:
+            self.__server.shutdown()
+            self.__server.server_close()
+            self.__server = None
+
+    def get_url(self):
+        host, port = self.__server.server_address[:2]
+        return f'http://{host}:{port}'
+
+    def get_stats(self):
+        """
+        :return: dict with requests count by endpoint, total requests, errors and throttled requests count
+        """
+        with self.__lock:
+            return {'requests': sum(self.__requests.values()), 'endpoints': dict(self.__requests),
+                    'errors': self.__errors, 'throttled': self.__throttled}
+
+    @staticmethod
+    def get_endpoint(method: str, path: str):
+        # IDs and file paths are cut, so requests are grouped by API method
+        return method + ' ' + re.sub(r'/(upload|img)/.*$', r'/\1/*', re.sub(r'/\d+$', '/{id}', path))
+
+    def __is_throttled(self, token: str):
+        if self.__rate_limit is None:
+            return False
+        now = time.monotonic()
+        window = self.__windows[token]
+        while window and now - window[0] >= 1.0:
+            window.popleft()
+        if len(window) >= self.__rate_limit:
+            return True
+        window.append(now)
+        return False
+
+    def dispatch(self, method: str, path: str, query: dict, body: bytes, headers):
+        with self.__lock:
+            self.__requests[self.get_endpoint(method, path)] += 1
+            delay = self.__latency * (1 + self.__random.uniform(-self.__jitter, self.__jitter))
+            is_error = self.__random.random() < self.__error_rate
+            is_throttled = self.__is_throttled(self.get_token(query, headers))
+            self.__errors += is_error
+            self.__throttled += is_throttled
+        if delay > 0:
+            time.sleep(delay)
+        if is_throttled:
+            return self.throttled()
+        if is_error:
+            return self.error()
+        return self.handle(method, path, query, body)
+
+    def get_token(self, query: dict, headers):
+        return ''
+
+    def throttled(self):
+        return 429, None, {'Retry-After': '1'}
+
+    def error(self):
+        return 503, None, {}
+
+    def handle(self, method: str, path: str, query: dict, body: bytes):
+        """
+        :return: tuple of HTTP status, JSON object or bytes, and dict of headers
+        """
+        raise NotImplementedError
+
+
+class MockVk(MockServer):
+    """
+    VK API with users.get, status.get, photos.get, photos.getAlbums, friends.getMutual and execute of these methods.
+    Album photos are generated on the fly, so album size costs no memory. Photo URLs point to this server
+    """
+    SIZES = (('s', 75, 56), ('m', 130, 97), ('x', 604, 453), ('y', 807, 605), ('z', 1280, 960), ('w', 2560, 1920))
+    # system albums in order of photo IDs ranges, user albums get IDs 1, 2, ...
+    SYSTEM_ALBUMS = ((-7, 'wall'), (-6, 'profile'), (-15, 'saved'))
+    # photo IDs of every album start from album number multiplied by this value
+    ALBUM_IDS_RANGE = 10 ** 6
+
+    def __init__(self, photos=1000, friends=10, albums=0, **kwargs):
+        """
+        :param photos: photos count in every album
+        :param friends: mutual friends count of every pair of users
+        :param albums: count of user albums besides system ones
+        :param kwargs: see MockServer
+        """
+        super().__init__(**kwargs)
+        self.__photos = photos
+        self.__friends = friends
+        self.__albums = albums
+
+    def get_api_url(self):
+        return self.get_url() + '/method/'
+
+    def get_token(self, query: dict, headers):
+        return query.get('access_token', '')
+
+    def throttled(self):
+        return 200, {'error': {'error_code': 6, 'error_msg': 'Too many requests per second'}}, {}
+
+    def error(self):
+        return 200, {'error': {'error_code': 10, 'error_msg': 'Internal server error'}}, {}
+
+    def make_photo(self, index: int, owner_id: int, album_id=-7, base=0):
+        url = self.get_url()
+        return {'id': base + index + 1, 'owner_id': owner_id, 'album_id': album_id, 'date': 1600000000 + index * 60,
+                'text': '', 'likes': {'user_likes': 0, 'count': index % 50}, 'reposts': {'count': 0},
+                'comments': {'count': 0}, 'tags': {'count': 0}, 'can_comment': 1,
+                'sizes': [{'type': size_type, 'width': width, 'height': height,
+                           'url': f'{url}/img/{owner_id}/{base + index}_{size_type}.jpg?size={width}x{height}'
+                                  f'&type=album'}
+                          for size_type, width, height in self.SIZES]}
+
+    def get_album_number(self, album_id):
+        """
+        :param album_id: system album name or ID, or user album ID
+        :return: number of album, which gives range of its photo IDs
+        """
+        for number, (system_id, name) in enumerate(self.SYSTEM_ALBUMS):
+            if str(album_id) in (name, str(system_id)):
+                return number
+        return len(self.SYSTEM_ALBUMS) + int(album_id) - 1
+
+    def photos_get(self, params: dict):
+        owner_id = int(params.get('owner_id') or params.get('user_id') or 1)
+        offset, count = int(params.get('offset', 0)), int(params.get('count', 50))
+        album_id = params.get('album_id') or 'wall'
+        base = self.get_album_number(album_id) * self.ALBUM_IDS_RANGE
+        return {'count': self.__photos,
+                'items': [self.make_photo(i, owner_id, album_id, base)
+                          for i in range(offset, min(offset + count, self.__photos))]}
+
+    def photos_get_albums(self, params: dict):
+        albums = [{'id': album_id, 'title': name.capitalize(), 'size': self.__photos}
+                  for album_id, name in self.SYSTEM_ALBUMS] if str(params.get('need_system')) in ('1', 'True') else []
+        albums += [{'id': album_id, 'title': f'Album {album_id}', 'size': self.__photos}
+                   for album_id in range(1, self.__albums + 1)]
+        return {'count': len(albums), 'items': albums}
+
+    def call(self, method: str, params: dict):
+        """
+        :return: tuple of method response and error dict, one of them is None
+        """
+        if method == 'users.get':
+            ids = str(params.get('user_ids') or '1').split(',')
+            return [{'id': int(x) if x.isdigit() else 1, 'first_name': 'Test', 'last_name': f'User{x}',
+                     'domain': f'id{x}'} for x in ids], None
+        if method == 'status.get':
+            return {'text': 'benchmark'}, None
+        if method == 'photos.get':
+            return self.photos_get(params), None
+        if method == 'photos.getAlbums':
+            return self.photos_get_albums(params), None
+        if method == 'friends.getMutual':
+            return [{'id': int(x), 'common_friends': list(range(100, 100 + self.__friends)),
+                     'common_count': self.__friends} for x in str(params.get('target_uids', '2')).split(',')], None
+        return None, {'error_code': 3, 'error_msg': 'Unknown method passed'}
+
+    def execute(self, code: str):
+        responses = []
+        errors = []
+        for method, params in re.findall(r'API\.([\w.]+)\((\{.*?\})\)', code):
+            response, error = self.call(method, json.loads(params))
+            if error is not None:
+                responses.append(False)
+                errors.append({'method': method, **error})
+            else:
+                responses.append(response)
+        result = {'response': responses}
+        if errors:
+            result['execute_errors'] = errors
+        return result
+
+    def handle(self, method: str, path: str, query: dict, body: bytes):
+        if path.startswith('/img/'):
+            return 200, b'\xff\xd8' + b'\0' * 4096, {}
+        name = path[len('/method/'):]
+        if name == 'execute':
+            return 200, self.execute(query.get('code', '')), {}
+        response, error = self.call(name, query)
+        if error is not None:
+            return 200, {'error': error}, {}
+        return 200, {'response': response}, {}
+
+
+class MockDisk(MockServer):
+    """
+    Yandex disk API: disk info, folders, remote and direct uploads, async operations, flat files list
+    and last uploaded files. Files are kept in memory as path and size
+    """
+    def __init__(self, operation_checks=1, **kwargs):
+        """
+        :param operation_checks: status checks before async operation is finished
+        :param kwargs: see MockServer
+        """
+        super().__init__(**kwargs)
+        self.__operation_checks = operation_checks
+        self.__files = {}
+        # MD5 of files uploaded directly, remote uploads get fake MD5
+        self.__md5 = {}
+        # files get increasing modified times in order of uploads, so last uploaded feed can be followed
+        self.__modified = {}
+        self.__folders = set()
+        self.__operations = {}
+        self.__lock = threading.Lock()
+
+    def get_api_url(self):
+        return self.get_url()
+
+    def get_token(self, query: dict, headers):
+        return headers.get('Authorization', '')
+
+    def get_files(self):
+        with self.__lock:
+            return dict(self.__files)
+
+    def get_md5(self):
+        """
+        :return: MD5 of files uploaded directly by upload links
+        """
+        with self.__lock:
+            return dict(self.__md5)
+
+    @staticmethod
+    def normalize(path: str):
+        return '/' + path.replace('disk:', '').strip('/')
+
+    def __make_item(self, path: str, index: int):
+        size = self.__files.get(path)
+        return {'path': 'disk:' + path, 'name': path.rpartition('/')[2], 'type': 'file' if size is not None else 'dir',
+                'size': size or 0, 'md5': self.__md5.get(path, f'{index:032x}'),
+                'modified': self.__modified.get(path, '2020-01-01T00:00:00+00:00')}
+
+    def __add_file(self, path: str, size: int, md5: str = None):
+        with self.__lock:
+            self.__files[path] = size
+            self.__modified[path] = (datetime(2020, 1, 1, tzinfo=timezone.utc) +
+                                     timedelta(seconds=len(self.__operations) + 1)).isoformat()
+            if md5 is not None:
+                self.__md5[path] = md5
+            self.__operations[str(len(self.__operations) + 1)] = 0
+            return str(len(self.__operations))
+
+    def resources(self, method: str, query: dict):
+        path = self.normalize(query.get('path', '/'))
+        with self.__lock:
+            if method == 'PUT':
+                if path in self.__folders:
+                    return 409, {'error': 'DiskPathPointsToExistentDirectoryError'}, {}
+                self.__folders.add(path)
+                return 201, {'href': f'{self.get_url()}/v1/disk/resources?path=disk:{path}', 'method': 'GET'}, {}
+            if method == 'DELETE':
+                found = [key for key in self.__files if key == path or key.startswith(path + '/')]
+                for key in found:
+                    del self.__files[key]
+                    self.__md5.pop(key, None)
+                    self.__modified.pop(key, None)
+                self.__folders.discard(path)
+                return 204, None, {}
+            if path in self.__files:
+                return 200, self.__make_item(path, 0), {}
+            if path != '/' and path not in self.__folders:
+                return 404, {'error': 'DiskNotFoundError'}, {}
+            names = sorted(key for key in list(self.__files) + list(self.__folders)
+                           if key.rpartition('/')[0] == path.rstrip('/'))
+        offset, limit = int(query.get('offset', 0)), int(query.get('limit', 20))
+        items = [self.__make_item(name, i) for i, name in enumerate(names[offset:offset + limit], offset)]
+        return 200, {'path': 'disk:' + path, 'name': path.rpartition('/')[2], 'type': 'dir',
+                     '_embedded': {'items': items, 'offset': offset, 'limit': limit, 'total': len(names)}}, {}
+
+    def files(self, query: dict, last_uploaded=False):
+        with self.__lock:
+            paths = list(self.__files)
+        if last_uploaded:
+            paths.reverse()
+        offset, limit = int(query.get('offset', 0)), int(query.get('limit', 20))
+        items = [self.__make_item(path, i) for i, path in enumerate(paths[offset:offset + limit], offset)]
+        return 200, {'items': items, 'limit': limit, 'offset': offset}, {}
+
+    def handle(self, method: str, path: str, query: dict, body: bytes):
+        if path == '/v1/disk':
+            return 200, {'user': {'login': 'benchmark', 'display_name': 'Benchmark'}, 'total_space': 10 ** 12,
+                         'used_space': sum(self.get_files().values())}, {}
+        if path == '/v1/disk/resources':
+            return self.resources(method, query)
+        if path == '/v1/disk/resources/upload':
+            disk_path = self.normalize(query.get('path', ''))
+            if method == 'POST':
+                # remote upload is accepted at once and finished by async operation
+                operation = self.__add_file(disk_path, 4098)
+                return 202, {'href': f'{self.get_url()}/v1/disk/operations/{operation}', 'method': 'GET'}, {}
+            return 200, {'href': f'{self.get_url()}/upload{disk_path}', 'method': 'PUT'}, {}
+        if path.startswith('/upload/'):
+            self.__add_file(path[len('/upload'):], len(body), hashlib.md5(body).hexdigest())
+            return 201, None, {}
+        if path.startswith('/v1/disk/operations/'):
+            operation = path.rpartition('/')[2]
+            with self.__lock:
+                checks = self.__operations.get(operation)
+                if checks is None:
+                    return 404, {'error': 'OperationNotFoundError'}, {}
+                self.__operations[operation] = checks + 1
+            return 200, {'status': 'success' if checks + 1 >= self.__operation_checks else 'in-progress'}, {}
+        if path == '/v1/disk/resources/files':
+            return self.files(query)
+        if path == '/v1/disk/resources/last-uploaded':
+            return self.files(query, last_uploaded=True)
+        return 404, {'error': 'NotFound'}, {}
@@ -0,0 +1,84 @@
+"""
+Compares memory and construction time of photo links representations:
+old lists [filename, extension, url, size type, owner ID, photo ID] and PhotoBatch.
+Usage: python benchmarks/photo_records.py [photos count]
+"""
+import gc
+import pathlib as pl
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, str(pl.Path(__file__).resolve().parent.parent))
+
+from ImageSaver import ImageSaver  # noqa: E402
+
+SIZE_TYPES = 'smxopqryzw'
+
+
+def make_items(count: int):
+    """
+    :return: synthetic VK photos with the same structure as photos.get returns with photo_sizes and extended
+    """
+    return [{'id': 457239017 + i, 'owner_id': 1, 'date': 1600000000 + i, 'likes': {'count': i % 500},
+             'sizes': [{'type': letter, 'width': 75 * k, 'height': 50 * k,
+                        'url': f'https://sun9-{i % 90}.userapi.com/impg/c{857000 + i}/v{857000 + i}/{i:x}{letter}/'
+                               f'photo.jpg?size={75 * k}x{50 * k}&quality=96&sign={i:032x}&type=album'}
+                       for k, letter in enumerate(SIZE_TYPES, 1)]}
+            for i in range(count)]
+
+
+def make_lists(items: list):
+    # the way links were made before PhotoBatch: one list per photo
+    result = []
+    likes_set = set()
+    for item in items:
+        size = max(item['sizes'], key=lambda x: x['width'] * x['height'])
+        name = str(item['likes']['count'])
+        if name in likes_set:
+            i = 1
+            while f'{name}_{i}' in likes_set:
+                i += 1
+            name += f'_{i}'
+        likes_set.add(name)
+        result.append([name, pl.Path(size['url']).suffix, size['url'], size['type'],
+                       item['owner_id'], item['id']])
+    return result
+
+
+def make_batch(items: list):
+    return ImageSaver.get_links_from_items(items)
+
+
+def measure(function, items: list):
+    # tracemalloc slows down every allocation, so time is measured in separate run
+    gc.collect()
+    started = time.perf_counter()
+    function(items)
+    seconds = time.perf_counter() - started
+    gc.collect()
+    tracemalloc.start()
+    result = function(items)
+    size, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, seconds, size, peak
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    items = make_items(count)
+    print(f'{count} photos')
+    print(f'{"representation":<20}{"time, s":>10}{"memory, MB":>12}{"peak, MB":>10}{"bytes/photo":>13}')
+    for name, function in (('lists', make_lists), ('PhotoBatch', make_batch)):
+        result, seconds, size, peak = measure(function, items)
+        assert len(result) == count and isinstance(result[0][0], str)
+        print(f'{name:<20}{seconds:>10.3f}{size / 2 ** 20:>12.1f}{peak / 2 ** 20:>10.1f}{size / count:>13.0f}')
+        del result
+    # items of batch are old lists, so upload_remote_files can take any of them
+    # (old lists kept query string of URL in extension, so it isn't compared)
+    old, new = make_lists(items[:1])[0], make_batch(items[:1])[0]
+    assert [old[i] for i in (0, 2, 3, 4, 5)] == [new[i] for i in (0, 2, 3, 4, 5)]
+
+
+if __name__ == '__main__':
+    main()
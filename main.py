@@ -1,4 +1,7 @@
 from ImageSaver import ImageSaver
+from Logger import Logger
+from SyncManifest import SyncManifest
+from UploadOptions import UploadOptions
 
 
 class PrintColors:
@@ -12,6 +15,12 @@ class PrintColors:
     UNDERLINE = '\033[4m'
 
 
+def print_flushed(*args):
+    # log records are written by background thread, so they go first to keep order of console output
+    Logger.flush()
+    print(*args)
+
+
 def run_demo():
     token_vk = ''
     app_id_vk = ''
@@ -23,6 +32,7 @@ def run_demo():
     max_images_qty = 10
     album = 'wall'  # can be wall, profile, saved
     log_file_path = 'images_log.json'
+    manifest_path = 'sync_manifest.db'
     padding = 40
 
     if token_vk == '':
@@ -46,39 +56,34 @@ def run_demo():
 
     saver = ImageSaver(token_vk=token_vk, token_ya=token_ya, uid_vk=vk_user_id, debug_mode=DEBUG_MODE)
     if not saver.is_initialized():
-        print(f'{PrintColors.FAIL}Can\'t continue. I interrupt the demo!{PrintColors.ENDC}')
+        print_flushed(f'{PrintColors.FAIL}Can\'t continue. I interrupt the demo!{PrintColors.ENDC}')
         return
 
-    print('\n' + f'{PrintColors.OKBLUE}Heating{PrintColors.ENDC}'.center(padding, '-'))
+    print_flushed('\n' + f'{PrintColors.OKBLUE}Heating{PrintColors.ENDC}'.center(padding, '-'))
     saver.get_user_vk_status()
 
+    manifest = SyncManifest(manifest_path)
     result = saver.get_file_info(folder_name)
     if result['success']:
-        choice = ''
-        while not (choice in ['y', 'n']):
-            choice = input(f'{PrintColors.OKGREEN}\nTarget folder "{result["object"]["path"][6:]}" exists, would you '
-                           f'like to delete it (otherwise files will be duplicated)? \nPress "y" to confirm or "n" '
-                           f'to skip: {PrintColors.ENDC}')
-            if choice == 'y':
-                saver.delete_file(folder_name)
-                break
-            elif choice == 'n':
-                break
+        # existing files are never overwritten: new photos get free names and uploaded ones are skipped by manifest
+        print_flushed(f'Target folder "{result["object"]["path"][6:]}" exists, {manifest.count(folder_name)} files '
+                      f'are known from previous runs, only missing files will be uploaded')
 
     result = saver.create_folder(folder_name)
     # Let's continue even if 409 error received (folder exist)
     if result['success'] or result['message'].find('409') >= 0:
-        print('\n' + f'{PrintColors.OKBLUE}Downloading{PrintColors.ENDC}'.center(padding, '-'))
-        links = saver.get_images_links(album_id=album, max_qty=max_images_qty)
-        print('\n' + f'{PrintColors.OKBLUE}Uploading{PrintColors.ENDC}'.center(padding, '-'))
-        saver.upload_remote_files(folder_name, links, log_file_path)
-        print('\n' + f'{PrintColors.OKBLUE}Checking{PrintColors.ENDC}'.center(padding, '-'))
+        print_flushed('\n' + f'{PrintColors.OKBLUE}Downloading{PrintColors.ENDC}'.center(padding, '-'))
+        links = saver.get_images_links(album_id=album, max_qty=max_images_qty, folder=folder_name)
+        print_flushed('\n' + f'{PrintColors.OKBLUE}Uploading{PrintColors.ENDC}'.center(padding, '-'))
+        saver.upload_remote_files(folder_name, links, log_file_path, UploadOptions(manifest=manifest))
+        print_flushed('\n' + f'{PrintColors.OKBLUE}Checking{PrintColors.ENDC}'.center(padding, '-'))
         saver.list_disk()
     else:
-        print(f'{PrintColors.FAIL}Something went wrong: {result["message"]}{PrintColors.ENDC}')
+        print_flushed(f'{PrintColors.FAIL}Something went wrong: {result["message"]}{PrintColors.ENDC}')
 
-    print('\n' + f'{PrintColors.OKBLUE}Finishing{PrintColors.ENDC}'.center(padding, '-'))
-    print('This is the end of demo!')
+    manifest.close()
+    print_flushed('\n' + f'{PrintColors.OKBLUE}Finishing{PrintColors.ENDC}'.center(padding, '-'))
+    print_flushed('This is the end of demo!')
 
 
 run_demo()
@@ -0,0 +1,88 @@
+"""
+Shared fixtures of tests: local mock servers of VK and Yandex disk from benchmarks/mock_api.py
+and savers connected to them. Every test gets own tokens, so shared rate limiters and identity cache
+of other tests don't change its requests
+"""
+import pathlib as pl
+import sys
+import threading
+import uuid
+
+import pytest
+
+ROOT = pl.Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+sys.path.insert(0, str(ROOT / 'benchmarks'))
+
+from ImageSaver import ImageSaver  # noqa: E402
+from mock_api import MockDisk, MockVk  # noqa: E402
+
+
+class RecordingDisk(MockDisk):
+    """
+    MockDisk which fails remote uploads of URLs containing '/bad/' and counts uploads in flight
+    """
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.__lock = threading.Lock()
+        self.__in_flight = 0
+        self.__max_in_flight = 0
+        self.__uploads = []
+
+    def get_max_in_flight(self):
+        with self.__lock:
+            return self.__max_in_flight
+
+    def get_uploads(self):
+        """
+        :return: disk paths of remote uploads in order of requests
+        """
+        with self.__lock:
+            return list(self.__uploads)
+
+    def dispatch(self, method: str, path: str, query: dict, body: bytes, headers):
+        if not (method == 'POST' and path == '/v1/disk/resources/upload'):
+            return super().dispatch(method, path, query, body, headers)
+        with self.__lock:
+            self.__uploads.append(query.get('path'))
+            self.__in_flight += 1
+            self.__max_in_flight = max(self.__max_in_flight, self.__in_flight)
+        try:
+            if '/bad/' in query.get('url', ''):
+                return 400, {'error': 'BadUrl', 'message': 'URL can not be downloaded'}, {}
+            return super().dispatch(method, path, query, body, headers)
+        finally:
+            with self.__lock:
+                self.__in_flight -= 1
+
+
+@pytest.fixture
+def vk_server():
+    with MockVk(photos=120, friends=5) as server:
+        yield server
+
+
+@pytest.fixture
+def disk_server():
+    with RecordingDisk(latency=0.005, jitter=0.9) as server:
+        yield server
+
+
+@pytest.fixture
+def tokens():
+    suffix = uuid.uuid4().hex
+    return f'vk-{suffix}', f'ya-{suffix}'
+
+
+@pytest.fixture
+def saver(vk_server, disk_server, tokens):
+    return ImageSaver(tokens[0], tokens[1], None, vk_rate=1000.0, ya_rate=1000.0, vk_api_url=vk_server.get_api_url(),
+                      ya_api_url=disk_server.get_api_url())
+
+
+def make_files(count: int, bad: tuple = (), url: str = 'http://127.0.0.1:9/img'):
+    """
+    :param bad: indexes of files which URLs fail on RecordingDisk
+    :return: list of [filename, extension, url, size type, owner ID, photo ID]
+    """
+    return [[str(i), '.jpg', f'{url}/{"bad" if i in bad else "ok"}/{i}.jpg', 'z', 1, i + 1] for i in range(count)]
@@ -0,0 +1,23 @@
+class FakeClock:
+    """
+    Replaces time module in tested module: sleep only moves clock forward and records delays
+    """
+    def __init__(self, now=1000.0):
+        self.now = now
+        self.sleeps = []
+
+    def monotonic(self):
+        return self.now
+
+    def time(self):
+        return self.now
+
+    def perf_counter(self):
+        return self.now
+
+    def sleep(self, seconds: float):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+    def advance(self, seconds: float):
+        self.now += seconds
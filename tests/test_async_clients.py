@@ -0,0 +1,205 @@
+import asyncio
+import threading
+import time
+import uuid
+
+from AsyncHttpSession import AsyncHttpSession
+from AsyncVkClient import AsyncVkClient
+from AsyncYaUploader import AsyncYaUploader
+from Metrics import Metrics
+from RateLimiter import RateLimiter
+from RetryPolicy import RetryPolicy
+from VkClient import VkClient
+from YaUploader import YaUploader
+from mock_api import MockDisk, MockVk
+
+USER = {'id': 1, 'first_name': 'Test', 'last_name': 'User', 'domain': 'id1'}
+
+
+class BusyVk(MockVk):
+    """
+    MockVk which answers the first calls of chosen method with VK error 6 (too many requests per second)
+    """
+    def __init__(self, method: str, failures: int, **kwargs):
+        super().__init__(**kwargs)
+        self.__lock = threading.Lock()
+        self.__method = method
+        self.__failures = failures
+
+    def call(self, method: str, params: dict):
+        with self.__lock:
+            if method == self.__method and self.__failures:
+                self.__failures -= 1
+                return None, {'error_code': 6, 'error_msg': 'Too many requests per second'}
+        return super().call(method, params)
+
+
+class BusyDisk(MockDisk):
+    """
+    MockDisk which answers the first requests of disk info with HTTP 503
+    """
+    def __init__(self, failures: int, **kwargs):
+        super().__init__(**kwargs)
+        self.__lock = threading.Lock()
+        self.__failures = failures
+
+    def handle(self, method: str, path: str, query: dict, body: bytes):
+        with self.__lock:
+            if path == '/v1/disk' and self.__failures:
+                self.__failures -= 1
+                return 503, None, {}
+        return super().handle(method, path, query, body)
+
+
+def make_policy(api_base_url: str, token: str, metrics: Metrics, service='vk', max_attempts=3):
+    make = RetryPolicy.for_vk if service == 'vk' else RetryPolicy.for_yandex
+    return make(api_base_url, token, max_attempts=max_attempts, base_delay=0.0, jitter=0.0, metrics=metrics)
+
+
+def run_async(make_clients, calls):
+    """
+    Creates async clients in event loop and awaits calls
+    :param make_clients: coroutine function which gets AsyncHttpSession and returns clients
+    :param calls: function which gets clients and returns list of coroutines
+    """
+    async def run():
+        session = AsyncHttpSession()
+        try:
+            clients = await make_clients(session)
+            return [await call for call in calls(clients)]
+        finally:
+            await session.close()
+    return asyncio.run(run())
+
+
+def test_async_vk_client_gives_the_same_results(vk_server):
+    token = f'vk-{uuid.uuid4().hex}'
+    url = vk_server.get_api_url()
+
+    def calls(client):
+        return [client.get_users(user_ids=['1', '5']), client.get_user_status(),
+                client.get_user_photos(album_id='wall', count=5, offset=3, fields=['id', 'likes']),
+                client.get_mutual_friends(friends_ids=[2, 3])]
+
+    client = VkClient(token, api_base_url=url, rate_limiter=RateLimiter(1000.0))
+    expected = calls(client)
+
+    async def make_client(session):
+        return await AsyncVkClient.create(token, session=session, api_base_url=url, rate_limiter=RateLimiter(1000.0))
+
+    assert run_async(make_client, calls) == expected
+    assert [x['success'] for x in expected] == [True] * 4
+
+
+def test_async_uploader_gives_the_same_results(disk_server):
+    token = f'ya-{uuid.uuid4().hex}'
+    url = disk_server.get_api_url()
+
+    def calls(uploader):
+        return [uploader.get_disk_info(), uploader.get_file_info('/Test'), uploader.create_folder('Test'),
+                uploader.create_folder('Test'), uploader.get_file_info('/Test'), uploader.list_files(),
+                uploader.delete_file('Test')]
+
+    uploader = YaUploader(token, api_base_url=url, rate_limiter=RateLimiter(1000.0))
+    expected = calls(uploader)
+
+    async def make_uploader(session):
+        return await AsyncYaUploader.create(token, session=session, api_base_url=url, rate_limiter=RateLimiter(1000.0))
+
+    assert run_async(make_uploader, calls) == expected
+    # missing folder and the second creation fail with the same messages
+    assert [x['success'] for x in expected] == [True, False, True, False, True, True, True]
+
+
+def test_async_clients_share_rate_limiter_of_token(vk_server):
+    token = f'vk-{uuid.uuid4().hex}'
+    limiter = RateLimiter.for_token('vk', token, 20.0)
+    # sync client of the same token gets the same limiter by default
+    assert VkClient(token, api_base_url=vk_server.get_api_url(), user=USER).get_rate_limiter() is limiter
+
+    async def make_client(session):
+        client = await AsyncVkClient.create(token, session=session, api_base_url=vk_server.get_api_url())
+        assert client.get_rate_limiter() is limiter
+        return client
+
+    started = time.monotonic()
+    results = run_async(make_client, lambda client: [client.get_user_status() for _ in range(5)])
+    # init and 5 requests are spaced by 1/20 second, waiting doesn't block event loop
+    assert time.monotonic() - started >= 0.2
+    assert all(x['success'] for x in results)
+    assert limiter.get_stats()['acquired'] == 6
+
+
+def test_async_vk_client_retries_throttled_calls():
+    metrics = Metrics()
+    token = f'vk-{uuid.uuid4().hex}'
+    with BusyVk('status.get', 2) as vk:
+        url = vk.get_api_url()
+
+        async def make_client(session):
+            return await AsyncVkClient.create(token, session=session, api_base_url=url,
+                                              rate_limiter=RateLimiter(1000.0), metrics=metrics,
+                                              retry_policy=make_policy(url, token, metrics))
+
+        [result] = run_async(make_client, lambda client: [client.get_user_status()])
+        assert vk.get_stats()['endpoints']['GET /method/status.get'] == 3
+    assert result == {'object': 'benchmark', 'success': True, 'message': ''}
+    snapshot = metrics.snapshot()['counters']
+    assert snapshot['retries_total'] == [{'labels': {'reason': 'throttled', 'service': 'vk'}, 'value': 2}]
+    # errors which were retried successfully are not API errors of results, the same as in VkClient
+    assert 'api_errors_total' not in snapshot
+    requests_total = {x['labels']['endpoint']: x['value'] for x in snapshot['http_requests_total']}
+    assert requests_total == {'users.get': 1, 'status.get': 3}
+
+
+def test_async_uploader_retries_unavailable_disk():
+    metrics = Metrics()
+    token = f'ya-{uuid.uuid4().hex}'
+    with BusyDisk(2) as disk:
+        url = disk.get_api_url()
+
+        async def make_uploader(session):
+            return await AsyncYaUploader.create(token, session=session, api_base_url=url,
+                                                rate_limiter=RateLimiter(1000.0), metrics=metrics,
+                                                retry_policy=make_policy(url, token, metrics, 'ya'))
+
+        [result] = run_async(make_uploader, lambda uploader: [uploader.get_disk_info()])
+        assert disk.get_stats()['endpoints']['GET /v1/disk'] == 4
+    assert result['success']
+    statuses = {x['labels']['status']: x['value'] for x in metrics.snapshot()['counters']['http_requests_total']}
+    assert statuses == {'503': 2, '200': 2}
+
+
+def test_async_vk_client_reports_connection_errors_as_failed_results():
+    metrics = Metrics()
+    token = f'vk-{uuid.uuid4().hex}'
+    url = 'http://127.0.0.1:9/method/'
+
+    async def make_client(session):
+        # known user, so client is initialized without requests
+        return AsyncVkClient(token, session=session, user=USER, api_base_url=url, rate_limiter=RateLimiter(1000.0),
+                             metrics=metrics, retry_policy=make_policy(url, token, metrics))
+
+    [result] = run_async(make_client, lambda client: [client.get_user_status()])
+    assert result['object'] is None and result['success'] is False
+    assert result['message'].startswith('Request failed: ClientConnectorError')
+    statuses = {x['labels']['status'] for x in metrics.snapshot()['counters']['http_requests_total']}
+    assert statuses == {'ClientConnectorError'}
+    assert metrics.snapshot()['counters']['retries_total'] == \
+        [{'labels': {'reason': 'connection', 'service': 'vk'}, 'value': 2}]
+
+
+def test_async_vk_client_init_fails_on_connection_error():
+    url = 'http://127.0.0.1:9/method/'
+    token = f'vk-{uuid.uuid4().hex}'
+
+    async def make_client(session):
+        return AsyncVkClient(token, session=session, api_base_url=url, rate_limiter=RateLimiter(1000.0),
+                             retry_policy=make_policy(url, token, Metrics(), max_attempts=1))
+
+    async def init(client):
+        return await client.init(), client.get_status()
+
+    [(initialized, status)] = run_async(make_client, lambda client: [init(client)])
+    assert not initialized
+    assert status.startswith('AsyncVkClient init failed: Request failed: ClientConnectorError')
@@ -0,0 +1,56 @@
+import asyncio
+import time
+
+import pytest
+
+import OperationTracker
+from AsyncHttpSession import AsyncHttpSession
+from AsyncYaUploader import AsyncYaUploader
+from RateLimiter import RateLimiter
+from mock_api import MockDisk
+
+
+@pytest.fixture
+def delays(monkeypatch):
+    """
+    Records attempts passed to backoff schedule and makes delays short
+    """
+    attempts = []
+
+    def get_backoff_delay(attempt: int, base_delay=0.3, max_delay=10.0, jitter=0.5):
+        attempts.append(attempt)
+        return 0.01
+
+    monkeypatch.setattr(OperationTracker.OperationTracker, 'get_backoff_delay', staticmethod(get_backoff_delay))
+    return attempts
+
+
+def wait_operation(checks: int, timeout: float):
+    async def run():
+        with MockDisk(operation_checks=checks) as disk:
+            session = AsyncHttpSession()
+            try:
+                uploader = await AsyncYaUploader.create('ya-token', session=session, api_base_url=disk.get_api_url(),
+                                                        rate_limiter=RateLimiter(1000.0))
+                assert uploader.is_initialized()
+                accepted = await uploader.upload_remote_file('/Test/1.jpg', 'http://127.0.0.1:9/1.jpg')
+                return await uploader.get_operation_status(accepted['object']['href'], timeout=timeout)
+            finally:
+                await session.close()
+    return asyncio.run(run())
+
+
+def test_operation_is_checked_with_backoff_until_success(delays):
+    # the old schedule gave up after 10 checks
+    result = wait_operation(checks=15, timeout=30)
+    assert result['success']
+    assert delays == list(range(15))
+
+
+def test_operation_waiting_is_limited_by_timeout(delays):
+    started = time.monotonic()
+    result = wait_operation(checks=1000, timeout=0.2)
+    assert not result['success']
+    assert result['message'] == 'Timeout reached'
+    assert time.monotonic() - started < 5
+    assert 5 <= len(delays) <= 21
@@ -0,0 +1,125 @@
+from DiskIndex import DiskIndex
+from ImageSaver import ImageSaver
+from conftest import make_files
+
+
+class FakeUploader:
+    """
+    Flat files list and last uploaded feed of files added by add_file, counts requests
+    """
+    def __init__(self):
+        self.files = []
+        self.requests = []
+        self.fail = False
+
+    def add_file(self, path: str, md5: str = None):
+        self.files = [x for x in self.files if x['path'] != 'disk:/' + path]
+        self.files.append({'path': 'disk:/' + path, 'size': 10, 'md5': md5 or f'{len(self.files):032x}',
+                           'modified': f'2020-01-01T00:00:{len(self.requests) * 10 + len(self.files):02d}+00:00'})
+
+    def get_files_page(self, limit=1000, offset=0):
+        self.requests.append(('files', offset))
+        if self.fail:
+            return {'object': None, 'success': False, 'message': 'Error 503'}
+        return {'object': self.files[offset:offset + limit], 'success': True, 'message': ''}
+
+    def get_last_uploaded(self, limit=1000):
+        self.requests.append(('last_uploaded', limit))
+        if self.fail:
+            return {'object': None, 'success': False, 'message': 'Error 503'}
+        return {'object': list(reversed(self.files))[:limit], 'success': True, 'message': ''}
+
+
+def test_first_refresh_reads_all_pages(tmp_path):
+    uploader = FakeUploader()
+    for i in range(5):
+        uploader.add_file(f'Test/{i}.jpg')
+    with DiskIndex(uploader, str(tmp_path / 'index.db'), page_size=2) as index:
+        assert index.refresh() == {'object': 5, 'success': True, 'message': ''}
+        assert uploader.requests == [('files', 0), ('files', 2), ('files', 4)]
+        assert index.get_names('Test') == {f'{i}.jpg' for i in range(5)}
+        assert index.get_names('/Test/') == index.get_names('disk:/Test')
+        assert index.exists('Test') and index.exists('disk:/Test/3.jpg')
+        assert not index.exists('Test/5.jpg')
+        assert index.get('Test/1.jpg')['md5'] == f'{1:032x}'
+
+
+def test_incremental_refresh_adds_new_files_only(tmp_path):
+    uploader = FakeUploader()
+    uploader.add_file('Test/0.jpg')
+    with DiskIndex(uploader, str(tmp_path / 'index.db'), page_size=10) as index:
+        index.refresh()
+        uploader.add_file('Test/1.jpg')
+        uploader.add_file('Other/2.jpg')
+        assert index.refresh()['object'] == 2
+        assert uploader.requests[-1] == ('last_uploaded', 10)
+        assert index.get_names('Test') == {'0.jpg', '1.jpg'}
+        assert index.get_names('Other') == {'2.jpg'}
+
+
+def test_feed_without_known_files_leads_to_full_refresh(tmp_path):
+    uploader = FakeUploader()
+    uploader.add_file('Test/0.jpg')
+    with DiskIndex(uploader, str(tmp_path / 'index.db'), page_size=2) as index:
+        index.refresh()
+        for i in range(1, 4):
+            uploader.add_file(f'Test/{i}.jpg')
+        # feed of 2 files has only new files, so older changes may be missed
+        index.refresh()
+        assert uploader.requests[-4:] == [('last_uploaded', 2), ('files', 0), ('files', 2), ('files', 4)]
+        assert index.get_names('Test') == {f'{i}.jpg' for i in range(4)}
+
+
+def test_full_refresh_drops_deleted_files(tmp_path):
+    uploader = FakeUploader()
+    for i in range(3):
+        uploader.add_file(f'Test/{i}.jpg')
+    with DiskIndex(uploader, str(tmp_path / 'index.db')) as index:
+        index.refresh()
+        uploader.files.pop(0)
+        index.refresh(full=True)
+        assert index.get_names('Test') == {'1.jpg', '2.jpg'}
+
+
+def test_failed_refresh_is_reported(tmp_path):
+    uploader = FakeUploader()
+    uploader.fail = True
+    with DiskIndex(uploader, str(tmp_path / 'index.db')) as index:
+        assert index.refresh() == {'object': 0, 'success': False, 'message': 'Error 503'}
+        assert index.get_stats()['full_refresh'] is None
+
+
+def test_index_is_kept_between_runs(tmp_path):
+    path = str(tmp_path / 'index.db')
+    uploader = FakeUploader()
+    uploader.add_file('Test/0.jpg', md5='a' * 32)
+    with DiskIndex(uploader, path) as index:
+        index.refresh()
+        index.add([{'path': 'Test/1.jpg'}])
+    with DiskIndex(uploader, path) as index:
+        assert index.get_stats()['files'] == 2
+        assert index.get_stats()['full_refresh'] is not None
+        assert index.find_by_hash(md5='a' * 32)[0]['path'] == 'Test/0.jpg'
+        # reopened index continues with incremental refresh
+        index.refresh()
+        assert uploader.requests[-1][0] == 'last_uploaded'
+
+
+def test_remove_folder(tmp_path):
+    with DiskIndex(FakeUploader(), str(tmp_path / 'index.db')) as index:
+        index.add([{'path': 'Test/1.jpg'}, {'path': 'Test/Sub/2.jpg'}, {'path': 'Test_1/3.jpg'}])
+        index.remove('Test')
+        assert [x['path'] for x in index.list_folder('', recursive=True)] == ['Test_1/3.jpg']
+
+
+def test_saver_refreshes_index_before_names_and_indexes_uploads(vk_server, disk_server, tokens, saver, tmp_path):
+    indexed = ImageSaver(tokens[0], tokens[1], None, vk_rate=1000.0, ya_rate=1000.0,
+                         vk_api_url=vk_server.get_api_url(), ya_api_url=disk_server.get_api_url(),
+                         disk_index_path=str(tmp_path / 'index.db'))
+    saver.upload_remote_files('Test', make_files(1), str(tmp_path / 'other.json'))
+    assert '0.jpg' in indexed.get_folder_names('Test')
+    # file uploaded by other saver after the first refresh is found by incremental refresh
+    saver.upload_remote_files('Test', make_files(2)[1:], str(tmp_path / 'other.json'))
+    assert '1.jpg' in indexed.get_folder_names('Test')
+    indexed.upload_remote_files('Test', make_files(3)[2:], str(tmp_path / 'log.json'))
+    assert '2.jpg' in indexed.get_disk_index().get_names('Test')
@@ -0,0 +1,116 @@
+import threading
+import uuid
+
+import pytest
+
+from ImageSaver import ImageSaver
+from Metrics import Metrics
+from RateLimiter import RateLimiter
+from VkClient import VkClient
+from mock_api import MockVk
+
+USER = {'id': 1, 'first_name': 'Test', 'last_name': 'User', 'domain': 'id1'}
+
+
+class FaultyVk(MockVk):
+    """
+    MockVk which fails chosen photos.get pages inside execute and chosen execute requests as whole,
+    and records calls count of every execute request
+    """
+    def __init__(self, failed_pages: dict = None, failed_requests=(), **kwargs):
+        """
+        :param failed_pages: {(album ID, offset): (error code, error message)} of failed photos.get calls
+        :param failed_requests: numbers of execute requests (from 1) answered with API error
+        """
+        super().__init__(**kwargs)
+        self.__lock = threading.Lock()
+        self.__failed_pages = failed_pages or {}
+        self.__failed_requests = set(failed_requests)
+        self.__executes = []
+
+    def get_executes(self):
+        with self.__lock:
+            return list(self.__executes)
+
+    def call(self, method: str, params: dict):
+        error = self.__failed_pages.get((str(params.get('album_id')), int(params.get('offset', 0))))
+        if method == 'photos.get' and error is not None:
+            return None, {'error_code': error[0], 'error_msg': error[1]}
+        return super().call(method, params)
+
+    def handle(self, method: str, path: str, query: dict, body: bytes):
+        if path == '/method/execute':
+            with self.__lock:
+                self.__executes.append(query.get('code', '').count('API.'))
+                if len(self.__executes) in self.__failed_requests:
+                    return 200, {'error': {'error_code': 15, 'error_msg': 'Access denied'}}, {}
+        return super().handle(method, path, query, body)
+
+
+def make_client(vk: MockVk, metrics: Metrics = None):
+    return VkClient(f'vk-{uuid.uuid4().hex}', 1, api_base_url=vk.get_api_url(), user=USER,
+                    rate_limiter=RateLimiter(1000.0), metrics=metrics or Metrics())
+
+
+def make_pages(client: VkClient, count: int, album_id='wall'):
+    return [client.make_user_photos_call(album_id=album_id, count=1, offset=i) for i in range(count)]
+
+
+def test_execute_code_has_json_params_and_no_none_values():
+    calls = [('photos.get', {'album_id': 'profile', 'extended': True, 'photo_sizes': False, 'offset': None}, ''),
+             ('users.get', {'user_ids': 'Иван,2'}, '')]
+    assert VkClient.make_execute_code(calls) == \
+        'return [API.photos.get({"album_id": "profile", "extended": 1, "photo_sizes": 0}),' \
+        'API.users.get({"user_ids": "Иван,2"})];'
+
+
+@pytest.mark.parametrize('calls_per_request, executes', [(25, [25, 25, 10]), (100, [25, 25, 10]),
+                                                         (7, [7] * 8 + [4]), (0, [1] * 60)])
+def test_calls_are_sent_in_requests_of_max_25_calls(calls_per_request, executes):
+    with FaultyVk(photos=100) as vk:
+        client = make_client(vk)
+        results = client.execute_batch(make_pages(client, 60), calls_per_request)
+        assert vk.get_executes() == executes
+    # results follow order of calls regardless of requests
+    assert [x['object']['items'][0]['id'] for x in results] == list(range(1, 61))
+
+
+def test_execute_errors_are_mapped_back_to_failed_calls():
+    failed_pages = {('wall', 1): (15, 'Access denied'), ('wall', 3): (200, 'Album is private'),
+                    ('wall', 30): (15, 'Access denied')}
+    metrics = Metrics()
+    with FaultyVk(photos=100, failed_pages=failed_pages) as vk:
+        client = make_client(vk, metrics)
+        results = client.execute_batch(make_pages(client, 35))
+    failed = {i: x['message'] for i, x in enumerate(results) if not x['success']}
+    # failed calls give false in response, their errors come in order of calls
+    assert failed == {1: 'API error: Access denied', 3: 'API error: Album is private', 30: 'API error: Access denied'}
+    assert [x['object']['items'][0]['id'] for i, x in enumerate(results) if i not in failed] == \
+        [i + 1 for i in range(35) if i not in failed]
+    errors = {x['labels']['code']: x['value'] for x in metrics.snapshot()['counters']['api_errors_total']}
+    assert errors == {15: 2, 200: 1}
+
+
+def test_failed_request_fails_its_calls_only():
+    with FaultyVk(photos=100, failed_requests=(2,)) as vk:
+        client = make_client(vk)
+        results = client.execute_batch(make_pages(client, 30), 10)
+        assert vk.get_executes() == [10, 10, 10]
+    assert [x['success'] for x in results] == [True] * 10 + [False] * 10 + [True] * 10
+    assert len({x['message'] for x in results[10:20]}) == 1
+    assert 'Access denied' in results[10]['message']
+
+
+def test_account_pages_keep_order_when_page_fails(disk_server, tokens):
+    albums = [{'album_id': album_id, 'title': album_id, 'size': 2500, 'name': album_id}
+              for album_id in ('wall', 'profile', 'saved')]
+    # pages have 1000 photos, the second page of profile fails, so profile stops there and next albums are loaded
+    with FaultyVk(photos=2500, failed_pages={('profile', 1000): (15, 'Access denied')}) as vk:
+        saver = ImageSaver(tokens[0], tokens[1], None, vk_rate=1000.0, ya_rate=1000.0, vk_api_url=vk.get_api_url(),
+                           ya_api_url=disk_server.get_api_url())
+        pages = list(saver.iter_account_pages(albums=albums, concurrency=4, pages_per_request=1))
+        # 3 first pages and 2 more pages of every album, one request per page
+        assert vk.get_executes() == [1] * 9
+    assert [(name, len(page)) for name, page in pages] == \
+        [('wall', 1000), ('wall', 1000), ('wall', 500), ('profile', 1000), ('saved', 1000), ('saved', 1000),
+         ('saved', 500)]
@@ -0,0 +1,104 @@
+import threading
+
+import pytest
+import requests
+
+from HttpSession import BoundSession, HttpSession
+from Metrics import Metrics
+from conftest import RecordingDisk
+
+
+class RecordingHttp:
+    """
+    Replaces HttpSession of BoundSession: records requests and answers them with empty response
+    """
+    def __init__(self, error: Exception = None):
+        self.requests = []
+        self.error = error
+
+    def request(self, method: str, url: str, **kwargs):
+        self.requests.append((method, url, kwargs))
+        if self.error is not None:
+            raise self.error
+        response = requests.Response()
+        response.status_code = 200
+        response._content = b'{}'
+        response.request = requests.Request(method, url).prepare()
+        return response
+
+
+class CountingLimiter:
+    def __init__(self):
+        self.acquired = 0
+
+    def acquire(self):
+        self.acquired += 1
+
+
+def test_base_params_and_headers_are_merged_with_request_ones():
+    http = RecordingHttp()
+    params = {'access_token': 'token', 'v': '5.124'}
+    session = BoundSession(http, 'https://api.vk.com/method/', params=params, headers={'User-Agent': 'Netology'},
+                           timeout=5)
+    session.get('users.get', params={'user_ids': '1', 'v': '5.131'}, headers={'Accept': 'application/json'})
+    session.post('https://upload.example/x', timeout=60)
+    session.delete('photos.delete', params={})
+    (method, url, first), (_, absolute_url, second), (_, _, third) = http.requests
+    assert (method, url) == ('GET', 'https://api.vk.com/method/users.get')
+    # request values override base ones
+    assert first['params'] == {'access_token': 'token', 'v': '5.131', 'user_ids': '1'}
+    assert first['headers'] == {'User-Agent': 'Netology', 'Accept': 'application/json'}
+    assert first['timeout'] == 5
+    # absolute URLs are not prefixed with base URL
+    assert absolute_url == 'https://upload.example/x'
+    assert second['params'] == params and second['timeout'] == 60
+    assert third['params'] == params
+    # base params of view are not changed by requests
+    assert params == {'access_token': 'token', 'v': '5.124'}
+
+
+def test_limiter_and_metrics_see_every_request():
+    limiter = CountingLimiter()
+    metrics = Metrics()
+    session = BoundSession(RecordingHttp(), 'https://cloud-api.yandex.net', limiter=limiter, metrics=metrics,
+                           service='ya')
+    session.get('/v1/disk/operations/3a5d7b9c1e')
+    session.get('https://cloud-api.yandex.net/v1/disk')
+    failing = BoundSession(RecordingHttp(requests.exceptions.ConnectTimeout()), 'https://x', metrics=metrics,
+                           service='ya')
+    with pytest.raises(requests.exceptions.ConnectTimeout):
+        failing.get('/v1/disk')
+    assert limiter.acquired == 2
+    requests_total = {(x['labels']['endpoint'], x['labels']['status']): x['value']
+                      for x in metrics.snapshot()['counters']['http_requests_total']}
+    # IDs in paths are replaced, so endpoints have limited number of labels
+    assert requests_total == {('/v1/disk/operations/{id}', '200'): 1, ('/v1/disk', '200'): 1,
+                              ('/v1/disk', 'ConnectTimeout'): 1}
+
+
+def upload_concurrently(http: HttpSession, disk: RecordingDisk, count: int):
+    barrier = threading.Barrier(count)
+    statuses = []
+
+    def upload(i):
+        barrier.wait()
+        response = http.request('POST', f'{disk.get_api_url()}/v1/disk/resources/upload',
+                                params={'path': f'Test/{i}.jpg', 'url': 'https://x/ok.jpg'})
+        statuses.append(response.status_code)
+
+    threads = [threading.Thread(target=upload, args=(i,)) for i in range(count)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return statuses
+
+
+def test_host_limit_caps_connections_to_host():
+    with RecordingDisk(latency=0.05, jitter=0.0) as limited, RecordingDisk(latency=0.05, jitter=0.0) as other:
+        with HttpSession(pool_block=True, host_limits={limited.get_api_url(): 2}) as http:
+            assert upload_concurrently(http, limited, 6) == [202] * 6
+            assert upload_concurrently(http, other, 6) == [202] * 6
+        assert limited.get_max_in_flight() == 2
+        # other hosts keep default pool size
+        assert other.get_max_in_flight() > 2
@@ -0,0 +1,129 @@
+import threading
+import time
+
+import pytest
+
+import IdentityCache as identity_cache_module
+from IdentityCache import IdentityCache
+from ImageSaver import ImageSaver
+from RateLimiter import RateLimiter
+from RetryPolicy import RetryPolicy
+from VkClient import VkClient
+from YaUploader import YaUploader
+from fake_clock import FakeClock
+
+
+def ok(value):
+    return {'object': value, 'success': True, 'message': ''}
+
+
+def failed(message):
+    return {'object': None, 'success': False, 'message': message}
+
+
+def get_checks(server, endpoint):
+    return server.get_stats()['endpoints'].get(endpoint, 0)
+
+
+def test_successful_check_is_cached_until_ttl(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(identity_cache_module, 'time', clock)
+    cache = IdentityCache(ttl=60.0)
+    key = IdentityCache.make_key('vk', 'secret-token')
+    calls = []
+
+    def loader():
+        calls.append(clock.now)
+        return ok(len(calls))
+
+    assert cache.load(key, loader) == ok(1)
+    clock.advance(59.0)
+    assert cache.load(key, loader) == ok(1)
+    assert cache.get(key) == ok(1)
+    clock.advance(1.0)
+    assert cache.get(key) is None
+    assert cache.load(key, loader) == ok(2)
+    assert cache.get_stats() == {'items': 1, 'hits': 1, 'misses': 2}
+    # token is not kept in key, keys of other users and services differ
+    assert 'secret-token' not in key
+    assert len({key, IdentityCache.make_key('vk', 'secret-token', 5), IdentityCache.make_key('ya', 'secret-token'),
+                IdentityCache.make_key('vk', 'other-token')}) == 4
+
+
+def test_failed_checks_and_zero_ttl_are_not_cached():
+    cache = IdentityCache()
+    results = iter([failed('Network error'), ok('user')])
+    assert cache.load('key', lambda: next(results)) == failed('Network error')
+    assert cache.load('key', lambda: next(results)) == ok('user')
+    assert cache.load('key', lambda: failed('not called')) == ok('user')
+    cache.invalidate('key')
+    assert cache.get('key') is None
+    uncached = IdentityCache(ttl=0)
+    uncached.load('key', lambda: ok('user'))
+    assert uncached.get_stats() == {'items': 0, 'hits': 0, 'misses': 1}
+
+
+@pytest.mark.parametrize('first_succeeds, loads', [(True, 1), (False, 2)])
+def test_concurrent_checks_of_one_key_wait_for_the_first(first_succeeds, loads):
+    cache = IdentityCache()
+    calls = []
+    started = threading.Event()
+
+    def loader():
+        calls.append(threading.get_ident())
+        started.set()
+        time.sleep(0.1)
+        return ok('user') if first_succeeds or len(calls) > 1 else failed('Timeout')
+
+    results = []
+    first = threading.Thread(target=lambda: results.append(cache.load('key', loader)))
+    first.start()
+    started.wait()
+    # the second caller comes while the first check is running
+    results.append(cache.load('key', loader))
+    first.join()
+    assert len(calls) == loads
+    assert results[-1] == ok('user')
+
+
+def test_lazy_clients_check_tokens_on_first_use(vk_server, disk_server, tokens):
+    cache = IdentityCache()
+    client = VkClient(tokens[0], lazy=True, api_base_url=vk_server.get_api_url(), rate_limiter=RateLimiter(1000.0),
+                      identity_cache=cache)
+    uploader = YaUploader(tokens[1], lazy=True, api_base_url=disk_server.get_api_url(),
+                          rate_limiter=RateLimiter(1000.0), identity_cache=cache)
+    assert get_checks(vk_server, 'GET /method/users.get') == 0
+    assert get_checks(disk_server, 'GET /v1/disk') == 0
+    assert not uploader.is_validated()
+    assert client.get_id() == '1'
+    assert uploader.is_initialized()
+    assert client.validate() and uploader.validate()
+    # clients created again with the same tokens use cached checks
+    VkClient(tokens[0], api_base_url=vk_server.get_api_url(), identity_cache=cache)
+    YaUploader(tokens[1], api_base_url=disk_server.get_api_url(), identity_cache=cache)
+    assert get_checks(vk_server, 'GET /method/users.get') == 1
+    assert get_checks(disk_server, 'GET /v1/disk') == 1
+    assert cache.get_stats() == {'items': 2, 'hits': 2, 'misses': 2}
+
+
+def test_lazy_saver_is_validated_once(vk_server, disk_server, tokens):
+    saver = ImageSaver(tokens[0], tokens[1], None, vk_api_url=vk_server.get_api_url(),
+                       ya_api_url=disk_server.get_api_url(), lazy=True)
+    assert get_checks(vk_server, 'GET /method/users.get') == 0
+    assert get_checks(disk_server, 'GET /v1/disk') == 0
+    assert saver.validate()
+    assert saver.is_initialized() and saver.is_client_initialized() and saver.is_uploader_initialized()
+    assert get_checks(vk_server, 'GET /method/users.get') == 1
+    assert get_checks(disk_server, 'GET /v1/disk') == 1
+
+
+def test_failed_token_check_is_repeated_by_new_client(vk_server, tokens):
+    dead_url = 'http://127.0.0.1:9/method/'
+    cache = IdentityCache()
+    policy = RetryPolicy.for_vk(dead_url, tokens[0], max_attempts=1)
+    client = VkClient(tokens[0], api_base_url=dead_url, rate_limiter=RateLimiter(1000.0), retry_policy=policy,
+                      identity_cache=cache)
+    assert not client.is_initialized()
+    assert 'init failed' in client.get_status()
+    assert cache.get_stats()['items'] == 0
+    assert VkClient(tokens[0], api_base_url=vk_server.get_api_url(), identity_cache=cache).is_initialized()
@@ -0,0 +1,71 @@
+import pytest
+
+from JobRunner import JobRunner
+
+
+def make_job(token_vk: str, token_ya: str, folder: str, **kwargs):
+    return JobRunner.make_job({'token_vk': token_vk, 'token_ya': token_ya, 'folder': folder, **kwargs})
+
+
+def get_tokens(shard: list):
+    return {('vk', job['token_vk']) for _, job in shard} | {('ya', job['token_ya']) for _, job in shard}
+
+
+def test_jobs_sharing_any_token_run_in_one_process():
+    jobs = list(enumerate([make_job('vk-a', 'ya-x', 'A'), make_job('vk-c', 'ya-y', 'C'), make_job('vk-b', 'ya-x', 'B'),
+                           make_job('vk-d', 'ya-w', 'D'), make_job('vk-b', 'ya-z', 'B2')]))
+    shards = JobRunner.get_shards(jobs, 3)
+    assert [[index for index, _ in shard] for shard in shards] == [[0, 2, 4], [1], [3]]
+    for shard in shards:
+        for other in shards:
+            if other is not shard:
+                assert not get_tokens(shard) & get_tokens(other)
+
+
+def test_shards_are_balanced_and_limited_by_processes():
+    jobs = list(enumerate(make_job(f'vk-{i}', f'ya-{i}', str(i)) for i in range(7)))
+    shards = JobRunner.get_shards(jobs, 3)
+    assert sorted(len(shard) for shard in shards) == [2, 2, 3]
+    assert sorted(index for shard in shards for index, _ in shard) == list(range(7))
+    assert len(JobRunner.get_shards(jobs[:2], 4)) == 2
+
+
+def test_job_without_required_field_is_error():
+    with pytest.raises(ValueError):
+        JobRunner.make_job({'token_vk': 'vk', 'folder': 'A'})
+
+
+def run_jobs(vk_server, disk_server, tmp_path, processes: int, tokens: tuple):
+    runner = JobRunner(workers=2, processes=processes, vk_rate=1000.0, ya_rate=1000.0,
+                       manifest_path=str(tmp_path / 'manifest.db'), log_dir=str(tmp_path / 'logs'),
+                       vk_api_url=vk_server.get_api_url(), ya_api_url=disk_server.get_api_url())
+    # every job backs up own user, so photos are not linked between jobs
+    jobs = [{'token_vk': tokens[0], 'token_ya': tokens[1], 'folder': f'Backup{i}', 'vk_id': i + 1, 'album_id': 'wall',
+             'max_qty': 5} for i in range(3)]
+    return runner.run(jobs)
+
+
+@pytest.mark.parametrize('processes', [1, 2])
+def test_jobs_are_run_in_threads_and_processes(vk_server, disk_server, tmp_path, tokens, processes):
+    result = run_jobs(vk_server, disk_server, tmp_path, processes, tokens)
+    assert result['success'], result
+    assert result['object']['succeeded'] == 3
+    assert [x['job'] for x in result['object']['jobs']] == [0, 1, 2]
+    assert [x['object']['uploaded'] for x in result['object']['jobs']] == [5, 5, 5]
+    assert sorted(path.split('/')[0] for path in disk_server.get_uploads()) == ['Backup0'] * 5 + ['Backup1'] * 5 + \
+        ['Backup2'] * 5
+    assert len(list((tmp_path / 'logs').glob('*.json'))) == 3
+    # rerun with manifest uploads nothing
+    result = run_jobs(vk_server, disk_server, tmp_path, processes, tokens)
+    assert [x['object']['skipped'] for x in result['object']['jobs']] == [5, 5, 5]
+    assert len(disk_server.get_uploads()) == 15
+
+
+def test_failed_job_is_reported_in_results(vk_server, tmp_path, tokens):
+    runner = JobRunner(workers=2, vk_rate=1000.0, ya_rate=1000.0, log_dir=str(tmp_path / 'logs'),
+                       vk_api_url=vk_server.get_api_url(), ya_api_url='http://127.0.0.1:9')
+    result = runner.run([{'token_vk': tokens[0], 'token_ya': tokens[1], 'folder': 'A'}])
+    assert not result['success']
+    assert result['message'] == '1 of 1 jobs failed'
+    assert result['object']['jobs'][0]['message']
+    assert tokens[1] not in str(result)
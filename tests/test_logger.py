@@ -0,0 +1,113 @@
+import io
+import json
+import threading
+import time
+
+import pytest
+
+from Logger import Logger
+
+
+class SlowStream(io.StringIO):
+    """
+    Console stream which is slow to write, so records stay in queue until listener gets to them
+    """
+    def write(self, text):
+        time.sleep(0.005)
+        return super().write(text)
+
+
+class Lazy:
+    """
+    Placeholder value which records threads formatting it
+    """
+    def __init__(self):
+        self.threads = []
+
+    def __str__(self):
+        self.threads.append(threading.get_ident())
+        return 'lazy'
+
+
+@pytest.fixture
+def outputs(tmp_path):
+    stream = SlowStream()
+    path = tmp_path / 'log.jsonl'
+    run_id = Logger.get_run_id()
+    Logger.configure(stream=stream, path=str(path))
+    Logger.set_run_id('run-1')
+    yield stream, path
+    Logger.set_run_id(run_id)
+    Logger.configure()
+
+
+def read_records(path):
+    return [json.loads(line) for line in path.read_text(encoding='utf-8').splitlines()]
+
+
+def test_flush_waits_until_queued_records_are_written(outputs):
+    stream, path = outputs
+    logger = Logger('Test')
+    for i in range(50):
+        logger.info('record %d', i)
+    Logger.flush()
+    assert stream.getvalue().splitlines() == [f'record {i}' for i in range(50)]
+    assert [x['message'] for x in read_records(path)] == [f'record {i}' for i in range(50)]
+
+
+def test_json_records_have_job_id_of_context(outputs):
+    _, path = outputs
+    logger = Logger('Test')
+
+    def run_job(job_id):
+        with Logger.job(job_id):
+            assert Logger.get_job_id() == job_id
+            logger.info('uploaded %s of %d', 'x.jpg', 3, url='https://x/1.jpg')
+        logger.info('job is done')
+
+    logger.warning('before jobs')
+    with Logger.job('main'):
+        # threads don't inherit job ID of thread which started them
+        threads = [threading.Thread(target=run_job, args=(job_id,)) for job_id in (1, 2)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    Logger.flush()
+    records = read_records(path)
+    assert records[0]['job_id'] is None
+    assert records[0]['level'] == 'warning'
+    uploads = sorted((x for x in records if x['message'] == 'uploaded x.jpg of 3'), key=lambda x: x['job_id'])
+    assert [(x['job_id'], x['url'], x['component'], x['run_id']) for x in uploads] == \
+        [(1, 'https://x/1.jpg', 'Test', 'run-1'), (2, 'https://x/1.jpg', 'Test', 'run-1')]
+    assert [x['job_id'] for x in records if x['message'] == 'job is done'] == [None, None]
+    assert Logger.get_job_id() is None
+
+
+def test_messages_are_formatted_by_listener_only_when_written(outputs):
+    stream, _ = outputs
+    value = Lazy()
+    Logger('Test').debug('value is %s', value)
+    Logger('Test', debug_mode=True).debug('value is %s', value)
+    Logger('Test').log(['a', 'b'], is_debug_msg=True)
+    Logger('Test').log(['a', 'b'], sep=', ')
+    Logger.flush()
+    assert stream.getvalue().splitlines() == ['value is lazy', 'a, b']
+    # record is formatted twice by listener thread, for console and for file, pytest capturing records
+    # of non-propagating loggers formats them in this thread too, so only listener thread is counted
+    assert len([x for x in value.threads if x != threading.get_ident()]) == 2
+
+
+def test_records_below_level_are_dropped(tmp_path):
+    stream = io.StringIO()
+    try:
+        Logger.configure(stream=stream, json_format=True, level='WARNING')
+        value = Lazy()
+        Logger('Test', debug_mode=True).info('value is %s', value)
+        Logger('Test').error('failed')
+        Logger.flush()
+    finally:
+        Logger.configure()
+    assert not value.threads
+    assert [(x['level'], x['message']) for x in map(json.loads, stream.getvalue().splitlines())] == \
+        [('error', 'failed')]
@@ -0,0 +1,107 @@
+import json
+import threading
+
+import pytest
+
+from Metrics import Histogram, Metrics
+
+
+def test_histogram_buckets_include_upper_bound():
+    histogram = Histogram((0.1, 0.5, 1.0))
+    for value in (0.05, 0.1, 0.3, 0.5, 0.7, 5.0):
+        histogram.observe(value)
+    assert histogram.counts == [2, 2, 1, 1]
+    assert histogram.get_cumulative() == [(0.1, 2), (0.5, 4), (1.0, 5), (float('inf'), 6)]
+    assert histogram.count == 6
+    assert histogram.sum == pytest.approx(6.65)
+
+
+def test_histogram_quantiles_are_interpolated_inside_bucket():
+    histogram = Histogram((1.0, 2.0, 4.0))
+    assert histogram.quantile(0.5) == 0.0
+    for value in (0.5, 1.5, 1.5, 3.0):
+        histogram.observe(value)
+    assert histogram.quantile(0.25) == pytest.approx(1.0)
+    assert histogram.quantile(0.5) == pytest.approx(1.5)
+    assert histogram.quantile(1.0) == pytest.approx(4.0)
+    # quantile in +Inf bucket is estimated by the last finite bound
+    histogram.observe(100.0)
+    assert histogram.quantile(1.0) == 4.0
+
+
+def make_metrics():
+    metrics = Metrics(buckets=(0.5, 0.1))
+    metrics.inc('api_errors_total', service='vk', code=15)
+    metrics.inc('api_errors_total', 2, code=15, service='vk')
+    metrics.inc('retries_total')
+    metrics.record_request('vk', 'photos.get', 200, 0.05, bytes_out=10, bytes_in=300)
+    metrics.record_request('vk', 'photos.get', 500, 0.2, bytes_out=10)
+    metrics.observe('stage_duration_seconds', 3.0, stage='say "hi"\\')
+    return metrics
+
+
+def test_json_snapshot():
+    snapshot = json.loads(make_metrics().to_json())
+    counters = snapshot['counters']
+    # the same labels in another order are the same series
+    assert counters['api_errors_total'] == [{'labels': {'code': 15, 'service': 'vk'}, 'value': 3}]
+    assert counters['retries_total'] == [{'labels': {}, 'value': 1}]
+    assert counters['http_requests_total'] == [
+        {'labels': {'endpoint': 'photos.get', 'service': 'vk', 'status': '200'}, 'value': 1},
+        {'labels': {'endpoint': 'photos.get', 'service': 'vk', 'status': '500'}, 'value': 1}]
+    assert counters['http_request_bytes_total'][0]['value'] == 20
+    assert counters['http_response_bytes_total'][0]['value'] == 300
+    [duration] = snapshot['histograms']['http_request_duration_seconds']
+    assert duration['labels'] == {'endpoint': 'photos.get', 'service': 'vk'}
+    assert (duration['count'], duration['sum']) == (2, pytest.approx(0.25))
+    # buckets are sorted and +Inf bucket is serializable
+    assert duration['buckets'] == [[0.1, 1], [0.5, 2], ['+Inf', 2]]
+
+
+def test_prometheus_text():
+    lines = make_metrics().to_prometheus().splitlines()
+    assert '# TYPE api_errors_total counter' in lines
+    assert 'api_errors_total{code="15",service="vk"} 3' in lines
+    assert 'retries_total 1' in lines
+    assert 'http_requests_total{endpoint="photos.get",service="vk",status="500"} 1' in lines
+    assert '# TYPE http_request_duration_seconds histogram' in lines
+    assert lines[lines.index('# TYPE http_request_duration_seconds histogram') + 1:][:5] == [
+        'http_request_duration_seconds_bucket{endpoint="photos.get",service="vk",le="0.1"} 1',
+        'http_request_duration_seconds_bucket{endpoint="photos.get",service="vk",le="0.5"} 2',
+        'http_request_duration_seconds_bucket{endpoint="photos.get",service="vk",le="+Inf"} 2',
+        'http_request_duration_seconds_sum{endpoint="photos.get",service="vk"} 0.25',
+        'http_request_duration_seconds_count{endpoint="photos.get",service="vk"} 2']
+    # quotes and backslashes in label values are escaped
+    assert 'stage_duration_seconds_count{stage="say \\"hi\\"\\\\"} 1' in lines
+
+
+def test_disabled_registry_ignores_updates():
+    metrics = Metrics(enabled=False)
+    metrics.inc('retries_total')
+    metrics.record_request('ya', 'upload', 201, 0.1)
+    with metrics.timer('stage_duration_seconds', stage='upload'):
+        pass
+    assert metrics.snapshot()['counters'] == metrics.snapshot()['histograms'] == {}
+    assert metrics.to_prometheus() == '\n'
+    metrics.set_enabled(True)
+    metrics.inc('retries_total')
+    metrics.reset()
+    assert metrics.snapshot()['counters'] == {}
+
+
+def test_updates_from_threads_are_not_lost():
+    metrics = Metrics()
+
+    def work():
+        for _ in range(1000):
+            metrics.inc('requests_total', service='vk')
+            metrics.observe('duration_seconds', 0.01)
+
+    threads = [threading.Thread(target=work) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    snapshot = metrics.snapshot()
+    assert snapshot['counters']['requests_total'][0]['value'] == 8000
+    assert snapshot['histograms']['duration_seconds'][0]['count'] == 8000
@@ -0,0 +1,87 @@
+import random
+from datetime import timedelta, timezone
+
+import pytest
+
+from NameAllocator import NameAllocator
+
+
+def make_item(i: int, likes: int, date=1600000000, owner_id=1):
+    return {'id': i, 'owner_id': owner_id, 'likes': {'count': likes}, 'date': date}
+
+
+def test_repeated_bases_get_numbers():
+    namer = NameAllocator()
+    assert [namer.allocate('5') for _ in range(4)] == ['5', '5_1', '5_2', '5_3']
+
+
+def test_seeded_names_are_not_given():
+    namer = NameAllocator()
+    # names of files in folder after previous run
+    namer.seed(['5.jpg', '5_1.jpg', '7.png', '.hidden', 'noext'])
+    assert namer.is_used('5') and namer.is_used('.hidden') and namer.is_used('noext')
+    assert [namer.allocate('5') for _ in range(2)] == ['5_2', '5_3']
+    assert namer.allocate('7') == '7_1'
+    assert namer.allocate('8') == '8'
+
+
+def test_seed_can_keep_suffixes():
+    namer = NameAllocator()
+    namer.seed(['5.jpg'], strip_suffix=False)
+    assert namer.allocate('5') == '5'
+
+
+def test_base_equal_to_numbered_name_is_not_duplicated():
+    namer = NameAllocator()
+    names = [namer.allocate(base) for base in ['5', '5', '5_1', '5_1', '5', '5_2']]
+    assert names == ['5', '5_1', '5_1_1', '5_1_2', '5_2', '5_2_1']
+    assert len(set(names)) == len(names)
+
+
+def test_used_set_is_shared_with_caller():
+    used = {'3'}
+    namer = NameAllocator(used=used)
+    assert namer.allocate('3') == '3_1'
+    assert '3_1' in used
+
+
+def test_custom_separator():
+    namer = NameAllocator(separator='-')
+    namer.allocate('1')
+    assert namer.allocate('1') == '1-1'
+
+
+@pytest.mark.parametrize('template', sorted(NameAllocator.TEMPLATES))
+def test_every_template_gives_unique_names(template):
+    rnd = random.Random(template)
+    namer = NameAllocator(template)
+    namer.seed([f'{i}.jpg' for i in range(0, 40, 3)] + [f'{i}_1.jpg' for i in range(10)])
+    seeded = set(namer.get_used())
+    items = [make_item(rnd.randint(1, 30), rnd.randint(0, 20), 1600000000 + rnd.randint(0, 3) * 86400,
+                       rnd.randint(1, 2)) for _ in range(500)]
+    names = [namer.allocate_for(item) for item in items]
+    assert len(set(names)) == len(names)
+    assert not seeded & set(names)
+
+
+@pytest.mark.parametrize('template, expected', [
+    ('likes', '12'),
+    ('likes_date', '12_2020-09-13'),
+    ('date', '2020-09-13'),
+    ('id', '7_42'),
+])
+def test_template_bases(template, expected):
+    assert NameAllocator(template).make_base(make_item(42, 12, owner_id=7)) == expected
+
+
+def test_format_string_template():
+    namer = NameAllocator('{owner_id}-{likes}-{date}', date_format='%Y')
+    assert namer.make_base(make_item(1, 3)) == '1-3-2020'
+
+
+def test_dates_are_in_utc_unless_timezone_is_set():
+    # 2020-12-31 22:30 UTC is already the next year in Moscow
+    item = make_item(1, 0, date=1609453800)
+    assert NameAllocator('date', date_format='%Y-%m-%d %H:%M').make_base(item) == '2020-12-31 22:30'
+    moscow = NameAllocator('date', date_format='%Y-%m-%d %H:%M', timezone=timezone(timedelta(hours=3)))
+    assert moscow.make_base(item) == '2021-01-01 01:30'
@@ -0,0 +1,163 @@
+import threading
+import types
+
+import pytest
+
+import OperationTracker
+from UploadOptions import UploadOptions
+from conftest import make_files
+from fake_clock import FakeClock
+
+
+class ClockCondition:
+    """
+    Condition of tracker thread: once started, timed wait moves fake clock to its end instead of waiting,
+    so checks happen exactly at their due time and tests don't sleep
+    """
+    def __init__(self, clock: FakeClock):
+        self.__condition = threading.Condition()
+        self.__clock = clock
+        self.started = threading.Event()
+
+    def __enter__(self):
+        return self.__condition.__enter__()
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        return self.__condition.__exit__(exc_type, exc_val, exc_tb)
+
+    def notify(self):
+        self.__condition.notify()
+
+    def wait(self, timeout=None):
+        if timeout is None:
+            return self.__condition.wait()
+        if not self.started.is_set():
+            return self.__condition.wait(0.01)
+        self.__clock.advance(timeout)
+        return False
+
+
+class ScriptedUploader:
+    """
+    check_operation returns 'in-progress' for given checks count, then final status of operation
+    """
+    def __init__(self, clock: FakeClock, scripts: dict):
+        self.__clock = clock
+        self.__scripts = scripts
+        self.checks = []
+
+    def check_operation(self, url: str):
+        self.checks.append((url, self.__clock.now))
+        in_progress, status = self.__scripts[url]
+        if len([x for x in self.checks if x[0] == url]) <= in_progress:
+            return {'object': 'in-progress', 'success': True, 'message': ''}
+        if status == 'error':
+            raise ConnectionError('connection reset')
+        return {'object': status, 'success': True, 'message': ''}
+
+    def get_check_times(self, url: str):
+        return [now for checked, now in self.checks if checked == url]
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    condition = ClockCondition(clock)
+    monkeypatch.setattr(OperationTracker, 'time', clock)
+    monkeypatch.setattr(OperationTracker, 'threading',
+                        types.SimpleNamespace(Condition=lambda: condition, Thread=threading.Thread))
+    clock.condition = condition
+    return clock
+
+
+def make_tracker(clock: FakeClock, scripts: dict, **kwargs):
+    uploader = ScriptedUploader(clock, scripts)
+    # one check at a time, so checks are recorded in order of queue
+    tracker = OperationTracker.OperationTracker(uploader, **{'base_delay': 1.0, 'max_delay': 8.0, 'jitter': 0,
+                                                             'concurrency': 1, **kwargs})
+    return tracker, uploader
+
+
+def test_backoff_delay_is_doubled_up_to_max_delay():
+    delays = [OperationTracker.OperationTracker.get_backoff_delay(i, 0.3, 10.0, 0) for i in range(8)]
+    assert delays == pytest.approx([0.3, 0.6, 1.2, 2.4, 4.8, 9.6, 10.0, 10.0])
+    for _ in range(100):
+        assert 5.0 <= OperationTracker.OperationTracker.get_backoff_delay(10, 0.3, 10.0, 0.5) <= 15.0
+
+
+def test_operations_are_checked_with_backoff_in_due_order(clock):
+    tracker, uploader = make_tracker(clock, {'slow': (5, 'success'), 'fast': (0, 'success'), 'bad': (1, 'failed')})
+    with tracker:
+        futures = {url: tracker.track(url) for url in ('slow', 'fast', 'bad')}
+        clock.condition.started.set()
+        result = tracker.wait(timeout=10)
+    started = 1000.0
+    # delays 1, 2, 4, 8, 8, 8 after start, the last check finds finished operation
+    assert uploader.get_check_times('slow') == [started + x for x in (1, 3, 7, 15, 23, 31)]
+    assert uploader.get_check_times('fast') == [started + 1]
+    assert uploader.get_check_times('bad') == [started + 1, started + 3]
+    # operations due at the same time are checked in order of tracking
+    assert [url for url, _ in uploader.checks[:3]] == ['slow', 'fast', 'bad']
+    assert futures['slow'].result() == {'object': {'url': 'slow', 'name': 'slow', 'status': 'success',
+                                                   'latency': 31.0, 'attempts': 6},
+                                        'success': True, 'message': ''}
+    assert futures['bad'].result()['message'] == 'Operation was not successful'
+    assert not result['success']
+    assert result['message'] == '1 operations failed'
+    assert [x['url'] for x in result['object']['failed_operations']] == ['bad']
+    assert {key: result['object'][key] for key in ('tracked', 'pending', 'success', 'failed', 'timeout')} == \
+        {'tracked': 3, 'pending': 0, 'success': 2, 'failed': 1, 'timeout': 0}
+    assert result['object']['latency_max'] == 31.0
+
+
+def test_operation_is_failed_after_timeout(clock):
+    tracker, uploader = make_tracker(clock, {'stuck': (1000, 'success')}, timeout=20.0)
+    with tracker:
+        future = tracker.track('stuck')
+        clock.condition.started.set()
+        result = future.result(timeout=10)
+    assert result['message'] == 'Timeout reached'
+    assert result['object']['status'] == 'timeout'
+    # checks at 1, 3, 7, 15 and 23 seconds, the last one is after timeout
+    assert result['object']['attempts'] == 5
+    assert result['object']['latency'] == 23.0
+    assert tracker.get_stats()['timeout'] == 1
+
+
+def test_network_errors_are_retried(clock):
+    tracker, uploader = make_tracker(clock, {'flaky': (0, 'error')}, timeout=5.0)
+    with tracker:
+        future = tracker.track('flaky')
+        clock.condition.started.set()
+        result = future.result(timeout=10)
+    assert result['message'] == 'Timeout reached'
+    assert len(uploader.get_check_times('flaky')) == 3
+
+
+def test_callbacks_get_finished_futures_and_close_finishes_pending(clock):
+    tracker, uploader = make_tracker(clock, {'done': (0, 'success'), 'pending': (1000, 'success')})
+    finished = []
+    tracker.track('done', name='1.jpg', callback=lambda future: finished.append(future.result()['object']['name']))
+    pending = tracker.track('pending')
+    # clock is moved once, so pending operation is checked once and waits for the next check
+    clock.advance(1)
+    assert tracker.wait(timeout=0.5)['message'] == '1 operations are still in progress'
+    assert finished == ['1.jpg']
+    tracker.close()
+    assert pending.result(timeout=1)['message'] == 'Tracker closed'
+    with pytest.raises(RuntimeError):
+        tracker.track('other')
+
+
+def test_tracker_is_closed_when_upload_is_interrupted(saver, tmp_path):
+    files = make_files(5)
+
+    def crashing_files():
+        yield from files[:3]
+        raise RuntimeError('crash')
+
+    before = set(threading.enumerate())
+    with pytest.raises(RuntimeError):
+        saver.upload_remote_files('Test', crashing_files(), str(tmp_path / 'log.json'), UploadOptions(confirm=True))
+    assert not [thread for thread in set(threading.enumerate()) - before
+                if thread.name == 'OperationTracker' and thread.is_alive()]
@@ -0,0 +1,63 @@
+import tracemalloc
+
+from PhotoBatch import PhotoBatch
+from conftest import make_files
+
+
+def make_batch(count: int):
+    batch = PhotoBatch()
+    for i in range(count):
+        batch.add(str(i), '.jpg' if i % 2 else '.png', f'https://sun9-1.userapi.com/{i}.jpg', 'zw'[i % 2], 1, i + 1,
+                  width=100 + i, height=50 + i, likes=i % 7, date=1600000000 + i)
+    return batch
+
+
+def test_items_are_link_lists():
+    batch = make_batch(3)
+    assert batch[1] == ['1', '.jpg', 'https://sun9-1.userapi.com/1.jpg', 'w', 1, 2]
+    assert batch[-1][0] == '2'
+    assert type(batch[0]) is list
+    assert batch.to_lists() == list(batch)
+
+
+def test_details_keep_all_columns():
+    assert make_batch(2).get_details(1) == {
+        'name': '1', 'suffix': '.jpg', 'url': 'https://sun9-1.userapi.com/1.jpg', 'size_type': 'w', 'owner_id': 1,
+        'photo_id': 2, 'width': 101, 'height': 51, 'likes': 1, 'date': 1600000001}
+
+
+def test_slice_keeps_details():
+    part = make_batch(10)[2:8:3]
+    assert [x[0] for x in part] == ['2', '5']
+    assert part.get_details(1)['width'] == 105
+
+
+def test_extend_with_batch_remaps_codes():
+    batch = PhotoBatch(make_files(2))
+    other = make_batch(4)
+    batch.extend(other)
+    assert len(batch) == 6
+    assert batch[2:] == other
+    assert batch.get_details(5)['likes'] == 3
+
+
+def test_absent_ids_are_none():
+    batch = PhotoBatch([['1', '.jpg', 'https://sun9-1.userapi.com/1.jpg', 'z']])
+    assert batch[0] == ['1', '.jpg', 'https://sun9-1.userapi.com/1.jpg', 'z', None, None]
+
+
+def test_batch_is_smaller_than_lists():
+    count = 20000
+
+    def measure(make):
+        tracemalloc.start()
+        result = make()
+        size = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        del result
+        return size
+
+    lists = measure(lambda: make_batch(count).to_lists())
+    batch = measure(lambda: make_batch(count))
+    # names and URLs are the same strings in both, the rest of list per photo is saved
+    assert batch < lists * 0.75
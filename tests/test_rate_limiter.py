@@ -0,0 +1,124 @@
+import logging
+
+import pytest
+
+import RateLimiter as rate_limiter_module
+from Logger import Logger
+from RateLimiter import RateLimiter
+from fake_clock import FakeClock
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(rate_limiter_module, 'time', clock)
+    return clock
+
+
+def test_requests_are_evenly_spaced(clock):
+    limiter = RateLimiter(10.0)
+    for _ in range(5):
+        assert limiter.acquire()
+    assert clock.sleeps == pytest.approx([0.1] * 4)
+    assert limiter.get_stats()['acquired'] == 5
+
+
+def test_burst_is_saved_while_idle(clock):
+    limiter = RateLimiter(10.0, burst=3)
+    clock.advance(10)
+    for _ in range(3):
+        assert limiter.try_acquire()
+    assert not limiter.try_acquire()
+    clock.advance(0.1)
+    assert limiter.try_acquire()
+
+
+def test_waiting_callers_get_own_slots(clock):
+    limiter = RateLimiter(4.0)
+    assert [limiter.reserve() for _ in range(4)] == pytest.approx([0.0, 0.25, 0.5, 0.75])
+
+
+def test_timeout_takes_nothing(clock):
+    limiter = RateLimiter(2.0)
+    limiter.acquire()
+    assert limiter.reserve(timeout=0.1) is None
+    assert not limiter.acquire(timeout=0.1)
+    assert clock.sleeps == []
+    assert limiter.reserve(timeout=0.5) == pytest.approx(0.5)
+
+
+def test_throttle_halves_rate_down_to_min_rate(clock):
+    limiter = RateLimiter(8.0, min_rate=3.0)
+    limiter.throttle()
+    assert limiter.get_rate() == 4.0
+    limiter.throttle()
+    assert limiter.get_rate() == 3.0
+    assert limiter.get_max_rate() == 8.0
+    assert limiter.get_stats()['throttled'] == 2
+
+
+def test_throttle_pauses_until_retry_after(clock):
+    limiter = RateLimiter(10.0)
+    limiter.throttle(2.0)
+    assert limiter.acquire()
+    # pause of server hint and one slot of halved rate
+    assert clock.sleeps == pytest.approx([2.0 + 1 / 5.0])
+
+
+def test_recover_restores_rate_by_steps(clock):
+    limiter = RateLimiter(10.0)
+    limiter.throttle()
+    for _ in range(4):
+        limiter.recover()
+    assert limiter.get_rate() == pytest.approx(5.0 + 4 * 10.0 * RateLimiter.RECOVERY_STEP)
+    for _ in range(100):
+        limiter.recover()
+    assert limiter.get_rate() == 10.0
+
+
+def test_set_rate_changes_max_rate(clock):
+    limiter = RateLimiter(10.0)
+    limiter.set_rate(2.0)
+    assert limiter.get_rate() == limiter.get_max_rate() == 2.0
+
+
+def test_limiters_are_shared_by_token():
+    first = RateLimiter.for_token('test', 'token-a', 5.0)
+    assert RateLimiter.for_token('test', 'token-a', 50.0) is first
+    assert first.get_rate() == 5.0
+    assert RateLimiter.for_token('test', 'token-b', 5.0) is not first
+
+
+def test_recover_credits_elapsed_time_at_old_rate(clock):
+    limiter = RateLimiter(10.0, burst=10)
+    limiter.throttle()
+    limiter.recover()
+    clock.advance(0.4)
+    limiter.recover()
+    # 0.4 sec at 5.5 tokens per second, not at recovered rate of 6 tokens per second
+    assert limiter.reserve(tokens=3) == pytest.approx((3 - 0.4 * 5.5) / 6.0)
+
+
+class RecordsHandler(logging.Handler):
+    def __init__(self):
+        super().__init__()
+        self.records = []
+
+    def emit(self, record: logging.LogRecord):
+        self.records.append(record)
+
+
+def test_shared_limiter_with_other_rate_is_reported():
+    handler = RecordsHandler()
+    logger = logging.getLogger(f'{Logger.NAME}.RateLimiter')
+    logger.addHandler(handler)
+    try:
+        first = RateLimiter.get_shared('test:mismatch', 5.0)
+        assert RateLimiter.get_shared('test:mismatch', 5.0) is first
+        assert handler.records == []
+        assert RateLimiter.get_shared('test:mismatch', 50.0, burst=4) is first
+    finally:
+        logger.removeHandler(handler)
+    assert first.get_rate() == 5.0
+    assert [x.levelno for x in handler.records] == [logging.WARNING]
+    assert 'requested rate 50' in handler.records[0].getMessage()
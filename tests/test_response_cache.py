@@ -0,0 +1,155 @@
+import sqlite3
+import uuid
+
+import pytest
+
+import ResponseCache as response_cache_module
+from Metrics import Metrics
+from RateLimiter import RateLimiter
+from ResponseCache import ResponseCache
+from VkClient import VkClient
+from fake_clock import FakeClock
+from mock_api import MockVk
+
+USER = {'id': 1, 'first_name': 'Test', 'last_name': 'User', 'domain': 'id1'}
+SCOPE = ResponseCache.make_scope('vk-token', '5.124')
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(response_cache_module, 'time', clock)
+    return clock
+
+
+def make_cache(path, **kwargs):
+    return ResponseCache(str(path), metrics=Metrics(), **kwargs)
+
+
+def test_responses_expire_after_ttl_of_method(tmp_path, clock):
+    with make_cache(tmp_path / 'cache.db', ttls={'status.get': 10.0}) as cache:
+        cache.put(SCOPE, 'status.get', {'user_id': 1}, {'response': {'text': 'old'}})
+        cache.put(SCOPE, 'users.get', {'user_ids': 1}, {'response': [USER]})
+        # not cached method
+        cache.put(SCOPE, 'status.set', {'text': 'new'}, {'response': 1})
+        clock.advance(9)
+        # params are normalized, so 1 and '1' are the same
+        assert cache.get(SCOPE, 'status.get', {'user_id': '1'}) == {'response': {'text': 'old'}}
+        clock.advance(2)
+        assert cache.get(SCOPE, 'status.get', {'user_id': 1}) is None
+        assert cache.get(SCOPE, 'users.get', {'user_ids': 1}) == {'response': [USER]}
+        assert cache.get(SCOPE, 'status.set', {'text': 'new'}) is None
+        assert cache.get_stats() == {'entries': 1, 'bytes': cache.get_stats()['bytes'], 'hits': 2, 'misses': 2}
+        clock.advance(86400)
+        assert cache.purge_expired() == 1
+        assert cache.get_stats()['entries'] == 0
+        assert cache.get_stats()['bytes'] == 0
+
+
+def test_least_recently_used_responses_are_evicted(tmp_path, clock):
+    with make_cache(tmp_path / 'cache.db', max_entries=3) as cache:
+        for i in range(3):
+            cache.put(SCOPE, 'users.get', {'user_ids': i}, {'response': [i]})
+            clock.advance(1)
+        # the first response is used, so the second one is the least recently used
+        assert cache.get(SCOPE, 'users.get', {'user_ids': 0}) is not None
+        clock.advance(1)
+        cache.put(SCOPE, 'users.get', {'user_ids': 3}, {'response': [3]})
+        assert [cache.get(SCOPE, 'users.get', {'user_ids': i}) is not None for i in range(4)] == \
+            [True, False, True, True]
+        assert cache.get_stats()['entries'] == 3
+
+
+def test_responses_are_evicted_over_max_bytes(tmp_path, clock):
+    content = {'response': 'x' * 100}
+    size = len('{"response":"' + 'x' * 100 + '"}')
+    with make_cache(tmp_path / 'cache.db', max_bytes=size * 2) as cache:
+        for i in range(5):
+            cache.put(SCOPE, 'users.get', {'user_ids': i}, content)
+            clock.advance(1)
+        assert cache.get_stats()['entries'] == 2
+        assert cache.get_stats()['bytes'] == size * 2
+        # response bigger than cache is not stored
+        cache.put(SCOPE, 'users.get', {'user_ids': 10}, {'response': 'x' * size * 2})
+        assert cache.get(SCOPE, 'users.get', {'user_ids': 10}) is None
+        assert cache.get(SCOPE, 'users.get', {'user_ids': 4}) == content
+
+
+def test_reopened_cache_keeps_responses_and_totals(tmp_path):
+    path = tmp_path / 'cache.db'
+    with make_cache(path) as cache:
+        for i in range(5):
+            cache.put(SCOPE, 'users.get', {'user_ids': i}, {'response': [i]})
+        stats = cache.get_stats()
+    with make_cache(path) as cache:
+        assert cache.get_stats() == {**stats, 'hits': 0, 'misses': 0}
+        assert cache.get(SCOPE, 'users.get', {'user_ids': 3}) == {'response': [3]}
+
+
+def test_totals_are_shared_by_caches_of_one_file(tmp_path):
+    # e.g. caches of JobRunner processes
+    path = tmp_path / 'cache.db'
+    with make_cache(path, max_entries=4) as first, make_cache(path, max_entries=4) as second:
+        for i in range(3):
+            first.put(SCOPE, 'users.get', {'user_ids': i}, {'response': [i]})
+        for i in range(3, 6):
+            second.put(SCOPE, 'users.get', {'user_ids': i}, {'response': [i]})
+        assert first.get_stats()['entries'] == second.get_stats()['entries'] == 4
+        first.invalidate(SCOPE, 'users.get')
+        assert second.get_stats()['entries'] == 0
+        assert second.get_stats()['bytes'] == 0
+
+
+def test_execute_responses_are_invalidated_with_their_methods(tmp_path):
+    with make_cache(tmp_path / 'cache.db') as cache:
+        cache.put(SCOPE, 'execute', {'code': 'a'}, {'response': [1]}, 60.0, ['photos.get', 'users.get'])
+        cache.put(SCOPE, 'execute', {'code': 'b'}, {'response': [2]}, 60.0, ['users.get'])
+        cache.put(SCOPE, 'photos.getAlbums', {'owner_id': 1}, {'response': {}})
+        cache.invalidate(SCOPE, 'photos.get')
+        assert cache.get(SCOPE, 'execute', {'code': 'a'}) is None
+        assert cache.get(SCOPE, 'execute', {'code': 'b'}) is not None
+        assert cache.get(SCOPE, 'photos.getAlbums', {'owner_id': 1}) is not None
+
+
+def test_cache_of_older_version_gets_methods_column(tmp_path):
+    path = str(tmp_path / 'cache.db')
+    connection = sqlite3.connect(path)
+    connection.execute('CREATE TABLE responses (key TEXT PRIMARY KEY, scope TEXT NOT NULL, method TEXT NOT NULL, '
+                       'content TEXT NOT NULL, size INTEGER NOT NULL, expires REAL NOT NULL, '
+                       'accessed REAL NOT NULL)')
+    for method, params in (('users.get', {'user_ids': 1}), ('execute', {'code': 'a'})):
+        connection.execute('INSERT INTO responses VALUES (?, ?, ?, ?, ?, ?, ?)',
+                           (ResponseCache.make_key(SCOPE, method, params), SCOPE, method, '{"response":1}', 14,
+                            4e9, 1.0))
+    connection.commit()
+    connection.close()
+    with make_cache(path) as cache:
+        # calls of old execute responses are unknown, so they are dropped
+        assert cache.get_stats()['entries'] == 1
+        assert cache.get(SCOPE, 'users.get', {'user_ids': 1}) == {'response': 1}
+        cache.invalidate(SCOPE, 'users.get')
+        assert cache.get_stats()['entries'] == 0
+
+
+def test_client_invalidates_pages_loaded_by_execute(tmp_path):
+    token = f'vk-{uuid.uuid4().hex}'
+    with MockVk(photos=30) as vk, make_cache(tmp_path / 'cache.db') as cache:
+        client = VkClient(token, 1, api_base_url=vk.get_api_url(), user=USER, response_cache=cache,
+                          rate_limiter=RateLimiter(1000.0))
+
+        def load_pages():
+            calls = [client.make_user_photos_call(album_id='profile', count=10, offset=i * 10) for i in range(3)]
+            return [len(x['object']['items']) for x in client.iter_execute(calls)]
+
+        def get_executes():
+            return vk.get_stats()['endpoints'].get('POST /method/execute', 0)
+
+        assert load_pages() == [10, 10, 10]
+        assert load_pages() == [10, 10, 10]
+        assert get_executes() == 1
+        client.invalidate_cache('photos.get')
+        assert load_pages() == [10, 10, 10]
+        assert get_executes() == 2
+        client.invalidate_cache('users.get')
+        load_pages()
+        assert get_executes() == 2
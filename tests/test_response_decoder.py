@@ -0,0 +1,128 @@
+import importlib
+import json
+
+import pytest
+
+from ResponseDecoder import ChunksReader, ResponseDecoder
+
+BODY = {'response': {'count': 3, 'items': [
+    {'id': 1, 'owner_id': -5, 'date': 1600000000, 'text': 'Привет, "мир"\n', 'likes': {'count': 0},
+     'sizes': [{'type': 's', 'width': 75, 'height': 56, 'url': 'https://x/1_s.jpg'}], 'lat': 55.75, 'tags': None},
+    {'id': 2, 'owner_id': 2 ** 40, 'date': 1600000060, 'text': '', 'likes': {'count': 12, 'user_likes': 1},
+     'sizes': [], 'lat': -0.5, 'can_comment': True},
+    {'id': 3, 'owner_id': 1, 'date': 1600000120, 'text': '\U0001f600', 'likes': {'count': 1},
+     'sizes': [{'type': 'z', 'width': 1280, 'height': 960, 'url': 'https://x/3_z.jpg'}], 'lat': 1e-3,
+     'reposts': {'count': 0}}]}}
+CONTENT = json.dumps(BODY, ensure_ascii=False).encode()
+FIELDS = ['id', 'owner_id', 'date', 'likes', 'sizes']
+
+
+class FakeResponse:
+    """
+    Response with content, which is also downloaded by small chunks, so chunk borders cut tokens
+    """
+    def __init__(self, content: bytes, status_code=200, chunk_size=7):
+        self.status_code = status_code
+        self.content = content
+        self.chunk_size = chunk_size
+        self.closed = False
+
+    def iter_content(self, chunk_size):
+        return (self.content[i:i + self.chunk_size] for i in range(0, len(self.content), self.chunk_size))
+
+    def close(self):
+        self.closed = True
+
+
+@pytest.fixture(params=['json', 'orjson', 'ujson'])
+def loads(request):
+    return pytest.importorskip(request.param).loads
+
+
+def get_vk_error(content):
+    return content.get('error', {}).get('error_msg') if type(content) is dict else None
+
+
+def test_backends_decode_the_same_objects(loads):
+    decoder = ResponseDecoder(get_vk_error, loads)
+    result = decoder.decode(FakeResponse(CONTENT), 'response, items')
+    assert result == {'object': BODY['response']['items'], 'success': True, 'message': ''}
+    cut = decoder.decode(FakeResponse(CONTENT), 'response', items_prefix='response.items.item', fields=FIELDS)
+    assert cut['object']['items'] == [{key: item[key] for key in FIELDS} for item in BODY['response']['items']]
+    assert cut['object']['count'] == 3
+
+
+def test_backends_report_errors_the_same_way(loads):
+    decoder = ResponseDecoder(get_vk_error, loads)
+    assert decoder.decode(FakeResponse(b'{"response": [1,')) == \
+        {'object': None, 'success': False, 'message': 'JSON decode error'}
+    assert decoder.decode(FakeResponse(b'{"error": {"error_code": 5, "error_msg": "User authorization failed"}}')) == \
+        {'object': None, 'success': False, 'message': 'User authorization failed'}
+    assert decoder.decode(FakeResponse(b'{"response": {}}'), 'response, items') == \
+        {'object': None, 'success': False, 'message': 'Object not found'}
+    assert decoder.decode(FakeResponse(b'', 503)) == \
+        {'object': None, 'success': False, 'message': 'Request error: 503 (Service Unavailable)'}
+    assert decoder.decode(FakeResponse(b'')) == {'object': None, 'success': True, 'message': 'Response body is empty'}
+
+
+@pytest.mark.parametrize('fields', [None, FIELDS])
+def test_streamed_decoding_gives_the_same_result(loads, fields):
+    pytest.importorskip('ijson')
+    decoder = ResponseDecoder(get_vk_error, loads)
+    for path in ('', 'response', 'response, items'):
+        expected = decoder.decode(FakeResponse(CONTENT), path, items_prefix='response.items.item', fields=fields)
+        response = FakeResponse(CONTENT)
+        assert decoder.decode_stream(response, path, items_prefix='response.items.item', fields=fields) == expected
+        assert response.closed
+    # floats are decoded as floats, not as Decimal
+    items = decoder.decode_stream(FakeResponse(CONTENT), 'response, items')['object']
+    assert [type(item['lat']) for item in items] == [float] * 3
+
+
+def test_streamed_decoding_reports_errors():
+    pytest.importorskip('ijson')
+    decoder = ResponseDecoder(get_vk_error)
+    assert decoder.decode_stream(FakeResponse(b'{"response": [1,'))['message'] == 'JSON decode error'
+    assert decoder.decode_stream(FakeResponse(b'')) == \
+        {'object': None, 'success': True, 'message': 'Response body is empty'}
+    assert decoder.decode_stream(FakeResponse(b'{"error": {"error_msg": "Too many requests"}}'))['message'] == \
+        'Too many requests'
+    assert decoder.decode_stream(FakeResponse(b'', 429))['message'] == 'Request error: 429 (Too Many Requests)'
+
+
+def test_streamed_decoding_without_ijson_decodes_whole_body(monkeypatch):
+    module = importlib.import_module('ResponseDecoder')
+    monkeypatch.setattr(module, 'ijson', None)
+    decoder = ResponseDecoder(get_vk_error)
+    response = FakeResponse(CONTENT)
+    assert decoder.decode_stream(response, 'response', items_prefix='response.items.item', fields=['id']) == \
+        {'object': {'count': 3, 'items': [{'id': 1}, {'id': 2}, {'id': 3}]}, 'success': True, 'message': ''}
+    assert response.closed
+
+
+def test_chunks_reader_reads_across_chunks():
+    reader = ChunksReader([b'abc', b'', b'defg', b'h'])
+    assert reader.read(2) == b'ab'
+    assert reader.read(5) == b'c'
+    assert reader.read(3) == b'def'
+    assert reader.read() == b'gh'
+    assert reader.read(1) == b''
+    assert ChunksReader([]).read() == b''
+
+
+def test_default_loads_can_be_replaced(monkeypatch):
+    calls = []
+
+    def loads(content):
+        calls.append(content)
+        return json.loads(content)
+
+    default = ResponseDecoder.get_default_loads()
+    try:
+        ResponseDecoder.set_default_loads(loads)
+        assert ResponseDecoder().decode(FakeResponse(b'{"response": 1}'), 'response')['object'] == 1
+        # decoder with own loads doesn't use default one
+        assert ResponseDecoder(loads=json.loads).decode(FakeResponse(b'[]'))['object'] == []
+    finally:
+        ResponseDecoder.set_default_loads(default)
+    assert calls == [b'{"response": 1}']
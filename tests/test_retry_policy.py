@@ -0,0 +1,190 @@
+import email.utils
+
+import pytest
+import requests
+
+import RetryPolicy as retry_policy_module
+from Metrics import Metrics
+from RateLimiter import RateLimiter
+from RetryPolicy import CircuitBreaker, CircuitOpenError, RetryPolicy
+from fake_clock import FakeClock
+
+
+class FakeResponse:
+    def __init__(self, status_code=200, headers: dict = None):
+        self.status_code = status_code
+        self.headers = headers or {}
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(retry_policy_module, 'time', clock)
+    return clock
+
+
+def make_sender(results: list):
+    """
+    :param results: results of attempts, exceptions are raised
+    """
+    calls = []
+
+    def send():
+        result = results[len(calls)]
+        calls.append(result)
+        if isinstance(result, Exception):
+            raise result
+        return result
+    return send, calls
+
+
+def is_throttled(result):
+    return result.get('retry_after')
+
+
+def test_throttled_result_is_retried_with_exponential_backoff(clock):
+    policy = RetryPolicy(max_attempts=5, base_delay=0.5, jitter=0.0, breaker=None)
+    send, calls = make_sender([{'retry_after': 0.0}] * 3 + [{'ok': True}])
+    assert policy.run(send, is_throttled) == {'ok': True}
+    assert len(calls) == 4
+    assert clock.sleeps == [0.5, 1.0, 2.0]
+    assert policy.get_retries() == 3
+
+
+def test_delay_honours_retry_after_and_max_delay(clock):
+    policy = RetryPolicy(max_attempts=4, base_delay=1.0, max_delay=2.0, jitter=0.0, breaker=None)
+    send, _ = make_sender([{'retry_after': 5.0}, {'retry_after': 0.0}, {'retry_after': 0.0}, {'ok': True}])
+    policy.run(send, is_throttled)
+    # server hint is longer than backoff, then backoff is capped by max delay
+    assert clock.sleeps == [5.0, 2.0, 2.0]
+
+
+def test_jitter_keeps_delay_within_bounds():
+    policy = RetryPolicy(base_delay=1.0, jitter=0.5)
+    delays = [policy.get_delay(2) for _ in range(200)]
+    assert all(2.0 <= x <= 6.0 for x in delays)
+    assert len(set(delays)) > 1
+
+
+def test_attempts_are_limited_and_last_result_is_returned(clock):
+    breaker = CircuitBreaker(failure_threshold=2)
+    policy = RetryPolicy(max_attempts=3, base_delay=0.1, jitter=0.0, breaker=breaker)
+    send, calls = make_sender([{'retry_after': 0.0, 'n': i} for i in range(5)])
+    assert policy.run(send, is_throttled)['n'] == 2
+    assert len(calls) == 3
+    assert len(clock.sleeps) == 2
+    # throttling is counted by breaker only once, when attempts are over
+    assert breaker.get_state() == CircuitBreaker.CLOSED
+
+
+def test_connection_errors_are_retried_and_the_last_is_raised(clock):
+    policy = RetryPolicy(max_attempts=3, base_delay=0.1, jitter=0.0, breaker=None)
+    send, calls = make_sender([requests.exceptions.ConnectionError('refused')] * 3)
+    with pytest.raises(requests.exceptions.ConnectionError):
+        policy.run(send, is_throttled)
+    assert len(calls) == 3
+
+
+def test_timeout_is_retried(clock):
+    policy = RetryPolicy(max_attempts=3, base_delay=0.1, jitter=0.0, breaker=None)
+    send, calls = make_sender([requests.exceptions.ReadTimeout('slow'), {'ok': True}])
+    assert policy.run(send, is_throttled) == {'ok': True}
+    assert len(calls) == 2
+
+
+def test_limiter_is_throttled_and_recovered(clock):
+    limiter = RateLimiter(10.0)
+    policy = RetryPolicy(max_attempts=3, base_delay=0.0, jitter=0.0, breaker=None)
+    send, _ = make_sender([{'retry_after': 0.0}, {'retry_after': 0.0}, {'ok': True}])
+    policy.run(send, is_throttled, limiter)
+    assert limiter.get_rate() == pytest.approx(2.5 + 10.0 * RateLimiter.RECOVERY_STEP)
+
+
+def test_retries_are_counted_in_metrics(clock):
+    metrics = Metrics()
+    policy = RetryPolicy(max_attempts=3, base_delay=0.0, jitter=0.0, breaker=None, metrics=metrics, service='vk')
+    send, _ = make_sender([requests.exceptions.ConnectionError('refused'), {'retry_after': 0.0}, {'ok': True}])
+    policy.run(send, is_throttled)
+    text = metrics.to_prometheus()
+    assert 'retries_total{reason="connection",service="vk"} 1' in text
+    assert 'retries_total{reason="throttled",service="vk"} 1' in text
+
+
+def test_retry_after_values(clock):
+    assert RetryPolicy.parse_retry_after('3') == 3.0
+    assert RetryPolicy.parse_retry_after('-1') == 0.0
+    assert RetryPolicy.parse_retry_after(None) is None
+    assert RetryPolicy.parse_retry_after('soon') is None
+    date = email.utils.formatdate(clock.now + 30, usegmt=True)
+    assert RetryPolicy.parse_retry_after(date) == pytest.approx(30, abs=1)
+
+
+def test_response_retry_after():
+    policy = RetryPolicy()
+    assert policy.get_response_retry_after(FakeResponse(200)) is None
+    assert policy.get_response_retry_after(FakeResponse(429)) == 0.0
+    assert policy.get_response_retry_after(FakeResponse(503, {'Retry-After': '7'})) == 7.0
+    assert policy.get_response_retry_after(FakeResponse(500)) is None
+
+
+def test_vk_policy_retries_throttling_codes_only():
+    policy = RetryPolicy.for_vk(breaker=None)
+    assert all(policy.is_retryable_error(code) for code in (6, 9, 10))
+    assert not policy.is_retryable_error(5)
+    assert not policy.is_retryable_error(None)
+
+
+def test_breaker_goes_from_open_to_half_open_to_closed(clock):
+    breaker = CircuitBreaker(failure_threshold=3, reset_timeout=30)
+    for _ in range(2):
+        breaker.record_failure()
+    assert breaker.allow()
+    breaker.record_failure()
+    assert breaker.get_state() == CircuitBreaker.OPEN
+    assert not breaker.allow()
+    clock.advance(30)
+    # only one trial request is allowed
+    assert breaker.allow()
+    assert breaker.get_state() == CircuitBreaker.HALF_OPEN
+    assert not breaker.allow()
+    breaker.record_success()
+    assert breaker.get_state() == CircuitBreaker.CLOSED
+    assert breaker.allow()
+
+
+def test_failed_trial_opens_breaker_again(clock):
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=10)
+    breaker.record_failure()
+    clock.advance(10)
+    assert breaker.allow()
+    breaker.record_failure()
+    assert breaker.get_state() == CircuitBreaker.OPEN
+    clock.advance(5)
+    assert not breaker.allow()
+
+
+def test_success_resets_failures(clock):
+    breaker = CircuitBreaker(failure_threshold=2)
+    breaker.record_failure()
+    breaker.record_success()
+    breaker.record_failure()
+    assert breaker.get_state() == CircuitBreaker.CLOSED
+
+
+def test_open_breaker_stops_requests(clock):
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=60)
+    breaker.record_failure()
+    policy = RetryPolicy(breaker=breaker)
+    send, calls = make_sender([{'ok': True}])
+    with pytest.raises(CircuitOpenError):
+        policy.run(send, is_throttled)
+    assert calls == []
+
+
+def test_connection_failures_open_breaker_during_retries(clock):
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=60)
+    policy = RetryPolicy(max_attempts=5, base_delay=0.0, jitter=0.0, breaker=breaker)
+    send, calls = make_sender([requests.exceptions.ConnectionError('refused')] * 5)
+    with pytest.raises(CircuitOpenError):
+        policy.run(send, is_throttled)
+    assert len(calls) == 2
@@ -0,0 +1,78 @@
+import pytest
+
+from SizeSelector import SizeSelector
+
+
+def make_size(size_type: str, width=0, height=0):
+    return {'type': size_type, 'width': width, 'height': height, 'url': f'https://x/{size_type}.jpg'}
+
+
+SIZES = [make_size('s', 75, 50), make_size('m', 130, 87), make_size('x', 604, 403), make_size('o', 130, 87),
+         make_size('p', 200, 133), make_size('q', 320, 213), make_size('r', 510, 340), make_size('y', 807, 538),
+         make_size('z', 1280, 853), make_size('w', 2560, 1706)]
+# photo uploaded before 2012 year has no dimensions of sizes
+OLD_SIZES = [make_size('s'), make_size('m'), make_size('x'), make_size('o'), make_size('p'), make_size('q'),
+             make_size('r')]
+
+
+def select_type(policy: str, sizes: list):
+    return SizeSelector.from_string(policy).select(sizes)['type']
+
+
+def test_max_takes_the_biggest_size():
+    assert select_type('max', SIZES) == 'w'
+    assert select_type('max', SIZES[:-1]) == 'z'
+    # nominal dimensions are used when real ones are absent
+    assert select_type('max', OLD_SIZES) == 'x'
+    assert select_type('max', [make_size('s'), make_size('y', 100, 100)]) == 'y'
+    # sizes of the same area are compared by rank
+    assert select_type('max', [make_size('o', 130, 87), make_size('m', 130, 87)]) == 'o'
+
+
+@pytest.mark.parametrize('policy, expected', [('width:1100', 'z'), ('width:720', 'y'), ('width:5000', 'w'),
+                                              ('width:700', 'x'), ('width:1', 's'), ('width:400', 'q')])
+def test_width_takes_the_closest_width(policy, expected):
+    assert select_type(policy, SIZES) == expected
+
+
+def test_width_prefers_bigger_size_from_two_closest():
+    assert select_type('width:165', [make_size('m', 130, 87), make_size('p', 200, 133)]) == 'p'
+    assert select_type('width:600', OLD_SIZES) == 'x'
+
+
+@pytest.mark.parametrize('policy, sizes, expected', [
+    ('type:x', SIZES, 'x'),
+    # the closest rank is taken if there is no exact type
+    ('type:w', SIZES[:-1], 'z'),
+    ('type:y', OLD_SIZES, 'r'),
+    # from two types with the same distance the bigger one is taken
+    ('type:o', [make_size('x'), make_size('p')], 'p'),
+    ('type:s', [make_size('w'), make_size('m'), make_size('z')], 'm'),
+])
+def test_type_falls_back_to_the_closest_rank(policy, sizes, expected):
+    assert select_type(policy, sizes) == expected
+
+
+def test_max_pixels_takes_the_biggest_size_which_fits():
+    assert select_type(f'max_pixels:{1280 * 1024}', SIZES) == 'z'
+    assert select_type(f'max_pixels:{807 * 538}', SIZES) == 'y'
+    # the smallest size is taken if nothing fits
+    assert select_type('max_pixels:100', SIZES) == 's'
+
+
+def test_page_is_selected_in_order():
+    selector = SizeSelector('width', width=600)
+    items = [{'sizes': SIZES}, {'sizes': []}, {}, {'sizes': OLD_SIZES[:2]}]
+    assert [size and size['type'] for size in selector.select_page(items)] == ['x', None, None, 'm']
+    assert selector.select([]) is None
+
+
+@pytest.mark.parametrize('policy', ['max', 'max_pixels:1310720', 'type:x', 'width:1280'])
+def test_short_form_round_trip(policy):
+    assert str(SizeSelector.from_string(policy)) == policy
+
+
+@pytest.mark.parametrize('policy', ['min', 'type:a', 'type', 'width', 'max_pixels:0'])
+def test_wrong_policies_are_rejected(policy):
+    with pytest.raises(ValueError):
+        SizeSelector.from_string(policy)
@@ -0,0 +1,188 @@
+import asyncio
+import threading
+import uuid
+
+import pytest
+
+from AsyncHttpSession import AsyncHttpSession
+from AsyncVkClient import AsyncVkClient
+from HttpSession import HttpSession
+from RateLimiter import RateLimiter
+from SocialGraph import SocialGraph
+from VkClient import VkClient
+from mock_api import MockVk
+
+USER = {'id': 1, 'first_name': 'Test', 'last_name': 'User', 'domain': 'id1'}
+
+
+class RecordingVk(MockVk):
+    """
+    MockVk which records API calls, including calls inside execute requests
+    """
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.__lock = threading.Lock()
+        self.__calls = []
+        self.__executes = []
+
+    def get_calls(self, method: str):
+        """
+        :return: params of all calls of method
+        """
+        with self.__lock:
+            return [params for name, params in self.__calls if name == method]
+
+    def get_executes(self):
+        """
+        :return: calls count of every execute request
+        """
+        with self.__lock:
+            return list(self.__executes)
+
+    def call(self, method: str, params: dict):
+        with self.__lock:
+            self.__calls.append((method, params))
+        return super().call(method, params)
+
+    def execute(self, code: str):
+        response = super().execute(code)
+        with self.__lock:
+            self.__executes.append(len(response['response']))
+        return response
+
+
+@pytest.fixture
+def vk():
+    with RecordingVk(friends=5) as server:
+        yield server
+
+
+@pytest.fixture
+def client(vk):
+    return VkClient(f'vk-{uuid.uuid4().hex}', 1, session=HttpSession(), rate_limiter=RateLimiter(1000.0),
+                    api_base_url=vk.get_api_url(), user=USER)
+
+
+def get_targets(vk: RecordingVk):
+    return [[int(x) for x in str(params['target_uids']).split(',')] for params in vk.get_calls('friends.getMutual')]
+
+
+def test_targets_are_chunked_into_calls_and_calls_into_executes(vk, client):
+    graph = SocialGraph(client)
+    targets = list(range(2, 2602))
+    result = graph.get_mutual_friends(1, targets)
+    assert result['success']
+    assert len(result['object']) == 2600
+    chunks = get_targets(vk)
+    assert len(chunks) == 26
+    assert all(len(x) == SocialGraph.MUTUAL_TARGETS_LIMIT for x in chunks)
+    assert sorted(x for chunk in chunks for x in chunk) == targets
+    assert vk.get_executes() == [25, 1]
+
+
+def test_repeated_and_reversed_queries_make_no_requests(vk, client):
+    graph = SocialGraph(client)
+    assert graph.get_mutual_friends(1, [2, 3])['object'] == {2: list(range(100, 105)), 3: list(range(100, 105))}
+    executes = vk.get_executes()
+    assert graph.get_mutual_friends(1, [3, 2])['success']
+    # mutual friends are symmetric, so pairs are known from the other side too
+    assert graph.get_mutual_friends(2, [1])['object'] == {1: list(range(100, 105))}
+    assert graph.get_mutual_friends(3, [1])['success']
+    assert vk.get_executes() == executes
+    assert graph.get_stats() == {'users': 3, 'pairs': 2, 'profiles': 0}
+
+
+def test_only_missing_pairs_are_loaded(vk, client):
+    graph = SocialGraph(client)
+    graph.get_mutual_friends(1, [2, 3])
+    graph.get_mutual_friends(1, [2, 3, 4, 5])
+    assert get_targets(vk) == [[2, 3], [4, 5]]
+
+
+def test_invalidate_forgets_user_pairs(vk, client):
+    graph = SocialGraph(client)
+    graph.get_mutual_matrix([1, 2, 3])
+    graph.get_profiles([2, 3])
+    graph.invalidate(2)
+    assert graph.get_stats() == {'users': 2, 'pairs': 1, 'profiles': 1}
+    calls = len(get_targets(vk))
+    graph.get_mutual_friends(1, [2, 3])
+    assert get_targets(vk)[calls:] == [[2]]
+    graph.invalidate()
+    assert graph.get_stats() == {'users': 0, 'pairs': 0, 'profiles': 0}
+
+
+def test_mutual_matrix_is_loaded_by_one_execute(vk, client):
+    result = SocialGraph(client).get_mutual_matrix([1, 2, 3, 2])
+    assert result['success']
+    assert sorted(result['object']) == [(1, 2), (1, 3), (2, 3)]
+    assert vk.get_executes() == [2]
+
+
+def test_common_friends_of_several_users(vk, client):
+    graph = SocialGraph(client)
+    assert graph.get_common_friends([1, 2, 3]) == {'object': list(range(100, 105)), 'success': True, 'message': ''}
+    assert not graph.get_common_friends([1, 1])['success']
+
+
+def test_profiles_are_loaded_in_bulk_and_cached(vk, client):
+    graph = SocialGraph(client)
+    ids = list(range(2, 2502))
+    result = graph.get_profiles(ids)
+    assert list(result['object']) == ids
+    assert [len(str(x['user_ids']).split(',')) for x in vk.get_calls('users.get')] == [1000, 1000, 500]
+    clients = graph.get_clients(ids[:10])
+    assert [x.get_id() for x in clients['object']] == [str(x) for x in ids[:10]]
+    assert len(vk.get_calls('users.get')) == 3
+
+
+def test_mutual_clients_make_no_requests_per_friend(vk, client):
+    other = client.make_client({'id': 2, 'first_name': 'Test', 'last_name': 'User2', 'domain': 'id2'})
+    clients = client & other
+    assert [x.get_domain() for x in clients] == [f'id{x}' for x in range(100, 105)]
+    assert len(vk.get_calls('users.get')) == 1
+    assert len(vk.get_calls('friends.getMutual')) == 1
+
+
+def test_async_mutual_clients_are_made_from_bulk_profiles():
+    async def run(vk: RecordingVk):
+        session = AsyncHttpSession()
+        try:
+            client = AsyncVkClient('vk-token', 1, session=session, user=USER, api_base_url=vk.get_api_url())
+            other = client.make_client({'id': 2, 'first_name': 'Test', 'last_name': 'User2', 'domain': 'id2'})
+            return await (client & other)
+        finally:
+            await session.close()
+
+    with RecordingVk(friends=1500) as vk:
+        clients = asyncio.run(run(vk))
+        assert len(clients) == 1500
+        assert all(x.is_initialized() for x in clients)
+        assert clients[0].get_id() == '100'
+        assert [len(str(x['user_ids']).split(',')) for x in vk.get_calls('users.get')] == [1000, 500]
+
+
+def test_mutual_clients_of_not_initialized_or_the_same_user(vk, client):
+    deleted = client.make_client({'id': 3, 'first_name': 'DELETED', 'last_name': '', 'domain': 'id3',
+                                  'deactivated': 'deleted'})
+    assert not deleted.is_initialized()
+    assert (client & deleted) is False
+    assert (deleted & client) is False
+    assert (client & 'id2') is False
+    assert (client & client.make_client(USER)) == []
+    assert vk.get_calls('friends.getMutual') == []
+
+
+def test_async_mutual_clients_of_not_initialized_or_the_same_user(vk):
+    async def run():
+        session = AsyncHttpSession()
+        try:
+            client = AsyncVkClient('vk-token', 1, session=session, user=USER, api_base_url=vk.get_api_url())
+            deleted = client.make_client({'id': 3, 'first_name': 'DELETED', 'last_name': '', 'domain': 'id3',
+                                          'deactivated': 'deleted'})
+            return await (client & deleted), await (deleted & client), await (client & client.make_client(USER))
+        finally:
+            await session.close()
+
+    assert asyncio.run(run()) == (False, False, [])
+    assert vk.get_calls('friends.getMutual') == []
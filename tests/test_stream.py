@@ -0,0 +1,71 @@
+import threading
+import time
+
+import pytest
+
+
+def get_producers():
+    return [thread for thread in threading.enumerate() if thread.name == 'ImageSaver-links' and thread.is_alive()]
+
+
+def fake_links(saver, monkeypatch, count: int, error: Exception = None):
+    """
+    Replaces links loading of saver with generator of count links, which fails with error at the end if it is set
+    :return: list of produced links, it grows while producer reads generator
+    """
+    produced = []
+
+    def iter_images_links(*args):
+        for i in range(count):
+            produced.append(i)
+            yield [str(i), '.jpg', f'http://127.0.0.1:9/img/{i}.jpg', 'z', 1, i + 1]
+        if error is not None:
+            raise error
+
+    monkeypatch.setattr(saver, 'iter_images_links', iter_images_links)
+    return produced
+
+
+def wait_until(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return condition()
+
+
+def test_streamed_links_are_the_same_as_loaded_ones(saver):
+    assert [link[:4] for link in saver.stream_images_links(max_qty=100, buffer_size=7)] == \
+        [link[:4] for link in saver.get_images_links(max_qty=100)]
+
+
+def test_buffer_stops_producer_until_consumer_catches_up(saver, monkeypatch):
+    produced = fake_links(saver, monkeypatch, 100)
+    links = saver.stream_images_links(buffer_size=5)
+    assert next(links)[0] == '0'
+    # 1 consumed link, 5 links in buffer and 1 link waiting for free place
+    assert wait_until(lambda: len(produced) == 7)
+    time.sleep(0.3)
+    assert len(produced) == 7
+    assert [link[0] for link in links] == [str(i) for i in range(1, 100)]
+    assert not get_producers()
+
+
+def test_producer_error_is_raised_after_produced_links(saver, monkeypatch):
+    fake_links(saver, monkeypatch, 3, ValueError('page is broken'))
+    links = saver.stream_images_links(buffer_size=2)
+    assert [next(links)[0] for _ in range(3)] == ['0', '1', '2']
+    with pytest.raises(ValueError, match='page is broken'):
+        next(links)
+    assert not get_producers()
+
+
+def test_consumer_stopping_early_stops_producer(saver, monkeypatch):
+    produced = fake_links(saver, monkeypatch, 10 ** 6)
+    links = saver.stream_images_links(buffer_size=10)
+    assert [next(links)[0] for _ in range(3)] == ['0', '1', '2']
+    assert wait_until(lambda: len(produced) > 10)
+    started = time.monotonic()
+    links.close()
+    assert time.monotonic() - started < 2
+    assert not get_producers()
+    assert len(produced) < 20
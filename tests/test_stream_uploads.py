@@ -0,0 +1,126 @@
+import hashlib
+import threading
+
+import pytest
+
+from HttpSession import HttpSession
+from ImageSaver import ImageSaver
+from RateLimiter import RateLimiter
+from RetryPolicy import RetryPolicy
+from SyncManifest import SyncManifest
+from UploadOptions import UploadOptions
+from YaUploader import YaUploader
+from conftest import make_files
+from mock_api import MockDisk
+
+# body of every image of MockVk
+IMAGE = b'\xff\xd8' + b'\0' * 4096
+
+
+class FlakyDisk(MockDisk):
+    """
+    MockDisk which answers the first upload link requests and uploads with HTTP 503,
+    stores bodies without their last byte if corrupt is set, and counts requests by kind
+    """
+    def __init__(self, failed_links=0, failed_uploads=0, corrupt=False, **kwargs):
+        super().__init__(**kwargs)
+        self.__lock = threading.Lock()
+        self.__failed = {'link': failed_links, 'upload': failed_uploads}
+        self.__corrupt = corrupt
+        self.__requests = {'link': 0, 'upload': 0}
+
+    def get_requests(self):
+        with self.__lock:
+            return dict(self.__requests)
+
+    def handle(self, method: str, path: str, query: dict, body: bytes):
+        kind = 'link' if path == '/v1/disk/resources/upload' and method == 'GET' else \
+            'upload' if path.startswith('/upload/') else None
+        if kind is not None:
+            with self.__lock:
+                self.__requests[kind] += 1
+                if self.__failed[kind]:
+                    self.__failed[kind] -= 1
+                    return 503, None, {}
+        if kind == 'upload' and self.__corrupt:
+            body = body[:-1]
+        return super().handle(method, path, query, body)
+
+
+def make_uploader(disk: MockDisk):
+    policy = RetryPolicy.for_yandex(disk.get_api_url(), max_attempts=3, base_delay=0.0, jitter=0.0)
+    return YaUploader('ya-token', session=HttpSession(), api_base_url=disk.get_api_url(),
+                      rate_limiter=RateLimiter(1000.0), retry_policy=policy)
+
+
+def test_streamed_file_gets_md5_computed_on_the_fly(vk_server):
+    progress = []
+    with FlakyDisk() as disk:
+        uploader = make_uploader(disk)
+        result = uploader.upload_from_url('/Test/1.jpg', f'{vk_server.get_url()}/img/1/1_z.jpg', chunk_size=1000,
+                                          verify=True, progress=lambda sent, total, seconds: progress.append(sent))
+        stored = disk.get_md5()['/Test/1.jpg']
+    assert result['success']
+    assert result['object']['md5'] == stored == hashlib.md5(IMAGE).hexdigest()
+    assert result['object']['verified']
+    assert result['object']['bytes'] == len(IMAGE)
+    assert progress[-1] == len(IMAGE)
+
+
+def test_checksum_mismatch_fails_verified_upload(vk_server):
+    with FlakyDisk(corrupt=True) as disk:
+        uploader = make_uploader(disk)
+        url = f'{vk_server.get_url()}/img/1/1_z.jpg'
+        result = uploader.upload_from_url('/Test/1.jpg', url, verify=True)
+        # without verification damaged file is not noticed
+        assert uploader.upload_from_url('/Test/2.jpg', url)['success']
+    assert not result['success']
+    assert not result['object']['verified']
+    assert result['message'] == "Checksum of /Test/1.jpg doesn't match: MD5 differs"
+
+
+def test_saver_keeps_md5_of_streamed_photos(vk_server, tokens, tmp_path):
+    files = make_files(3, url=vk_server.get_url() + '/img')
+    with FlakyDisk() as disk, SyncManifest(str(tmp_path / 'manifest.db')) as manifest:
+        saver = ImageSaver(tokens[0], tokens[1], None, vk_rate=1000.0, ya_rate=1000.0,
+                           vk_api_url=vk_server.get_api_url(), ya_api_url=disk.get_api_url(), transfer_mode='stream',
+                           verify_checksums=True)
+        result = saver.upload_remote_files('Test', files, str(tmp_path / 'log.json'),
+                                           UploadOptions(concurrency=3, manifest=manifest))
+        assert result['success']
+        assert result['object']['uploaded'] == 3
+        assert [manifest.find_photo(1, i + 1)['md5'] for i in range(3)] == [hashlib.md5(IMAGE).hexdigest()] * 3
+
+
+def test_saver_reports_files_with_wrong_checksum(vk_server, tokens, tmp_path):
+    files = make_files(3, url=vk_server.get_url() + '/img')
+    with FlakyDisk(corrupt=True) as disk:
+        saver = ImageSaver(tokens[0], tokens[1], None, vk_rate=1000.0, ya_rate=1000.0,
+                           vk_api_url=vk_server.get_api_url(), ya_api_url=disk.get_api_url(), transfer_mode='stream',
+                           verify_checksums=True)
+        result = saver.upload_remote_files('Test', files, str(tmp_path / 'log.json'), UploadOptions(fail_fast=False))
+    assert not result['success']
+    assert result['object']['uploaded'] == 0
+    assert [x['filename'] for x in result['object']['failed']] == ['0.jpg', '1.jpg', '2.jpg']
+
+
+def test_streamed_body_is_not_retried(vk_server):
+    url = f'{vk_server.get_url()}/img/1/1_z.jpg'
+    # upload link request has no body, so it is retried
+    with FlakyDisk(failed_links=2) as disk:
+        assert make_uploader(disk).upload_from_url('/Test/1.jpg', url)['success']
+        assert disk.get_requests() == {'link': 3, 'upload': 1}
+    # chunks of streamed body are consumed by the first attempt, so it can't be sent again
+    with FlakyDisk(failed_uploads=1) as disk:
+        result = make_uploader(disk).upload_from_url('/Test/1.jpg', url)
+        assert disk.get_requests() == {'link': 1, 'upload': 1}
+        assert '/Test/1.jpg' not in disk.get_files()
+    assert not result['success']
+
+
+@pytest.mark.parametrize('data', [IMAGE, iter([IMAGE[:100], IMAGE[100:]])])
+def test_upload_stream_is_not_retried_for_any_body(data):
+    with FlakyDisk(failed_uploads=1) as disk:
+        result = make_uploader(disk).upload_stream('/Test/1.jpg', data)
+        assert disk.get_requests()['upload'] == 1
+    assert not result['success']
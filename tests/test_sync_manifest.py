@@ -0,0 +1,144 @@
+import sqlite3
+
+from SyncManifest import SyncManifest
+from UploadOptions import UploadOptions
+from conftest import make_files
+
+
+def test_uploaded_files_are_kept_between_runs(tmp_path):
+    path = str(tmp_path / 'manifest.db')
+    files = make_files(3)
+    with SyncManifest(path) as manifest:
+        manifest.mark_uploaded('A', files[0], 'A/0.jpg')
+        manifest.mark_uploaded('A', files[1], 'A/1.jpg')
+    with SyncManifest(path) as manifest:
+        assert manifest.is_uploaded('A', files[0])
+        assert manifest.get_disk_path('A', files[1]) == 'A/1.jpg'
+        assert not manifest.is_uploaded('A', files[2])
+        # folders are independent
+        assert not manifest.is_uploaded('B', files[0])
+        assert manifest.count('A') == 2
+        assert manifest.get_uploaded('A') == [{'filename': '0.jpg', 'size': 'z'}, {'filename': '1.jpg', 'size': 'z'}]
+
+
+def test_size_type_is_part_of_key(tmp_path):
+    with SyncManifest(str(tmp_path / 'manifest.db')) as manifest:
+        file = make_files(1)[0]
+        manifest.mark_uploaded('A', file, 'A/0.jpg')
+        assert not manifest.is_uploaded('A', file[:3] + ['x'] + file[4:])
+
+
+def test_records_without_identity_are_not_saved(tmp_path):
+    with SyncManifest(str(tmp_path / 'manifest.db')) as manifest:
+        file = ['1', '.jpg', 'http://127.0.0.1:9/1.jpg', 'z']
+        manifest.mark_uploaded('A', file, 'A/1.jpg')
+        assert manifest.count('A') == 0
+        assert not manifest.is_uploaded('A', file)
+
+
+def test_forget_removes_folder(tmp_path):
+    with SyncManifest(str(tmp_path / 'manifest.db')) as manifest:
+        files = make_files(2)
+        manifest.mark_uploaded('A', files[0], 'A/0.jpg')
+        manifest.mark_uploaded('B', files[1], 'B/1.jpg')
+        manifest.forget('A')
+        assert manifest.count('A') == 0
+        assert manifest.count('B') == 1
+
+
+def test_rerun_after_partial_run_uploads_only_missing_files(saver, disk_server, tmp_path):
+    log_path = str(tmp_path / 'log.json')
+    with SyncManifest(str(tmp_path / 'manifest.db')) as manifest:
+        # the first run stops on failed file, as after crash
+        result = saver.upload_remote_files('Test', make_files(20, bad=(5,)), log_path, UploadOptions(manifest=manifest))
+        assert not result['success']
+        assert manifest.count('Test') == 5
+        first_run = disk_server.get_uploads()
+        options = UploadOptions(concurrency=4, manifest=manifest)
+        result = saver.upload_remote_files('Test', make_files(20), log_path, options)
+        assert result['success']
+        assert result['object']['skipped'] == 5
+        assert result['object']['uploaded'] == 15
+        second_run = disk_server.get_uploads()[len(first_run):]
+        assert sorted(second_run) == sorted(f'Test/{i}.jpg' for i in range(5, 20))
+        assert manifest.count('Test') == 20
+        # the third run has nothing to upload
+        result = saver.upload_remote_files('Test', make_files(20), log_path, UploadOptions(manifest=manifest))
+        assert result['object']['skipped'] == 20
+        assert len(disk_server.get_uploads()) == len(first_run) + len(second_run)
+
+
+def test_photo_from_other_folder_is_linked_not_uploaded(saver, disk_server, tmp_path):
+    files = make_files(5)
+    with SyncManifest(str(tmp_path / 'manifest.db')) as manifest:
+        options = UploadOptions(manifest=manifest, dedup=True)
+        result = saver.upload_remote_files('A', files, str(tmp_path / 'a.json'), options)
+        assert result['object']['uploaded'] == 5
+        uploads = disk_server.get_uploads()
+        # the same photos in other album, with other file names
+        other = [[f'b{i}', *file[1:]] for i, file in enumerate(files)] + make_files(6)[5:]
+        result = saver.upload_remote_files('B', other, str(tmp_path / 'b.json'), options)
+        assert result['success']
+        assert result['object']['linked'] == 5
+        assert result['object']['uploaded'] == 1
+        assert disk_server.get_uploads()[len(uploads):] == ['B/5.jpg']
+        assert manifest.get_uploaded('B') == [{'filename': f'b{i}.jpg', 'size': 'z', 'disk_path': f'A/{i}.jpg'}
+                                              for i in range(5)] + [{'filename': '5.jpg', 'size': 'z'}]
+        assert manifest.find_photo(1, 1)['disk_path'] == 'A/0.jpg'
+
+
+def test_photos_are_uploaded_again_unless_dedup_is_set(saver, disk_server, tmp_path):
+    files = make_files(3)
+    with SyncManifest(str(tmp_path / 'manifest.db')) as manifest:
+        saver.upload_remote_files('A', files, str(tmp_path / 'a.json'), UploadOptions(manifest=manifest, dedup=True))
+        # dedup is off by default
+        result = saver.upload_remote_files('B', files, str(tmp_path / 'b.json'), UploadOptions(manifest=manifest))
+        assert result['object']['linked'] == 0
+        assert result['object']['uploaded'] == 3
+        assert disk_server.get_uploads()[3:] == ['B/0.jpg', 'B/1.jpg', 'B/2.jpg']
+
+
+def test_repeated_photos_of_one_upload_are_dropped(saver, disk_server, tmp_path):
+    files = make_files(4)
+    # wall copy of photo has other size type, but the same identity
+    files += [[f'{file[0]}-wall', file[1], file[2], 'x', *file[4:]] for file in files[:2]]
+    result = saver.upload_remote_files('Test', files, str(tmp_path / 'log.json'), UploadOptions(dedup=True))
+    assert result['success']
+    assert result['object']['duplicates'] == 2
+    assert sorted(disk_server.get_uploads()) == [f'Test/{i}.jpg' for i in range(4)]
+
+
+def test_repeated_photos_are_uploaded_by_default(saver, disk_server, tmp_path):
+    files = make_files(2)
+    files += [['0-wall', *files[0][1:]]]
+    result = saver.upload_remote_files('Test', files, str(tmp_path / 'log.json'))
+    assert result['success']
+    assert result['object']['duplicates'] == 0
+    assert result['object']['uploaded'] == 3
+
+
+def test_manifest_of_older_version_gets_md5_column(tmp_path):
+    path = str(tmp_path / 'manifest.db')
+    connection = sqlite3.connect(path)
+    connection.execute('CREATE TABLE uploads (folder TEXT NOT NULL, owner_id INTEGER NOT NULL, '
+                       'photo_id INTEGER NOT NULL, size_type TEXT NOT NULL, filename TEXT NOT NULL, '
+                       'disk_path TEXT NOT NULL, url TEXT, uploaded REAL NOT NULL, '
+                       'PRIMARY KEY (folder, owner_id, photo_id, size_type))')
+    connection.execute("INSERT INTO uploads VALUES ('A', 1, 1, 'z', '0.jpg', 'A/0.jpg', NULL, 1.0)")
+    connection.commit()
+    connection.close()
+    files = make_files(2)
+    with SyncManifest(path) as manifest:
+        assert manifest.is_uploaded('A', files[0])
+        assert manifest.find_photo(1, 1) == {'folder': 'A', 'disk_path': 'A/0.jpg', 'size_type': 'z', 'md5': None}
+        manifest.mark_uploaded('A', files[1], 'A/1.jpg', md5='abc')
+    # the second open finds migrated table
+    with SyncManifest(path) as manifest:
+        assert manifest.find_photo(1, 2)['md5'] == 'abc'
+        assert manifest.count('A') == 2
+    connection = sqlite3.connect(path)
+    columns = [row[1] for row in connection.execute('PRAGMA table_info(uploads)')]
+    indexes = [row[1] for row in connection.execute('PRAGMA index_list(uploads)')]
+    connection.close()
+    assert columns.count('md5') == 1
+    assert 'uploads_photo' in indexes
@@ -0,0 +1,185 @@
+import hashlib
+import json
+import os
+
+import pytest
+
+import UploadLog as upload_log_module
+from UploadLog import UploadLog
+from UploadOptions import UploadOptions
+from conftest import make_files
+
+
+class FakeUploader:
+    """
+    Records uploaded segments instead of sending them, fails uploads while fail is True
+    """
+    def __init__(self):
+        self.segments = []
+        self.fail = False
+
+    def upload_stream(self, disk_path: str, data):
+        if self.fail:
+            return {'object': None, 'success': False, 'message': 'Error 503'}
+        self.segments.append((disk_path, data))
+        return {'object': {'bytes': len(data)}, 'success': True, 'message': ''}
+
+
+def entry(i: int):
+    return {'filename': f'{i}.jpg', 'size': 'z'}
+
+
+def read_lines(path):
+    with open(path, encoding='utf-8') as file:
+        return file.read().splitlines()
+
+
+def test_torn_last_line_is_skipped_and_cut_on_resume(tmp_path):
+    path = str(tmp_path / 'log.jsonl')
+    log = UploadLog(path)
+    for i in range(3):
+        log.append(entry(i))
+    log.flush()
+    # crash in the middle of writing the next entry
+    with open(path, 'a', encoding='utf-8') as file:
+        file.write('{"filename": "3.j')
+    assert log.read() == [entry(i) for i in range(3)]
+    log.close()
+    with UploadLog(path, append=True) as log:
+        log.append(entry(3))
+        assert log.read() == [entry(i) for i in range(4)]
+    assert [json.loads(line) for line in read_lines(path)] == [entry(i) for i in range(4)]
+
+
+def test_log_of_one_torn_line_is_emptied_on_resume(tmp_path):
+    path = tmp_path / 'log.jsonl'
+    path.write_text('{"filename"', encoding='utf-8')
+    with UploadLog(str(path), append=True) as log:
+        assert log.read() == []
+        log.append(entry(0))
+    assert read_lines(path) == [json.dumps(entry(0))]
+
+
+def test_broken_line_in_the_middle_is_error(tmp_path):
+    path = tmp_path / 'log.jsonl'
+    path.write_text('{"filename"\n' + json.dumps(entry(1)) + '\n', encoding='utf-8')
+    with UploadLog(str(path), append=True) as log:
+        with pytest.raises(ValueError):
+            log.read()
+
+
+def test_entries_are_synced_in_batches(tmp_path, monkeypatch):
+    synced = []
+    monkeypatch.setattr(upload_log_module.os, 'fsync', lambda fd: synced.append(fd))
+    path = str(tmp_path / 'log.jsonl')
+    log = UploadLog(path, flush_every=3)
+    for i in range(7):
+        log.append(entry(i))
+        assert len(synced) == (i + 1) // 3
+    # the last entry is still in the buffer, so crash would lose it only
+    assert len(read_lines(path)) == 6
+    log.close()
+    assert len(synced) == 3
+    assert len(read_lines(path)) == 7
+
+
+def test_fsync_can_be_disabled(tmp_path, monkeypatch):
+    synced = []
+    monkeypatch.setattr(upload_log_module.os, 'fsync', lambda fd: synced.append(fd))
+    with UploadLog(str(tmp_path / 'log.jsonl'), flush_every=1, fsync=False) as log:
+        log.append(entry(0))
+    assert synced == []
+
+
+def test_sync_uploads_unsynced_tail_as_numbered_segments(tmp_path):
+    uploader = FakeUploader()
+    with UploadLog(str(tmp_path / 'images_log.jsonl')) as log:
+        assert log.sync(uploader, 'Test/')['message'] == 'Nothing to sync'
+        for i in range(2):
+            log.append(entry(i))
+        assert log.get_unsynced_count() == 2
+        assert log.sync(uploader, 'Test/')['success']
+        assert log.get_unsynced_count() == 0
+        log.append(entry(2))
+        # failed segment is sent again with the same number and new entries
+        uploader.fail = True
+        assert not log.sync(uploader, 'Test/')['success']
+        assert log.get_unsynced_count() == 1
+        uploader.fail = False
+        log.append(entry(3))
+        assert log.sync(uploader, 'Test/')['success']
+    names = [name for name, _ in uploader.segments]
+    assert len(names) == 2
+    run_id = names[0].split('.')[1]
+    assert names == [f'Test/images_log.{run_id}.0001.jsonl', f'Test/images_log.{run_id}.0002.jsonl']
+    assert [[json.loads(line) for line in data.decode().splitlines()] for _, data in uploader.segments] == \
+           [[entry(0), entry(1)], [entry(2), entry(3)]]
+
+
+def test_resumed_log_syncs_only_new_entries(tmp_path):
+    path = str(tmp_path / 'log.jsonl')
+    with UploadLog(path) as log:
+        log.append(entry(0))
+    uploader = FakeUploader()
+    with UploadLog(path, append=True) as log:
+        log.append(entry(1))
+        assert log.sync(uploader, 'Test/')['success']
+    assert uploader.segments[0][1].decode() == json.dumps(entry(1)) + '\n'
+    assert os.path.getsize(path) == len(json.dumps(entry(0))) + len(json.dumps(entry(1))) + 2
+
+
+def test_rerun_after_crash_syncs_entries_left_by_crashed_run(saver, disk_server, tmp_path):
+    log_path = tmp_path / 'images_log.json'
+    files = make_files(10)
+
+    def crashing_files():
+        yield from files[:5]
+        raise RuntimeError('crash')
+
+    with pytest.raises(RuntimeError):
+        saver.upload_remote_files('Test', crashing_files(), str(log_path), UploadOptions(log_sync_every=0))
+    jsonl_path = log_path.with_suffix('.jsonl')
+    left = jsonl_path.read_bytes()
+    assert len(left.splitlines()) == 5
+    # the process was killed in the middle of the next entry
+    with open(jsonl_path, 'a', encoding='utf-8') as file:
+        file.write('{"filename": "5.j')
+    assert not [path for path in disk_server.get_files() if path.endswith('.jsonl')]
+
+    result = saver.upload_remote_files('Other', files[5:], str(log_path))
+    assert result['success']
+    segments = {path: md5 for path, md5 in disk_server.get_md5().items() if path.endswith('.jsonl')}
+    assert sorted(path.rpartition('.')[0].rpartition('.')[2] for path in segments) == ['0001', '0002']
+    left_segment = [path for path in segments if path.endswith('.0001.jsonl')][0]
+    new_segment = [path for path in segments if path.endswith('.0002.jsonl')][0]
+    # entries of the crashed run are synced to their own folder, new entries to the folder of this run
+    assert left_segment.startswith('/Test/images_log.')
+    assert segments[left_segment] == hashlib.md5(left).hexdigest()
+    assert new_segment.startswith('/Other/images_log.')
+    assert [json.loads(line) for line in read_lines(jsonl_path)] == [entry(i) for i in range(10)]
+    # exported log has entries of this run only
+    assert json.loads(log_path.read_text()) == [entry(i) for i in range(5, 10)]
+
+    # nothing is left for the third run
+    uploads = len(disk_server.get_md5())
+    assert saver.upload_remote_files('Other', [], str(log_path))['success']
+    assert len(disk_server.get_md5()) == uploads
+
+
+def test_state_keeps_synced_position_and_folder(tmp_path):
+    path = str(tmp_path / 'log.jsonl')
+    uploader = FakeUploader()
+    with UploadLog(path) as log:
+        log.set_folder('A/')
+        log.append(entry(0))
+        assert log.sync(uploader, 'A/')['success']
+        log.append(entry(1))
+    with UploadLog(path, append=True) as log:
+        assert log.get_folder() == 'A/'
+        assert log.get_unsynced_count() == 1
+        assert log.read(current_run=True) == []
+    # truncated log forgets its state
+    with UploadLog(path) as log:
+        assert log.get_folder() is None
+        assert log.get_unsynced_count() == 0
+    assert not os.path.exists(path + '.state')
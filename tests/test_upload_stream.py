@@ -0,0 +1,115 @@
+import asyncio
+import hashlib
+import io
+import threading
+
+import pytest
+
+from AsyncHttpSession import AsyncHttpSession
+from AsyncYaUploader import AsyncYaUploader
+from HttpSession import HttpSession
+from UploadStream import UploadStream
+from YaUploader import YaUploader
+from mock_api import MockDisk
+
+CONTENT = bytes(range(256)) * 41
+
+
+@pytest.fixture
+def local_file(tmp_path):
+    path = tmp_path / 'photo.jpg'
+    path.write_bytes(CONTENT)
+    return path
+
+
+def test_file_is_mapped_and_sent_in_chunks(local_file):
+    progress = []
+    with UploadStream.from_file(str(local_file), chunk_size=4096,
+                                progress=lambda sent, total, seconds: progress.append((sent, total))) as stream:
+        assert stream.len == stream.get_size() == len(CONTENT)
+        chunks = [bytes(chunk) for chunk in stream]
+        assert b''.join(chunks) == CONTENT
+        assert [len(chunk) for chunk in chunks] == [4096, 4096, len(CONTENT) - 8192]
+        assert progress == [(4096, len(CONTENT)), (8192, len(CONTENT)), (len(CONTENT), len(CONTENT))]
+        assert stream.get_stats()['bytes'] == len(CONTENT)
+        del chunks
+    # stream owns mapped file, so it can be removed after close
+    local_file.unlink()
+
+
+def test_empty_file_gives_no_chunks(tmp_path):
+    path = tmp_path / 'empty.jpg'
+    path.write_bytes(b'')
+    with UploadStream.from_file(str(path)) as stream:
+        assert stream.len == 0
+        assert list(stream) == []
+        assert stream.get_stats()['bytes'] == 0
+
+
+def test_sources_of_stream():
+    file = io.BytesIO(CONTENT)
+    file.seek(1000)
+    # size of file-like object is counted from its position
+    stream = UploadStream(file, chunk_size=5000)
+    assert stream.len == len(CONTENT) - 1000
+    assert [len(chunk) for chunk in stream] == [5000, len(CONTENT) - 6000]
+    # size of iterator is unknown, so chunked encoding is used, empty chunks are skipped
+    stream = UploadStream(iter([b'ab', b'', b'cde']))
+    assert stream.len is None
+    assert list(stream) == [b'ab', b'cde']
+    assert UploadStream(iter([b'ab']), size=2).len == 2
+    assert [bytes(chunk) for chunk in UploadStream(bytearray(b'abcde'), chunk_size=2)] == [b'ab', b'cd', b'e']
+
+
+class ThreadsFile(io.BytesIO):
+    """
+    File which records threads reading it
+    """
+    def __init__(self, data: bytes):
+        super().__init__(data)
+        self.threads = set()
+
+    def read(self, size=-1):
+        self.threads.add(threading.get_ident())
+        return super().read(size)
+
+
+def test_async_iteration_reads_chunks_out_of_event_loop(local_file):
+    async def read(stream: UploadStream):
+        with stream:
+            return [chunk async for chunk in stream]
+
+    file = ThreadsFile(CONTENT)
+    assert b''.join(asyncio.run(read(UploadStream(file, chunk_size=4096)))) == CONTENT
+    assert file.threads and threading.get_ident() not in file.threads
+    chunks = asyncio.run(read(UploadStream.from_file(str(local_file), chunk_size=4096)))
+    assert [len(chunk) for chunk in chunks] == [4096, 4096, len(CONTENT) - 8192]
+    # mapped chunks are copied, so they are valid after file is closed
+    assert all(type(chunk) is bytes for chunk in chunks)
+    assert b''.join(chunks) == CONTENT
+
+
+def test_uploaders_send_local_file_as_raw_body(local_file, tmp_path):
+    empty = tmp_path / 'empty.jpg'
+    empty.write_bytes(b'')
+
+    async def upload_async(disk: MockDisk):
+        session = AsyncHttpSession()
+        try:
+            uploader = await AsyncYaUploader.create('ya-token', session=session, api_base_url=disk.get_api_url())
+            return [await uploader.upload_local_file(str(local_file), 'Async/', 'photo.jpg', chunk_size=4096),
+                    await uploader.upload_local_file(str(empty), 'Async/', 'empty.jpg')]
+        finally:
+            await session.close()
+
+    with MockDisk() as disk:
+        uploader = YaUploader('ya-token', session=HttpSession(), api_base_url=disk.get_api_url())
+        results = [uploader.upload_local_file(str(local_file), 'Sync/', 'photo.jpg', chunk_size=4096),
+                   uploader.upload_local_file(str(empty), 'Sync/', 'empty.jpg')]
+        results += asyncio.run(upload_async(disk))
+        md5 = disk.get_md5()
+    assert [x['success'] for x in results] == [True] * 4
+    assert [x['object']['bytes'] for x in results] == [len(CONTENT), 0] * 2
+    for folder in ('Sync', 'Async'):
+        assert md5[f'/{folder}/photo.jpg'] == hashlib.md5(CONTENT).hexdigest()
+        assert md5[f'/{folder}/empty.jpg'] == hashlib.md5(b'').hexdigest()
@@ -0,0 +1,134 @@
+import asyncio
+import json
+
+import pytest
+
+from AsyncHttpSession import AsyncHttpSession
+from AsyncImageSaver import AsyncImageSaver
+from SyncManifest import SyncManifest
+from UploadOptions import UploadOptions
+from conftest import make_files
+
+
+def read_log(path):
+    with open(path, encoding='utf-8') as file:
+        return [json.loads(line) for line in file if line.strip()]
+
+
+def test_results_keep_order_of_files(saver, tmp_path):
+    files = make_files(40)
+    result = saver.upload_remote_files('Test', files, str(tmp_path / 'log.json'), UploadOptions(concurrency=8))
+    assert result['success']
+    assert result['object']['uploaded'] == 40
+    # uploads finish in random order, but log follows order of files
+    assert [x['filename'] for x in read_log(tmp_path / 'log.jsonl')] == [f'{i}.jpg' for i in range(40)]
+
+
+def test_fail_fast_stops_sequential_uploads(saver, disk_server, tmp_path):
+    result = saver.upload_remote_files('Test', make_files(20, bad=(5,)), str(tmp_path / 'log.json'))
+    assert not result['success']
+    assert [x['filename'] for x in result['object']['failed']] == ['5.jpg']
+    assert len(disk_server.get_uploads()) == 6
+    assert result['object']['uploaded'] == 5
+
+
+def test_fail_fast_stops_concurrent_uploads_within_window(saver, disk_server, tmp_path):
+    concurrency = 4
+    taken = []
+
+    def files():
+        for file in make_files(100, bad=(10,)):
+            taken.append(file)
+            yield file
+
+    result = saver.upload_remote_files('Test', files(), str(tmp_path / 'log.json'), UploadOptions(concurrency))
+    assert not result['success']
+    # uploads already submitted to the window are finished, nothing else is started
+    window = concurrency * 2
+    assert len(disk_server.get_uploads()) <= 11 + window
+    assert len(taken) <= 11 + window
+    assert result['object']['uploaded'] == len(disk_server.get_uploads()) - 1
+
+
+def test_without_fail_fast_all_files_are_uploaded(saver, disk_server, tmp_path):
+    result = saver.upload_remote_files('Test', make_files(30, bad=(3, 17)), str(tmp_path / 'log.json'),
+                                       UploadOptions(concurrency=4, fail_fast=False))
+    assert not result['success']
+    assert result['message'].endswith('and 1 more')
+    assert sorted(x['filename'] for x in result['object']['failed']) == ['17.jpg', '3.jpg']
+    assert result['object']['uploaded'] == 28
+    assert len(disk_server.get_uploads()) == 30
+
+
+def test_concurrency_limits_uploads_in_flight(saver, disk_server, tmp_path):
+    result = saver.upload_remote_files('Test', make_files(60), str(tmp_path / 'log.json'), UploadOptions(concurrency=3))
+    assert result['success']
+    assert 1 < disk_server.get_max_in_flight() <= 3
+
+
+def test_sequential_uploads_are_not_concurrent(saver, disk_server, tmp_path):
+    result = saver.upload_remote_files('Test', make_files(10), str(tmp_path / 'log.json'))
+    assert result['success']
+    assert disk_server.get_max_in_flight() == 1
+
+
+def test_upload_options_are_validated_and_copied():
+    options = UploadOptions(4, fail_fast=False)
+    changed = options.replace(concurrency=8)
+    assert changed.get_concurrency() == 8
+    assert not changed.get_fail_fast()
+    assert options.get_concurrency() == 4
+    for kwargs in ({'concurrency': 0}, {'buffer_size': 0}, {'log_sync_every': -1}):
+        with pytest.raises(ValueError):
+            UploadOptions(**kwargs)
+
+
+def test_without_export_json_only_jsonl_log_is_saved(saver, tmp_path):
+    result = saver.upload_remote_files('Test', make_files(3), str(tmp_path / 'log.json'),
+                                       UploadOptions(export_json=False))
+    assert result['success']
+    assert (tmp_path / 'log.jsonl').exists()
+    assert not (tmp_path / 'log.json').exists()
+
+
+def upload_async(vk_server, disk_server, tokens, files, log_path, options=None):
+    async def run():
+        session = AsyncHttpSession()
+        try:
+            saver = await AsyncImageSaver.create(tokens[0], tokens[1], None, session=session,
+                                                 vk_api_url=vk_server.get_api_url(),
+                                                 ya_api_url=disk_server.get_api_url(), vk_rate=1000.0, ya_rate=1000.0)
+            assert saver.is_initialized()
+            return await saver.upload_remote_files('Test', files, log_path, options)
+        finally:
+            await session.close()
+    return asyncio.run(run())
+
+
+def test_async_saver_takes_the_same_upload_options(vk_server, disk_server, tokens, tmp_path):
+    files = make_files(30, bad=(3, 17))
+    # the same photo twice is uploaded once with dedup
+    files.append(list(files[0]))
+    result = upload_async(vk_server, disk_server, tokens, files, str(tmp_path / 'log.json'),
+                          UploadOptions(concurrency=4, fail_fast=False, dedup=True))
+    assert not result['success']
+    assert [x['filename'] for x in result['object']['failed']] == ['3.jpg', '17.jpg']
+    assert result['object']['uploaded'] == 28
+    assert len(disk_server.get_uploads()) == 30
+    assert 1 < disk_server.get_max_in_flight() <= 4
+
+
+def test_async_saver_uploads_concurrently_by_default(vk_server, disk_server, tokens, tmp_path):
+    result = upload_async(vk_server, disk_server, tokens, make_files(40), str(tmp_path / 'log.json'))
+    assert result['success']
+    assert 4 < disk_server.get_max_in_flight() <= AsyncImageSaver.DEFAULT_CONCURRENCY
+    with open(tmp_path / 'log.json', encoding='utf-8') as file:
+        assert [x['filename'] for x in json.load(file)] == [f'{i}.jpg' for i in range(40)]
+
+
+def test_async_saver_rejects_unsupported_options(vk_server, disk_server, tokens, tmp_path):
+    with SyncManifest(str(tmp_path / 'manifest.db')) as manifest:
+        for options in (UploadOptions(confirm=True), UploadOptions(manifest=manifest)):
+            with pytest.raises(ValueError):
+                upload_async(vk_server, disk_server, tokens, make_files(3), str(tmp_path / 'log.json'), options)
+    assert disk_server.get_uploads() == []
@@ -0,0 +1,124 @@
+import threading
+import uuid
+
+import requests
+
+from HttpSession import HttpSession
+from RateLimiter import RateLimiter
+from RetryPolicy import CircuitBreaker, RetryPolicy
+from VkClient import VkClient
+from mock_api import MockVk
+
+USER = {'id': 1, 'first_name': 'Test', 'last_name': 'User', 'domain': 'id1'}
+
+
+class FailingSession(HttpSession):
+    """
+    HttpSession which counts requests and fails every one with connection error
+    """
+    def __init__(self):
+        super().__init__()
+        self.requests = 0
+
+    def request(self, method: str, url: str, timeout=None, **kwargs):
+        self.requests += 1
+        raise requests.exceptions.ConnectionError('Connection refused')
+
+
+class ThrottlingVk(MockVk):
+    """
+    MockVk which answers the first requests with HTTP 429 or VK error 6
+    """
+    def __init__(self, http_throttled=0, api_throttled=0, **kwargs):
+        super().__init__(**kwargs)
+        self.__lock = threading.Lock()
+        self.__http_throttled = http_throttled
+        self.__api_throttled = api_throttled
+
+    def handle(self, method: str, path: str, query: dict, body: bytes):
+        with self.__lock:
+            if self.__http_throttled:
+                self.__http_throttled -= 1
+                return 429, None, {'Retry-After': '0'}
+            if self.__api_throttled:
+                self.__api_throttled -= 1
+                return self.throttled()
+        return super().handle(method, path, query, body)
+
+
+def make_policy(max_attempts=3, breaker: CircuitBreaker = None):
+    return RetryPolicy.for_vk(max_attempts=max_attempts, base_delay=0.0, jitter=0.0,
+                              breaker=breaker if breaker is not None else CircuitBreaker(failure_threshold=100))
+
+
+def make_client(session: HttpSession, policy: RetryPolicy, limiter: RateLimiter = None, api_base_url: str = None):
+    return VkClient('vk-token', 1, session=session, retry_policy=policy, api_base_url=api_base_url,
+                    rate_limiter=limiter if limiter is not None else RateLimiter(1000.0), user=USER)
+
+
+def test_connection_error_is_retried_once_per_attempt():
+    session = FailingSession()
+    breaker = CircuitBreaker(failure_threshold=4)
+    result = make_client(session, make_policy(3, breaker)).get_user_status()
+    assert session.requests == 3
+    assert not result['success']
+    assert result['message'].startswith('Request failed: ConnectionError')
+    # every failed attempt is counted once, so threshold of 4 is not reached by 3 attempts
+    assert breaker.get_state() == CircuitBreaker.CLOSED
+
+
+def test_open_circuit_is_failed_result_without_requests():
+    session = FailingSession()
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=60)
+    breaker.record_failure()
+    result = make_client(session, make_policy(3, breaker)).get_user_status()
+    assert session.requests == 0
+    assert not result['success']
+    assert 'CircuitOpenError' in result['message']
+
+
+def test_http_and_api_throttling_are_retried_by_one_policy():
+    with ThrottlingVk(http_throttled=1, api_throttled=1) as server:
+        with HttpSession() as session:
+            result = make_client(session, make_policy(3), api_base_url=server.get_api_url()).get_user_status()
+        assert result['success']
+        assert result['object'] == 'benchmark'
+        assert server.get_stats()['requests'] == 3
+
+
+def test_throttling_over_attempts_is_failed_result():
+    with ThrottlingVk(http_throttled=10) as server:
+        with HttpSession() as session:
+            result = make_client(session, make_policy(2), api_base_url=server.get_api_url()).get_user_status()
+        assert not result['success']
+        assert server.get_stats()['requests'] == 2
+
+
+def test_limiter_recovers_once_per_success():
+    limiter = RateLimiter(100.0)
+    with ThrottlingVk(api_throttled=1) as server:
+        with HttpSession() as session:
+            client = make_client(session, make_policy(3), limiter, server.get_api_url())
+            assert client.get_user_status()['success']
+    # rate is halved by throttling and restored by one step after the only success
+    assert limiter.get_rate() == 50.0 + 100.0 * RateLimiter.RECOVERY_STEP
+
+
+def test_breakers_are_isolated_by_url_and_token():
+    dead_url = 'http://127.0.0.1:9/method/'
+    token = f'vk-{uuid.uuid4().hex}'
+    policy = RetryPolicy.for_vk(dead_url, token, base_delay=0.0, jitter=0.0)
+    with HttpSession() as session:
+        dead = VkClient(token, 1, session=session, retry_policy=policy, api_base_url=dead_url, user=USER)
+        for _ in range(2):
+            assert not dead.get_user_status()['success']
+        assert policy.get_breaker().get_state() == CircuitBreaker.OPEN
+        with MockVk() as server:
+            # the same token with other URL and other token with the same URL have own breakers
+            for other_token, url in ((token, server.get_api_url()), (f'vk-{uuid.uuid4().hex}', dead_url)):
+                breaker = RetryPolicy.for_vk(url, other_token).get_breaker()
+                assert breaker is not policy.get_breaker()
+                assert breaker.get_state() == CircuitBreaker.CLOSED
+            healthy = VkClient(f'vk-{uuid.uuid4().hex}', 5, session=session, api_base_url=server.get_api_url())
+            assert healthy.is_initialized()
+    assert RetryPolicy.for_vk(dead_url, token).get_breaker() is policy.get_breaker()